@@ -6,10 +6,13 @@ Define globals available to all modules in PISA
 from __future__ import absolute_import
 
 from collections import namedtuple, OrderedDict
+import hashlib
 import os
 import sys
+import threading
 import warnings
 
+from numba import config as numba_config
 from numba import jit as numba_jit
 from numba import NumbaDeprecationWarning
 from numpy import (
@@ -20,7 +23,6 @@ from numpy import (
     complex64, complex128, complex256,
 )
 import numpy as np
-from pint import UnitRegistry
 
 from ._version import get_versions
 
@@ -72,6 +74,7 @@ __all__ = [
     'C_FTYPE',
     'C_PRECISION_DEF',
     'CACHE_DIR',
+    'LAZY_IMPORT',
 ]
 
 
@@ -79,13 +82,6 @@ __version__ = get_versions()['version']
 """PISA version is automatically constructed from versioneer/git info"""
 
 
-ureg = UnitRegistry() # pylint: disable=invalid-name
-"""Single Pint unit registry that should be used by all PISA code"""
-
-Q_ = ureg.Quantity # pylint: disable=invalid-name
-"""Shortcut for Quantity that uses central PISA Pint unit regeistry"""
-
-
 # Default value for CACHE_DIR
 CACHE_DIR = '~/.cache/pisa'
 """Root directory for storing PISA cache files"""
@@ -107,10 +103,45 @@ elif 'XDG_CACHE_HOME' in os.environ:
 CACHE_DIR = os.path.expanduser(os.path.expandvars(CACHE_DIR))
 
 
-# If `NUMBA_CACHE_DIR` env var is not set and `PISA_CACHE_DIR` is, then use
-# `PISA_CACHE_DIR/numba` for caching Numba's compiled objects
-if 'NUMBA_CACHE_DIR' not in os.environ:
-    os.environ['NUMBA_CACHE_DIR'] = os.path.join(CACHE_DIR, 'numba')
+# Lazy-loading mode defers building the unit registry (including importing
+# Pint), probing for CUDA (only possible if PISA_TARGET selects a CPU target),
+# and importing the submodules of `pisa.core` until each is first accessed.
+# This speeds up short-lived processes that need only parts of PISA.
+# Deferred attributes rely on module-level `__getattr__` (Python >= 3.7).
+LAZY_IMPORT = False
+"""Whether PISA defers expensive initialization until first use"""
+
+if 'PISA_LAZY_IMPORT' in os.environ:
+    PISA_LAZY_IMPORT = os.environ['PISA_LAZY_IMPORT']
+    ini_msgs.append(
+        'PISA_LAZY_IMPORT env var is defined as: "%s"' % PISA_LAZY_IMPORT
+    )
+    if PISA_LAZY_IMPORT.strip().lower() in ['1', 'true', 'yes', 'on']:
+        if sys.version_info >= (3, 7):
+            LAZY_IMPORT = True
+        else:
+            ini_msgs.append('lazy-loading mode requires Python >= 3.7')
+    elif PISA_LAZY_IMPORT.strip().lower() not in ['', '0', 'false', 'no', 'off']:
+        raise ValueError(
+            'Environment var PISA_LAZY_IMPORT="%s" is unrecognized; set it to'
+            ' "1" or "0".' % PISA_LAZY_IMPORT
+        )
+
+_UREG_LOCK = threading.Lock()
+
+def _init_ureg():
+    """Define `ureg`, the single Pint unit registry that should be used by all
+    PISA code, and `Q_`, the shortcut for Quantity that uses it (if not already
+    defined)"""
+    global ureg, Q_ # pylint: disable=global-statement, invalid-name
+    with _UREG_LOCK:
+        if 'ureg' not in globals():
+            from pint import UnitRegistry
+            ureg = UnitRegistry()
+            Q_ = ureg.Quantity
+
+if not LAZY_IMPORT:
+    _init_ureg()
 
 
 # Default to single thread, then try to read from env
@@ -125,25 +156,20 @@ if 'OMP_NUM_THREADS' in os.environ:
 # Get SmartArray DeprecationWarning out of the way silently
 warnings.filterwarnings("ignore", category=NumbaDeprecationWarning)
 
-NUMBA_CUDA_AVAIL = False
-def dummy_func(x):
-    """Decorate to to see if Numba actually works"""
-    x += 1
-
-try:
-    from numba import cuda
-    assert cuda.gpus, 'No GPUs detected'
-    cuda.jit('void(float64)')(dummy_func)
-except Exception:
-    pass
-else:
-    NUMBA_CUDA_AVAIL = True
-finally:
-    if 'cuda' in globals() or 'cuda' in locals():
-        if NUMBA_CUDA_AVAIL:
-            cuda.close()
-        del cuda
-del dummy_func
+def _numba_cuda_avail():
+    """Return whether Numba can compile code for and run it on a CUDA GPU"""
+    def dummy_func(x):
+        """Decorate to to see if Numba actually works"""
+        x += 1
+
+    try:
+        from numba import cuda
+        assert cuda.gpus, 'No GPUs detected'
+        cuda.jit('void(float64)')(dummy_func)
+    except Exception:
+        return False
+    cuda.close()
+    return True
 
 # Default value for FTYPE
 FTYPE = np.float64
@@ -170,16 +196,22 @@ if 'PISA_FTYPE' in os.environ:
 ITYPE = np.int32 if FTYPE == np.float32 else np.int64
 del FLOAT32_STRINGS, FLOAT64_STRINGS
 
-# set default target
-if NUMBA_CUDA_AVAIL:
-    TARGET = 'cuda'
-else:
-    TARGET = 'cpu'
-
 cpu_targets = ['cpu', 'numba'] # pylint: disable=invalid-name
 parallel_targets = ['parallel', 'multicore'] # pylint: disable=invalid-name
 gpu_targets = ['cuda', 'gpu', 'numba-cuda'] # pylint: disable=invalid-name
 
+# set default target; probing for CUDA is deferred in lazy-loading mode if the
+# user explicitly asks for a CPU target
+if (LAZY_IMPORT and os.environ.get('PISA_TARGET', '').strip().lower()
+        in cpu_targets + parallel_targets):
+    TARGET = 'cpu'
+else:
+    NUMBA_CUDA_AVAIL = _numba_cuda_avail()
+    if NUMBA_CUDA_AVAIL:
+        TARGET = 'cuda'
+    else:
+        TARGET = 'cpu'
+
 # ignore PISA_TARGET env var if no numba support at all available
 if TARGET is not None and 'PISA_TARGET' in os.environ:
     PISA_TARGET = os.environ['PISA_TARGET']
@@ -211,6 +243,43 @@ if TARGET is not None and 'PISA_TARGET' in os.environ:
 del cpu_targets, gpu_targets, parallel_targets
 
 
+def _numba_source_hash():
+    """Hash of the source of all PISA modules that use Numba.
+
+    Numba only invalidates a cached function if the file defining it changes,
+    not if a function it calls (e.g. a `myjit` kernel in another module) does,
+    so the cache must not outlive any change to these modules.
+
+    """
+    hasher = hashlib.sha256()
+    pisa_dir = os.path.dirname(os.path.abspath(__file__))
+    for dirpath, dirnames, filenames in os.walk(pisa_dir):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if not filename.endswith('.py'):
+                continue
+            with open(os.path.join(dirpath, filename), 'rb') as source_file:
+                source = source_file.read()
+            if b'numba' in source:
+                hasher.update(source)
+    return hasher.hexdigest()[:16]
+
+
+# If `NUMBA_CACHE_DIR` env var is not set, then use
+# `CACHE_DIR/numba/<TARGET>_<FTYPE>_<source hash>` for caching Numba's
+# compiled objects; kernels compiled for different targets and precisions
+# thereby never share (and invalidate) each other's cache files, and changing
+# any module using Numba starts a new cache (a user-defined NUMBA_CACHE_DIR
+# must be cleared manually, e.g. via `pisa-warmup --clear`)
+if 'NUMBA_CACHE_DIR' not in os.environ:
+    os.environ['NUMBA_CACHE_DIR'] = os.path.join(
+        CACHE_DIR, 'numba', '%s_%s_%s' % (TARGET, np.dtype(FTYPE).name,
+                                         _numba_source_hash())
+    )
+# Numba reads its config on import, so make it pick up the above
+numba_config.reload_config()
+
+
 # Define HASH_SIGFIGS to set hashing precision based on FTYPE above; value here
 # is default (i.e. for FTYPE == np.float64)
 HASH_SIGFIGS = 12
@@ -272,5 +341,19 @@ del target_msg
 sys.stderr.write("<< "+"; ".join(ini_msgs)+" >>\n")
 del ini_msgs
 
+
+def __getattr__(name):
+    """Initialize attributes deferred in lazy-loading mode upon first access"""
+    if name in ('ureg', 'Q_'):
+        _init_ureg()
+        return globals()[name]
+    if name == 'NUMBA_CUDA_AVAIL':
+        globals()[name] = _numba_cuda_avail()
+        return globals()[name]
+    raise AttributeError(
+        'module %r has no attribute %r' % (__name__, name)
+    )
+
+
 # Clean up imported names
-del os, sys, np, UnitRegistry, get_versions
+del hashlib, os, sys, threading, np, get_versions
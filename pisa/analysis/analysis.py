@@ -16,15 +16,19 @@ import time
 
 import numpy as np
 import scipy.optimize as optimize
+from uncertainties import unumpy as unp
 
 from pisa import EPSILON, FTYPE, ureg
 from pisa.core.detectors import Detectors
+from pisa.core.distribution_maker import DistributionMaker
 from pisa.core.map import Map, MapSet
 from pisa.core.param import ParamSet
 from pisa.utils.comparisons import recursiveEquality
 from pisa.utils.log import logging
 from pisa.utils.fileio import to_file
-from pisa.utils.stats import METRICS_TO_MAXIMIZE, METRICS_TO_MINIMIZE
+from pisa.utils.stats import (ARRAY_METRICS, GRAD_METRICS, LLH_METRICS,
+                              METRICS_TO_MAXIMIZE, METRICS_TO_MINIMIZE,
+                              array_metric_total)
 
 
 __all__ = ['MINIMIZERS_USING_SYMM_GRAD',
@@ -330,6 +334,8 @@ class Analysis(object):
     """
     def __init__(self):
         self._nit = 0
+        # (data distribution, its nominal values) for the metric fast path
+        self._data_arrays = (None, None)
 
     def fit_hypo(self, data_dist, hypo_maker, hypo_param_selections, metric,
                  minimizer_settings, reset_free=True, 
@@ -605,6 +611,12 @@ class Analysis(object):
         metric : string or iterable of strings
 
         minimizer_settings : dict
+            If the option "jac" is "analytic", the gradient of the metric is
+            computed analytically w.r.t. all free params for which the stages
+            of the `hypo_maker` provide derivatives (see
+            `DistributionMaker.get_output_grads`) and by forward differences
+            w.r.t. all others (see `_minimizer_callable_and_grad`). Otherwise,
+            "jac" is passed on to `scipy.optimize.minimize`.
 
         other_metrics : None, string, or sequence of strings
 
@@ -642,7 +654,12 @@ class Analysis(object):
         x0 = hypo_maker.params.free._rescaled_values # pylint: disable=protected-access
 
         minimizer_method = minimizer_settings['method']['value'].lower()
-        if minimizer_method in MINIMIZERS_USING_SYMM_GRAD:
+        minimizer_options = dict(minimizer_settings['options']['value'])
+        jac = minimizer_options.pop('jac', None)
+        analytic_jac = jac == 'analytic'
+        # With analytic gradients, the finite differences that remain are
+        # one-sided and stay within the bounds
+        if minimizer_method in MINIMIZERS_USING_SYMM_GRAD and not analytic_jac:
             logging.warning(
                 'Minimizer %s requires artificial boundaries SMALLER than the'
                 ' user-specified boundaries (so that numerical gradients do'
@@ -725,14 +742,22 @@ class Analysis(object):
 
         # reset number of iterations before each minimization
         self._nit = 0
+        args = (hypo_maker, data_dist, metric, counter, fit_history, pprint,
+                blind, external_priors_penalty)
+        if analytic_jac:
+            fun = self._minimizer_callable_and_grad
+            args += (minimizer_options.get('eps', np.sqrt(np.finfo(FTYPE).eps)),)
+            jac = True
+        else:
+            fun = self._minimizer_callable
         optimize_result = optimize.minimize(
-            fun=self._minimizer_callable,
+            fun=fun,
             x0=x0,
-            args=(hypo_maker, data_dist, metric, counter, fit_history, pprint,
-                  blind, external_priors_penalty),
+            args=args,
+            jac=jac,
             bounds=bounds,
             method=minimizer_settings['method']['value'],
-            options=minimizer_settings['options']['value'],
+            options=minimizer_options,
             callback=self._minimizer_callback
         )
         end_t = time.time()
@@ -950,7 +975,8 @@ class Analysis(object):
         return detailed_metric_info
 
     def _minimizer_callable(self, scaled_param_vals, hypo_maker, data_dist,
-                            metric, counter, fit_history, pprint, blind, external_priors_penalty=None):
+                            metric, counter, fit_history, pprint, blind,
+                            external_priors_penalty=None, return_asimov=False):
         """Simple callback for use by scipy.optimize minimizers.
 
         This should *not* in general be called by users, as `scaled_param_vals`
@@ -993,6 +1019,9 @@ class Analysis(object):
         external_priors_penalty : func
             User defined prior penalty function
 
+        return_asimov : bool
+            Also return the Asimov distribution(s) generated by `hypo_maker`
+
         """
         # Want to *maximize* e.g. log-likelihood but we're using a minimizer,
         # so flip sign of metric in those cases.
@@ -1010,9 +1039,24 @@ class Analysis(object):
         # Set param values from the scaled versions the minimizer works with
         hypo_maker._set_rescaled_free_params(scaled_param_vals) # pylint: disable=protected-access
 
+        # Metrics supported by `array_metric_total` can be evaluated directly
+        # on float arrays, skipping the creation of the Asimov map set
+        use_arrays = (
+            not return_asimov
+            and isinstance(hypo_maker, DistributionMaker)
+            and metric[0] in ARRAY_METRICS
+            and isinstance(data_dist, MapSet) and len(data_dist) == 1
+            and hypo_maker.output_arrays_available
+        )
+
         # Get the Asimov map set
         try:
-            hypo_asimov_dist = hypo_maker.get_outputs(return_sum=True)
+            if use_arrays:
+                hypo_nominal, hypo_sumw2 = hypo_maker.get_output_arrays(
+                    return_sum=True
+                )
+            else:
+                hypo_asimov_dist = hypo_maker.get_outputs(return_sum=True)
         except Exception as e:
             if blind:
                 logging.error('Minimizer failed')
@@ -1043,6 +1087,16 @@ class Analysis(object):
                     metric_val += data
                 priors = hypo_maker.params.priors_penalty(metric=metric[0]) # uses just the "first" metric for prior
                 metric_val += priors
+            elif use_arrays:
+                metric_val = (
+                    array_metric_total(
+                        actual_values=self._get_data_nominal(data_dist),
+                        expected_values=hypo_nominal,
+                        metric=metric[0],
+                        expected_sumw2=hypo_sumw2,
+                    )
+                    + hypo_maker.params.priors_penalty(metric=metric[0])
+                )
             else: # DistributionMaker object
                 metric_val = (
                     data_dist.metric_total(expected_values=hypo_asimov_dist,
@@ -1084,9 +1138,151 @@ class Analysis(object):
             fit_history.append(
                 [metric_val] + [v.value.m for v in hypo_maker.params.free]
             )
-            
+
+        if return_asimov:
+            return sign*metric_val, hypo_asimov_dist
         return sign*metric_val
 
+    def _get_data_nominal(self, data_dist):
+        """Flat nominal values of the single map in `data_dist`, cached for
+        as long as the same data distribution is fit"""
+        cached_dist, nominal = self._data_arrays
+        if cached_dist is not data_dist:
+            nominal = np.ascontiguousarray(
+                data_dist[0].nominal_values, dtype=np.float64
+            ).ravel()
+            self._data_arrays = (data_dist, nominal)
+        return nominal
+
+    def _minimizer_callable_and_grad(self, scaled_param_vals, hypo_maker,
+                                     data_dist, metric, counter, fit_history,
+                                     pprint, blind, external_priors_penalty,
+                                     eps):
+        """Same as `_minimizer_callable` but also return the gradient w.r.t.
+        `scaled_param_vals`, for use by scipy.optimize minimizers with
+        `jac=True`.
+
+        Derivatives w.r.t. params for which the stages provide them (see
+        `Pipeline.get_output_grads`) are chained analytically through the
+        metric, which must be one of `GRAD_METRICS`, at no additional cost.
+        Derivatives w.r.t. all other params are computed by forward
+        differences with step `eps` (backward at the upper bound), each
+        requiring one more distribution to be generated.
+
+        """
+        if isinstance(metric, str):
+            metric = [metric]
+        sign = -1 if metric[0] in METRICS_TO_MAXIMIZE else +1
+        scaled_param_vals = np.array(scaled_param_vals, dtype=np.float64)
+        callable_args = (hypo_maker, data_dist, metric, counter, fit_history,
+                         pprint, blind, external_priors_penalty)
+
+        fun, hypo_asimov_dist = self._minimizer_callable(
+            scaled_param_vals, *callable_args, return_asimov=True
+        )
+
+        if isinstance(hypo_maker, Detectors):
+            metrics = list(metric)
+            if len(metrics) == 1:
+                metrics *= len(hypo_maker.distribution_makers)
+            value_grads = self._detectors_metric_grads(
+                hypo_maker, data_dist, hypo_asimov_dist, metrics
+            )
+        else:
+            value_grads = self._metric_grads(
+                hypo_maker, data_dist, hypo_asimov_dist, metric[0]
+            )
+
+        free_params = hypo_maker.params.free
+        grad = np.empty(len(free_params), dtype=np.float64)
+        numerical = []
+        for idx, (param, value_grad) in enumerate(zip(free_params, value_grads)):
+            if value_grad is None:
+                numerical.append(idx)
+                continue
+            value_grad += self._prior_penalty_grad(param, metric[0])
+            width = param.range[1].m - param.range[0].m
+            grad[idx] = sign * value_grad * width
+
+        for idx in numerical:
+            step = eps if scaled_param_vals[idx] + eps <= 1 else -eps
+            shifted_vals = scaled_param_vals.copy()
+            shifted_vals[idx] += step
+            grad[idx] = (
+                self._minimizer_callable(shifted_vals, *callable_args) - fun
+            ) / step
+
+        return fun, grad
+
+    @staticmethod
+    def _metric_grads(distribution_maker, data_dist, hypo_asimov_dist, metric):
+        """Derivatives of `metric` (without priors) w.r.t. the values of the
+        free params of `distribution_maker`, in units of the params, or None
+        for the params without analytic derivatives. Requires outputs to have
+        been generated with the current param values."""
+        free_names = distribution_maker.params.free.names
+        if metric not in GRAD_METRICS:
+            return [None] * len(free_names)
+        output_grads = distribution_maker.get_output_grads(
+            param_names=free_names, return_sum=True
+        )
+        bin_grads = OrderedDict(
+            (m.name, data_dist[m.name].metric_grad(m, metric))
+            for m in hypo_asimov_dist
+        )
+        grads = []
+        for name in free_names:
+            if output_grads[name] is None:
+                grads.append(None)
+                continue
+            grads.append(float(np.sum([
+                np.sum(bin_grads[m.name] * unp.nominal_values(m.hist))
+                for m in output_grads[name]
+            ])))
+        return grads
+
+    def _detectors_metric_grads(self, detectors, data_dist, hypo_asimov_dist,
+                                metrics):
+        """Same as `_metric_grads` for `Detectors`, with the free params
+        ordered as in `Detectors.params.free`, i.e. shared params first (see
+        `Detectors._set_rescaled_free_params`)"""
+        shared_grads = [0.] * len(detectors.shared_params)
+        other_grads = []
+        spi = detectors.shared_param_ind_list
+        for det_idx, distribution_maker in enumerate(detectors):
+            grads = self._metric_grads(
+                distribution_maker, data_dist[det_idx],
+                hypo_asimov_dist[det_idx], metrics[det_idx]
+            )
+            shared_pos = dict(spi[det_idx]) if spi else {}
+            for free_idx, grad in enumerate(grads):
+                if free_idx not in shared_pos:
+                    other_grads.append(grad)
+                    continue
+                shared_idx = shared_pos[free_idx]
+                if grad is None or shared_grads[shared_idx] is None:
+                    shared_grads[shared_idx] = None
+                else:
+                    shared_grads[shared_idx] += grad
+        return shared_grads + other_grads
+
+    @staticmethod
+    def _prior_penalty_grad(param, metric, rel_step=1e-6):
+        """Derivative of the prior penalty of `param` w.r.t. its value (in
+        units of the param), by central differences (which are cheap as they
+        do not require generating distributions)"""
+        if param.prior is None or param.prior.kind == 'uniform':
+            return 0.
+        if metric in LLH_METRICS:
+            penalty = param.prior.llh
+        else:
+            penalty = param.prior.chi2
+        step = rel_step * (param.range[1].m - param.range[0].m)
+        return float(
+            penalty(param.value + step * param.units)
+            - penalty(param.value - step * param.units)
+        ) / (2 * step)
+
     def _minimizer_callback(self, xk): # pylint: disable=unused-argument
         """Passed as `callback` parameter to `optimize.minimize`, and is called
         after each iteration. Keeps track of number of iterations.
@@ -1292,17 +1488,36 @@ class Analysis(object):
             # With single parameter, can use either `zip` or `product`
             loopfunc = product
 
+        points = [
+            pos for i, pos in enumerate(loopfunc(*steplist))
+            if not points_acc or i in points_acc
+        ]
+
         params = hypo_maker.params
 
+        # If no free params are left to optimize at the scanned points,
+        # generate all Asimov distributions at once; `get_outputs_multi` visits
+        # the points in an order in which stages can reuse their cached outputs
+        multi_outputs = None
+        free_names = params.free.names
+        if (isinstance(hypo_maker, DistributionMaker) and points
+                and set(param_names).issubset(free_names)
+                and (not profile or set(free_names).issubset(param_names))):
+            multi_outputs = hypo_maker.get_outputs_multi(
+                [
+                    [dict(pos).get(name, params[name].value)
+                     for name in free_names]
+                    for pos in points
+                ],
+                return_sum=True,
+            )
+
         # Fix the parameters to be scanned if `profile` is set to True
         params.fix(param_names)
 
         results = {'steps': {}, 'results': []}
         results['steps'] = {pname: [] for pname in param_names}
-        for i, pos in enumerate(loopfunc(*steplist)):
-            if points_acc and i not in points_acc:
-                continue
-
+        for i, pos in enumerate(points):
             msg = ''
             for (pname, val) in pos:
                 params[pname].value = val
@@ -1326,7 +1541,10 @@ class Analysis(object):
                     data_dist=data_dist,
                     hypo_maker=hypo_maker,
                     hypo_param_selections=hypo_param_selections,
-                    hypo_asimov_dist=hypo_maker.get_outputs(return_sum=True),
+                    hypo_asimov_dist=(
+                        hypo_maker.get_outputs(return_sum=True)
+                        if multi_outputs is None else multi_outputs[i]
+                    ),
                     metric=metric,
                     **{k: v for k,v in kwargs.items() if k not in ["pprint","reset_free","check_octant"]}
                 )
@@ -14,15 +14,18 @@ from __future__ import absolute_import, division
 
 from collections.abc import Mapping, Sequence
 from collections import OrderedDict
-from copy import copy
+from copy import copy, deepcopy
 import getpass
 from itertools import chain, product
+import multiprocessing
 import os
 import random
 import re
+import shutil
 import socket
 import string
 import sys
+import tempfile
 import time
 from traceback import format_exception
 
@@ -36,14 +39,14 @@ from pisa.core.map import MapSet
 from pisa.utils.comparisons import normQuant
 from pisa.utils.fileio import from_file, get_valid_filename, mkdir, to_file
 from pisa.utils.hash import hash_obj
-from pisa.utils.log import logging
+from pisa.utils.log import logging, set_verbosity
 from pisa.utils.random_numbers import get_random_state
 from pisa.utils.resources import find_resource
 from pisa.utils.stats import ALL_METRICS
 from pisa.utils.format import timediff, timestamp
 
 
-__all__ = ['Labels', 'HypoTesting']
+__all__ = ['Labels', 'HypoTesting', 'test_HypoTesting_trials']
 
 __author__ = 'J.L. Lanfranchi, P.Eller, S. Wren'
 
@@ -62,6 +65,17 @@ __license__ = '''Copyright (c) 2014-2017, The IceCube Collaboration
  limitations under the License.'''
 
 
+_PARALLEL_HYPO_TESTING = None
+"""HypoTesting instance that forked worker processes run their tasks on; only
+set while `HypoTesting.run_trials_parallel` is running"""
+
+
+def _run_parallel_task(task):
+    """Run one `(data_ind, fid_inds)` task in a worker process"""
+    data_ind, fid_inds = task
+    return _PARALLEL_HYPO_TESTING.run_task(data_ind=data_ind, fid_inds=fid_inds)
+
+
 class Labels(object):
     """Derive file labels and naming scheme for data and directories produced
     by the HypoTesting class.
@@ -600,12 +614,19 @@ class HypoTesting(Analysis):
         )
 
 
-    def run_analysis(self):
+    def run_analysis(self, num_workers=1):
         """Run the defined analysis.
 
         Progress and estimated time remaining is written to stdout/stderr, and
         results are logged to an appropriate directory within `self.logdir`.
 
+        Parameters
+        ----------
+        num_workers : int >= 1
+            Number of processes to distribute the (data, fiducial) trials
+            over. If 1, all trials are run serially in this process. See
+            `run_trials_parallel` for details.
+
         """
         logging.info('Running LLR analysis.')
         self.analysis_start_time = time.time()
@@ -617,59 +638,10 @@ class HypoTesting(Analysis):
 
         t0 = time.time()
         try:
-            # Loop for multiple (if fluctuated) data distributions
-            for self.data_ind in range(self.data_start_ind,
-                                        self.data_start_ind
-                                        + self.num_data_trials):
-                data_trials_complete = self.data_ind-self.data_start_ind
-                pct_data_complete = (
-                    100.*(data_trials_complete)/self.num_data_trials
-                )
-                logging.info(
-                    'Working on %s set ID %d (will stop after ID %d).'
-                    ' %0.2f%s of %s sets completed.',
-                    self.labels.data_disp,
-                    self.data_ind,
-                    self.data_start_ind+self.num_data_trials-1,
-                    pct_data_complete,
-                    '%',
-                    self.labels.data_disp
-                )
-
-                self.generate_data()
-                self.fit_hypos_to_data()
-
-                # Loop for multiple (if fluctuated) fiducial data distributions
-                for self.fid_ind in range(self.fid_start_ind,
-                                           self.fid_start_ind
-                                           + self.num_fid_trials):
-                    fid_trials_complete = self.fid_ind-self.fid_start_ind
-                    pct_fid_dist_complete = (
-                        100*(fid_trials_complete)/self.num_fid_trials
-                    )
-
-                    dt = time.time() - t0
-                    total_complete = (self.num_fid_trials*data_trials_complete
-                                      + fid_trials_complete)
-                    trials_to_go = (self.num_data_trials*self.num_fid_trials
-                                    - total_complete)
-
-                    ts_remaining = '???'
-                    if total_complete > 0:
-                        sec_per_fid = dt / total_complete
-                        time_to_go = sec_per_fid * trials_to_go
-                        ts_remaining = timediff(time_to_go, sec_decimals=0,
-                                                hms_always=True)
-
-                    logging.info(
-                        ('Working on {data_disp} set ID %d / {fid_disp} set ID'
-                         ' %d. %d trials to go, est time remaining: %s'
-                         %(self.data_ind, self.fid_ind, trials_to_go,
-                           ts_remaining)).format(**self.labels.dict)
-                    )
-
-                    self.produce_fid_data()
-                    self.fit_hypos_to_fid()
+            if num_workers > 1:
+                self.run_trials_parallel(num_workers=num_workers)
+            else:
+                self.run_trials(t0=t0)
         except: # pylint: disable=bare-except
             exc = sys.exc_info()
         else:
@@ -698,6 +670,229 @@ class HypoTesting(Analysis):
             if exc[0] is not None:
                 raise exc[0](exc[1]).with_traceback(exc[2])
 
+    def run_trials(self, t0=None):
+        """Serially run all (data, fiducial) trials in this process, skipping
+        those that have been completed already (see `run_task`).
+
+        Parameters
+        ----------
+        t0 : None or float
+            Start time (as returned by `time.time`) used for estimating the
+            remaining run time; defaults to now.
+
+        """
+        if t0 is None:
+            t0 = time.time()
+
+        fid_inds = range(self.fid_start_ind,
+                         self.fid_start_ind + self.num_fid_trials)
+
+        # Loop for multiple (if fluctuated) data distributions
+        for data_ind in range(self.data_start_ind,
+                              self.data_start_ind + self.num_data_trials):
+            data_trials_complete = data_ind - self.data_start_ind
+            pct_data_complete = (
+                100.*(data_trials_complete)/self.num_data_trials
+            )
+
+            ts_remaining = '???'
+            if data_trials_complete > 0:
+                sec_per_data = (time.time() - t0) / data_trials_complete
+                time_to_go = sec_per_data * (self.num_data_trials
+                                             - data_trials_complete)
+                ts_remaining = timediff(time_to_go, sec_decimals=0,
+                                        hms_always=True)
+
+            logging.info(
+                'Working on %s set ID %d (will stop after ID %d).'
+                ' %0.2f%s of %s sets completed, est time remaining: %s',
+                self.labels.data_disp,
+                data_ind,
+                self.data_start_ind+self.num_data_trials-1,
+                pct_data_complete,
+                '%',
+                self.labels.data_disp,
+                ts_remaining
+            )
+
+            self.run_task(data_ind=data_ind, fid_inds=fid_inds)
+
+        self.data_ind = self.data_start_ind + self.num_data_trials - 1
+        self.fid_ind = self.fid_start_ind + self.num_fid_trials - 1
+
+    def run_trials_parallel(self, num_workers):
+        """Run all (data, fiducial) trials, distributed over a pool of
+        `num_workers` processes.
+
+        Workers are forked from this process and hence each works on its own
+        copy of the (already set up) distribution makers. Trials are seeded
+        via `get_random_state` exactly as in the serial `run_trials`, so fit
+        results are identical to those of a serial run. This requires
+        `reset_free` to be True, such that no fit depends on the outcome of
+        the previous one in the same process.
+
+        Completed trials are skipped just like in `run_trials` (see
+        `run_task`).
+
+        Each task consists of one data trial and a (sub)set of its fiducial
+        trials. The fiducial trials of a data trial are only split across
+        tasks if there are fewer data trials than workers; the fits to the
+        data distribution are then done by each of those tasks, unless
+        already logged by another one.
+
+        Parameters
+        ----------
+        num_workers : int >= 1
+
+        Notes
+        -----
+        Forking requires that no GPU context exists in this process, so run
+        with `PISA_TARGET=cpu` (or `parallel`).
+
+        """
+        global _PARALLEL_HYPO_TESTING # pylint: disable=global-statement
+
+        if not self.reset_free:
+            raise ValueError(
+                'Running trials in parallel requires `reset_free` to be True,'
+                ' as otherwise fits would start from the outcome of whichever'
+                ' fit the same worker process ran before.'
+            )
+
+        tasks = self._get_parallel_tasks(num_workers)
+        num_trials = self.num_data_trials * self.num_fid_trials
+        logging.info(
+            'Distributing %d trials in %d tasks over %d worker processes.',
+            num_trials, len(tasks), num_workers
+        )
+
+        t0 = time.time()
+        trials_done = 0
+        _PARALLEL_HYPO_TESTING = self
+        try:
+            ctx = multiprocessing.get_context('fork')
+            with ctx.Pool(processes=num_workers) as pool:
+                for data_ind, fid_inds in pool.imap_unordered(
+                        _run_parallel_task, tasks):
+                    trials_done += len(fid_inds)
+                    trials_to_go = num_trials - trials_done
+                    time_to_go = (
+                        (time.time() - t0) / trials_done * trials_to_go
+                    )
+                    logging.info(
+                        ('Finished {data_disp} set ID %d / {fid_disp} set IDs'
+                         ' %d-%d. %d trials to go, est time remaining: %s'
+                         %(data_ind, fid_inds[0], fid_inds[-1], trials_to_go,
+                           timediff(time_to_go, sec_decimals=0,
+                                    hms_always=True))
+                        ).format(**self.labels.dict)
+                    )
+        finally:
+            _PARALLEL_HYPO_TESTING = None
+
+        self.data_ind = self.data_start_ind + self.num_data_trials - 1
+        self.fid_ind = self.fid_start_ind + self.num_fid_trials - 1
+
+    def _get_parallel_tasks(self, num_workers):
+        """Divide the (data, fiducial) trials into tasks of the form
+        `(data_ind, fid_inds)` for `run_trials_parallel`."""
+        data_inds = range(self.data_start_ind,
+                          self.data_start_ind + self.num_data_trials)
+        fid_inds = np.arange(self.fid_start_ind,
+                             self.fid_start_ind + self.num_fid_trials)
+        num_chunks = int(np.ceil(num_workers / self.num_data_trials))
+        num_chunks = min(num_chunks, self.num_fid_trials)
+        tasks = []
+        for data_ind in data_inds:
+            for chunk in np.array_split(fid_inds, num_chunks):
+                tasks.append((data_ind, [int(i) for i in chunk]))
+        return tasks
+
+    def fid_trial_done(self, data_ind, fid_ind):
+        """Whether all fits for a (data, fiducial) trial have been logged.
+
+        Parameters
+        ----------
+        data_ind, fid_ind : int
+
+        Returns
+        -------
+        done : bool
+
+        """
+        dirpath = self.get_thisdata_dirpath(data_ind)
+        self.labels.derive_fid_fits_names(fid_ind=fid_ind)
+        for label in [self.labels.h0_fit_to_h0_fid,
+                      self.labels.h1_fit_to_h1_fid,
+                      self.labels.h1_fit_to_h0_fid,
+                      self.labels.h0_fit_to_h1_fid]:
+            if not os.path.isfile(os.path.join(dirpath, label + '.json.bz2')):
+                return False
+        return True
+
+    def get_thisdata_dirpath(self, data_ind):
+        """Directory the fits for data trial `data_ind` are logged to"""
+        dirpath = self.data_dirpath
+        if self.fluctuate_data:
+            dirpath += '_' + format(data_ind, 'd')
+        return dirpath
+
+    def run_task(self, data_ind, fid_inds):
+        """Run one data trial and the fiducial trials `fid_inds` thereof.
+
+        This is the unit of work of both `run_trials` and
+        `run_trials_parallel`. Each fit result is written to the log directory
+        as soon as it finishes, such that an interrupted run can be resumed by
+        re-running with the same `logdir` and settings: fiducial trials whose
+        four fits have all been logged are skipped, and the fits to the data
+        distribution are restored from their log files (see
+        `load_fits_to_data`) rather than redone.
+
+        Parameters
+        ----------
+        data_ind : int
+        fid_inds : sequence of int
+
+        Returns
+        -------
+        data_ind : int
+        fid_inds : list of int
+
+        """
+        fid_inds = list(fid_inds)
+        fid_inds_todo = [
+            fid_ind for fid_ind in fid_inds
+            if not self.fid_trial_done(data_ind, fid_ind)
+        ]
+        if not fid_inds_todo:
+            logging.info(
+                ('{data_disp} set ID %d / {fid_disp} set IDs %d-%d already'
+                 ' completed; skipping.'
+                 %(data_ind, fid_inds[0], fid_inds[-1])
+                ).format(**self.labels.dict)
+            )
+            return data_ind, fid_inds
+        if len(fid_inds_todo) < len(fid_inds) and not self.reset_free:
+            logging.warning(
+                'Skipping completed trials while `reset_free` is False; the'
+                ' remaining fits start from different values than they would'
+                ' in an uninterrupted run.'
+            )
+
+        self.data_ind = data_ind
+        self.generate_data()
+        if not self.load_fits_to_data():
+            self.fit_hypos_to_data()
+        for self.fid_ind in fid_inds_todo:
+            logging.info(
+                ('Working on {data_disp} set ID %d / {fid_disp} set ID %d.'
+                 %(self.data_ind, self.fid_ind)).format(**self.labels.dict)
+            )
+            self.produce_fid_data()
+            self.fit_hypos_to_fid()
+
+        return data_ind, fid_inds
+
     def generate_data(self):
         """Geneerate "data" distribution"""
         logging.info('Generating %s distributions.', self.labels.data_disp)
@@ -753,6 +948,57 @@ class HypoTesting(Analysis):
 
         return self.data_dist
 
+    def load_fits_to_data(self):
+        """Restore the fits of both hypotheses to the current "data"
+        distribution from the files logged by a previous run.
+
+        Each hypothesis maker's free params are set to the logged best fit
+        values, from which the fiducial Asimov distribution is regenerated.
+
+        Returns
+        -------
+        loaded : bool
+            False if not both fits have been logged or if `blind` is True
+            (best fit values are not logged then); the fits must be done in
+            that case.
+
+        """
+        if self.blind:
+            return False
+
+        dirpath = self.get_thisdata_dirpath(self.data_ind)
+        fits = [
+            (self.labels.h0_fit_to_data, self.h0_maker,
+             self.h0_param_selections),
+            (self.labels.h1_fit_to_data, self.h1_maker,
+             self.h1_param_selections),
+        ]
+        fpaths = [os.path.join(dirpath, label + '.json.bz2')
+                  for label, _, _ in fits]
+        if not all(os.path.isfile(fpath) for fpath in fpaths):
+            return False
+
+        fit_infos = []
+        for fpath, (_, hypo_maker, param_selections) in zip(fpaths, fits):
+            logging.info('Loading fit to %s distributions from "%s".',
+                         self.labels.data_disp, fpath)
+            fit_info = from_file(fpath)
+            hypo_maker.select_params(param_selections)
+            hypo_maker.reset_free()
+            for name, value in fit_info['params'].items():
+                hypo_maker.params[name].value = ureg.Quantity(value)
+            fit_info['params'] = deepcopy(hypo_maker.params)
+            fit_info['hypo_asimov_dist'] = hypo_maker.get_outputs(
+                return_sum=True
+            )
+            fit_infos.append(fit_info)
+
+        self.thisdata_dirpath = dirpath
+        self.h0_fit_to_data, self.h1_fit_to_data = fit_infos
+        self.h0_fid_asimov_dist = self.h0_fit_to_data['hypo_asimov_dist']
+        self.h1_fid_asimov_dist = self.h1_fit_to_data['hypo_asimov_dist']
+        return True
+
     # TODO: use hashes to ensure fits aren't repeated that don't have to be?
     def fit_hypos_to_data(self):
         """Fit both hypotheses to "data" to produce fiducial Asimov
@@ -761,9 +1007,7 @@ class HypoTesting(Analysis):
 
         """
         # Setup directory for logging results
-        self.thisdata_dirpath = self.data_dirpath
-        if self.fluctuate_data:
-            self.thisdata_dirpath += '_' + format(self.data_ind, 'd')
+        self.thisdata_dirpath = self.get_thisdata_dirpath(self.data_ind)
         mkdir(self.thisdata_dirpath)
 
         # If h0 maker is same as data maker, we know the fit will end up with
@@ -1559,8 +1803,15 @@ class HypoTesting(Analysis):
             if isinstance(v, ureg.Quantity):
                 v = str(v)
             info[k] = v
-        to_file(info, os.path.join(dirpath, label + '.json.bz2'),
-                sort_keys=False)
+        # Write to a temporary file first and then move it into place, such
+        # that a file found under the final name is always complete (see
+        # `fid_trial_done`), even if the process is killed while writing
+        fpath = os.path.join(dirpath, label + '.json.bz2')
+        tmp_fpath = os.path.join(
+            dirpath, '.%s.%d.tmp.json.bz2' % (label, os.getpid())
+        )
+        to_file(info, tmp_fpath, sort_keys=False)
+        os.replace(tmp_fpath, fpath)
 
     def set_param_ranges(self, selection, test_name, rangetuple, inj_units):
         """Give the parameter in hypo_testing selected by selection
@@ -1963,3 +2214,83 @@ class HypoTesting(Analysis):
                 for h1_param in self.h1_maker.params:
                     if h1_param.name == data_param.name:
                         h1_param.is_fixed = False
+
+
+def test_HypoTesting_trials():
+    """Check that resuming an interrupted run and running the trials in
+    parallel both log the same fits as an uninterrupted serial run"""
+    def run_trials(logdir, num_workers=1):
+        hypo_testing = HypoTesting(
+            logdir=logdir,
+            minimizer_settings=(
+                'settings/minimizer/slsqp_ftol1e-6_eps1e-4_maxiter1000.json'
+            ),
+            data_is_data=False, fluctuate_data=True, fluctuate_fid=True,
+            metric='chi2', h0_maker='settings/pipeline/example.cfg',
+            h0_param_selections=['ih'], h1_param_selections=['nh'],
+            data_param_selections=['nh'], num_data_trials=2, num_fid_trials=2,
+            check_octant=False, allow_dirty=True, allow_no_git_info=True,
+            store_minimizer_history=False
+        )
+        # Keep the fits quick
+        for selection in ['nh', 'ih']:
+            hypo_testing.h0_maker.select_params(selection)
+            hypo_testing.h0_maker.params.fix(['theta23', 'delta_index'])
+        hypo_testing.run_analysis(num_workers=num_workers)
+        return hypo_testing.logroot
+
+    def read_fits(logroot):
+        fits = OrderedDict()
+        for dirpath, _, fnames in sorted(os.walk(logroot)):
+            for fname in sorted(fnames):
+                if not fname.startswith('hypo_'):
+                    continue
+                info = from_file(os.path.join(dirpath, fname))
+                relpath = os.path.relpath(os.path.join(dirpath, fname), logroot)
+                fits[relpath] = (info['metric_val'], info['params'])
+        return fits
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        serial_logroot = run_trials(os.path.join(tmpdir, 'serial'))
+        serial_fits = read_fits(serial_logroot)
+        # 2 data trials x (2 fits to data + 2 fid trials x 4 fits to fid)
+        assert len(serial_fits) == 20, list(serial_fits.keys())
+
+        # Pretend the run was interrupted after the first fid trial of the
+        # first data trial
+        resumed_dir = os.path.join(tmpdir, 'resumed')
+        shutil.copytree(os.path.join(tmpdir, 'serial'), resumed_dir)
+        resumed_logroot = os.path.join(
+            resumed_dir,
+            os.path.relpath(serial_logroot, os.path.join(tmpdir, 'serial'))
+        )
+        data_fit_mtimes = OrderedDict()
+        for relpath in serial_fits:
+            dirname, fname = os.path.split(relpath)
+            fpath = os.path.join(resumed_logroot, relpath)
+            is_fid_fit = '_fid_' in fname
+            if (dirname.endswith('_1')
+                    or is_fid_fit and not fname.endswith('_0.json.bz2')):
+                os.remove(fpath)
+            elif not is_fid_fit:
+                data_fit_mtimes[fpath] = os.path.getmtime(fpath)
+        assert len(data_fit_mtimes) == 2
+        assert run_trials(resumed_dir) == resumed_logroot
+        assert read_fits(resumed_logroot) == serial_fits
+        # Logged fits to data are loaded, not redone
+        for fpath, mtime in data_fit_mtimes.items():
+            assert os.path.getmtime(fpath) == mtime, fpath
+
+        parallel_logroot = run_trials(os.path.join(tmpdir, 'parallel'),
+                                      num_workers=2)
+        assert read_fits(parallel_logroot) == serial_fits
+    finally:
+        shutil.rmtree(tmpdir)
+
+    logging.info('<< PASS : test_HypoTesting_trials >>')
+
+
+if __name__ == '__main__':
+    set_verbosity(1)
+    test_HypoTesting_trials()
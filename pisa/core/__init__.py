@@ -1,12 +1,56 @@
 # Useful for interactive sessions to be able to say `from pisa.core import *`
 # (though this is discouraged for any script; use instead full, explicit paths
 # in imports)
-from .binning import *
-from .distribution_maker import *
-from .events import *
-from .map import *
-from .param import *
-from .pipeline import *
-from .prior import *
-from .stage import *
-from .transform import *
+
+from pisa import LAZY_IMPORT
+
+
+_STAR_MODULES = (
+    'binning',
+    'distribution_maker',
+    'events',
+    'map',
+    'param',
+    'pipeline',
+    'prior',
+    'stage',
+    'transform',
+)
+"""Submodules whose public names are made available in `pisa.core`"""
+
+
+if LAZY_IMPORT:
+    from importlib import import_module
+
+    def __getattr__(name):
+        """Import submodules (and the names they export) upon first access"""
+        if name == '__all__':
+            all_names = []
+            for modname in _STAR_MODULES:
+                all_names.extend(import_module('.' + modname, __name__).__all__)
+            globals()['__all__'] = all_names
+            return all_names
+        try:
+            return import_module('.' + name, __name__)
+        except ModuleNotFoundError as err:
+            if err.name != '%s.%s' % (__name__, name):
+                raise
+        # Later modules take precedence, as with star imports
+        for modname in reversed(_STAR_MODULES):
+            module = import_module('.' + modname, __name__)
+            if name in module.__all__:
+                return getattr(module, name)
+        raise AttributeError(
+            'module %r has no attribute %r' % (__name__, name)
+        )
+
+else:
+    from .binning import *
+    from .distribution_maker import *
+    from .events import *
+    from .map import *
+    from .param import *
+    from .pipeline import *
+    from .prior import *
+    from .stage import *
+    from .transform import *
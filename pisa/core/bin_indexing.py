@@ -1,5 +1,5 @@
 """
-Functions to retrieve the bin index for a 1- to 3-dimensional sample.
+Functions to retrieve the bin index for an N-dimensional sample.
 
 Functions were adapted from translation.py
 
@@ -30,7 +30,7 @@ from pisa import FTYPE, TARGET
 from pisa.core.binning import OneDimBinning, MultiDimBinning
 from pisa.core.translation import find_index
 from pisa.utils.log import logging, set_verbosity
-from pisa.utils.numba_tools import WHERE
+from pisa.utils.numba_tools import NUMBA_CACHE, WHERE
 
 
 __all__ = ["lookup_indices", "test_lookup_indices"]
@@ -43,6 +43,7 @@ FX = "f4" if FTYPE == np.float32 else "f8"
     [f"({FX}[:], {FX}[:], i8[:])"],
     "(), (j) -> ()",
     target=TARGET,
+    cache=NUMBA_CACHE,
 )
 def lookup_indices_vectorized_1d(sample_x, bin_edges_x, out):
     """Lookup bin indices for sample_x values, where binning is defined by
@@ -54,6 +55,7 @@ def lookup_indices_vectorized_1d(sample_x, bin_edges_x, out):
     [f"({FX}[:], {FX}[:], {FX}[:], {FX}[:], i8[:])"],
     "(), (), (a), (b) -> ()",
     target=TARGET,
+    cache=NUMBA_CACHE,
 )
 def lookup_indices_vectorized_2d(sample_x, sample_y, bin_edges_x, bin_edges_y, out):
     """Same as above, except we get back the index"""
@@ -78,6 +80,7 @@ def lookup_indices_vectorized_2d(sample_x, sample_y, bin_edges_x, bin_edges_y, o
     [f"({FX}[:], {FX}[:], {FX}[:], {FX}[:], {FX}[:], {FX}[:], i8[:])"],
     "(), (), (), (a), (b), (c) -> ()",
     target=TARGET,
+    cache=NUMBA_CACHE,
 )
 def lookup_indices_vectorized_3d(
     sample_x, sample_y, sample_z, bin_edges_x, bin_edges_y, bin_edges_z, out
@@ -123,7 +126,9 @@ def lookup_indices(sample, binning):
 
     Notes
     -----
-    this method works for 1d, 2d and 3d histogram only
+    1d, 2d and 3d binnings are handled by dedicated kernels; for higher
+    dimensionalities, the indices are found for each dimension separately and
+    combined
 
     """
     # Convert non-MultiDimBinning objects into MultiDimBinning if possible;
@@ -144,11 +149,7 @@ def lookup_indices(sample, binning):
     }
 
     if binning.num_dims not in lookup_funcs:
-        raise NotImplementedError(
-            "binning must have num_dims in {}; got {}".format(
-                sorted(lookup_funcs.keys()), binning.num_dims
-            )
-        )
+        return _lookup_indices_nd(sample, binning)
 
     lookup_func = lookup_funcs[binning.num_dims]
 
@@ -169,6 +170,23 @@ def lookup_indices(sample, binning):
     return indices
 
 
+def _lookup_indices_nd(sample, binning):
+    """Combine the indices of `sample` in each dimension of `binning` into
+    flat indices, following the conventions of `lookup_indices`"""
+    indices = np.zeros(len(sample[0]), dtype=np.int64)
+    underflow = np.zeros(len(sample[0]), dtype=bool)
+    overflow = np.zeros(len(sample[0]), dtype=bool)
+    for dim_sample, dim in zip(sample, binning):
+        dim_indices = lookup_indices([dim_sample], dim).get("host")
+        underflow |= dim_indices == -1
+        overflow |= dim_indices == dim.num_bins
+        indices *= dim.num_bins
+        indices += dim_indices
+    indices[overflow] = binning.size
+    indices[underflow] = -1
+    return SmartArray(indices)
+
+
 def test_lookup_indices():
     """Unit tests for `lookup_indices` function"""
 
@@ -245,6 +263,18 @@ def test_lookup_indices():
     ref = np.array([-1, 0, 11, 51, 54, 56, 52])
     assert np.array_equal(test, ref), "test={} != ref={}".format(test, ref)
 
+    # 4D case: same flattening as above; an underflow in any dimension
+    # takes precedence over an overflow in another
+    #
+    w = SmartArray(np.array([0.5, 0.5, 2.5, 1.5, 0.5, 2.5, -1.0], dtype=FTYPE))
+    binning_w = OneDimBinning(name="w", num_bins=3, is_lin=True, domain=[0, 3])
+    binning_4d = binning_3d * binning_w
+    logging.trace("TEST 4D:")
+    indices = lookup_indices([x, y, z, w], binning_4d)
+    test = indices.get()
+    ref = np.array([-1, 0, 35, 154, 162, 168, -1])
+    assert np.array_equal(test, ref), "test={} != ref={}".format(test, ref)
+
     logging.info("<< PASS : test_lookup_indices >>")
 
 
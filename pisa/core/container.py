@@ -16,10 +16,12 @@ from itertools import chain
 import numpy as np
 from numba import SmartArray
 
-from pisa import FTYPE
+from pisa import FTYPE, TARGET
 from pisa.core.binning import OneDimBinning, MultiDimBinning
+from pisa.core.bin_indexing import lookup_indices
 from pisa.core.map import Map, MapSet
-from pisa.core.translation import histogram, lookup, resample
+from pisa.core.translation import (histogram, histogram_from_indices, lookup,
+                                   lookup_from_indices, resample_from_indices)
 from pisa.utils.comparisons import ALLCLOSE_KW
 from pisa.utils.log import logging
 
@@ -47,6 +49,9 @@ class ContainerSet(object):
             self.add_container(container)
         self._data_specs = None
         self.data_specs = data_specs
+        self.key_versions = {}
+        """Number of times each key has been recomputed (by a stage), such that
+        downstream stages can tell whether their inputs have changed"""
 
     def add_container(self, container):
         if container.name in self.names:
@@ -116,6 +121,32 @@ class ContainerSet(object):
             c.unlink()
         self.linked_containers = []
 
+    def mark_recomputed(self, keys):
+        """Increment the version of each of `keys`, signalling to downstream
+        stages that the data stored under these keys has changed
+
+        Parameters
+        ----------
+        keys : iterable of str
+
+        """
+        for key in keys:
+            self.key_versions[key] = self.key_versions.get(key, 0) + 1
+
+    def get_key_versions(self, keys):
+        """Get the versions of `keys` (0 for keys that were never recomputed)
+
+        Parameters
+        ----------
+        keys : iterable of str
+
+        Returns
+        -------
+        versions : tuple of int
+
+        """
+        return tuple(self.key_versions.get(key, 0) for key in keys)
+
     def __getitem__(self, key):
         if key in self.names:
             return self.containers[self.names.index(key)]
@@ -233,6 +264,12 @@ class Container(object):
         self.binned_data = OrderedDict()
         self.data_specs = data_specs
         self.linked = False
+        self.bin_indices = OrderedDict()
+        """Binning hash : flat bin indices of the events (see
+        `get_bin_indices`)"""
+        self.resample_indices = OrderedDict()
+        """(old binning hash, new binning hash) : flat bin indices of the bin
+        centers of each binning in the other one (see `resample`)"""
 
     @property
     def data_mode(self):
@@ -273,7 +310,7 @@ class Container(object):
         """
         self.scalar_data[key] = data
 
-    def add_array_data(self, key, data):
+    def add_array_data(self, key, data, copy=True):
         """
         Parameters
         ----------
@@ -282,13 +319,18 @@ class Container(object):
 
         data : ndarray
 
+        copy : bool
+            Whether to copy `data` (if an ndarray); otherwise, the container
+            shares its memory (e.g. of a memory-mapped file)
+
         """
         if isinstance(data, np.ndarray):
-            data = SmartArray(data)
+            data = SmartArray(data, copy=copy)
         if self.array_length is None:
             self.array_length = data.get('host').shape[0]
         assert data.get('host').shape[0] == self.array_length
         self.array_data[key] = data
+        self.invalidate_bin_indices([key])
 
     def add_binned_data(self, key, data, flat=True):
         """Add data to binned_data
@@ -383,12 +425,50 @@ class Container(object):
         # TODO: make work for n-dim
         logging.debug('Transforming %s array to binned data'%(key))
         weights = self.array_data[key]
-        sample = [self.array_data[n] for n in binning.names]
 
-        hist = histogram(sample, weights, binning, averaged)
+        if TARGET == 'cuda' and binning.num_dims in [2, 3]:
+            sample = [self.array_data[n] for n in binning.names]
+            hist = histogram(sample, weights, binning, averaged)
+        else:
+            hist = histogram_from_indices(
+                self.get_bin_indices(binning), weights, binning.size, averaged
+            )
 
         self.add_binned_data(key, (binning, hist))
 
+    def get_bin_indices(self, binning):
+        """Get the flat index of the bin in `binning` each event falls into
+        (see `pisa.core.bin_indexing.lookup_indices`).
+
+        The indices are computed once per binning and cached until the array
+        data of one of the binning dimensions is replaced (via
+        `add_array_data`) or `invalidate_bin_indices` is called.
+
+        Parameters
+        ----------
+        binning : MultiDimBinning
+
+        Returns
+        -------
+        indices : SmartArray of ints
+
+        """
+        if binning.hash not in self.bin_indices:
+            sample = [self.array_data[n] for n in binning.names]
+            self.bin_indices[binning.hash] = (
+                binning.names, lookup_indices(sample, binning)
+            )
+        return self.bin_indices[binning.hash][1]
+
+    def invalidate_bin_indices(self, keys=None):
+        """Drop the cached bin indices of binnings that have any of `keys`
+        as dimension (all cached bin indices if `keys` is None), which must
+        be done whenever the event arrays of these keys are modified in
+        place"""
+        for binning_hash, (names, _) in list(self.bin_indices.items()):
+            if keys is None or any(key in names for key in keys):
+                del self.bin_indices[binning_hash]
+
     def binned_to_array(self, key):
         """Augmented binned data to array data"""
         try:
@@ -400,8 +480,13 @@ class Container(object):
             else:
                 raise ValueError('Key `%s` does not exist in container `%s`'%(key, self.name))
         logging.debug('Transforming %s binned to array data'%(key))
-        sample = [self.array_data[n] for n in binning.names]
-        self.add_array_data(key, lookup(sample, hist, binning))
+        if TARGET == 'cuda' and binning.num_dims in [2, 3]:
+            sample = [self.array_data[n] for n in binning.names]
+            self.add_array_data(key, lookup(sample, hist, binning))
+        else:
+            self.add_array_data(
+                key, lookup_from_indices(self.get_bin_indices(binning), hist)
+            )
 
     def binned_to_binned(self, key, new_binning):
         """Resample a binned key into a different binning
@@ -416,12 +501,42 @@ class Container(object):
         """
         logging.debug('Resampling %s'%(key))
         old_binning, hist = self.binned_data[key]
-        sample = [self.get_binned_data(name, old_binning) for name in old_binning.names]
-        new_sample = [SmartArray(self.unroll_binning(name, new_binning)) for name in new_binning.names]
-        hist = resample(hist, sample, old_binning, new_sample, new_binning)
+        hist = self.resample(hist, old_binning, new_binning)
 
         self.add_binned_data(key, (new_binning, hist))
 
+    def resample(self, hist, old_binning, new_binning):
+        """Resample `hist` from `old_binning` into `new_binning` (see
+        `pisa.core.translation.resample_from_indices`), evaluating the bin
+        centers of either binning in the other one only once per pair of
+        binnings
+
+        Parameters
+        ----------
+        hist : SmartArray
+
+        old_binning, new_binning : MultiDimBinning
+
+        Returns
+        -------
+        new_hist : SmartArray
+
+        """
+        if old_binning.names != new_binning.names:
+            raise ValueError(
+                f'cannot translate betwen {old_binning} and {new_binning}'
+            )
+        key = (old_binning.hash, new_binning.hash)
+        if key not in self.resample_indices:
+            old_sample = [self.unroll_binning(name, old_binning) for name in old_binning.names]
+            new_sample = [self.unroll_binning(name, new_binning) for name in new_binning.names]
+            self.resample_indices[key] = (
+                lookup_indices(old_sample, new_binning).get('host'),
+                lookup_indices(new_sample, old_binning).get('host'),
+            )
+        old_indices, new_indices = self.resample_indices[key]
+        return resample_from_indices(old_indices, new_indices, hist)
+
     def scalar_to_array(self, key):
         raise NotImplementedError()
 
@@ -453,9 +568,7 @@ class Container(object):
         if out_binning is not None:
             if not binning == out_binning:
                 logging.warning('Automatically re-beinning data %s'%key)
-                sample = [SmartArray(self.unroll_binning(name, binning)) for name in binning.names]
-                new_sample = [SmartArray(self.unroll_binning(name, out_binning)) for name in out_binning.names]
-                return resample(data, sample, binning, new_sample, out_binning)
+                return self.resample(data, binning, out_binning)
         return data
 
     @staticmethod
@@ -557,6 +670,11 @@ def test_container_set():
     else:
         raise Exception('identical containers added to a containerset, this should not be possible')
 
+    assert data.get_key_versions(['x', 'y']) == (0, 0)
+    data.mark_recomputed(['x'])
+    data.mark_recomputed(['x'])
+    assert data.get_key_versions(['x', 'y']) == (2, 0)
+
 
 if __name__ == '__main__':
     test_container()
@@ -28,6 +28,7 @@ from pisa.utils.config_parser import PISAConfigParser
 from pisa.utils.fileio import expand, mkdir, to_file
 from pisa.utils.hash import hash_obj
 from pisa.utils.log import set_verbosity, logging
+from pisa.utils.parallel import PipelineExecutor
 from pisa.utils.random_numbers import get_random_state
 
 
@@ -46,8 +47,18 @@ class Detectors(object):
         
     shared_params : Parameter to be treated the same way in all the
         distribution_makers that contain them.
+
+    parallel : None, 'threads' or 'processes', optional
+        If not None, evaluate the (independent) detectors concurrently in
+        `get_outputs`, `get_output_arrays` and `get_output_grads`, see
+        `pisa.utils.parallel.PipelineExecutor`.
+
+    num_parallel : int or None, optional
+        Number of threads if `parallel` is 'threads'; default is one per
+        detector.
     """
-    def __init__(self, pipelines, label=None, shared_params=None):
+    def __init__(self, pipelines, label=None, shared_params=None,
+                 parallel=None, num_parallel=None):
         self.label = label
         self._source_code_hash = None
         
@@ -85,6 +96,13 @@ class Detectors(object):
                     n += 1
             if n < 2:
                 raise NameError('Shared param %s only a free param in less than 2 detectors.' % sp)
+
+        self._executor = None
+        if parallel is not None and len(self._distribution_makers) > 1:
+            self._executor = PipelineExecutor(
+                self._distribution_makers, kind=parallel,
+                num_parallel=num_parallel
+            )
             
     def __iter__(self):
         return iter(self._distribution_makers)
@@ -102,9 +120,56 @@ class Detectors(object):
         List of MapSets if `return_sum=True` or list of lists of MapSets if `return_sum=False`
 
         """
+        if self._executor is not None:
+            return self._executor.get_outputs(**kwargs)
         outputs = [distribution_maker.get_outputs(**kwargs) for distribution_maker in self]
         return outputs
 
+    def get_output_grads(self, **kwargs):
+        """Compute the derivatives of the outputs w.r.t. params analytically.
+
+        Parameters
+        ----------
+        **kwargs
+            Passed on to each distribution_maker's `get_output_grads` method.
+
+        Returns
+        -------
+        List of OrderedDicts (one per detector), see
+        `DistributionMaker.get_output_grads`
+
+        """
+        if self._executor is not None:
+            return self._executor.call('get_output_grads', **kwargs)
+        return [distribution_maker.get_output_grads(**kwargs) for distribution_maker in self]
+
+    @property
+    def output_arrays_available(self):
+        """bool : whether `get_output_arrays` can be used (see
+        `Pipeline.output_arrays_available`)"""
+        return all(
+            distribution_maker.output_arrays_available
+            for distribution_maker in self
+        )
+
+    def get_output_arrays(self, **kwargs):
+        """Compute and return the outputs as plain float arrays.
+
+        Parameters
+        ----------
+        **kwargs
+            Passed on to each distribution_maker's `get_output_arrays` method.
+
+        Returns
+        -------
+        List (one entry per detector), see
+        `DistributionMaker.get_output_arrays`
+
+        """
+        if self._executor is not None:
+            return self._executor.call('get_output_arrays', **kwargs)
+        return [distribution_maker.get_output_arrays(**kwargs) for distribution_maker in self]
+
     def update_params(self, params):
         for distribution_maker in self:
             distribution_maker.update_params(params)
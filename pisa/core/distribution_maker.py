@@ -10,7 +10,7 @@ from __future__ import absolute_import
 from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
 from collections import OrderedDict
 from collections.abc import Mapping
-from functools import reduce
+from copy import deepcopy
 import inspect
 from itertools import product
 import os
@@ -18,14 +18,16 @@ import os
 import numpy as np
 
 from pisa import ureg
-from pisa.core.map import MapSet
+from pisa.core.map import MapSet, sum_maps
 from pisa.core.pipeline import Pipeline
 from pisa.core.param import ParamSet
 from pisa.utils.config_parser import PISAConfigParser
 from pisa.utils.fileio import expand, mkdir, to_file
 from pisa.utils.hash import hash_obj
 from pisa.utils.log import set_verbosity, logging
+from pisa.utils.parallel import PipelineExecutor
 from pisa.utils.random_numbers import get_random_state
+from pisa.utils.stats import ARRAY_METRICS, array_metric_total
 
 
 __all__ = ['DistributionMaker', 'test_DistributionMaker', 'parse_args', 'main']
@@ -69,6 +71,15 @@ class DistributionMaker(object):
         checked for consistency (you should use multiple `Detector`s if you
         have incompatible data sets).
 
+    parallel : None, 'threads' or 'processes', optional
+        If not None, evaluate the (independent) pipelines concurrently in
+        `get_outputs`, `get_output_arrays` and `get_output_grads`, see
+        `pisa.utils.parallel.PipelineExecutor`.
+
+    num_parallel : int or None, optional
+        Number of threads if `parallel` is 'threads'; default is one per
+        pipeline.
+
     Notes
     -----
     Free params with the same name in two pipelines are updated at the same
@@ -85,7 +96,8 @@ class DistributionMaker(object):
     intervals are non-physical.
 
     """
-    def __init__(self, pipelines, label=None, set_livetime_from_data=True):
+    def __init__(self, pipelines, label=None, set_livetime_from_data=True,
+                 parallel=None, num_parallel=None):
 
         self.label = label
         self._source_code_hash = None
@@ -177,6 +189,12 @@ class DistributionMaker(object):
 
             self._detector_name = name
 
+        self._executor = None
+        if parallel is not None and len(self._pipelines) > 1:
+            self._executor = PipelineExecutor(
+                self._pipelines, kind=parallel, num_parallel=num_parallel
+            )
+
     def __iter__(self):
         return iter(self._pipelines)
 
@@ -200,17 +218,226 @@ class DistributionMaker(object):
         MapSet if `return_sum=True` or list of MapSets if `return_sum=False`
 
         """
-        outputs = [pipeline.get_outputs(**kwargs) for pipeline in self] # pylint: disable=redefined-outer-name
+        if self._executor is not None:
+            outputs = self._executor.get_outputs(**kwargs)
+        else:
+            outputs = [pipeline.get_outputs(**kwargs) for pipeline in self] # pylint: disable=redefined-outer-name
         if return_sum:
-            if len(outputs) > 1:
-                outputs = reduce(lambda x, y: sum(x) + sum(y), outputs)
-            else:
-                outputs = sum(sum(outputs))
-            outputs.name = sum_map_name
-            outputs.tex = sum_map_tex_name
-            outputs = MapSet(outputs)
+            outputs = MapSet(sum_maps(
+                [m for mapset in outputs for m in mapset],
+                name=sum_map_name,
+                tex=sum_map_tex_name,
+            ))
+        return outputs
+
+    @property
+    def output_arrays_available(self):
+        """bool : whether `get_output_arrays` can be used (see
+        `Pipeline.output_arrays_available`)"""
+        return all(pipeline.output_arrays_available for pipeline in self)
+
+    def get_output_arrays(self, return_sum=False):
+        """Compute and return the outputs as plain float arrays, see
+        `Pipeline.get_output_arrays`.
+
+        Parameters
+        ----------
+        return_sum : bool
+            If True, add up the outputs of all containers of all pipelines
+            (as `get_outputs` does for Maps). Otherwise, return a list with
+            one OrderedDict per pipeline.
+
+        Returns
+        -------
+        (nominal, sumw2) if `return_sum=True` or list of OrderedDicts if
+        `return_sum=False`. `sumw2` is None if no pipeline outputs errors.
+
+        """
+        if self._executor is not None:
+            outputs = self._executor.call('get_output_arrays')
+        else:
+            outputs = [pipeline.get_output_arrays() for pipeline in self]
+        if not return_sum:
+            return outputs
+
+        nominal = None
+        sumw2 = None
+        for arrays in outputs:
+            for container_nominal, container_sumw2 in arrays.values():
+                if nominal is None:
+                    nominal = container_nominal.copy()
+                else:
+                    nominal += container_nominal
+                if container_sumw2 is None:
+                    continue
+                if sumw2 is None:
+                    sumw2 = container_sumw2.copy()
+                else:
+                    sumw2 += container_sumw2
+        return nominal, sumw2
+
+    def get_output_grads(self, param_names=None, return_sum=False,
+                         sum_map_name='total', sum_map_tex_name='Total'):
+        """Compute the derivatives of the outputs w.r.t. params analytically;
+        see `Pipeline.get_output_grads`. Must be called after `get_outputs`
+        with the current param values.
+
+        Parameters
+        ----------
+        param_names : None or sequence of str
+            Params to differentiate w.r.t.; defaults to all free params
+
+        return_sum : bool
+            If True, add up the derivatives of all Maps in all MapSets, as
+            `get_outputs` does for the outputs. Otherwise, return a list of
+            MapSets (one per pipeline) for each param.
+
+        Returns
+        -------
+        grads : OrderedDict
+            Param name : MapSet (or list of MapSets) with the derivatives, or
+            None if no analytic derivatives are available for the param in
+            any of the pipelines using it
+
+        """
+        if param_names is None:
+            param_names = self.params.free.names
+        param_names = list(param_names)
+        for name in param_names:
+            if not any(name in pipeline.params.names for pipeline in self):
+                raise ValueError('No pipeline has a param named "%s"' % name)
+
+        # In 'processes' mode, only the workers' pipelines hold the weights
+        # of the last `get_outputs` call, so the derivatives are computed
+        # there as well
+        if self._executor is not None:
+            pipeline_grads = self._executor.call(
+                'get_output_grads', param_names=param_names
+            )
+        else:
+            pipeline_grads = [
+                pipeline.get_output_grads(param_names) for pipeline in self
+            ]
+
+        grads = OrderedDict()
+        for name in param_names:
+            outputs = [pg[name] for pg in pipeline_grads]
+            if any(mapset is None for mapset in outputs):
+                grads[name] = None
+                continue
+            if return_sum:
+                total = sum([sum(mapset) for mapset in outputs])
+                total.name = sum_map_name
+                total.tex = sum_map_tex_name
+                outputs = MapSet(total)
+            grads[name] = outputs
+        return grads
+
+    def get_outputs_multi(self, values, rescaled=False, reorder=True,
+                          **kwargs):
+        """Compute and return the outputs for several free-param vectors.
+
+        This sets each vector of free param values in turn and calls
+        `get_outputs`, i.e. each point is computed separately. Points are
+        (optionally) visited in an order in which the params of upstream
+        stages change as rarely as possible, such that stages whose params are
+        unchanged since the previous point return their cached results.
+
+        The free params are restored to their original values afterwards.
+
+        Parameters
+        ----------
+        values : sequence of sequences, shape (K, len(self.params.free))
+            Each row is one vector of free param values, in the order of
+            `self.params.free.names`.
+
+        rescaled : bool
+            If True, `values` are [0, 1]-rescaled, dimensionless values as
+            used by the minimizer (see `_set_rescaled_free_params`). Otherwise
+            values are quantities (or floats for dimensionless params) as
+            passed to `set_free_params`.
+
+        reorder : bool
+            Visit the points in the order described above. Outputs are always
+            returned in the order of `values`.
+
+        **kwargs
+            Passed on to `get_outputs`.
+
+        Returns
+        -------
+        outputs : list of length K
+            One entry per row in `values`, each being what `get_outputs`
+            returns for that point
+
+        """
+        free_params = self.params.free
+        values = list(values)
+        for vals in values:
+            if len(vals) != len(free_params):
+                raise ValueError(
+                    'Each row of `values` must have %d entries (one per free'
+                    ' param), got %d' % (len(free_params), len(vals))
+                )
+
+        if reorder and len(values) > 1:
+            order = self._multi_order(values, rescaled=rescaled)
+        else:
+            order = range(len(values))
+
+        orig_values = [p.value for p in free_params]
+        outputs = [None] * len(values)
+        try:
+            for idx in order:
+                if rescaled:
+                    self._set_rescaled_free_params(values[idx])
+                else:
+                    self.set_free_params(values[idx])
+                # Outputs can share memory with the pipelines' data, which is
+                # overwritten by the next point, so keep an independent copy
+                outputs[idx] = deepcopy(self.get_outputs(**kwargs))
+        finally:
+            self.set_free_params(orig_values)
+
         return outputs
 
+    def _multi_order(self, values, rescaled=False):
+        """Order in which to evaluate the points in `values` such that
+        consecutive points tend to share the values of upstream params.
+
+        Points are sorted lexicographically, with the free params ordered by
+        the first position (stage index in any pipeline) at which they are
+        used; i.e. the param of the most upstream stage varies slowest.
+
+        """
+        free_names = self.params.free.names
+        first_use = OrderedDict((name, np.inf) for name in free_names)
+        for pipeline in self:
+            for stage_idx, stage in enumerate(pipeline):
+                for name in stage.params.names:
+                    if name in first_use:
+                        first_use[name] = min(first_use[name], stage_idx)
+
+        free_params = self.params.free
+        columns = []
+        for param_idx, param in enumerate(free_params):
+            if rescaled:
+                col = [float(vals[param_idx]) for vals in values]
+            else:
+                col = [
+                    val.m_as(param.units) if isinstance(val, ureg.Quantity)
+                    else float(val)
+                    for val in (vals[param_idx] for vals in values)
+                ]
+            columns.append(col)
+
+        # `np.lexsort` uses the *last* key as the primary one
+        upstream_first = sorted(
+            range(len(free_names)), key=lambda i: first_use[free_names[i]]
+        )
+        keys = [columns[i] for i in reversed(upstream_first)]
+        return list(np.lexsort(keys))
+
     def update_params(self, params):
         for pipeline in self:
             pipeline.update_params(params)
@@ -410,6 +637,114 @@ def test_DistributionMaker():
         #current_hier = new_hier
         #current_mat = new_mat
 
+    #
+    # Test: get_outputs_multi gives the same as evaluating point by point
+    #
+
+    free_params = dm.params.free
+    nominal_rvals = free_params._rescaled_values # pylint: disable=protected-access
+    rvals_multi = [
+        [0.2] * len(free_params),
+        [0.7] * len(free_params),
+        list(nominal_rvals),
+        [0.2] * (len(free_params) - 1) + [0.9],
+    ]
+    multi_outputs = dm.get_outputs_multi(
+        rvals_multi, rescaled=True, return_sum=True
+    )
+    assert dm.params.free._rescaled_values == nominal_rvals # pylint: disable=protected-access
+    for rvals, multi_output in zip(rvals_multi, multi_outputs):
+        dm._set_rescaled_free_params(rvals) # pylint: disable=protected-access
+        output = dm.get_outputs(return_sum=True)
+        assert np.allclose(
+            multi_output['total'].nominal_values,
+            output['total'].nominal_values,
+            rtol=1e-10,
+        )
+    dm.reset_free()
+
+    #
+    # Test: analytic derivatives of the outputs agree with finite differences
+    #
+
+    dm.get_outputs(return_sum=True)
+    grads = dm.get_output_grads(return_sum=True)
+    assert set(grads.keys()) == set(dm.params.free.names)
+    num_checked = 0
+    for name, grad in grads.items():
+        if grad is None:
+            continue
+        param = dm.params[name]
+        nominal_value = param.value
+        step = 1e-5 * max(abs(nominal_value.m), 1)
+        outputs = []
+        for sgn in (+1, -1):
+            param.value = nominal_value + sgn * step * param.units
+            dm.update_params(param)
+            outputs.append(dm.get_outputs(return_sum=True)['total'].nominal_values)
+        param.value = nominal_value
+        dm.update_params(param)
+        num_grad = (outputs[0] - outputs[1]) / (2 * step)
+        assert np.allclose(grad['total'].nominal_values, num_grad,
+                           rtol=1e-5, atol=1e-8 * np.max(np.abs(num_grad))), name
+        num_checked += 1
+    assert num_checked > 0
+    dm.reset_free()
+
+    #
+    # Test: concurrent evaluation of the pipelines gives the same outputs
+    #
+
+    free_params = dm.params.free
+    rvals = [0.3] * len(free_params)
+    sdm = DistributionMaker(
+        ['settings/pipeline/example.cfg', 'settings/pipeline/example.cfg']
+    )
+    sdm._set_rescaled_free_params(rvals) # pylint: disable=protected-access
+    ref = sdm.get_outputs(return_sum=True)['total']
+    ref_grads = sdm.get_output_grads(return_sum=True)
+    ref_arrays = sdm.get_output_arrays(return_sum=True)
+    for parallel in ['threads', 'processes']:
+        pdm = DistributionMaker(
+            ['settings/pipeline/example.cfg', 'settings/pipeline/example.cfg'],
+            parallel=parallel,
+        )
+        pdm._set_rescaled_free_params(rvals) # pylint: disable=protected-access
+        output = pdm.get_outputs(return_sum=True)['total']
+        assert np.allclose(output.nominal_values, ref.nominal_values,
+                           rtol=1e-12), parallel
+        assert np.allclose(output.std_devs, ref.std_devs, rtol=1e-12), parallel
+        grads = pdm.get_output_grads(return_sum=True)
+        for name, ref_grad in ref_grads.items():
+            if ref_grad is None:
+                assert grads[name] is None, (parallel, name)
+                continue
+            assert np.allclose(grads[name]['total'].nominal_values,
+                               ref_grad['total'].nominal_values,
+                               rtol=1e-12), (parallel, name)
+        arrays = pdm.get_output_arrays(return_sum=True)
+        for array, ref_array in zip(arrays, ref_arrays):
+            assert np.allclose(array, ref_array, rtol=1e-12), parallel
+        pdm._executor.close() # pylint: disable=protected-access
+    dm.reset_free()
+
+    #
+    # Test: output arrays agree with the outputs' Maps and give the same
+    # metrics
+    #
+
+    assert dm.output_arrays_available
+    output = dm.get_outputs(return_sum=True)['total']
+    nominal, sumw2 = dm.get_output_arrays(return_sum=True)
+    assert np.allclose(nominal, output.nominal_values.ravel(), rtol=1e-12)
+    assert np.allclose(sumw2, output.std_devs.ravel()**2, rtol=1e-12)
+    data = output.fluctuate(method='poisson', random_state=0)
+    for metric in ARRAY_METRICS:
+        ref = data.metric_total(expected_values=output, metric=metric)
+        val = array_metric_total(data.nominal_values, nominal, metric,
+                                 expected_sumw2=sumw2)
+        assert np.isclose(val, ref, rtol=1e-10), (metric, val, ref)
+
 
 def parse_args():
     """Get command line arguments"""
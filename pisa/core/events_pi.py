@@ -6,13 +6,17 @@ import argparse
 from collections.abc import Mapping, Iterable
 from collections import OrderedDict
 import copy
+import os
+import shutil
 
 import numpy as np
 
 from pisa import FTYPE
 from pisa.core.binning import OneDimBinning, MultiDimBinning
-from pisa.utils.fileio import from_file
+from pisa.utils.fileio import from_file, mkdir
+from pisa.utils.jsons import from_json, to_json
 from pisa.utils.log import logging
+from pisa.utils.resources import find_resource
 
 
 __all__ = [
@@ -20,9 +24,14 @@ __all__ = [
     "NU_INTERACTIONS",
     "OUTPUT_NUFLAVINT_KEYS",
     "LEGACY_FLAVKEY_XLATION",
+    "COLUMNAR_EVENTS_INDEX",
     "EventsPi",
     "split_nu_events_by_flavor_and_interaction",
     "fix_oppo_flux",
+    "is_columnar_events",
+    "write_columnar_events",
+    "open_columnar_events",
+    "test_columnar_events",
     "main",
 ]
 
@@ -65,6 +74,11 @@ LEGACY_FLAVKEY_XLATION = dict(
     nutau_bar="nutaubar",
 )
 
+COLUMNAR_EVENTS_INDEX = "columnar_events.json"
+"""Name of the index file identifying a directory as columnar events store"""
+
+COLUMNAR_EVENTS_VERSION = 1
+
 
 class EventsPi(OrderedDict):
     """
@@ -168,7 +182,16 @@ class EventsPi(OrderedDict):
                         " an iterable of strings"
                     )
 
-        if isinstance(events_file, str):
+        if isinstance(events_file, str) and is_columnar_events(events_file):
+            # Only open the variables that are actually used; these are
+            # memory-mapped, i.e. not read until accessed
+            variables = None
+            if variable_mapping is not None:
+                variables = set()
+                for src in variable_mapping.values():
+                    variables.update([src] if isinstance(src, str) else src)
+            input_data = open_columnar_events(events_file, variables=variables)
+        elif isinstance(events_file, str):
             input_data = from_file(events_file)
             if not isinstance(input_data, Mapping):
                 raise TypeError(
@@ -270,8 +293,12 @@ class EventsPi(OrderedDict):
                 array_data_to_stack = []
                 for var in var_src:
                     if var in input_data[data_key]:
+                        # Arrays loaded from a file are not shared with anything
+                        # else, so no need to copy them if already in FTYPE
                         array_data_to_stack.append(
-                            input_data[data_key][var].astype(FTYPE)
+                            input_data[data_key][var].astype(
+                                FTYPE, copy=not isinstance(events_file, str)
+                            )
                         )
                     else:
                         raise KeyError(
@@ -281,7 +308,10 @@ class EventsPi(OrderedDict):
 
                 # Note `squeeze` removes the extraneous 2nd dim in case of a
                 # single `src`
-                array_data = np.squeeze(np.stack(array_data_to_stack, axis=1))
+                if len(array_data_to_stack) == 1:
+                    array_data = np.squeeze(array_data_to_stack[0])
+                else:
+                    array_data = np.squeeze(np.stack(array_data_to_stack, axis=1))
 
                 # Add each array to the event
                 # TODO Memory copies?
@@ -538,6 +568,193 @@ def fix_oppo_flux(input_data):
             val["nominal_numubar_flux"] = val.pop("neutrino_oppo_numu_flux")
 
 
+def is_columnar_events(path):
+    """Whether `path` (a path or PISA resource) is a columnar events store as
+    written by `write_columnar_events`"""
+    path = find_resource(path, fail=False)
+    return (
+        path is not None
+        and os.path.isdir(path)
+        and os.path.isfile(os.path.join(path, COLUMNAR_EVENTS_INDEX))
+    )
+
+
+def write_columnar_events(events, output_dir, metadata=None, dtype=FTYPE,
+                          overwrite=False):
+    """Write events to a columnar events store, i.e. a directory with one
+    `.npy` file per variable per category (e.g. flavour-interaction) that can
+    be opened memory-mapped by `open_columnar_events`.
+
+    Parameters
+    ----------
+    events : mapping
+        Mapping of categories to mappings of variable names to arrays with one
+        entry (along the first axis) per event, e.g. an `EventsPi` object
+
+    output_dir : str
+        Directory to write to
+
+    metadata : mapping, optional
+        Stored along with the events; if None, use `events.metadata` if present
+
+    dtype : numpy dtype
+        All arrays are stored with this dtype, which should be the `FTYPE` used
+        when loading the events (otherwise they are converted when loaded)
+
+    overwrite : bool
+        Replace an existing store at `output_dir`
+
+    """
+    if metadata is None:
+        metadata = getattr(events, "metadata", None)
+
+    if os.path.exists(output_dir):
+        if not overwrite:
+            raise IOError('"%s" already exists' % output_dir)
+        if not is_columnar_events(output_dir):
+            raise IOError(
+                'Refusing to overwrite "%s", which is not a columnar events'
+                " store" % output_dir
+            )
+        shutil.rmtree(output_dir)
+    mkdir(output_dir, warn=False)
+
+    categories = OrderedDict()
+    for category, variables in events.items():
+        mkdir(os.path.join(output_dir, category), warn=False)
+        num_events = None
+        for var, array_data in variables.items():
+            array_data = np.asarray(array_data, dtype=dtype)
+            if num_events is None:
+                num_events = len(array_data)
+            elif len(array_data) != num_events:
+                raise ValueError(
+                    "Variable '%s' of '%s' has %d entries but expected %d"
+                    % (var, category, len(array_data), num_events)
+                )
+            np.save(
+                os.path.join(output_dir, category, var + ".npy"), array_data,
+                allow_pickle=False
+            )
+        categories[category] = OrderedDict(
+            [("num_events", num_events), ("variables", list(variables.keys()))]
+        )
+
+    # Write the index last, such that incomplete stores are not recognised
+    index = OrderedDict(
+        [
+            ("version", COLUMNAR_EVENTS_VERSION),
+            ("dtype", np.dtype(dtype).name),
+            ("categories", categories),
+            ("metadata", OrderedDict(metadata) if metadata else OrderedDict()),
+        ]
+    )
+    to_json(index, os.path.join(output_dir, COLUMNAR_EVENTS_INDEX))
+
+
+def open_columnar_events(events_dir, variables=None, mmap_mode="c"):
+    """Open a columnar events store written by `write_columnar_events`.
+
+    Parameters
+    ----------
+    events_dir : str
+        Path or PISA resource
+
+    variables : collection of str, optional
+        Only open these variables (if present); default is to open all
+
+    mmap_mode : None or str
+        Passed to `numpy.load`. The default, "c" (copy-on-write), maps the
+        files without reading them, and changes to the arrays are never
+        written back.
+
+    Returns
+    -------
+    events : OrderedDict
+        Mapping of categories to mappings of variable names to arrays, with the
+        metadata attached as `events.attrs` (as for HDF5 files)
+
+    """
+    events_dir = find_resource(events_dir)
+    index = from_json(os.path.join(events_dir, COLUMNAR_EVENTS_INDEX))
+    if index["version"] > COLUMNAR_EVENTS_VERSION:
+        raise ValueError(
+            'Columnar events store "%s" has version %d, can only read up to'
+            " %d" % (events_dir, index["version"], COLUMNAR_EVENTS_VERSION)
+        )
+
+    events = OrderedDict()
+    for category, info in index["categories"].items():
+        events[category] = OrderedDict()
+        for var in info["variables"]:
+            if variables is not None and var not in variables:
+                continue
+            events[category][var] = np.load(
+                os.path.join(events_dir, category, var + ".npy"),
+                mmap_mode=mmap_mode,
+                allow_pickle=False,
+            )
+    events.attrs = OrderedDict(index["metadata"])
+    return events
+
+
+def test_columnar_events():
+    """Unit tests for the columnar events store"""
+    import tempfile
+
+    events_file = (
+        "events/events__vlvnt__toy_1_to_80GeV_spidx1.0_cz-1_to_1_1e2evts_set0"
+        "__unjoined__with_fluxes_honda-2015-spl-solmin-aa.hdf5"
+    )
+    variable_mapping = OrderedDict(
+        [
+            ("true_energy", "true_energy"),
+            ("true_coszen", "true_coszen"),
+            ("nominal_flux", ["nominal_nue_flux", "nominal_numu_flux"]),
+        ]
+    )
+    ref_events = EventsPi(name="ref")
+    ref_events.load_events_file(events_file, variable_mapping=variable_mapping)
+
+    all_events = EventsPi(name="all")
+    all_events.load_events_file(events_file)
+
+    testdir = tempfile.mkdtemp()
+    try:
+        events_dir = os.path.join(testdir, "events")
+        write_columnar_events(all_events, events_dir)
+        assert is_columnar_events(events_dir)
+        try:
+            write_columnar_events(all_events, events_dir)
+        except IOError:
+            pass
+        else:
+            raise AssertionError("existing store overwritten")
+
+        # Only the requested variables are opened, and memory-mapped
+        opened = open_columnar_events(events_dir, variables=["true_energy"])
+        assert list(opened.keys()) == list(all_events.keys())
+        for category in opened.values():
+            assert list(category.keys()) == ["true_energy"]
+            assert isinstance(category["true_energy"], np.memmap)
+
+        events = EventsPi(name="columnar")
+        events.load_events_file(events_dir, variable_mapping=variable_mapping)
+        assert events.metadata == all_events.metadata
+        assert list(events.keys()) == list(ref_events.keys())
+        for key, variables in ref_events.items():
+            assert list(events[key].keys()) == list(variables.keys())
+            for var, array_data in variables.items():
+                assert events[key][var].dtype == FTYPE
+                assert np.array_equal(events[key][var], array_data)
+            # Single-source variables are not copied
+            assert isinstance(events[key]["true_energy"], np.memmap)
+    finally:
+        shutil.rmtree(testdir, ignore_errors=True)
+
+    logging.info("<< PASS : test_columnar_events >>")
+
+
 def main():
     """Load an events file and print the contents"""
     parser = argparse.ArgumentParser(description="Events parsing")
@@ -549,6 +766,13 @@ def main():
     parser.add_argument(
         "-i", "--input-file", type=str, required=True, help="Input HDF5 events file"
     )
+    parser.add_argument(
+        "--columnar-output-dir",
+        type=str,
+        default=None,
+        help="""Convert the events to a columnar events store (one memory-mappable
+        file per variable per category) in this directory""",
+    )
     args = parser.parse_args()
 
     events = EventsPi(neutrinos=args.neutrinos)
@@ -560,6 +784,10 @@ def main():
     print(events.metadata)
     print(events)
 
+    if args.columnar_output_dir is not None:
+        write_columnar_events(events, args.columnar_output_dir)
+        logging.info("Wrote columnar events to : %s", args.columnar_output_dir)
+
 
 if __name__ == "__main__":
     main()
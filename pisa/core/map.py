@@ -23,7 +23,6 @@ import tempfile
 
 from decorator import decorate
 import numpy as np
-from scipy.stats import poisson, norm
 from six import string_types
 import uncertainties
 from uncertainties import ufloat
@@ -44,7 +43,7 @@ from pisa.utils import stats
 
 
 __all__ = ['type_error', 'reduceToHist', 'rebin', 'valid_nominal_values',
-           'Map', 'MapSet', 'test_Map', 'test_MapSet']
+           'sum_maps', 'Map', 'MapSet', 'test_Map', 'test_MapSet']
 
 __author__ = 'J.L. Lanfranchi'
 
@@ -210,6 +209,51 @@ def valid_nominal_values(data_array):
     return np.ma.masked_invalid(unp.nominal_values(data_array))
 
 
+def sum_maps(maps, name=None, tex=None):
+    """Add up Maps with the same binning bin by bin.
+
+    Equivalent to `sum(maps)` for maps with independent uncertainties, but the
+    nominal values and variances are accumulated as plain arrays instead of
+    propagating the uncertainties through one addition per map.
+
+    Parameters
+    ----------
+    maps : iterable of Map
+    name, tex : str or None
+        Name and tex of the sum; default is that of the first map
+
+    Returns
+    -------
+    total : Map
+
+    """
+    maps = list(maps)
+    if len(maps) == 0:
+        raise ValueError('Need at least one Map to sum.')
+    binning = maps[0].binning
+    dtypes = [np.float64 if m.hist.dtype == np.object else m.hist.dtype
+              for m in maps]
+    nominal = np.zeros(binning.shape, dtype=np.result_type(np.float32, *dtypes))
+    variance = None
+    for m in maps:
+        if m.binning.shape != binning.shape:
+            raise ValueError('Cannot sum maps of shapes %s and %s'
+                             % (binning.shape, m.binning.shape))
+        nominal += unp.nominal_values(m.hist)
+        if m.hist.dtype == np.object:
+            if variance is None:
+                variance = np.zeros_like(nominal)
+            variance += unp.std_devs(m.hist)**2
+    hist = nominal if variance is None else unp.uarray(nominal, np.sqrt(variance))
+    return Map(
+        name=maps[0].name if name is None else name,
+        tex=maps[0].tex if tex is None else tex,
+        hist=hist,
+        binning=binning,
+        full_comparison=any(m.full_comparison for m in maps),
+    )
+
+
 # TODO: implement strategies for decreasing dimensionality (i.e.
 # projecting map onto subset of dimensions in the original map)
 
@@ -964,6 +1008,9 @@ class Map(object):
         ..  [1] Bohm & Zech, "Statistics of weighted Poisson events and its applications" (2013),
             https://arxiv.org/abs/1309.1287
         """
+        # scipy.stats is slow to import and only needed here
+        from scipy.stats import poisson, norm
+
         orig = method
         method = str(method).strip().lower().replace(' ', '')
         if method == 'poisson':
@@ -1478,8 +1525,9 @@ class Map(object):
         expected_values = reduceToHist(expected_values)
 
         if binned:
-            return stats.conv_llh(actual_values=self.hist,
-                                  expected_values=expected_values)
+            return stats.conv_llh(
+                actual_values=self.hist, expected_values=expected_values
+            ).reshape(self.shape)
 
         return np.sum(stats.conv_llh(actual_values=self.hist,
                                      expected_values=expected_values))
@@ -1576,6 +1624,31 @@ class Map(object):
             raise ValueError('`metric` "%s" not recognized; use one of %s.'
                              % (metric, stats.ALL_METRICS))
 
+    def metric_grad(self, expected_values, metric):
+        """Calculate the derivatives of the total `metric` between this map
+        and `expected_values` w.r.t. each of the expected values; self is
+        taken to be the "actual values" (or (pseudo)data).
+
+        Parameters
+        ----------
+        expected_values : numpy.ndarray or Map of same dimension as this
+
+        metric : str
+            One of `stats.GRAD_METRICS`
+
+        Returns
+        -------
+        grad : numpy.ndarray of same shape as this map
+
+        """
+        if metric not in stats.GRAD_METRICS:
+            raise ValueError('Derivatives of `metric` "%s" not available; use'
+                             ' one of %s.' % (metric, stats.GRAD_METRICS))
+        expected_values = reduceToHist(expected_values)
+        return getattr(stats, metric + '_grad')(
+            actual_values=self.hist, expected_values=expected_values
+        )
+
     def __setitem__(self, idx, val):
         return setitem(self.hist, idx, val)
 
@@ -3028,6 +3101,22 @@ def test_Map():
 
     deepcopy(m_orig)
 
+    # Test sum_maps against adding up maps one at a time
+    shape = (e_binning * cz_binning).shape
+    maps = [
+        Map(name='m%d' % i, binning=(e_binning, cz_binning),
+            hist=unp.uarray(np.full(shape, i + 1.), np.full(shape, 0.5 * i)))
+        for i in range(3)
+    ] + [Map(name='m3', binning=(e_binning, cz_binning), hist=np.ones(shape))]
+    total = sum_maps(maps, name='total')
+    ref = sum(maps)
+    assert total.name == 'total'
+    assert np.allclose(total.nominal_values, ref.nominal_values, rtol=1e-12)
+    assert np.allclose(total.std_devs, ref.std_devs, rtol=1e-12)
+    total = sum_maps(maps[-1:])
+    assert total.name == 'm3' and total.hist.dtype != np.object
+    assert np.all(total.hist == maps[-1].hist)
+
     logging.info(str(('<< PASS : test_Map >>')))
 
 
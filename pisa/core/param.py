@@ -21,7 +21,7 @@ import numpy as np
 import pint
 from six import string_types
 
-from pisa import ureg
+from pisa import HASH_SIGFIGS, ureg
 from pisa.core.prior import Prior
 from pisa.utils import jsons
 from pisa.utils.comparisons import (
@@ -260,6 +260,18 @@ class Param:
         else:
             self._units = ureg.Unit('dimensionless')
 
+    @property
+    def value_key(self):
+        """Cheap-to-compute representation of the current value (magnitude in
+        the param's units, which never change) that compares equal if and only
+        if the values are equal; use for detecting value changes"""
+        val = self._value
+        if isinstance(val, ureg.Quantity):
+            val = val.magnitude
+            if isinstance(val, np.ndarray):
+                return tuple(val.ravel().tolist())
+        return val
+
     @property
     def magnitude(self):
         return self._value.magnitude
@@ -1069,6 +1081,17 @@ class ParamSet(Sequence):
             return hash_obj(normQuant(self.values))
         return hash_obj(self.values)
 
+    @property
+    def values_key(self):
+        """tuple : cheap alternative to `values_hash` for detecting changes of
+        param values within a process (taking microseconds instead of pickling
+        and hashing quantities). Entries are the params' `value_key`s; if
+        `normalize_values` is True, floats are rounded to `HASH_SIGFIGS`
+        significant figures."""
+        if self.normalize_values:
+            return tuple(_round_value_key(obj.value_key) for obj in self._params)
+        return tuple(obj.value_key for obj in self._params)
+
     @property
     def nominal_values_hash(self):
         """int : hash only on the nominal param values"""
@@ -1107,6 +1130,16 @@ class ParamSet(Sequence):
         )
 
 
+def _round_value_key(key):
+    """Round floats in a `Param.value_key` to `HASH_SIGFIGS` significant
+    figures"""
+    if isinstance(key, float):
+        return float('%.*e' % (HASH_SIGFIGS - 1, key))
+    if isinstance(key, tuple):
+        return tuple(_round_value_key(k) for k in key)
+    return key
+
+
 class ParamSelector:
     """
     Parameters
@@ -1371,6 +1404,13 @@ def test_Param():
         param2 = deepcopy(p2)
         assert param2 == p2
 
+        # Test value_key
+        key0 = p2.value_key
+        p2.value = val1
+        assert p2.value_key == key0
+        p2.value = p2.value * 1.01
+        assert p2.value_key != key0
+
     finally:
         rmtree(temp_dir)
 
@@ -1564,6 +1604,21 @@ def test_ParamSet():
         param_set.serializable_state, param_set2.serializable_state
     )
 
+    # Test change detection via values_key
+    key0 = param_set.values_key
+    assert param_set.values_key == key0
+    param_set.param3.value = 2.0*ureg.m/ureg.s
+    assert param_set.values_key == key0
+    param_set.param3.value = 2.5*ureg.m/ureg.s
+    assert param_set.values_key != key0
+    param_set.param3.value = 2.0*ureg.m/ureg.s
+    assert param_set.values_key == key0
+    param_set.param3.value = (2.0 + 1e-13)*ureg.m/ureg.s
+    assert param_set.values_key != key0
+    param_set.normalize_values = True
+    assert param_set.values_key == _round_value_key(key0)
+    param_set.normalize_values = False
+
     logging.info('<< PASS : test_ParamSet >>')
 
 
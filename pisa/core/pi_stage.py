@@ -17,7 +17,7 @@ from pisa.utils.log import logging
 from pisa.utils.profiler import profile
 
 
-__all__ = ["PiStage"]
+__all__ = ["PiStage", "test_PiStage"]
 __version__ = "Pi"
 __author__ = "Philipp Eller (pde3@psu.edu)"
 
@@ -58,6 +58,18 @@ class PiStage(BaseStage):
     output_apply_keys : tuple of str
         keys of the output data (usually 'weights')
 
+    calc_key_params : mapping or None
+        names of the params each key computed by the compute function depends
+        on (`output_calc_keys` as well as any intermediate keys). Upon a change
+        of params, `compute_function` is only called if any of these keys is
+        affected, and `dirty_calc_keys` tells it which ones are. Keys not
+        specified here (or all, if None) depend on all params.
+
+    grad_params : sequence of str or None
+        names of the params for which the service implements
+        `log_weight_grad_function`, i.e. can provide analytic derivatives of
+        the output weights; see `log_weight_grad`
+
     """
 
     def __init__(
@@ -76,6 +88,8 @@ class PiStage(BaseStage):
         output_apply_keys=(),
         input_calc_keys=(),
         output_calc_keys=(),
+        calc_key_params=None,
+        grad_params=None,
     ):
         super().__init__(
             params=params,
@@ -123,6 +137,38 @@ class PiStage(BaseStage):
         self.input_apply_keys = input_apply_keys
         self.output_apply_keys = output_apply_keys
 
+        if calc_key_params is not None:
+            calc_key_params = {
+                key: frozenset(names) for key, names in calc_key_params.items()
+            }
+            for key, names in calc_key_params.items():
+                unknown = names.difference(self.expected_params or ())
+                if unknown:
+                    raise ValueError(
+                        "Key `%s` declared to depend on params %s, which are"
+                        " not expected by the stage" % (key, sorted(unknown))
+                    )
+        self.calc_key_params = calc_key_params
+
+        grad_params = frozenset(grad_params or ())
+        unknown = grad_params.difference(self.expected_params or ())
+        if unknown:
+            raise ValueError(
+                "Gradients declared for params %s, which are not expected by"
+                " the stage" % sorted(unknown)
+            )
+        self.grad_params = grad_params
+
+        self.changed_params = frozenset()
+        """names of the params that changed since the last computation"""
+
+        self.dirty_calc_keys = frozenset()
+        """keys that need to be recomputed by the current call to
+        `compute_function`"""
+
+        self._param_value_keys = {}
+        self._input_calc_key_versions = None
+
         # make a string of the modes for convenience
         mode = ["N", "N", "N"]
         if self.input_mode == "binned":
@@ -170,8 +216,15 @@ class PiStage(BaseStage):
         # call the user-defined setup function
         self.setup_function()
 
-        # invalidate param hash:
+        # the setup function may (re)write any event arrays in place, so
+        # cached bin indices can no longer be trusted
+        if self.data is not None:
+            self._invalidate_bin_indices()
+
+        # invalidate param hash and everything that was computed:
         self.param_hash = -1
+        self._param_value_keys = {}
+        self._input_calc_key_versions = None
 
     def setup_function(self):
         """Implement in services (subclasses of PiStage)"""
@@ -182,12 +235,23 @@ class PiStage(BaseStage):
         if len(self.params) == 0 and len(self.output_calc_keys) == 0:
             return
 
-        # simplest caching algorithm: don't compute if params didn't change
-        new_param_hash = self.params.values_hash
-        if new_param_hash == self.param_hash:
+        # don't compute if neither params nor inputs (recomputed by upstream
+        # stages) changed
+        new_param_hash = self.params.values_key
+        input_versions = self.data.get_key_versions(self.input_calc_keys)
+        inputs_changed = input_versions != self._input_calc_key_versions
+        if new_param_hash == self.param_hash and not inputs_changed:
             logging.trace("cached output")
             return
 
+        self.changed_params = self._get_changed_params()
+        self.dirty_calc_keys = self._get_dirty_calc_keys(inputs_changed)
+        self.param_hash = new_param_hash
+        self._input_calc_key_versions = input_versions
+        if self.calc_key_params is not None and not self.dirty_calc_keys:
+            logging.trace("changed params do not affect any output")
+            return
+
         self.data.data_specs = self.input_specs
         # convert any inputs if necessary:
         if self.mode[:2] == "EB":
@@ -207,19 +271,50 @@ class PiStage(BaseStage):
 
         self.data.data_specs = self.calc_specs
         self.compute_function()
-        self.param_hash = new_param_hash
+
+        output_keys = [
+            key for key in self.output_calc_keys if key in self.dirty_calc_keys
+        ]
+        self.data.mark_recomputed(output_keys)
+        if self.calc_mode == "events":
+            self._invalidate_bin_indices(output_keys)
 
         # convert any outputs if necessary:
         if self.mode[1:] == "EB":
             for container in self.data:
-                for key in self.output_calc_keys:
+                for key in output_keys:
                     container.array_to_binned(key, self.output_specs)
 
         elif self.mode[1:] == "BE":
             for container in self.data:
-                for key in self.output_calc_keys:
+                for key in output_keys:
                     container.binned_to_array(key)
 
+    def _get_changed_params(self):
+        """Find the names of the params whose values changed since the last
+        call to this method (all of them after `setup`)"""
+        changed = set()
+        for param, value_key in zip(self.params, self.params.values_key):
+            if (param.name not in self._param_value_keys
+                    or self._param_value_keys[param.name] != value_key):
+                changed.add(param.name)
+                self._param_value_keys[param.name] = value_key
+        return frozenset(changed)
+
+    def _get_dirty_calc_keys(self, inputs_changed):
+        """Find the keys that have to be recomputed given `changed_params` and
+        whether the stage's inputs changed"""
+        all_keys = set(self.output_calc_keys)
+        if self.calc_key_params is not None:
+            all_keys.update(self.calc_key_params)
+        if inputs_changed or self.calc_key_params is None:
+            return frozenset(all_keys)
+        return frozenset(
+            key for key in all_keys
+            if key not in self.calc_key_params
+            or self.calc_key_params[key] & self.changed_params
+        )
+
     def compute_function(self):
         """Implement in services (subclasses of PiStage)"""
         pass
@@ -247,6 +342,8 @@ class PiStage(BaseStage):
         # else:
         self.data.data_specs = self.output_specs
         self.apply_function()
+        if self.output_mode == "events":
+            self._invalidate_bin_indices(self.output_apply_keys)
 
         if self.mode == "BBE":
             for container in self.data:
@@ -257,6 +354,49 @@ class PiStage(BaseStage):
         """Implement in services (subclasses of PiStage)"""
         pass
 
+    def _invalidate_bin_indices(self, keys=None):
+        """Drop the bin indices cached by the containers (see
+        `Container.get_bin_indices`) for binnings that have any of `keys`
+        (which the stage may have modified in place) as dimension, or all of
+        them if `keys` is None"""
+        for container in self.data.containers:
+            container.invalidate_bin_indices(keys)
+
+    def log_weight_grad(self, param_name):
+        """Get the derivative of the logarithm of the output weights w.r.t.
+        the param `param_name` (in units of the param), as far as it is due to
+        this stage.
+
+        This is only meaningful for params whose effect on the weights is a
+        multiplicative factor per event (or bin) that downstream stages do not
+        alter, and only after the stage was run with the current param values.
+
+        Parameters
+        ----------
+        param_name : str
+            One of `grad_params`
+
+        Returns
+        -------
+        log_weight_grad : dict or None
+            Container name : array in the stage's output representation (or
+            scalar, if constant across the container). Containers not in the
+            dict are not affected by the param. None if not available at the
+            current param values (e.g. for a scale factor of zero).
+
+        """
+        if param_name not in self.grad_params:
+            raise ValueError(
+                "Stage %s.%s does not provide gradients w.r.t. param `%s`"
+                % (self.stage_name, self.service_name, param_name)
+            )
+        self.data.data_specs = self.output_specs
+        return self.log_weight_grad_function(param_name)
+
+    def log_weight_grad_function(self, param_name):
+        """Implement in services that declare `grad_params`"""
+        raise NotImplementedError()
+
     def run(self, inputs=None):
         if not inputs is None:
             raise ValueError("PISA pi requires there not be any inputs.")
@@ -282,3 +422,93 @@ class PiStage(BaseStage):
             logging.warning('Cannot create CAKE style output mapset')
 
         return self.outputs
+
+
+def test_PiStage():
+    """Unit tests for dependency-aware recomputation in `PiStage.compute`"""
+    # pylint: disable=invalid-name
+    import numpy as np
+    from pisa import ureg
+    from pisa.core.binning import OneDimBinning
+    from pisa.core.container import Container
+    from pisa.core.param import Param, ParamSet
+
+    class counting_stage(PiStage):
+        """Stage that records which keys it was asked to (re)compute"""
+        def __init__(self, names, input_calc_keys, calc_key_params):
+            super().__init__(
+                params=ParamSet([
+                    Param(name=name, value=1*ureg.dimensionless, prior=None,
+                          range=None, is_fixed=False)
+                    for name in names
+                ]),
+                expected_params=names,
+                input_specs="events",
+                calc_specs="events",
+                output_specs="events",
+                input_calc_keys=input_calc_keys,
+                output_calc_keys=tuple(calc_key_params),
+                calc_key_params=calc_key_params,
+            )
+            self.computed = []
+
+        def compute_function(self):
+            self.computed.append(set(self.dirty_calc_keys))
+
+    data = ContainerSet("data", [Container("test")])
+    upstream = counting_stage(("a", "b"), (), {"ya": ("a",), "yb": ("b",)})
+    downstream = counting_stage(("c",), ("ya",), {"z": ("c",)})
+    for stage in (upstream, downstream):
+        stage.data = data
+        stage.setup()
+
+    def run():
+        upstream.compute()
+        downstream.compute()
+        computed = (upstream.computed, downstream.computed)
+        upstream.computed, downstream.computed = [], []
+        return computed
+
+    # everything is computed initially, then nothing until params change
+    assert run() == ([{"ya", "yb"}], [{"z"}])
+    assert run() == ([], [])
+
+    # only keys depending on the changed param are recomputed, and only
+    # downstream stages that use those keys
+    upstream.params.b = 2*ureg.dimensionless
+    assert run() == ([{"yb"}], [])
+    upstream.params.a = 2*ureg.dimensionless
+    assert run() == ([{"ya"}], [{"z"}])
+    downstream.params.c = 2*ureg.dimensionless
+    assert run() == ([], [{"z"}])
+    assert data.get_key_versions(["ya", "yb", "z"]) == (2, 2, 3)
+
+    try:
+        counting_stage(("a",), (), {"ya": ("a", "b")})
+    except ValueError:
+        pass
+    else:
+        raise Exception("undeclared param dependency should raise ValueError")
+
+    # bin indices cached before a stage is set up again are not reused if the
+    # setup rewrites the event arrays in place
+    class rewriting_stage(PiStage):
+        """Stage overwriting `x` in place upon setup"""
+        def setup_function(self):
+            for container in self.data:
+                np.copyto(container.array_data["x"].get("host"), self.new_x)
+
+    binning = MultiDimBinning([OneDimBinning(name="x", domain=[0, 4], num_bins=4, is_lin=True)])
+    container = Container("test")
+    container.add_array_data("x", np.array([0.5, 1.5, 2.5]))
+    data = ContainerSet("data", [container])
+    assert np.array_equal(container.get_bin_indices(binning), [0, 1, 2])
+    stage = rewriting_stage(params=ParamSet([]), expected_params=(),
+                            input_specs="events", calc_specs="events",
+                            output_specs="events")
+    stage.data = data
+    stage.new_x = np.array([3.5, 3.5, 0.5])
+    stage.setup()
+    assert np.array_equal(container.get_bin_indices(binning), [3, 3, 0])
+
+    logging.info("<< PASS : test_PiStage >>")
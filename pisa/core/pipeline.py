@@ -18,15 +18,17 @@ from inspect import getsource
 import os
 import traceback
 
+from numba import SmartArray
 import numpy as np
+from uncertainties import unumpy as unp
 
-from pisa import ureg
 from pisa.core.events import Data
 from pisa.core.map import Map, MapSet
 from pisa.core.param import ParamSet
 from pisa.core.stage import Stage
 from pisa.core.pi_stage import PiStage
 from pisa.core.transform import TransformSet
+from pisa.core.translation import histogram_from_indices
 from pisa.core.container import ContainerSet
 from pisa.utils.config_parser import PISAConfigParser, parse_pipeline_config
 from pisa.utils.fileio import mkdir
@@ -373,6 +375,202 @@ class Pipeline(object):
 
         return outputs
 
+    @property
+    def output_arrays_available(self):
+        """bool : whether `get_output_arrays` can be used, i.e. whether all
+        stages are PiStages and the last one has binned output"""
+        stages = self.stages
+        return (
+            len(stages) > 0
+            and all(isinstance(stage, PiStage) for stage in stages)
+            and stages[-1].output_mode == "binned"
+        )
+
+    def get_output_arrays(self):
+        """Run the pipeline and return its outputs as plain float arrays.
+
+        This bypasses the creation of Maps (holding uncertainties arrays) by
+        `get_outputs`, and is meant to be used together with
+        `pisa.utils.stats.array_metric_total`.
+
+        Returns
+        -------
+        arrays : OrderedDict
+            Container name : (nominal, sumw2), where `nominal` are the bin
+            contents and `sumw2` are the squared errors (None if the last
+            stage does not output errors). Both are flat (in the order of
+            `Map.hist.ravel()`), C-contiguous float64 arrays.
+
+        """
+        if not self.output_arrays_available:
+            raise ValueError(
+                "Output arrays are only available for pipelines made of"
+                " PiStages with binned output"
+            )
+        for stage in self.stages:
+            stage.run()
+
+        last_stage = self.stages[-1]
+        keys = [key for key in last_stage.output_apply_keys if key != "errors"]
+        if len(keys) != 1:
+            raise ValueError(
+                "Cannot determine output key from %s"
+                % (last_stage.output_apply_keys,)
+            )
+        has_errors = "errors" in last_stage.output_apply_keys
+
+        arrays = OrderedDict()
+        for container in last_stage.data:
+            nominal = np.array(
+                container.get_hist(keys[0])[0], dtype=np.float64, order="C"
+            ).ravel()
+            if has_errors:
+                sumw2 = np.square(
+                    container.get_hist("errors")[0], dtype=np.float64
+                ).ravel()
+            else:
+                sumw2 = None
+            arrays[container.name] = (nominal, sumw2)
+        return arrays
+
+    @property
+    def grad_params(self):
+        """frozenset of str : names of params for which `get_output_grads` can
+        compute analytic derivatives, i.e. those for which all stages using
+        them provide `log_weight_grad`s"""
+        stages = self.stages
+        if not all(isinstance(stage, PiStage) for stage in stages):
+            return frozenset()
+        if stages[-1].output_mode != "binned":
+            return frozenset()
+        grad_params = set()
+        for stage in stages:
+            grad_params.update(stage.grad_params)
+        for stage in stages:
+            grad_params.difference_update(
+                set(stage.params.names).difference(stage.grad_params)
+            )
+        return frozenset(grad_params)
+
+    def get_output_grads(self, param_names=None):
+        """Compute the derivatives of the outputs w.r.t. params analytically
+        from the stages' `log_weight_grad`s, chaining them through the
+        histogramming of events.
+
+        The outputs must have been computed (with `get_outputs`) for the
+        current param values, as the derivatives are evaluated using the
+        weights stored in the pipeline's data.
+
+        Parameters
+        ----------
+        param_names : None or sequence of str
+            Params to differentiate w.r.t.; defaults to all free params
+
+        Returns
+        -------
+        grads : OrderedDict
+            Param name : MapSet with the derivatives of the output maps w.r.t.
+            the param (in units of the param), or None if analytic derivatives
+            are not available for the param at its current value. The
+            derivatives w.r.t. params the pipeline does not have are zero.
+
+        """
+        if param_names is None:
+            param_names = self.params.free.names
+        grad_params = self.grad_params
+        own_names = set(self.params.names)
+
+        grads = OrderedDict()
+        if all(n in own_names and n not in grad_params for n in param_names):
+            for name in param_names:
+                grads[name] = None
+            return grads
+
+        last_stage = self.stages[-1]
+        data = last_stage.data
+        binning = last_stage.output_specs
+        outputs = last_stage.get_outputs()
+        data.data_specs = "events"
+        event_weights = {
+            container.name: container["weights"].get("host") for container in data
+        }
+        event_hists = {}
+
+        for name in param_names:
+            if name not in own_names:
+                grads[name] = MapSet(
+                    [
+                        Map(
+                            name=output_map.name,
+                            hist=np.zeros(output_map.shape),
+                            binning=output_map.binning,
+                        )
+                        for output_map in outputs
+                    ],
+                    name=outputs.name,
+                )
+                continue
+            if name not in grad_params:
+                grads[name] = None
+                continue
+
+            rel_grads = OrderedDict(
+                (container.name, np.zeros(binning.size)) for container in data
+            )
+            for stage in self:
+                if name not in stage.params.names:
+                    continue
+                log_weight_grads = stage.log_weight_grad(name)
+                if log_weight_grads is None:
+                    rel_grads = None
+                    break
+                for container_name, log_weight_grad in log_weight_grads.items():
+                    if stage.output_mode == "binned":
+                        if stage.output_specs != binning:
+                            rel_grads = None
+                            break
+                        rel_grads[container_name] += log_weight_grad
+                        continue
+                    # relative change of the binned weights due to the change
+                    # of the event weights
+                    indices = data[container_name].get_bin_indices(binning)
+                    if container_name not in event_hists:
+                        event_hists[container_name] = histogram_from_indices(
+                            indices, SmartArray(event_weights[container_name]),
+                            binning.size, averaged=False
+                        ).get("host")
+                    weights_grad = event_weights[container_name] * log_weight_grad
+                    hist_grad = histogram_from_indices(
+                        indices, SmartArray(weights_grad), binning.size,
+                        averaged=False
+                    ).get("host")
+                    hist = event_hists[container_name]
+                    with np.errstate(divide="ignore", invalid="ignore"):
+                        rel_grads[container_name] += np.where(
+                            hist != 0, hist_grad / hist, 0.
+                        )
+                if rel_grads is None:
+                    break
+
+            if rel_grads is None:
+                grads[name] = None
+                continue
+
+            maps = []
+            for output_map in outputs:
+                hist = unp.nominal_values(output_map.hist)
+                maps.append(
+                    Map(
+                        name=output_map.name,
+                        hist=hist * rel_grads[output_map.name].reshape(hist.shape),
+                        binning=output_map.binning,
+                    )
+                )
+            grads[name] = MapSet(maps, name=outputs.name)
+
+        data.data_specs = binning
+        return grads
+
     def update_params(self, params):
         """Update params for the pipeline.
 
@@ -474,6 +672,7 @@ class Pipeline(object):
 def test_Pipeline():
     """Unit tests for Pipeline class"""
     # pylint: disable=line-too-long
+    from pisa import ureg
 
     # TODO: make a test config file with hierarchy AND material selector,
     # uncomment / add in tests commented / removed below
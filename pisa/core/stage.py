@@ -14,7 +14,7 @@ from pisa.core.events import Events
 from pisa.core.map import Map, MapSet
 from pisa.core.param import Param
 from pisa.core.transform import TransformSet
-from pisa.utils.cache import DiskCache, MemoryCache
+from pisa.utils.cache import ArrayDiskCache, DiskCache, MemoryCache
 from pisa.utils.comparisons import normQuant
 from pisa.utils.fileio import mkdir
 from pisa.utils.hash import hash_obj
@@ -64,7 +64,7 @@ class Stage(BaseStage):
 
     output_names : None or list of strings
 
-    disk_cache : None, bool, string, or DiskCache
+    disk_cache : None, bool, string, DiskCache, or ArrayDiskCache
       * If None or False, no disk cache is available.
       * If True, a disk cache is generated at the path
         `CACHE_DIR/<stage_name>/<service_name>.sqlite` where CACHE_DIR is
@@ -75,7 +75,15 @@ class Stage(BaseStage):
         "relative/dir/mycache.sqlite") is taken relative to the CACHE_DIR; the
         aforementioned example will be turned into
         `CACHE_DIR/relative/dir/mycache.sqlite`.
-      * If a DiskCache object is passed, it will be used directly
+      * If string ending in a slash (e.g. "relative/dir/mycache/"), this is
+        interpreted as above but as the directory of an ArrayDiskCache
+      * If a DiskCache or ArrayDiskCache object is passed, it will be used
+        directly
+
+      Nominal transforms are stored to the disk cache. With an
+      ArrayDiskCache, which stores arrays as memory-mapped files, transforms
+      are stored as well, such that e.g. a later scan over the same parameter
+      values can load rather than recompute them.
 
     memcache_deepcopy : bool
         Whether to deepcopy objects prior to storing to the memory cache and
@@ -396,6 +404,11 @@ class Stage(BaseStage):
             )
         logging.trace("transforms_hash: %s" % str(transforms_hash))
 
+        transforms = None
+        transforms_disk_cache_key = self._derive_transforms_disk_cache_key(
+            transforms_hash
+        )
+
         # Load and return existing transforms if in the cache
         if (
             self.transforms_cache is not None
@@ -406,14 +419,25 @@ class Stage(BaseStage):
             logging.trace("loading transforms from cache.")
             transforms = self.transforms_cache[transforms_hash]
 
+        # Otherwise try to load from an array disk cache
+        elif transforms_disk_cache_key is not None:
+            transforms = self.disk_cache.get(transforms_disk_cache_key)
+            if transforms is not None:
+                self.transforms_loaded_from_cache = "disk"
+                logging.trace("loading transforms from disk cache.")
+                if self.transforms_cache is not None:
+                    self.transforms_cache[transforms_hash] = transforms
+
         # Otherwise: compute transforms, set hash, and store to cache
-        else:
+        if transforms is None:
             self.transforms_computed = True
             logging.trace("computing transforms.")
             transforms = self._compute_transforms()
             transforms.hash = transforms_hash
             if self.transforms_cache is not None:
                 self.transforms_cache[transforms_hash] = transforms
+            if transforms_disk_cache_key is not None:
+                self.disk_cache[transforms_disk_cache_key] = transforms
 
         self.check_transforms(transforms)
         self.transforms = transforms
@@ -651,7 +675,7 @@ class Stage(BaseStage):
 
     def instantiate_disk_cache(self):
         """Instantiate a disk cache for use by the stage."""
-        if isinstance(self.disk_cache, DiskCache):
+        if isinstance(self.disk_cache, (DiskCache, ArrayDiskCache)):
             self.disk_cache_path = self.disk_cache.path
             return
 
@@ -660,6 +684,13 @@ class Stage(BaseStage):
             self.disk_cache_path = None
             return
 
+        if isinstance(self.disk_cache, str) and self.disk_cache.endswith("/"):
+            self.disk_cache = ArrayDiskCache(
+                self.disk_cache, max_depth=100, is_lru=True
+            )
+            self.disk_cache_path = self.disk_cache.path
+            return
+
         if isinstance(self.disk_cache, str):
             dirpath, filename = os.path.split(
                 os.path.expandvars(os.path.expanduser(self.disk_cache))
@@ -786,6 +817,29 @@ class Stage(BaseStage):
 
         return transforms_hash, nominal_transforms_hash
 
+    def _derive_transforms_disk_cache_key(self, transforms_hash):
+        """Derive the key for storing transforms with hash `transforms_hash`
+        to the disk cache, or None if they are not to be stored there.
+
+        Transforms are only stored to an ArrayDiskCache (from which they can
+        be retrieved in little more time than from the memory cache) and only
+        if the hash is valid. Since the transforms hash includes the nominal
+        transforms hash (and hence the source code hash), it is valid across
+        sessions unless `_derive_transforms_hash` is overridden.
+
+        """
+        if not isinstance(self.disk_cache, ArrayDiskCache):
+            return None
+        if self.debug_mode is not None:
+            return None
+        # `_derive_transforms_hash` returns a (transforms, nominal transforms)
+        # hash tuple, the former of which already includes the latter
+        if isinstance(transforms_hash, tuple):
+            transforms_hash = transforms_hash[0]
+        if transforms_hash is None:
+            return None
+        return hash_obj(("transforms", transforms_hash), full_hash=True)
+
     def _derive_nominal_transforms_hash(self):
         """Derive a hash to uniquely identify the nominal transform. This
         should be unique across processes and invocations bacuase the nominal
@@ -14,6 +14,7 @@ from functools import wraps
 import importlib
 import inspect
 import os
+import pickle
 import shutil
 import sys
 import tempfile
@@ -303,7 +304,9 @@ class TransformSet(object):
         return MapSet(maps=outputs, hash=hash_)
 
     def __getattr__(self, attr):
-        if attr in TRANS_SET_SLOTS:
+        # Private attributes are never those of the transforms; in particular,
+        # `_transforms` is not yet set when unpickling
+        if attr in TRANS_SET_SLOTS or attr.startswith('_'):
             return super().__getattribute__(attr)
         # TODO: return maps based upon name?
         #if attr in
@@ -1057,6 +1060,11 @@ def test_BinnedTensorTransform():
     finally:
         shutil.rmtree(testdir, ignore_errors=True)
 
+    # Transform sets can be pickled (e.g. to be stored to a disk cache)
+    xforms_ = pickle.loads(pickle.dumps(xforms))
+    assert xforms_ == xforms
+    assert xforms_.hash == xforms.hash
+
     logging.info('<< PASS : test_TransformSet >>')
 
 
@@ -15,23 +15,28 @@ from __future__ import absolute_import, print_function, division
 from copy import deepcopy
 
 import numpy as np
-from numba import guvectorize, SmartArray, cuda
+from numba import guvectorize, jit, SmartArray, cuda
 
 from pisa import FTYPE, TARGET
 from pisa.core.binning import OneDimBinning, MultiDimBinning
 from pisa.utils.comparisons import recursiveEquality
 from pisa.utils.log import logging, set_verbosity
-from pisa.utils.numba_tools import myjit, WHERE
+from pisa.utils.numba_tools import myjit, register_kernel, NUMBA_CACHE, WHERE
 from pisa.utils import vectorizer
 
 __all__ = [
     'resample',
+    'resample_from_indices',
     'histogram',
+    'histogram_from_indices',
     'lookup',
+    'lookup_from_indices',
     'find_index',
     'find_index_unsafe',
     'find_index_cuda',
     'test_histogram',
+    'test_histogram_from_indices',
+    'test_lookup_and_resample_from_indices',
     'test_find_index',
 ]
 
@@ -215,6 +220,189 @@ def histogram_np(sample, weights, binning, apply_weights=True):  # pylint: disab
     return SmartArray(flat_hist.astype(FTYPE))
 
 
+def histogram_from_indices(indices, weights, num_bins, averaged):
+    """Histogram `weights` given the flat bin index of each sample point, as
+    obtained from `pisa.core.bin_indexing.lookup_indices`.
+
+    This is equivalent to `histogram` (when passing the sample points and
+    binning the `indices` were derived from) but, as the indices can be
+    reused as long as the sample points do not change, avoids searching the
+    bin edges for every sample point on every call.
+
+    Parameters
+    ----------
+    indices : SmartArray of ints
+        Points with indices outside of [0, num_bins) are ignored
+
+    weights : SmartArray
+        1D, or 2D for array-valued weights (one column per element)
+
+    num_bins : int
+
+    averaged : bool
+        See `histogram`
+
+    Returns
+    -------
+    flat_hist : SmartArray
+
+    """
+    weights = weights.get('host')
+    indices = indices.get('host')
+    flat_hist = np.zeros((num_bins,) + weights.shape[1:], dtype=np.float64)
+    counts = np.zeros(num_bins, dtype=np.float64)
+    # treat scalar weights as array-valued weights with a single element
+    histogram_indices_kernel(
+        indices,
+        weights.reshape(weights.shape[0], -1),
+        averaged,
+        flat_hist.reshape(num_bins, -1),
+        counts,
+    )
+    return SmartArray(flat_hist.astype(FTYPE))
+
+
+@register_kernel(f"(i8[::1], {FX}[:, ::1], b1, f8[:, ::1], f8[::1])")
+@jit(nopython=True, nogil=True, cache=NUMBA_CACHE)
+def histogram_indices_kernel(indices, weights, averaged, out, counts):
+    """Accumulate `weights` (2D) into `out` at `indices` and count the points
+    per bin into `counts` in a single pass; divide by the counts (leaving 0
+    for empty bins) if `averaged`"""
+    num_bins = out.shape[0]
+    for i in range(indices.shape[0]):
+        idx = indices[i]
+        if idx < 0 or idx >= num_bins:
+            continue
+        counts[idx] += 1
+        for j in range(weights.shape[1]):
+            out[idx, j] += weights[i, j]
+    if averaged:
+        for idx in range(num_bins):
+            if counts[idx] == 0:
+                continue
+            for j in range(out.shape[1]):
+                out[idx, j] /= counts[idx]
+
+
+def lookup_from_indices(indices, flat_hist):
+    """Extract the histogram values at sample points given the flat bin index
+    of each point, as obtained from `pisa.core.bin_indexing.lookup_indices`.
+
+    This is equivalent to `lookup` (when passing the sample points and
+    binning the `indices` were derived from), but works for any number of
+    dimensions and reduces to a single gather if the indices are reused.
+
+    Parameters
+    ----------
+    indices : SmartArray of ints
+        Points with indices outside of [0, num_bins) get the value 0
+
+    flat_hist : SmartArray
+        1D, or 2D for array-valued histograms
+
+    Returns
+    -------
+    hist_vals : SmartArray
+
+    """
+    flat_hist = flat_hist.get('host')
+    indices = indices.get('host')
+    hist_vals = np.empty(indices.shape + flat_hist.shape[1:], dtype=FTYPE)
+    lookup_indices_kernel(
+        indices,
+        flat_hist.reshape(flat_hist.shape[0], -1),
+        hist_vals.reshape(indices.shape[0], -1),
+    )
+    return SmartArray(hist_vals)
+
+
+@register_kernel(f"(i8[::1], {FX}[:, ::1], {FX}[:, ::1])")
+@jit(nopython=True, nogil=True, cache=NUMBA_CACHE)
+def lookup_indices_kernel(indices, flat_hist, out):
+    """Gather the rows of `flat_hist` (2D) at `indices` into `out`, setting
+    rows with invalid indices to 0"""
+    num_bins = flat_hist.shape[0]
+    for i in range(indices.shape[0]):
+        idx = indices[i]
+        if idx < 0 or idx >= num_bins:
+            for j in range(out.shape[1]):
+                out[i, j] = 0.
+        else:
+            for j in range(out.shape[1]):
+                out[i, j] = flat_hist[idx, j]
+
+
+def resample_from_indices(old_indices, new_indices, flat_hist):
+    """Resample binned data given the flat bin indices of the bin centers of
+    one binning in the other binning.
+
+    This is equivalent to `resample` (when passing the bin centers of the
+    two binnings as samples), but works for any number of dimensions and
+    only takes a single pass over the bins if the indices are reused:
+    New bins containing the centers of more than one old bin get the average
+    of these old bins' values, all other new bins get the value of the old
+    bin containing their center (or 0 if there is none).
+
+    Parameters
+    ----------
+    old_indices : array of ints
+        Index in the new binning of each old bin's center
+
+    new_indices : array of ints
+        Index in the old binning of each new bin's center
+
+    flat_hist : SmartArray
+        Values in the old binning; 1D, or 2D for array-valued histograms
+
+    Returns
+    -------
+    new_hist_vals : SmartArray
+
+    """
+    flat_hist = flat_hist.get('host')
+    num_new_bins = new_indices.shape[0]
+    new_hist_vals = np.zeros(
+        (num_new_bins,) + flat_hist.shape[1:], dtype=np.float64
+    )
+    counts = np.zeros(num_new_bins, dtype=np.float64)
+    resample_indices_kernel(
+        old_indices,
+        new_indices,
+        flat_hist.reshape(flat_hist.shape[0], -1),
+        new_hist_vals.reshape(num_new_bins, -1),
+        counts,
+    )
+    return SmartArray(new_hist_vals.astype(FTYPE))
+
+
+@register_kernel(f"(i8[::1], i8[::1], {FX}[:, ::1], f8[:, ::1], f8[::1])")
+@jit(nopython=True, nogil=True, cache=NUMBA_CACHE)
+def resample_indices_kernel(old_indices, new_indices, flat_hist, out, counts):
+    """Kernel for `resample_from_indices`; `flat_hist` and `out` are 2D and
+    `out` and `counts` must be zero-initialized"""
+    num_old_bins = flat_hist.shape[0]
+    num_new_bins = out.shape[0]
+    for i in range(num_old_bins):
+        idx = old_indices[i]
+        if idx < 0 or idx >= num_new_bins:
+            continue
+        counts[idx] += 1
+        for j in range(out.shape[1]):
+            out[idx, j] += flat_hist[i, j]
+    for idx in range(num_new_bins):
+        if counts[idx] > 1:
+            for j in range(out.shape[1]):
+                out[idx, j] /= counts[idx]
+            continue
+        old_idx = new_indices[idx]
+        if old_idx < 0 or old_idx >= num_old_bins:
+            for j in range(out.shape[1]):
+                out[idx, j] = 0.
+        else:
+            for j in range(out.shape[1]):
+                out[idx, j] = flat_hist[old_idx, j]
+
+
 # TODO: can we do just n-dimensional? And scalars or arbitrary array shapes?
 # TODO: optimize using shared memory
 @cuda.jit
@@ -551,6 +739,7 @@ def find_index_cuda(val, bin_edges, out):
     [f'({FX}[:], {FX}[:], {FX}[:], {FX}[:], {FX}[:], {FX}[:])'],
     '(), (), (j), (k), (l) -> ()',
     target=TARGET,
+    cache=NUMBA_CACHE,
 )
 def lookup_vectorized_2d(
     sample_x,
@@ -581,6 +770,7 @@ def lookup_vectorized_2d(
     [f'({FX}[:], {FX}[:], {FX}[:, :], {FX}[:], {FX}[:], {FX}[:])'],
     '(), (), (j, d), (k), (l) -> (d)',
     target=TARGET,
+    cache=NUMBA_CACHE,
 )
 def lookup_vectorized_2d_arrays(
     sample_x,
@@ -615,6 +805,7 @@ def lookup_vectorized_2d_arrays(
     [f'({FX}[:], {FX}[:], {FX}[:], {FX}[:], {FX}[:], {FX}[:], {FX}[:], {FX}[:])'],
     '(), (), (), (j), (k), (l), (m) -> ()',
     target=TARGET,
+    cache=NUMBA_CACHE,
 )
 def lookup_vectorized_3d(
     sample_x,
@@ -651,6 +842,7 @@ def lookup_vectorized_3d(
     [f'({FX}[:], {FX}[:], {FX}[:], {FX}[:, :], {FX}[:], {FX}[:], {FX}[:], {FX}[:])'],
     '(), (), (), (j, d), (k), (l), (m) -> (d)',
     target=TARGET,
+    cache=NUMBA_CACHE,
 )
 def lookup_vectorized_3d_arrays(
     sample_x,
@@ -732,6 +924,88 @@ def test_histogram():
     logging.info('<< PASS : test_histogram >>')
 
 
+def test_histogram_from_indices():
+    """Unit tests for `histogram_from_indices` function.
+
+    Correctness is defined as matching the output of `histogram`.
+    """
+    # pylint: disable=import-outside-toplevel
+    from pisa.core.bin_indexing import lookup_indices
+
+    n_evts = 10000
+    rand = np.random.RandomState(seed=0)
+    binning = MultiDimBinning([
+        OneDimBinning(name='x', num_bins=5, is_lin=True, domain=[0, 1]),
+        OneDimBinning(name='y', num_bins=4, is_lin=True, domain=[0, 1]),
+    ])
+    # include points outside of the binning and on its upper edges
+    sample = [
+        SmartArray(rand.uniform(-0.1, 1.1, n_evts).astype(FTYPE)),
+        SmartArray(np.concatenate(
+            [[1.], rand.uniform(0, 1.1, n_evts - 1)]
+        ).astype(FTYPE)),
+    ]
+    indices = lookup_indices(sample, binning)
+
+    for weights in [SmartArray(rand.rand(n_evts).astype(FTYPE)),
+                    SmartArray(rand.rand(n_evts, 3).astype(FTYPE))]:
+        for averaged in [False, True]:
+            test = histogram_from_indices(
+                indices, weights, binning.size, averaged
+            ).get()
+            ref = histogram(sample, weights, binning, averaged).get()
+            assert test.shape == ref.shape
+            assert np.allclose(test, ref, rtol=1e-5 if FTYPE == np.float32 else 1e-12), \
+                    f'\ntest:\n{test}\n\nref:\n{ref}'
+
+    logging.info('<< PASS : test_histogram_from_indices >>')
+
+
+def test_lookup_and_resample_from_indices():
+    """Unit tests for `lookup_from_indices` and `resample_from_indices`
+    functions.
+
+    Correctness is defined as matching the outputs of `lookup` and `resample`.
+    """
+    # pylint: disable=import-outside-toplevel
+    from pisa.core.bin_indexing import lookup_indices
+
+    n_evts = 1000
+    rand = np.random.RandomState(seed=0)
+    x = OneDimBinning(name='x', num_bins=6, is_lin=True, domain=[0, 1])
+    y = OneDimBinning(name='y', num_bins=5, is_log=True, domain=[1, 100])
+    z = OneDimBinning(name='z', num_bins=2, is_lin=True, domain=[-1, 1])
+    fine_x = OneDimBinning(name='x', num_bins=20, is_lin=True, domain=[0.1, 1.1])
+    coarse_y = OneDimBinning(name='y', num_bins=2, is_log=True, domain=[1, 100])
+
+    def centers(binning):
+        grid = binning.meshgrid(entity='weighted_centers', attach_units=False)
+        return [SmartArray(g.ravel()) for g in grid]
+
+    for binning, new_binning in [(x * y, fine_x * coarse_y),
+                                 (x * y * z, fine_x * coarse_y * z)]:
+        sample = [
+            SmartArray(rand.uniform(e[0] - 0.1, e[-1] + 0.1, n_evts).astype(FTYPE))
+            for e in (dim.edge_magnitudes for dim in binning)
+        ]
+        indices = lookup_indices(sample, binning)
+        old_indices = lookup_indices(centers(binning), new_binning).get()
+        new_indices = lookup_indices(centers(new_binning), binning).get()
+        for flat_hist in [SmartArray(rand.rand(binning.size).astype(FTYPE)),
+                          SmartArray(rand.rand(binning.size, 3).astype(FTYPE))]:
+            test = lookup_from_indices(indices, flat_hist).get()
+            ref = lookup(sample, flat_hist, binning).get()
+            assert recursiveEquality(test, ref), f'\ntest:\n{test}\n\nref:\n{ref}'
+
+            test = resample_from_indices(old_indices, new_indices, flat_hist).get()
+            ref = resample(flat_hist, centers(binning), binning,
+                           centers(new_binning), new_binning).get()
+            assert np.allclose(test, ref, rtol=1e-5 if FTYPE == np.float32 else 1e-12), \
+                    f'\ntest:\n{test}\n\nref:\n{ref}'
+
+    logging.info('<< PASS : test_lookup_and_resample_from_indices >>')
+
+
 def test_find_index():
     """Unit tests for `find_index` function.
 
@@ -870,3 +1144,5 @@ if __name__ == '__main__':
     set_verbosity(1)
     test_find_index()
     test_histogram()
+    test_histogram_from_indices()
+    test_lookup_and_resample_from_indices()
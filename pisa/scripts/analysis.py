@@ -281,6 +281,15 @@ def parse_args(command, description):
             type=int, default=0,
             help='''Fluctated fiducial data index.'''
         )
+    if command == discrete_hypo_test:
+        parser.add_argument(
+            '--num-workers',
+            type=int, default=1,
+            help='''Number of processes to distribute the data and fiducial
+            trials over. Results are identical to those of a serial run, and
+            trials already logged in a previous (e.g. interrupted) run with
+            the same settings are skipped.'''
+        )
     # A blind analysis only makes sense when the possibility of actually
     # analysing data is available.
     if command not in (inj_param_scan, systematics_tests):
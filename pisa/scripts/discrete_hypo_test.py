@@ -75,11 +75,13 @@ def discrete_hypo_test(return_outputs=False):
             ps_list = [x.strip().lower() for x in ps_str.split(',')]
         init_args_d[ps_name] = ps_list
 
+    num_workers = init_args_d.pop('num_workers')
+
     # Instantiate the analysis object
     hypo_testing = HypoTesting(**init_args_d)
 
     # Run the analysis
-    hypo_testing.run_analysis()
+    hypo_testing.run_analysis(num_workers=num_workers)
 
     if return_outputs:
         return hypo_testing
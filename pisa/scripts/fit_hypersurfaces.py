@@ -135,7 +135,6 @@ from __future__ import absolute_import, division, print_function
 
 from argparse import ArgumentParser
 from ast import literal_eval
-from collections import OrderedDict
 from collections.abc import Mapping, Sequence
 import copy
 from io import StringIO
@@ -152,7 +151,9 @@ from pisa.core.distribution_maker import DistributionMaker
 from pisa.core.map import Map, MapSet
 from pisa.utils.fileio import mkdir, from_file, to_file
 from pisa.utils.log import logging, set_verbosity
-from pisa.utils.hypersurface import Hypersurface, HypersurfaceParam, get_hypersurface_file_name
+from pisa.utils.hypersurface import (
+    HypersurfaceParam, get_hypersurface_file_name, parallel_fit_hypersurfaces
+)
 
 
 __all__ = [
@@ -253,6 +254,19 @@ def parse_args():
     parser.add_argument(
         "-o", "--outdir", type=str, required=True, help="Set output directory"
     )
+    parser.add_argument(
+        "--num-parallel", type=int, default=1,
+        help="Number of processes to fit the hypersurfaces with"
+    )
+    parser.add_argument(
+        "--bin-chunk-size", type=int, default=None,
+        help="Maximum number of bins fitted per process task (default: one task per map)"
+    )
+    parser.add_argument(
+        "--checkpoint-dir", type=str, default=None,
+        help="""Directory to store the results of each fit task in; re-running
+        with the same directory resumes an interrupted fit"""
+    )
     parser.add_argument("-v", action="count", default=None, help="set verbosity level")
     args = parser.parse_args()
     return args
@@ -467,7 +481,7 @@ def load_and_modify_pipeline_cfg(fit_cfg, section):
     return pipeline_cfg, pipeline_cfg_path
 
 
-def create_hypersurfaces(fit_cfg):
+def create_hypersurfaces(fit_cfg, num_parallel=1, bin_chunk_size=None, checkpoint_dir=None):
     """Generate and store mapsets for different discrete systematics sets
     (with a single set characterised by a dedicated pipeline configuration)
 
@@ -476,6 +490,16 @@ def create_hypersurfaces(fit_cfg):
     fit_cfg : string
         Path to a fit config file
 
+    num_parallel : int
+        Number of processes to fit the hypersurfaces with
+
+    bin_chunk_size : int, optional
+        Maximum number of bins fitted per task (default: one task per map)
+
+    checkpoint_dir : string, optional
+        Directory to checkpoint the fit results in, allowing to resume an
+        interrupted fit
+
     Returns
     -------
     hypersurfaces : OrderedDict
@@ -593,32 +617,18 @@ def create_hypersurfaces(fit_cfg):
     # Fit the hypersurface
     #
 
-    hypersurfaces = OrderedDict()
-
-    # Fit one per map, so loop over them
-    for map_name in nominal_mapset.names :
-
-        # Create the hypersurface
-        hypersurface = Hypersurface( 
-            params=params,
-            initial_intercept=1., # Initial value for intercept
-        )
-
-        # Get just the requested map
-        nominal_map = nominal_mapset[map_name]
-        sys_maps = [ s[map_name] for s in sys_mapsets ]
-
-        # Perform fit
-        hypersurface.fit(
-            nominal_map=nominal_map,
-            nominal_param_values=nominal_param_values,
-            sys_maps=sys_maps,
-            sys_param_values=sys_param_values,
-            norm=True,
-        )
-
-        # Store the result
-        hypersurfaces[map_name] = hypersurface
+    # Fit one per map
+    hypersurfaces = parallel_fit_hypersurfaces(
+        nominal_mapset=nominal_mapset,
+        nominal_param_values=nominal_param_values,
+        sys_mapsets=sys_mapsets,
+        sys_param_values=sys_param_values,
+        params=params,
+        log=False,
+        num_parallel=num_parallel,
+        bin_chunk_size=bin_chunk_size,
+        checkpoint_dir=checkpoint_dir,
+    )
 
     # Done
     return hypersurfaces
@@ -633,7 +643,12 @@ def main():
     set_verbosity(args.v)
 
     # Read in data and fit hypersurfaces to it
-    hypersurfaces = create_hypersurfaces(fit_cfg=args.fit_cfg)
+    hypersurfaces = create_hypersurfaces(
+        fit_cfg=args.fit_cfg,
+        num_parallel=args.num_parallel,
+        bin_chunk_size=args.bin_chunk_size,
+        checkpoint_dir=args.checkpoint_dir,
+    )
 
     # Store as JSON
     mkdir(args.outdir)
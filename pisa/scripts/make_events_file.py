@@ -14,13 +14,14 @@ from collections import OrderedDict
 from copy import deepcopy
 import os
 
+import h5py
 import numpy as np
 
 from pisa.core.events import Events
 from pisa.utils.data_proc_params import DataProcParams
 from pisa.utils.format import list2hrlist
-from pisa.utils.fileio import expand, mkdir, to_file
-from pisa.utils.flavInt import (FlavIntData, NuFlav, NuFlavIntGroup,
+from pisa.utils.fileio import check_file_exists, expand, mkdir, to_file
+from pisa.utils.flavInt import (BarSep, FlavIntData, NuFlav, NuFlavIntGroup,
                                 ALL_NUFLAVINTS, ALL_NUINT_TYPES, xlateGroupsStr)
 from pisa.utils.log import logging, set_verbosity
 from pisa.utils.mcSimRunSettings import DetMCSimRunsSettings
@@ -28,7 +29,7 @@ from pisa.utils.resources import find_resource
 
 
 __all__ = ['EXAMPLE', 'CMSQ_TO_MSQ', 'EXTRACT_FIELDS', 'OUTPUT_FIELDS',
-           'powerLawIntegral', 'makeEventsFile',
+           'powerLawIntegral', 'append_to_dataset', 'makeEventsFile',
            'parse_args', 'main']
 
 __author__ = 'J.L. Lanfranchi'
@@ -97,6 +98,22 @@ def powerLawIntegral(E0, E1, gamma):
     return I.evalf(subs={E: E1}) - I.evalf(subs={E: E0})
 
 
+def append_to_dataset(group, name, data):
+    """Append `data` along the first axis of the dataset `name` in the h5py
+    `group`, creating a resizable dataset if it does not exist yet"""
+    data = np.asarray(data)
+    if name not in group:
+        group.create_dataset(
+            name=name, data=data, maxshape=(None,) + data.shape[1:],
+            chunks=True, compression=None, shuffle=True, fletcher32=False
+        )
+        return
+    dset = group[name]
+    start = len(dset)
+    dset.resize(start + len(data), axis=0)
+    dset[start:] = data
+
+
 def makeEventsFile(data_files, detector, proc_ver, cut, outdir,
                    run_settings=None, data_proc_params=None, join=None,
                    cust_cuts=None, extract_fields=EXTRACT_FIELDS,
@@ -320,199 +337,6 @@ def makeEventsFile(data_files, detector, proc_ver, cut, outdir,
         for flavintgrp1 in flavint_groupings[grp_n+1:]:
             assert len(set(flavintgrp0).intersection(set(flavintgrp1))) == 0
 
-    flavintgrp_names = [str(flavintgrp) for flavintgrp in flavint_groupings]
-
-    # Instantiate storage for all intermediate destination fields;
-    # The data structure looks like:
-    #   extracted_data[group #][interaction type][field name] = list of data
-    if extract_fields is None:
-        extracted_data = [
-            {
-                inttype: {} for inttype in ALL_NUINT_TYPES
-            }
-            for _ in flavintgrp_names
-        ]
-    else:
-        extracted_data = [
-            {
-                inttype: {field: [] for field in extract_fields}
-                for inttype in ALL_NUINT_TYPES
-            }
-            for _ in flavintgrp_names
-        ]
-
-    # Instantiate generated-event counts for destination fields; count
-    # CClseparately from NC because aeff's for CC & NC add, whereas
-    # aeffs intra-CC should be weighted-averaged (as for intra-NC)
-    ngen = [
-        {inttype: {} for inttype in ALL_NUINT_TYPES}
-        for _ in flavintgrp_names
-    ]
-
-    # Loop through all of the files, retrieving the events, filtering,
-    # and recording the number of generated events pertinent to
-    # calculating aeff
-    filecount = {}
-    detector_geom = None
-    bad_files = []
-    for run, fnames in data_files.items():
-        file_count = 0
-        for fname in fnames:
-            # Retrieve data from all nodes specified in the processing
-            # settings file
-            logging.trace('Trying to get data from file %s', fname)
-            try:
-                data = data_proc_params.get_data(
-                    fname, run_settings=run_settings
-                )
-            except (ValueError, KeyError, IOError):
-                logging.warning('Bad file encountered: %s', fname)
-                bad_files.append(fname)
-                continue
-
-            file_count += 1
-
-            # Check to make sure only one run is present in the data
-            runs_in_data = set(data['run'])
-            assert len(runs_in_data) == 1, 'Must be just one run in data'
-
-            #run = int(data['run'][0])
-            if not run in filecount:
-                filecount[run] = 0
-            filecount[run] += 1
-            rs_run = run_settings[run]
-
-            # Record geom; check that geom is consistent with other runs
-            if detector_geom is None:
-                detector_geom = rs_run['geom']
-            assert rs_run['geom'] == detector_geom, \
-                    'All runs\' geometries must match!'
-
-            # Loop through all flavints spec'd for run
-            for run_flavint in rs_run['flavints']:
-                barnobar = run_flavint.bar_code
-                int_type = run_flavint.intType
-
-                # Retrieve this-interaction-type- & this-barnobar-only events
-                # that also pass cuts. (note that cut names are strings)
-                intonly_cut_data = data_proc_params.apply_cuts(
-                    data,
-                    cuts=cuts+[str(int_type), str(barnobar)],
-                    return_fields=extract_fields
-                )
-
-                # Record the generated count and data for this run/flavor for
-                # each group to which it's applicable
-                for grp_n, flavint_group in enumerate(flavint_groupings):
-                    if not run_flavint in flavint_group:
-                        continue
-
-                    # Instantiate a field for particles and antiparticles,
-                    # keyed by the output of the bar_code property for each
-                    if not run in ngen[grp_n][int_type]:
-                        ngen[grp_n][int_type][run] = {
-                            NuFlav(12).bar_code: 0,
-                            NuFlav(-12).bar_code: 0,
-                        }
-
-                    # Record count only if it hasn't already been recorded
-                    if ngen[grp_n][int_type][run][barnobar] == 0:
-                        # Note that one_weight includes cc/nc:total fraction,
-                        # so DO NOT specify the full flavint here, only flav
-                        # (since one_weight does NOT take bar/nobar fraction,
-                        # it must be included here in the ngen computation)
-                        flav_ngen = run_settings.get_num_gen(run=run,
-                                                             barnobar=barnobar)
-                        ngen[grp_n][int_type][run][barnobar] = flav_ngen
-
-                    # Append the data. Note that extracted_data is:
-                    # extracted_data[group n][int_type][extract field name] =
-                    #   list
-                    if extract_fields is None:
-                        for f in intonly_cut_data.keys():
-                            if f not in extracted_data[grp_n][int_type]:
-                                extracted_data[grp_n][int_type][f] = []
-                            extracted_data[grp_n][int_type][f].extend(
-                                intonly_cut_data[f]
-                            )
-                    else:
-                        for f in extract_fields:
-                            extracted_data[grp_n][int_type][f].extend(
-                                intonly_cut_data[f]
-                            )
-        logging.info('File count for run %s: %d', run, file_count)
-    to_file(bad_files, '/tmp/bad_files.json')
-
-    if ((output_fields is None
-         and (extract_fields is None or 'one_weight' in extract_fields))
-            or 'weighted_aeff' in output_fields):
-        fmtfields = (' '*12+'flavint_group',
-                     'int type',
-                     '     run',
-                     'part/anti',
-                     'part/anti count',
-                     'aggregate count')
-        fmt_n = [len(f) for f in fmtfields]
-        fmt = '  '.join([r'%'+str(n)+r's' for n in fmt_n])
-        lines = '  '.join(['-'*n for n in fmt_n])
-        logging.info(fmt, fmtfields)
-        logging.info(lines)
-        for grp_n, flavint_group in enumerate(flavint_groupings):
-            for int_type in set([fi.intType for fi in
-                                 flavint_group.flavints]):
-                ngen_it_tot = 0
-                for run, run_counts in ngen[grp_n][int_type].items():
-                    for barnobar, barnobar_counts in run_counts.items():
-                        ngen_it_tot += barnobar_counts
-                        logging.info(
-                            fmt, flavint_group.simple_str(), int_type,
-                            str(run), barnobar, int(barnobar_counts),
-                            int(ngen_it_tot)
-                        )
-                # Convert data to numpy array
-                if extract_fields is None:
-                    for field in extracted_data[grp_n][int_type].keys():
-                        extracted_data[grp_n][int_type][field] = \
-                                np.array(extracted_data[grp_n][int_type][field])
-                else:
-                    for field in extract_fields:
-                        extracted_data[grp_n][int_type][field] = \
-                                np.array(extracted_data[grp_n][int_type][field])
-                # Generate weighted_aeff field for this group / int type's data
-                extracted_data[grp_n][int_type]['weighted_aeff'] = \
-                        extracted_data[grp_n][int_type]['one_weight'] \
-                        / ngen_it_tot * CMSQ_TO_MSQ
-
-    # Report file count per run
-    for run, count in filecount.items():
-        logging.info('Files read, run %s: %d', run, count)
-        ref_num_i3_files = run_settings[run]['num_i3_files']
-        if count != ref_num_i3_files:
-            logging.warning(
-                'Run %s, Number of files read (%d) != number of '
-                'source I3 files (%d), which may indicate an error.',
-                run, count, ref_num_i3_files
-            )
-
-    # Generate output data
-    for flavint in ALL_NUFLAVINTS:
-        int_type = flavint.intType
-        for grp_n, flavint_group in enumerate(flavint_groupings):
-            if not flavint in flavint_group:
-                logging.trace('flavint %s not in flavint_group %s, passing.',
-                              flavint, flavint_group)
-                continue
-            else:
-                logging.trace(
-                    'flavint %s **IS** in flavint_group %s, storing.',
-                    flavint, flavint_group
-                )
-            if output_fields is None:
-                evts[flavint] = extracted_data[grp_n][int_type]
-            else:
-                evts[flavint] = {f: extracted_data[grp_n][int_type][f]
-                                 for f in output_fields}
-
     # Generate file name
     numerical_runs = []
     alphanumerical_runs = []
@@ -540,8 +364,220 @@ def makeEventsFile(data_files, detector, proc_ver, cut, outdir,
     outfpath = os.path.join(outdir, fname)
     logging.info('Writing events to %s', outfpath)
 
-    # Save data to output file
-    evts.save(outfpath)
+    def flavint_path(flavint):
+        """Path of the node holding a flavint's data (as `FlavIntData` names
+        it) in the output file"""
+        with BarSep('_'):
+            return '/%s/%s' % (flavint.flav, flavint.int_type)
+
+    # The events of each group / interaction type are stored in the output
+    # file under the group's first flavint of that interaction type (and
+    # hardlinked for the other flavints once all files have been read)
+    data_paths = OrderedDict()
+    for flavint in ALL_NUFLAVINTS:
+        for grp_n, flavint_group in enumerate(flavint_groupings):
+            if flavint in flavint_group:
+                data_paths.setdefault(
+                    (grp_n, flavint.int_type), flavint_path(flavint)
+                )
+
+    compute_aeff = (
+        (output_fields is None
+         and (extract_fields is None or 'one_weight' in extract_fields))
+        or (output_fields is not None and 'weighted_aeff' in output_fields)
+    )
+
+    # Instantiate generated-event counts for destination fields; count
+    # CClseparately from NC because aeff's for CC & NC add, whereas
+    # aeffs intra-CC should be weighted-averaged (as for intra-NC)
+    ngen = [
+        {inttype: {} for inttype in ALL_NUINT_TYPES}
+        for _ in flavint_groupings
+    ]
+
+    # Loop through all of the files, retrieving the events, filtering,
+    # and recording the number of generated events pertinent to
+    # calculating aeff. Each file's events are appended to the output file
+    # right away, such that memory use does not grow with the number of files.
+    check_file_exists(fname=outfpath, overwrite=True, warn=True)
+    h5file = h5py.File(outfpath, 'w')
+    try:
+        h5file.attrs.update(evts.metadata)
+        filecount = {}
+        bad_files = []
+        for run, fnames in data_files.items():
+            file_count = 0
+            for fname in fnames:
+                # Retrieve data from all nodes specified in the processing
+                # settings file
+                logging.trace('Trying to get data from file %s', fname)
+                try:
+                    data = data_proc_params.get_data(
+                        fname, run_settings=run_settings
+                    )
+                except (ValueError, KeyError, IOError):
+                    logging.warning('Bad file encountered: %s', fname)
+                    bad_files.append(fname)
+                    continue
+
+                file_count += 1
+
+                # Check to make sure only one run is present in the data
+                runs_in_data = set(data['run'])
+                assert len(runs_in_data) == 1, 'Must be just one run in data'
+
+                #run = int(data['run'][0])
+                if not run in filecount:
+                    filecount[run] = 0
+                filecount[run] += 1
+                rs_run = run_settings[run]
+
+                # Check that geom is consistent with that in the file name
+                assert rs_run['geom'] == detector_geom, \
+                        'All runs\' geometries must match!'
+
+                # Loop through all flavints spec'd for run
+                for run_flavint in rs_run['flavints']:
+                    barnobar = run_flavint.flav.bar_code
+                    int_type = run_flavint.int_type
+
+                    # Retrieve this-interaction-type- & this-barnobar-only
+                    # events that also pass cuts. (note that cut names are
+                    # strings)
+                    intonly_cut_data = data_proc_params.apply_cuts(
+                        data,
+                        cuts=cuts+[str(int_type), str(barnobar)],
+                        return_fields=extract_fields
+                    )
+
+                    # Record the generated count and data for this run/flavor
+                    # for each group to which it's applicable
+                    for grp_n, flavint_group in enumerate(flavint_groupings):
+                        if not run_flavint in flavint_group:
+                            continue
+
+                        # Instantiate a field for particles and antiparticles,
+                        # keyed by the output of the bar_code property for each
+                        if not run in ngen[grp_n][int_type]:
+                            ngen[grp_n][int_type][run] = {
+                                NuFlav(12).bar_code: 0,
+                                NuFlav(-12).bar_code: 0,
+                            }
+
+                        # Record count only if it hasn't already been recorded
+                        if ngen[grp_n][int_type][run][barnobar] == 0:
+                            # Note that one_weight includes cc/nc:total
+                            # fraction, so DO NOT specify the full flavint
+                            # here, only flav (since one_weight does NOT take
+                            # bar/nobar fraction, it must be included here in
+                            # the ngen computation)
+                            flav_ngen = run_settings.get_num_gen(
+                                run=run, barnobar=barnobar
+                            )
+                            ngen[grp_n][int_type][run][barnobar] = flav_ngen
+
+                        # Append the data to the group / int type's datasets.
+                        # "weighted_aeff" starts out as a copy of one_weight,
+                        # which is normalized once all files have been read.
+                        node = h5file.require_group(
+                            data_paths[(grp_n, int_type)]
+                        )
+                        if extract_fields is None:
+                            fields = intonly_cut_data.keys()
+                        else:
+                            fields = extract_fields
+                        for f in fields:
+                            if output_fields is None or f in output_fields:
+                                append_to_dataset(node, f, intonly_cut_data[f])
+                        if compute_aeff:
+                            append_to_dataset(
+                                node, 'weighted_aeff',
+                                np.asarray(intonly_cut_data['one_weight'],
+                                           dtype=np.float64)
+                            )
+            logging.info('File count for run %s: %d', run, file_count)
+        to_file(bad_files, '/tmp/bad_files.json')
+
+        # Datasets of groups / int types without any events are empty
+        if output_fields is not None:
+            expected_fields = list(output_fields)
+        elif extract_fields is not None:
+            expected_fields = list(extract_fields)
+            if compute_aeff:
+                expected_fields.append('weighted_aeff')
+        else:
+            expected_fields = []
+        for data_path in data_paths.values():
+            node = h5file.require_group(data_path)
+            for field in expected_fields:
+                if field not in node:
+                    append_to_dataset(node, field, np.array([]))
+
+        if compute_aeff:
+            fmtfields = (' '*12+'flavint_group',
+                         'int type',
+                         '     run',
+                         'part/anti',
+                         'part/anti count',
+                         'aggregate count')
+            fmt_n = [len(f) for f in fmtfields]
+            fmt = '  '.join([r'%'+str(n)+r's' for n in fmt_n])
+            lines = '  '.join(['-'*n for n in fmt_n])
+            logging.info(fmt, fmtfields)
+            logging.info(lines)
+            for grp_n, flavint_group in enumerate(flavint_groupings):
+                for int_type in set([fi.int_type for fi in
+                                     flavint_group.flavints]):
+                    ngen_it_tot = 0
+                    for run, run_counts in ngen[grp_n][int_type].items():
+                        for barnobar, barnobar_counts in run_counts.items():
+                            ngen_it_tot += barnobar_counts
+                            logging.info(
+                                fmt, flavint_group.simple_str(), int_type,
+                                str(run), barnobar, int(barnobar_counts),
+                                int(ngen_it_tot)
+                            )
+                    # Generate weighted_aeff field for this group / int type's
+                    # data, normalizing the stored one_weight chunk by chunk
+                    dset = h5file[data_paths[(grp_n, int_type)]]['weighted_aeff']
+                    chunk_rows = dset.chunks[0] if dset.chunks else len(dset)
+                    for start in range(0, len(dset), max(chunk_rows, 1)):
+                        stop = min(start + chunk_rows, len(dset))
+                        dset[start:stop] = \
+                                dset[start:stop] / ngen_it_tot * CMSQ_TO_MSQ
+
+        # Report file count per run
+        for run, count in filecount.items():
+            logging.info('Files read, run %s: %d', run, count)
+            ref_num_i3_files = run_settings[run]['num_i3_files']
+            if count != ref_num_i3_files:
+                logging.warning(
+                    'Run %s, Number of files read (%d) != number of '
+                    'source I3 files (%d), which may indicate an error.',
+                    run, count, ref_num_i3_files
+                )
+
+        # Link the datasets of each flavint to those of its group / int type
+        for flavint in ALL_NUFLAVINTS:
+            int_type = flavint.int_type
+            for grp_n, flavint_group in enumerate(flavint_groupings):
+                if not flavint in flavint_group:
+                    logging.trace('flavint %s not in flavint_group %s, passing.',
+                                  flavint, flavint_group)
+                    continue
+                else:
+                    logging.trace(
+                        'flavint %s **IS** in flavint_group %s, storing.',
+                        flavint, flavint_group
+                    )
+                data_path = data_paths[(grp_n, int_type)]
+                if flavint_path(flavint) == data_path:
+                    continue
+                node = h5file.require_group(flavint_path(flavint))
+                for field, dset in h5file[data_path].items():
+                    node[field] = dset
+    finally:
+        h5file.close()
 
 
 def parse_args():
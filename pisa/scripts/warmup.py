@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+
+"""
+Precompile PISA's Numba kernels and store them in the on-disk Numba cache, such
+that subsequent processes (e.g. batch jobs) load the compiled machine code
+instead of spending time in JIT compilation.
+
+All modules of PISA are imported, which compiles the kernels with explicit
+signatures (e.g. `guvectorize`); lazily compiled kernels are then compiled for
+the signatures they were registered with via
+`pisa.utils.numba_tools.register_kernel`.
+
+Kernels are compiled for the `TARGET` and `FTYPE` of the current environment
+(see `PISA_TARGET` and `PISA_FTYPE` env vars), so run this once for each
+combination you use. Numba checks whether the source file defining a kernel
+has changed, but not whether functions it calls (defined in other files) have
+changed. The default cache dir therefore contains a hash of all PISA modules
+using Numba (see `pisa/__init__.py`); if you set `NUMBA_CACHE_DIR` yourself,
+use `--clear` after modifying such functions.
+"""
+
+
+from __future__ import absolute_import, division, print_function
+
+from argparse import ArgumentParser
+from importlib import import_module
+import os
+import pkgutil
+import shutil
+import time
+
+from numba import config as numba_config, sigutils
+
+import pisa
+from pisa import FTYPE, TARGET
+from pisa.utils.log import logging, set_verbosity
+from pisa.utils.numba_tools import KERNELS
+
+
+__all__ = [
+    'EXCLUDED_PACKAGES', 'import_all_modules', 'compile_registered_kernels',
+    'parse_args', 'main'
+]
+
+__license__ = '''Copyright (c) 2014-2020, The IceCube Collaboration
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.'''
+
+
+EXCLUDED_PACKAGES = ('pisa.scripts',)
+"""Packages not imported when collecting kernels (they don't define any)"""
+
+
+def import_all_modules():
+    """Import all modules of the `pisa` package (except `EXCLUDED_PACKAGES`),
+    which compiles (or loads from the cache) all kernels with explicit
+    signatures and fills the `KERNELS` registry. Modules that fail to import
+    (e.g. due to missing optional dependencies or resources) are skipped."""
+    for modinfo in pkgutil.walk_packages(
+            pisa.__path__, 'pisa.',
+            onerror=lambda name: logging.debug('Skipping package %s', name)):
+        modname = modinfo.name
+        if modname.startswith(EXCLUDED_PACKAGES):
+            continue
+        t0 = time.time()
+        try:
+            import_module(modname)
+        except ImportError as err:
+            logging.debug('Skipping %s: %s', modname, err)
+            continue
+        except Exception as err: # pylint: disable=broad-except
+            logging.warning('Skipping %s, which failed to import: %s: %s',
+                            modname, type(err).__name__, err)
+            continue
+        logging.debug('%s: %.1f s', modname, time.time() - t0)
+
+
+def compile_registered_kernels():
+    """Compile all lazily compiled kernels in `KERNELS` for the signatures they
+    were registered with"""
+    for name, (kernel, signatures) in KERNELS.items():
+        if not signatures:
+            continue
+        t0 = time.time()
+        for signature in signatures:
+            # Numba's cache is keyed by the signature as passed to `compile`,
+            # which must hence be the tuple of argument types as used on call
+            args, _ = sigutils.normalize_signature(signature)
+            kernel.compile(tuple(args))
+        logging.debug('%s: %.1f s', name, time.time() - t0)
+
+
+def parse_args():
+    """Parse command line arguments"""
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument(
+        '--clear', action='store_true',
+        help='''Remove all cached kernels for the current TARGET and FTYPE
+        before compiling'''
+    )
+    parser.add_argument(
+        '-v', action='count', default=1,
+        help='Set verbosity level'
+    )
+    return parser.parse_args()
+
+
+def main():
+    """Compile all of PISA's kernels into the Numba cache"""
+    args = parse_args()
+    set_verbosity(args.v)
+
+    if TARGET == 'cuda':
+        logging.warning('Numba cannot cache CUDA kernels; nothing to do.')
+        return
+
+    cache_dir = numba_config.CACHE_DIR
+    if args.clear and os.path.isdir(cache_dir):
+        logging.info('Removing Numba cache dir "%s"', cache_dir)
+        shutil.rmtree(cache_dir)
+
+    logging.info(
+        'Compiling kernels for TARGET=%s, FTYPE=%s into "%s"',
+        TARGET, FTYPE.__name__, cache_dir
+    )
+    t0 = time.time()
+    import_all_modules()
+    logging.info('Imported all modules: %.1f s', time.time() - t0)
+    t1 = time.time()
+    compile_registered_kernels()
+    logging.info('Compiled registered kernels: %.1f s', time.time() - t1)
+    logging.info('Done; total %.1f s', time.time() - t0)
+
+
+if __name__ == '__main__':
+    main()
@@ -79,6 +79,7 @@ class pi_aeff(PiStage):  # pylint: disable=invalid-name
             output_specs=output_specs,
             input_apply_keys=input_apply_keys,
             output_apply_keys=output_apply_keys,
+            grad_params=expected_params,
         )
 
         assert self.input_mode is not None
@@ -112,3 +113,24 @@ class pi_aeff(PiStage):  # pylint: disable=invalid-name
                 scale=scale,
                 out=container['weights'],
             )
+
+    def log_weight_grad_function(self, param_name):
+        # all params are overall scale factors, so d(log w)/dp = 1/p for the
+        # containers they apply to
+        value = self.params[param_name].m
+        if value == 0:
+            return None
+
+        grads = {}
+        for container in self.data:
+            if param_name == 'nutau_cc_norm':
+                applies = container.name in ['nutau_cc', 'nutaubar_cc']
+            elif param_name == 'nutau_norm':
+                applies = 'nutau' in container.name
+            elif param_name == 'nu_nc_norm':
+                applies = 'nc' in container.name
+            else:
+                applies = True
+            if applies:
+                grads[container.name] = 1. / value
+        return grads
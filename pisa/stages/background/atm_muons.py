@@ -12,7 +12,7 @@ from pisa.core.pi_stage import PiStage
 from pisa.utils.resources import open_resource
 from pisa.utils.log import logging
 from pisa.utils.profiler import profile
-from pisa.utils.numba_tools import WHERE, myjit, ftype
+from pisa.utils.numba_tools import NUMBA_CACHE, WHERE, myjit, ftype
 
 __all__ = ["atm_muons"]
 
@@ -224,6 +224,6 @@ if FTYPE == np.float64:
 else:
     signature = '(f4, f4, f4[:])'
 
-@guvectorize([signature], '(),()->()', target=TARGET)
+@guvectorize([signature], '(),()->()', target=TARGET, cache=NUMBA_CACHE)
 def apply_atm_muon_sys(weight_mod,atm_muon_scale,out):
     out[0] *= weight_mod * atm_muon_scale
\ No newline at end of file
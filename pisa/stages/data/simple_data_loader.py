@@ -23,9 +23,11 @@ class simple_data_loader(PiStage):
     Parameters
     ----------
 
-    events_file : hdf5 file path
+    events_file : hdf5 file path or columnar events directory
         output from make_events, including flux weights
-        and Genie systematics coefficients
+        and Genie systematics coefficients; a columnar events store (see
+        `pisa.core.events_pi.write_columnar_events`) is opened memory-mapped,
+        and only the variables in `data_dict` are read
 
     mc_cuts : cut expr
         e.g. '(true_coszen <= 0.5) & (true_energy <= 70)'
@@ -173,8 +175,12 @@ class simple_data_loader(PiStage):
                 )
 
             # add the events data to the container
+            # (memory-mapped arrays from a columnar events store are used
+            # in place rather than read into memory all at once)
             for key, val in self.evts[name].items():
-                container.add_array_data(key, val)
+                container.add_array_data(
+                    key, val, copy=not isinstance(val, np.memmap)
+                )
 
             # create weights arrays:
             # * `initial_weights` as starting point (never modified)
@@ -15,9 +15,10 @@ from numba import guvectorize
 import numpy as np
 
 from pisa import FTYPE, TARGET
+from pisa.core.container import VirtualContainer
 from pisa.core.pi_stage import PiStage
 from pisa.utils.log import logging
-from pisa.utils.numba_tools import WHERE
+from pisa.utils.numba_tools import NUMBA_CACHE, WHERE
 from pisa.utils import vectorizer
 import pisa.utils.hypersurface as hs
 
@@ -129,6 +130,7 @@ class pi_hypersurfaces(PiStage): # pylint: disable=invalid-name
             output_calc_keys=output_calc_keys,
             input_apply_keys=input_apply_keys,
             output_apply_keys=output_apply_keys,
+            grad_params=self.hypersurface_param_names,
         )
 
         # -- Only allowed/implemented modes -- #
@@ -192,7 +194,12 @@ class pi_hypersurfaces(PiStage): # pylint: disable=invalid-name
             else:
                 container_hs = self.hypersurfaces[container.name]
             # Get the hypersurface scale factors (reshape to 1D array)
-            if self.propagate_uncertainty:
+            if self.propagate_uncertainty and container_hs.supports_fused_evaluation:
+                # evaluate directly into the container arrays
+                scales = container["hs_scales"].get('host')
+                uncertainties = container["hs_scales_uncertainty"].get('host')
+                container_hs.evaluate_with_uncertainty(param_values, out=scales, sigma=uncertainties)
+            elif self.propagate_uncertainty:
                 scales, uncertainties = container_hs.evaluate(param_values, return_uncertainty=True)
                 scales = scales.reshape(container.size)
                 uncertainties = uncertainties.reshape(container.size)
@@ -219,6 +226,47 @@ class pi_hypersurfaces(PiStage): # pylint: disable=invalid-name
         # Unlink the containers again
         self.data.unlink_containers()
 
+    def log_weight_grad_function(self, param_name):
+        # scales are only applied bin-wise to binned outputs here
+        if self.output_mode != "binned":
+            return None
+
+        if self.links is not None:
+            for key, val in self.links.items():
+                self.data.link_containers(key, val)
+
+        param_values = {sys_param_name: self.params[sys_param_name].m
+                        for sys_param_name in self.hypersurface_param_names}
+        if self.interpolated:
+            osc_params = {name: self.params[name] for name in self.inter_params}
+
+        grads = {}
+        try:
+            for container in self.data:
+                if self.interpolated:
+                    container_hs = self.hypersurfaces[container.name].get_hypersurface(**osc_params)
+                else:
+                    container_hs = self.hypersurfaces[container.name]
+                scales = container_hs.evaluate(param_values).reshape(container.size)
+                if np.any(scales == 0.):
+                    return None
+                log_grad = container_hs.evaluate_log_grad(param_values, param_name).reshape(container.size)
+                # empty bins get a constant scale of 1 and weights that become
+                # negative are set to 0, so neither depends on the param
+                log_grad[~(np.isfinite(scales) & (scales > 0.))] = 0.
+                if not np.all(np.isfinite(log_grad)):
+                    return None
+                if isinstance(container, VirtualContainer):
+                    names = [c.name for c in container]
+                else:
+                    names = [container.name]
+                for name in names:
+                    grads[name] = log_grad
+        finally:
+            self.data.unlink_containers()
+
+        return grads
+
     def apply_function(self):
         for container in self.data:
             # update uncertainty first, before the weights are changed
@@ -247,7 +295,7 @@ if FTYPE == np.float32:
     _SIGNATURE = ['(f4[:], f4[:], f4[:])']
 else:
     _SIGNATURE = ['(f8[:], f8[:], f8[:])']
-@guvectorize(_SIGNATURE, '(),()->()', target=TARGET)
+@guvectorize(_SIGNATURE, '(),()->()', target=TARGET, cache=NUMBA_CACHE)
 def calc_uncertainty(weight, scale_uncertainty, out):
     '''vectorized error propagation'''
     out[0] = weight[0]*scale_uncertainty[0]
@@ -24,6 +24,7 @@ import scipy.interpolate as interpolate
 from pisa import numba_jit, ureg
 from pisa.core.map import Map, MapSet
 from pisa.core.stage import Stage
+from pisa.utils.hash import hash_file, hash_obj
 from pisa.utils.resources import open_resource
 from pisa.utils.log import logging
 from pisa.utils.profiler import profile
@@ -140,6 +141,9 @@ class honda(Stage): #pylint: disable=invalid-name
         If None, no disk cache is available.
         If str, represents a path with which to instantiate a utils.DiskCache
         object. Must be concurrent-access-safe (across threads and processes).
+        The nominal flux maps (before any flux systematics are applied) are
+        stored there, keyed by the flux table file, output binning and
+        energy scale.
 
     outputs_cache_depth : int >= 0
 
@@ -397,6 +401,8 @@ class honda(Stage): #pylint: disable=invalid-name
 
         self.previous_energy_scale = None
         self.output_maps = None
+        # (flux file, hash of its contents) for the disk cache key
+        self._flux_file_hash = (None, None)
 
     def load_2d_table(self, smooth=0.05):
         """Manipulate 2 dimensional flux tables.
@@ -649,20 +655,31 @@ class honda(Stage): #pylint: disable=invalid-name
 
         if self.params.energy_scale.value != self.previous_energy_scale \
                 or self.output_maps is None:
-            for prim in self.primaries:
-                outbnames = set(self.output_binning.names)
-                if outbnames == set(['true_energy', 'true_coszen',
-                                     'true_azimuth']):
-                    output_maps.append(self.compute_3d_outputs(prim))
-                elif outbnames == set(['true_energy', 'true_coszen']):
-                    output_maps.append(self.compute_2d_outputs(prim))
-                else:
-                    raise ValueError(
-                        'Incompatible `output_binning` for either 2D (requires'
-                        ' "energy" and "coszen") or 3D (additionally requires'
-                        ' "azimuth"). Faulty `output_binning`=%s'
-                        %self.output_binning
-                    )
+            cache_key = None
+            if self.disk_cache is not None:
+                cache_key = self._derive_nominal_flux_hash()
+                if cache_key in self.disk_cache:
+                    logging.trace('Loading nominal flux maps from disk cache')
+                    output_maps = self.disk_cache[cache_key]
+
+            if not output_maps:
+                for prim in self.primaries:
+                    outbnames = set(self.output_binning.names)
+                    if outbnames == set(['true_energy', 'true_coszen',
+                                         'true_azimuth']):
+                        output_maps.append(self.compute_3d_outputs(prim))
+                    elif outbnames == set(['true_energy', 'true_coszen']):
+                        output_maps.append(self.compute_2d_outputs(prim))
+                    else:
+                        raise ValueError(
+                            'Incompatible `output_binning` for either 2D (requires'
+                            ' "energy" and "coszen") or 3D (additionally requires'
+                            ' "azimuth"). Faulty `output_binning`=%s'
+                            %self.output_binning
+                        )
+                if cache_key is not None:
+                    self.disk_cache[cache_key] = output_maps
+
             self.previous_energy_scale = self.params.energy_scale.value
             self.output_maps = output_maps
 
@@ -687,6 +704,19 @@ class honda(Stage): #pylint: disable=invalid-name
 
         return scaled_output_maps
 
+    def _derive_nominal_flux_hash(self):
+        """Hash of everything the nominal flux maps (computed by
+        `compute_2d_outputs` or `compute_3d_outputs`) depend on"""
+        flux_file = self.params.flux_file.value
+        if self._flux_file_hash[0] != flux_file:
+            self._flux_file_hash = (flux_file, hash_file(flux_file))
+        return hash_obj(
+            [self.__class__.__name__, self._flux_file_hash[1],
+             self.params.flux_mode.value, self.output_binning.hash,
+             self.params.energy_scale.m_as('dimensionless'), self.primaries],
+            full_hash=self.full_hash
+        )
+
     def compute_2d_binning_constants(self):
         self.bin_volumes = self.output_binning.bin_volumes(attach_units=False)
         # Adds/ensures the expected units for the binning
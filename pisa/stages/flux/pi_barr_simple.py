@@ -16,7 +16,7 @@ from numba import guvectorize, cuda
 from pisa import FTYPE, TARGET
 from pisa.core.pi_stage import PiStage
 from pisa.utils.profiler import profile
-from pisa.utils.numba_tools import WHERE, myjit, ftype
+from pisa.utils.numba_tools import NUMBA_CACHE, WHERE, myjit, ftype
 from pisa.utils.resources import find_resource
 from pisa.utils.barr_parameterization import modRatioNuBar, modRatioUpHor
 
@@ -80,6 +80,7 @@ class pi_barr_simple(PiStage):  # pylint: disable=invalid-name
             input_calc_keys=input_calc_keys,
             output_calc_keys=output_calc_keys,
             output_apply_keys=output_apply_keys,
+            grad_params=("delta_index",),
         )
 
         assert self.input_mode is not None
@@ -117,6 +118,20 @@ class pi_barr_simple(PiStage):  # pylint: disable=invalid-name
             )
             container["nu_flux"].mark_changed(WHERE)
 
+    def log_weight_grad_function(self, param_name):
+        # The spectral index scales all flavours of the flux (and hence the
+        # weights) by (E / E_pivot)**delta_index; the other params act
+        # differently on nue and numu, so their effect on the weights depends
+        # on the oscillation probabilities
+        if self.calc_mode != self.output_mode:
+            return None
+        # pivot energy as hard-coded in `apply_sys_kernel`
+        egy_pivot = 24.0900951261
+        return {
+            container.name: np.log(container["true_energy"].get("host") / egy_pivot)
+            for container in self.data
+        }
+
 
 @myjit
 def apply_ratio_scale(ratio_scale, sum_constant, in1, in2, out):
@@ -226,7 +241,9 @@ else:
     SIGNATURE = "(f4, f4, f4[:], f4[:], i4, f4, f4, f4, f4, f4, f4[:])"
 
 
-@guvectorize([SIGNATURE], "(),(),(d),(d),(),(),(),(),(),()->(d)", target=TARGET)
+@guvectorize(
+    [SIGNATURE], "(),(),(d),(d),(),(),(),(),(),()->(d)", target=TARGET, cache=NUMBA_CACHE
+)
 def apply_sys_vectorized(
     true_energy,
     true_coszen,
@@ -10,9 +10,11 @@ import numpy as np
 
 from pisa import FTYPE
 from pisa.core.pi_stage import PiStage
+from pisa.utils.hash import hash_file
 from pisa.utils.log import logging
 from pisa.utils.profiler import profile
-from pisa.utils.flux_weights import load_2d_table, calculate_2d_flux_weights
+from pisa.utils.flux_weights import (load_2d_table, calculate_2d_flux_weights,
+                                     get_flux_cache, get_flux_cache_key)
 
 
 class pi_honda_ip(PiStage):
@@ -26,6 +28,13 @@ class pi_honda_ip(PiStage):
 
             flux_table : str
 
+    disk_cache : None, bool, str, or ArrayCache
+        Cache for the nominal fluxes, which only depend on the flux table and the
+        events' true energies and coszens. If None or False, the fluxes are
+        computed on every setup. If True, a cache in the directory "flux_weights"
+        under `pisa.CACHE_DIR` is used; if str, the directory at that path
+        (relative to `pisa.CACHE_DIR` if not absolute).
+
     """
 
     def __init__(
@@ -38,6 +47,7 @@ class pi_honda_ip(PiStage):
         input_specs=None,
         calc_specs=None,
         output_specs=None,
+        disk_cache=None,
     ):
 
         expected_params = ('flux_table',)
@@ -73,9 +83,13 @@ class pi_honda_ip(PiStage):
         assert self.calc_mode is not None
         assert self.output_mode is not None
 
+        self.disk_cache = get_flux_cache(disk_cache)
+
     def setup_function(self):
 
         self.flux_table = load_2d_table(self.params.flux_table.value)
+        if self.disk_cache is not None:
+            self.flux_table_hash = hash_file(self.params.flux_table.value)
 
         self.data.data_specs = self.calc_specs
         if self.calc_mode == 'binned':
@@ -111,13 +125,35 @@ class pi_honda_ip(PiStage):
         indices = [0, 1, 0, 1]
         tables = ['nue', 'numu', 'nuebar', 'numubar']
         for container in self.data:
-            for out_name, index, table in zip(out_names, indices, tables):
-                logging.info('Calculating nominal %s flux for %s', table, container.name)
-                calculate_2d_flux_weights(true_energies=container['true_energy'].get('host'),
-                                           true_coszens=container['true_coszen'].get('host'),
-                                           en_splines=self.flux_table[table],
-                                           out=container[out_name].get('host')[:, index]
-                                          )
+            true_energies = container['true_energy'].get('host')
+            true_coszens = container['true_coszen'].get('host')
+            if self.disk_cache is not None:
+                # The fluxes only depend on the table and the true variables
+                cache_key = get_flux_cache_key(
+                    self.__class__.__name__, self.flux_table_hash,
+                    true_energies, true_coszens
+                )
+                cached = self.disk_cache.get(cache_key)
+            else:
+                cached = None
+
+            if cached is not None:
+                logging.info('Loading nominal fluxes for %s from cache', container.name)
+                for out_name in ('nu_flux_nominal', 'nubar_flux_nominal'):
+                    np.copyto(src=cached[out_name], dst=container[out_name].get('host'))
+            else:
+                for out_name, index, table in zip(out_names, indices, tables):
+                    logging.info('Calculating nominal %s flux for %s', table, container.name)
+                    calculate_2d_flux_weights(true_energies=true_energies,
+                                              true_coszens=true_coszens,
+                                              en_splines=self.flux_table[table],
+                                              out=container[out_name].get('host')[:, index]
+                                             )
+                if self.disk_cache is not None:
+                    self.disk_cache[cache_key] = {
+                        out_name: container[out_name].get('host')
+                        for out_name in ('nu_flux_nominal', 'nubar_flux_nominal')
+                    }
             container['nu_flux_nominal'].mark_changed('host')
             container['nubar_flux_nominal'].mark_changed('host')
 
@@ -19,9 +19,11 @@ from numba import guvectorize
 
 from pisa import FTYPE, TARGET
 from pisa.core.pi_stage import PiStage
+from pisa.utils.flux_weights import get_flux_cache, get_flux_cache_key
+from pisa.utils.hash import hash_file
 from pisa.utils.log import logging
 from pisa.utils.profiler import profile
-from pisa.utils.numba_tools import WHERE, myjit
+from pisa.utils.numba_tools import NUMBA_CACHE, WHERE, myjit
 from pisa.utils.resources import find_resource
 
 
@@ -33,6 +35,12 @@ class pi_mceq_barr(PiStage):
     ----------
     table_file : pickle file containing pre-generated tables from MCEq
 
+    disk_cache : None, bool, str, or ArrayCache
+        Cache for the nominal fluxes and gradients, which only depend on the
+        tables and the events' true variables (see
+        `pisa.utils.flux_weights.get_flux_cache`). If None or False, they are
+        evaluated on every setup.
+
     params : ParamSet
         Must exclusively have parameters: .. ::
 
@@ -88,6 +96,7 @@ class pi_mceq_barr(PiStage):
         input_specs=None,
         calc_specs=None,
         output_specs=None,
+        disk_cache=None,
     ):
 
         #
@@ -174,6 +183,7 @@ class pi_mceq_barr(PiStage):
 
         # store args
         self.table_file = table_file
+        self.disk_cache = get_flux_cache(disk_cache)
 
         # init base class
         super(pi_mceq_barr, self).__init__(
@@ -257,23 +267,53 @@ class pi_mceq_barr(PiStage):
         # Note that doing this all on CPUs, since the splines reside on the CPUs
         # The actual `compute_function` computation can be done on GPUs though
 
-        # Load the MCEq splines
+        # The MCEq splines are only loaded if any container is not found in the
+        # disk cache
         spline_file = find_resource(self.table_file)
-        logging.info("Loading MCEq spline tables from : %s", spline_file)
-        # Encoding is to support pickle files created with python v2
-        self.spline_tables_dict = pickle.load(BZ2File(spline_file), encoding="latin1")
+        self.spline_tables_dict = None
+        if self.disk_cache is not None:
+            table_hash = hash_file(spline_file)
 
         # Loop over containers
         for container in self.data:
 
+            nu_flux_nominal = container["nu_flux_nominal"].get("host")
+            gradients = container["gradients"].get("host")
+            nubar = container["nubar"]
+
+            if self.disk_cache is not None:
+                cache_key = get_flux_cache_key(
+                    self.__class__.__name__,
+                    table_hash,
+                    container["true_energy"].get("host"),
+                    container["true_coszen"].get("host"),
+                    nubar,
+                    self.gradient_param_names,
+                )
+                cached = self.disk_cache.get(cache_key)
+                if cached is not None:
+                    logging.info(
+                        "Loading nominal flux and gradients for %s from cache",
+                        container.name,
+                    )
+                    np.copyto(src=cached["nu_flux_nominal"], dst=nu_flux_nominal)
+                    np.copyto(src=cached["gradients"], dst=gradients)
+                    container["nu_flux_nominal"].mark_changed("host")
+                    container["gradients"].mark_changed("host")
+                    continue
+
+            if self.spline_tables_dict is None:
+                logging.info("Loading MCEq spline tables from : %s", spline_file)
+                # Encoding is to support pickle files created with python v2
+                self.spline_tables_dict = pickle.load(
+                    BZ2File(spline_file), encoding="latin1"
+                )
+
             # Grab containers here once to save time
             # TODO make spline generation script store splines directly in
             # terms of energy, not ln(energy)
             true_log_energy = np.log(container["true_energy"].get("host"))
             true_abs_coszen = np.abs(container["true_coszen"].get("host"))
-            nu_flux_nominal = container["nu_flux_nominal"].get("host")
-            gradients = container["gradients"].get("host")
-            nubar = container["nubar"]
 
             #
             # Nominal flux
@@ -353,6 +393,12 @@ class pi_mceq_barr(PiStage):
             # Tell the smart arrays we've changed the flux gradient values on the host
             container["gradients"].mark_changed("host")
 
+            if self.disk_cache is not None:
+                self.disk_cache[cache_key] = {
+                    "nu_flux_nominal": nu_flux_nominal,
+                    "gradients": gradients,
+                }
+
     def _eval_spline(self, true_log_energy, true_abs_coszen, spline, out):
         """
         Evaluate the spline for the full arrays of [ ln(energy), abs(coszen) ] values
@@ -511,7 +557,9 @@ if FTYPE == np.float64:
     SIGNATURE = SIGNATURE.replace("f4", "f8")
 
 
-@guvectorize([SIGNATURE], "(),(),(),(),(b),(b,c),(c)->(b)", target=TARGET)
+@guvectorize(
+    [SIGNATURE], "(),(),(),(),(b),(b,c),(c)->(b)", target=TARGET, cache=NUMBA_CACHE
+)
 def apply_sys_vectorized(
     true_energy,
     true_coszen,
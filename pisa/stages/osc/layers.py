@@ -5,6 +5,8 @@ Calculation of Earth layers and electron densities.
 
 from __future__ import division
 
+import threading
+
 import numpy as np
 try:
     import numba
@@ -12,11 +14,15 @@ except ImportError:
     numba = None
 
 from pisa import FTYPE
+from pisa.utils.cache import MemoryCache
 from pisa.utils.fileio import from_file
+from pisa.utils.hash import hash_obj
 from pisa.utils.log import logging, set_verbosity
 
 
-__all__ = ['extCalcLayers', 'Layers']
+__all__ = ['LAYER_GEOMETRY_CACHE_DEPTH', 'LAYER_GEOMETRY_CACHE',
+           'extCalcLayerGeometry', 'scaleLayerDensities', 'extCalcLayers',
+           'Layers']
 
 __author__ = 'P. Eller'
 
@@ -47,8 +53,22 @@ else:
     ftype = numba.typeof(FTYPE(1))
 
 
+LAYER_GEOMETRY_CACHE_DEPTH = 20
+"""Maximum number of coszen arrays whose layer geometry is kept in memory"""
+
+LAYER_GEOMETRY_CACHE = MemoryCache(
+    max_depth=LAYER_GEOMETRY_CACHE_DEPTH, is_lru=True
+)
+"""Process-wide cache of the paths through the Earth, shared by all `Layers`
+instances (and hence by the oscillation and absorption stages). Keys are
+`(prem_file, detector_depth, prop_height, coszen hash)`, values are the
+electron-fraction independent outputs of `extCalcLayerGeometry`."""
+
+_LAYER_GEOMETRY_CACHE_LOCK = threading.Lock()
+
+
 @jit(nopython=True, nogil=True, cache=True)
-def extCalcLayers(
+def extCalcLayerGeometry(
         cz,
         r_detector,
         prop_height,
@@ -56,12 +76,16 @@ def extCalcLayers(
         max_layers,
         min_detector_depth,
         rhos,
-        YeFrac,
         YeOuterRadius,
-        default_elec_frac,
         coszen_limit,
         radii):
-    """Layer density/distance calculator for each coszen specified.
+    """Layer matter density/distance calculator for each coszen specified,
+    independent of the electron fractions.
+
+    Instead of the electron fraction itself, each traversed layer is assigned
+    an index into the array `[YeFrac[0], ..., YeFrac[-1], default_elec_frac]`
+    such that the electron densities can be obtained by a cheap rescaling (see
+    `scaleLayerDensities`) whenever the electron fractions change.
 
     Accelerated with Numba if present.
 
@@ -74,23 +98,28 @@ def extCalcLayers(
     max_layers
     min_detector_depth
     rhos
-    YeFrac
     YeOuterRadius
-    default_elec_frac
     coszen_limit
+    radii
 
     Returns
     -------
     n_layers : int number of layers
-    density : array of densities, flattened from (cz, max_layers)
+    matter_density : array of matter densities, flattened from (cz, max_layers)
     distance : array of distances per layer, flattened from (cz, max_layers)
+    ye_index : array of electron fraction indices, flattened from
+        (cz, max_layers)
 
     """
     # Something to store the final results in
     shape = (np.int64(len(cz)), np.int64(max_layers))
     n_layers = np.zeros(shape[0], dtype=np.int32)
     distance = np.zeros(shape=shape, dtype=FTYPE)
-    density = np.zeros(shape=shape, dtype=FTYPE)
+    matter_density = np.zeros(shape=shape, dtype=FTYPE)
+    # Index of the default electron fraction
+    default_index = len(YeOuterRadius)
+    ye_index = np.full(shape, default_index, dtype=np.int32)
+    top_index = default_index - 1
 
     # Loop over all CZ values
     for k, coszen in enumerate(cz):
@@ -99,7 +128,7 @@ def extCalcLayers(
         # To store results
         traverse_rhos = np.zeros(max_layers, dtype=FTYPE)
         traverse_dist = np.zeros(max_layers, dtype=FTYPE)
-        traverse_electron_frac = np.zeros(max_layers, dtype=FTYPE)
+        traverse_ye_index = np.full(max_layers, default_index, dtype=np.int32)
 
         # Above horizon
         if coszen >= 0:
@@ -122,14 +151,13 @@ def extCalcLayers(
             path_thru_outerlayer = path_len - path_thru_atm
             traverse_rhos[0] = 0.0
             traverse_dist[0] = path_thru_atm
-            traverse_electron_frac[0] = default_elec_frac
 
             # In that case the neutrino passes through some earth (?)
             layers = 1
             if detector_depth > min_detector_depth:
                 traverse_rhos[1] = rhos[0]
                 traverse_dist[1] = path_thru_outerlayer
-                traverse_electron_frac[1] = YeFrac[-1]
+                traverse_ye_index[1] = top_index
                 layers += 1
 
         # Below horizon
@@ -148,8 +176,7 @@ def extCalcLayers(
                 / path_len
             )
 
-            # TODO: Why default here?
-            traverse_electron_frac[0] = default_elec_frac
+            # TODO: Why default electron fraction here (via initialization)?
             i_trav = 1
 
             # Path through the final layer above the detector (if necessary)
@@ -158,7 +185,7 @@ def extCalcLayers(
             if detector_depth > min_detector_depth:
                 traverse_rhos[1] = rhos[0]
                 traverse_dist[1] = path_len - tot_earth_len - traverse_dist[0]
-                traverse_electron_frac[1] = YeFrac[-1]
+                traverse_ye_index[1] = top_index
                 i_trav += 1
 
             # See how many layers we will pass
@@ -173,13 +200,12 @@ def extCalcLayers(
             for i in range(layers):
                 # this is the density
                 traverse_rhos[i+i_trav] = rhos[i]
-                # TODO: Why default? is this air with density 0 and electron
-                # fraction just doesn't matter?
-                traverse_electron_frac[i+i_trav] = default_elec_frac
+                # TODO: Why default (if no radius matches)? is this air with
+                # density 0 and electron fraction just doesn't matter?
                 for rad_i in range(len(YeOuterRadius)):
                     # TODO: why 1.001 here?
                     if radii[i] < (YeOuterRadius[rad_i] * 1.001):
-                        traverse_electron_frac[i+i_trav] = YeFrac[rad_i]
+                        traverse_ye_index[i+i_trav] = rad_i
                         break
 
                 # Now calculate the distance travele in layer
@@ -199,18 +225,99 @@ def extCalcLayers(
                     index = 2 * layers - i + i_trav - 1
                     traverse_rhos[index] = traverse_rhos[i+i_trav-1]
                     traverse_dist[index] = traverse_dist[i+i_trav-1]
-                    traverse_electron_frac[index] = (
-                        traverse_electron_frac[i+i_trav-1]
-                    )
+                    traverse_ye_index[index] = traverse_ye_index[i+i_trav-1]
 
             # That is now the total
             layers = 2 * layers + i_trav - 1
 
         n_layers[k] = np.int32(layers)
-        density[k] = traverse_rhos * traverse_electron_frac
+        matter_density[k] = traverse_rhos
         distance[k] = traverse_dist
+        ye_index[k] = traverse_ye_index
+
+    return n_layers, matter_density.ravel(), distance.ravel(), ye_index.ravel()
+
+
+@jit(nopython=True, nogil=True, cache=True)
+def scaleLayerDensities(matter_density, ye_index, YeFrac, default_elec_frac):
+    """Electron densities from the matter densities and electron fraction
+    indices returned by `extCalcLayerGeometry`.
+
+    Parameters
+    ----------
+    matter_density
+    ye_index
+    YeFrac
+    default_elec_frac
+
+    Returns
+    -------
+    density : array of densities, same shape as `matter_density`
+
+    """
+    elec_frac = np.empty(len(YeFrac) + 1, dtype=FTYPE)
+    elec_frac[:-1] = YeFrac
+    elec_frac[-1] = default_elec_frac
+    density = np.empty_like(matter_density)
+    for i in range(len(matter_density)):
+        density[i] = matter_density[i] * elec_frac[ye_index[i]]
+    return density
+
+
+def extCalcLayers(
+        cz,
+        r_detector,
+        prop_height,
+        detector_depth,
+        max_layers,
+        min_detector_depth,
+        rhos,
+        YeFrac,
+        YeOuterRadius,
+        default_elec_frac,
+        coszen_limit,
+        radii):
+    """Layer density/distance calculator for each coszen specified.
 
-    return n_layers, density.ravel(), distance.ravel()
+    Accelerated with Numba if present.
+
+    Parameters
+    ----------
+    cz
+    r_detector
+    prop_height
+    detector_depth
+    max_layers
+    min_detector_depth
+    rhos
+    YeFrac
+    YeOuterRadius
+    default_elec_frac
+    coszen_limit
+
+    Returns
+    -------
+    n_layers : int number of layers
+    density : array of densities, flattened from (cz, max_layers)
+    distance : array of distances per layer, flattened from (cz, max_layers)
+
+    """
+    n_layers, matter_density, distance, ye_index = extCalcLayerGeometry(
+        cz=cz,
+        r_detector=r_detector,
+        prop_height=prop_height,
+        detector_depth=detector_depth,
+        max_layers=max_layers,
+        min_detector_depth=min_detector_depth,
+        rhos=rhos,
+        YeOuterRadius=YeOuterRadius,
+        coszen_limit=coszen_limit,
+        radii=radii
+    )
+    density = scaleLayerDensities(
+        matter_density, ye_index, YeFrac, default_elec_frac
+    )
+    return n_layers, density, distance
 
 
 class Layers(object):
@@ -247,8 +354,19 @@ class Layers(object):
     distance : 1d float array of length (max_layers * len(cz))
             containing distance values and filled up with 0s otherwise
 
+    matter_density : 1d float array of length (max_layers * len(cz))
+            like `density`, but not multiplied by the electron fractions
+
+    Notes
+    -----
+    The electron fraction independent layer geometry is stored in the
+    process-wide `LAYER_GEOMETRY_CACHE`, such that calling `calcLayers` again
+    with the same coszen values (e.g. after `setElecFrac`, or from another
+    stage using the same Earth model) only rescales the densities.
+
     """
     def __init__(self, prem_file, detector_depth=1., prop_height=2.):
+        self.prem_file = prem_file
         # Load earth model
         if prem_file is not None :
             self.using_earth_model = True
@@ -325,20 +443,36 @@ class Layers(object):
         if not self.using_earth_model:
             raise ValueError("Cannot calculate layers when not using an Earth model")
 
-        # run external function
-        self._n_layers, self._density, self._distance = extCalcLayers(
-            cz=cz,
-            r_detector=self.r_detector,
-            prop_height=self.prop_height,
-            detector_depth=self.detector_depth,
-            max_layers=self.max_layers,
-            min_detector_depth=self.min_detector_depth,
-            rhos=self.rhos,
-            YeFrac=self.YeFrac,
-            YeOuterRadius=self.YeOuterRadius,
-            default_elec_frac=self.default_elec_frac,
-            coszen_limit=self.coszen_limit,
-            radii=self.radii
+        cz = np.ascontiguousarray(cz)
+        cache_key = (self.prem_file, self.detector_depth, self.prop_height,
+                     cz.dtype.str, hash_obj(cz, full_hash=True))
+        with _LAYER_GEOMETRY_CACHE_LOCK:
+            geometry = LAYER_GEOMETRY_CACHE.get(cache_key)
+        if geometry is None:
+            # run external function
+            geometry = extCalcLayerGeometry(
+                cz=cz,
+                r_detector=self.r_detector,
+                prop_height=self.prop_height,
+                detector_depth=self.detector_depth,
+                max_layers=self.max_layers,
+                min_detector_depth=self.min_detector_depth,
+                rhos=self.rhos,
+                YeOuterRadius=self.YeOuterRadius,
+                coszen_limit=self.coszen_limit,
+                radii=self.radii
+            )
+            # shared between instances, so protect against modifications
+            for array in geometry:
+                array.setflags(write=False)
+            with _LAYER_GEOMETRY_CACHE_LOCK:
+                LAYER_GEOMETRY_CACHE[cache_key] = geometry
+
+        (self._n_layers, self._matter_density, self._distance,
+         self._ye_index) = geometry
+        self._density = scaleLayerDensities(
+            self._matter_density, self._ye_index, self.YeFrac,
+            self.default_elec_frac
         )
 
     @property
@@ -353,6 +487,12 @@ class Layers(object):
             raise ValueError("Cannot get density when not using an Earth model")
         return self._density
 
+    @property
+    def matter_density(self):
+        if not self.using_earth_model:
+            raise ValueError("Cannot get density when not using an Earth model")
+        return self._matter_density
+
     @property
     def distance(self):
         return self._distance
@@ -404,6 +544,31 @@ def test_Layers():
     logging.info('density  = %s' %layer.density)
     logging.info('distance = %s' %layer.distance)
 
+    logging.info('Test cached layer geometry:')
+    n_layers, density, distance = extCalcLayers(
+        cz=cz,
+        r_detector=layer.r_detector,
+        prop_height=layer.prop_height,
+        detector_depth=layer.detector_depth,
+        max_layers=layer.max_layers,
+        min_detector_depth=layer.min_detector_depth,
+        rhos=layer.rhos,
+        YeFrac=np.array([0.4, 0.45, 0.5], dtype=FTYPE),
+        YeOuterRadius=layer.YeOuterRadius,
+        default_elec_frac=layer.default_elec_frac,
+        coszen_limit=layer.coszen_limit,
+        radii=layer.radii
+    )
+    other_layer = Layers('osc/PREM_4layer.dat')
+    other_layer.setElecFrac(0.4, 0.45, 0.5)
+    other_layer.calcLayers(cz.copy())
+    assert other_layer.distance is layer.distance
+    assert np.array_equal(other_layer.n_layers, n_layers)
+    assert np.array_equal(other_layer.distance, distance)
+    assert np.array_equal(other_layer.density, density)
+    assert not np.array_equal(other_layer.density, layer.density)
+    assert np.all(other_layer.density <= other_layer.matter_density)
+
     logging.info('Test path length calculation:')
     layer = Layers(None)
     cz = np.array([1.,0.,-1.])
@@ -19,7 +19,7 @@ from pisa.stages.osc.nsi_params import StdNSIParams, VacuumLikeNSIParams
 from pisa.stages.osc.pi_osc_params import OscParams
 from pisa.stages.osc.layers import Layers
 from pisa.stages.osc.prob3numba.numba_osc_hostfuncs import propagate_array, fill_probs
-from pisa.utils.numba_tools import WHERE
+from pisa.utils.numba_tools import NUMBA_CACHE, WHERE
 from pisa.utils.resources import find_resource
 
 
@@ -62,6 +62,18 @@ class pi_prob3(PiStage):
             eps_mutau_phase : quantity (angle)
             eps_tautau : quantity (dimensionless)
 
+    unique_events : bool
+        In events mode, only evaluate the oscillation probabilities once per
+        unique (true_energy, true_coszen) pair of each container and scatter
+        them back to the events
+
+    unique_tolerance : float >= 0
+        If `unique_events` is True, treat events as identical if their
+        log(true_energy) and true_coszen both agree within this tolerance
+        (i.e. fall into the same cell of a grid with this spacing); the
+        probabilities of the first event in each cell are used for all of
+        them. 0 (default) only merges exactly identical events.
+
     **kwargs
         Other kwargs are handled by PiStage
     -----
@@ -72,6 +84,8 @@ class pi_prob3(PiStage):
       self,
       nsi_type=None,
       reparam_mix_matrix=False,
+      unique_events=False,
+      unique_tolerance=0.,
       data=None,
       params=None,
       input_names=None,
@@ -152,6 +166,23 @@ class pi_prob3(PiStage):
         # what keys are added or altered for the outputs during apply
         output_apply_keys = ('weights',)
 
+        # which params the keys computed depend on (the earth model, detector
+        # depth, and propagation height are only used in setup)
+        electron_fracs = ('YeI', 'YeO', 'YeM')
+        prob_params = electron_fracs + (
+            'theta12',
+            'theta13',
+            'theta23',
+            'deltam21',
+            'deltam31',
+            'deltacp',
+        ) + nsi_params
+        calc_key_params = {
+            'densities': electron_fracs,
+            'prob_e': prob_params,
+            'prob_mu': prob_params,
+        }
+
         # init base class
         super().__init__(
             data=data,
@@ -166,12 +197,30 @@ class pi_prob3(PiStage):
             input_apply_keys=input_apply_keys,
             output_calc_keys=output_calc_keys,
             output_apply_keys=output_apply_keys,
+            calc_key_params=calc_key_params,
         )
 
         assert self.input_mode is not None
         assert self.calc_mode is not None
         assert self.output_mode is not None
 
+        self.unique_events = unique_events
+        self.unique_tolerance = float(unique_tolerance)
+        if self.unique_tolerance < 0:
+            raise ValueError('`unique_tolerance` must be >= 0, got %s'
+                             % self.unique_tolerance)
+        if self.unique_events and self.calc_mode != 'events':
+            raise ValueError('`unique_events` requires calc_mode "events",'
+                             ' got "%s"' % self.calc_mode)
+        self.unique_indices = None
+        """Per container: indices of the representative events and the index
+        of each event's representative among those"""
+        self.unique_compression = None
+        """Ratio of the number of events to the number of evaluated events"""
+        self.unique_max_prob_error = None
+        """Max. abs. probability error due to `unique_tolerance` (evaluated
+        during the first computation)"""
+
         self.layers = None
         self.osc_params = None
         self.nsi_params = None
@@ -250,8 +299,28 @@ class pi_prob3(PiStage):
             container['prob_e'] = np.empty((container.size), dtype=FTYPE)
             container['prob_mu'] = np.empty((container.size), dtype=FTYPE)
 
-    def calc_probs(self, nubar, e_array, rho_array, len_array, out):
-        ''' wrapper to execute osc. calc '''
+        # --- find the events for which to evaluate the probabilities ---
+        if self.unique_events:
+            self.unique_indices = {}
+            n_events = n_unique = 0
+            for container in self.data:
+                indices = unique_event_indices(
+                    container['true_energy'].get('host'),
+                    container['true_coszen'].get('host'),
+                    tolerance=self.unique_tolerance,
+                )
+                self.unique_indices[container.name] = indices
+                n_events += container.size
+                n_unique += len(indices[0])
+            self.unique_compression = n_events / max(n_unique, 1)
+            logging.info(
+                'Evaluating oscillation probabilities for %d unique out of %d'
+                ' events (compression ratio %.2f)',
+                n_unique, n_events, self.unique_compression
+            )
+
+    def propagate(self, nubar, e_array, rho_array, len_array, out):
+        ''' execute osc. calc on plain arrays '''
         if self.reparam_mix_matrix:
             mix_matrix = self.osc_params.mix_matrix_reparam_complex
         else:
@@ -260,13 +329,48 @@ class pi_prob3(PiStage):
                         mix_matrix,
                         self.gen_mat_pot_matrix_complex,
                         nubar,
-                        e_array.get(WHERE),
-                        rho_array.get(WHERE),
-                        len_array.get(WHERE),
-                        out=out.get(WHERE)
+                        e_array,
+                        rho_array,
+                        len_array,
+                        out=out
                        )
+
+    def calc_probs(self, nubar, e_array, rho_array, len_array, out):
+        ''' wrapper to execute osc. calc '''
+        self.propagate(nubar,
+                       e_array.get(WHERE),
+                       rho_array.get(WHERE),
+                       len_array.get(WHERE),
+                       out=out.get(WHERE)
+                      )
         out.mark_changed(WHERE)
 
+    def calc_unique_probs(self, container, check_error=False):
+        ''' osc. calc for the unique events of a container only, with the
+        results scattered back to all of its events; optionally returns the
+        max. abs. deviation from the per-event calculation '''
+        first_indices, inverse = self.unique_indices[container.name]
+        e_array = container['true_energy'].get('host')
+        rho_array = container['densities'].get('host')
+        len_array = container['distances'].get('host')
+        unique_probs = np.empty((len(first_indices), 3, 3), dtype=FTYPE)
+        self.propagate(container['nubar'],
+                       e_array[first_indices],
+                       rho_array[first_indices],
+                       len_array[first_indices],
+                       out=unique_probs
+                      )
+        out = container['probability'].get('host')
+        np.take(unique_probs, inverse, axis=0, out=out)
+        container['probability'].mark_changed('host')
+
+        if not check_error or container.size == 0:
+            return None
+        exact_probs = np.empty_like(out)
+        self.propagate(container['nubar'], e_array, rho_array, len_array,
+                       out=exact_probs)
+        return np.max(np.abs(out - exact_probs))
+
     @profile
     def compute_function(self):
 
@@ -280,17 +384,19 @@ class pi_prob3(PiStage):
             self.data.link_containers('nubar', ['nuebar_cc', 'numubar_cc', 'nutaubar_cc',
                                                 'nuebar_nc', 'numubar_nc', 'nutaubar_nc'])
 
-        # this can be done in a more clever way (don't have to recalculate all paths)
+        # the paths through the Earth are cached by `Layers`, so a change of
+        # the electron fractions only rescales the densities
         YeI = self.params.YeI.value.m_as('dimensionless')
         YeO = self.params.YeO.value.m_as('dimensionless')
         YeM = self.params.YeM.value.m_as('dimensionless')
-        if YeI != self.YeI or YeO != self.YeO or YeM != self.YeM:
+        if 'densities' in self.dirty_calc_keys and (
+            YeI != self.YeI or YeO != self.YeO or YeM != self.YeM
+        ):
             self.YeI = YeI; self.YeO = YeO; self.YeM = YeM
             self.layers.setElecFrac(self.YeI, self.YeO, self.YeM)
             for container in self.data:
                 self.layers.calcLayers(container['true_coszen'].get('host'))
                 container['densities'] = self.layers.density.reshape((container.size, self.layers.max_layers))
-                container['distances'] = self.layers.distance.reshape((container.size, self.layers.max_layers))
 
         # --- update mixing params ---
         self.osc_params.theta12 = self.params.theta12.value.m_as('rad')
@@ -342,13 +448,28 @@ class pi_prob3(PiStage):
             logging.debug('Using standard matter potential:\n%s'
                           % self.gen_mat_pot_matrix_complex)
 
-        for container in self.data:
-            self.calc_probs(container['nubar'],
-                            container['true_energy'],
-                            container['densities'],
-                            container['distances'],
-                            out=container['probability'],
-                           )
+        if self.unique_events:
+            check_error = (self.unique_tolerance > 0
+                           and self.unique_max_prob_error is None)
+            errors = [self.calc_unique_probs(container, check_error)
+                      for container in self.data]
+            if check_error:
+                self.unique_max_prob_error = max(
+                    [0.] + [err for err in errors if err is not None]
+                )
+                logging.info(
+                    'Max. oscillation probability error due to'
+                    ' unique_tolerance = %s: %.3e', self.unique_tolerance,
+                    self.unique_max_prob_error
+                )
+        else:
+            for container in self.data:
+                self.calc_probs(container['nubar'],
+                                container['true_energy'],
+                                container['densities'],
+                                container['distances'],
+                                out=container['probability'],
+                               )
 
         # the following is flavour specific, hence unlink
         self.data.unlink_containers()
@@ -382,13 +503,65 @@ class pi_prob3(PiStage):
             container['weights'].mark_changed(WHERE)
 
 
+def unique_event_indices(true_energy, true_coszen, tolerance=0.):
+    """Find the (approximately) unique (true_energy, true_coszen) pairs.
+
+    Parameters
+    ----------
+    true_energy, true_coszen : 1d arrays
+    tolerance : float >= 0
+        Spacing of the grid in (log(true_energy), true_coszen) whose cells
+        define which events are considered identical; 0 requires exact equality
+
+    Returns
+    -------
+    first_indices : 1d int array
+        Index of the first event of each unique pair
+    inverse : 1d int array
+        For each event, the index into `first_indices` of its representative
+
+    """
+    if tolerance > 0:
+        keys = np.stack(
+            [np.floor(np.log(true_energy) / tolerance),
+             np.floor(true_coszen / tolerance)],
+            axis=1
+        )
+    else:
+        keys = np.stack([true_energy, true_coszen], axis=1)
+    _, first_indices, inverse = np.unique(
+        keys, axis=0, return_index=True, return_inverse=True
+    )
+    return first_indices, inverse.ravel()
+
+
 # vectorized function to apply (flux * prob)
 # must be outside class
 if FTYPE == np.float64:
     signature = '(f8[:], f8, f8, f8[:])'
 else:
     signature = '(f4[:], f4, f4, f4[:])'
-@guvectorize([signature], '(d),(),()->()', target=TARGET)
+@guvectorize([signature], '(d),(),()->()', target=TARGET, cache=NUMBA_CACHE)
 def apply_probs(flux, prob_e, prob_mu, out):
     out[0] *= (flux[0] * prob_e) + (flux[1] * prob_mu)
 
+
+def test_unique_event_indices():
+    """Unit tests for function ``unique_event_indices``"""
+    true_energy = np.array([1., 2., 1., 2., 1.00001, 3.], dtype=FTYPE)
+    true_coszen = np.array([-1., 0., -1., 0.5, -1., 0.], dtype=FTYPE)
+
+    first_indices, inverse = unique_event_indices(true_energy, true_coszen)
+    assert len(first_indices) == 5
+    assert np.all(true_energy[first_indices][inverse] == true_energy)
+    assert np.all(true_coszen[first_indices][inverse] == true_coszen)
+
+    first_indices, inverse = unique_event_indices(
+        true_energy, true_coszen, tolerance=1e-3
+    )
+    assert len(first_indices) == 4
+    assert inverse[4] == inverse[0]
+    assert np.allclose(true_energy[first_indices][inverse], true_energy,
+                       rtol=1e-3)
+
+    logging.info('<< PASS : test_unique_event_indices >>')
@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+# pylint: disable = invalid-name
+
+
+"""
+Benchmark the throughput (events per second) of the prob3numba layered-matter
+propagation `propagate_array` for a realistic sample of atmospheric neutrino
+events (PREM 12-layer Earth model, random coszen and log-uniform energies).
+
+As the precision is fixed at import time via the `PISA_FTYPE` env var, each
+requested precision is benchmarked in a fresh interpreter.
+"""
+
+
+from __future__ import absolute_import, print_function, division
+
+
+__all__ = [
+    "DEFAULT_N_EVENTS",
+    "FTYPES",
+    "benchmark_propagate_array",
+    "run_benchmarks",
+    "main",
+]
+
+
+from argparse import ArgumentParser
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from pisa import FTYPE, TARGET
+from pisa.utils.log import Levels, logging, set_verbosity
+from pisa.stages.osc.layers import Layers
+from pisa.stages.osc.prob3numba.numba_osc_hostfuncs import (
+    CX,
+    FX,
+    IX,
+    propagate_array,
+)
+from pisa.stages.osc.prob3numba.numba_osc_tests import TEST_CASES
+
+
+DEFAULT_N_EVENTS = int(1e6)
+
+FTYPES = ("fp32", "fp64")
+"""Precisions to benchmark (values for the `PISA_FTYPE` env var)"""
+
+
+def benchmark_propagate_array(n_events=DEFAULT_N_EVENTS, repeats=3, seed=0):
+    """Time `propagate_array` for `n_events` events at the current FTYPE.
+
+    Parameters
+    ----------
+    n_events : int
+    repeats : int
+        Number of timed calls; the fastest is reported. One additional call
+        is made beforehand to exclude compilation time.
+    seed : int
+
+    Returns
+    -------
+    events_per_sec : float
+
+    """
+    rand = np.random.RandomState(seed)
+    coszen = rand.uniform(-1, 1, n_events).astype(FX)
+    energies = np.power(10, rand.uniform(0, 2, n_events)).astype(FX)
+    nubars = np.where(rand.uniform(size=n_events) < 0.5, 1, -1).astype(IX)
+
+    layers = Layers("osc/PREM_12layer.dat", detector_depth=2, prop_height=20)
+    layers.setElecFrac(0.4656, 0.4656, 0.4957)
+    layers.calcLayers(coszen)
+    densities = layers.density.reshape((n_events, layers.max_layers))
+    distances = layers.distance.reshape((n_events, layers.max_layers))
+
+    tc = next(iter(TEST_CASES.values()))
+    dm = tc["dm"].astype(FX)
+    pmns = tc["pmns"].astype(CX)
+    mat_pot = tc["mat_pot"].astype(CX)
+    probabilities = np.empty((n_events, 3, 3), dtype=FX)
+
+    # compile (or load from cache) outside of the timed calls
+    propagate_array(
+        dm, pmns, mat_pot, nubars[:10], energies[:10], densities[:10],
+        distances[:10], probabilities[:10]
+    )
+
+    times = []
+    for _ in range(repeats):
+        t0 = time.time()
+        propagate_array(
+            dm, pmns, mat_pot, nubars, energies, densities, distances,
+            probabilities
+        )
+        times.append(time.time() - t0)
+
+    assert np.all(np.isfinite(probabilities))
+    events_per_sec = n_events / min(times)
+    logging.info(
+        "<< propagate_array (%s, %s): %d events, %.3e events/s >>",
+        np.dtype(FTYPE).name, TARGET, n_events, events_per_sec
+    )
+    return events_per_sec
+
+
+def run_benchmarks(ftypes=FTYPES, n_events=DEFAULT_N_EVENTS, repeats=3):
+    """Run `benchmark_propagate_array` in a fresh interpreter per precision.
+
+    Parameters
+    ----------
+    ftypes : sequence of str
+    n_events : int
+    repeats : int
+
+    Returns
+    -------
+    results : dict
+        Events per second, keyed by the entries of `ftypes`
+
+    """
+    results = {}
+    for ftype in ftypes:
+        env = dict(os.environ)
+        env["PISA_FTYPE"] = ftype
+        statement = (
+            "from pisa.stages.osc.prob3numba.numba_osc_benchmark import"
+            " benchmark_propagate_array;"
+            f" print(benchmark_propagate_array({n_events:d}, {repeats:d}))"
+        )
+        output = subprocess.run(
+            [sys.executable, "-c", statement],
+            env=env,
+            check=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            universal_newlines=True,
+        ).stdout
+        results[ftype] = float(output.strip().splitlines()[-1])
+        logging.info(
+            f"<< {ftype}: {n_events} events, {results[ftype]:.3e} events/s >>"
+        )
+    return results
+
+
+def main(description=__doc__):
+    """Script interface for `run_benchmarks` function"""
+    parser = ArgumentParser(description=description)
+    parser.add_argument("--n-events", type=int, default=DEFAULT_N_EVENTS)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument(
+        "--ftypes", nargs="+", default=list(FTYPES), choices=list(FTYPES)
+    )
+    parser.add_argument("-v", action="count", default=Levels.INFO)
+    kwargs = vars(parser.parse_args())
+    set_verbosity(kwargs.pop("v"))
+    results = run_benchmarks(**kwargs)
+    for ftype, events_per_sec in results.items():
+        print(f"{ftype}: {events_per_sec:.3e} events/s")
+
+
+if __name__ == "__main__":
+    main()
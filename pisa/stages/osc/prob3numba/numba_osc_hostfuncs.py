@@ -7,6 +7,8 @@ Host function wrappers for numba_osc_kernels.
 These allow calling any kernel defined there (using SmartArray and approrpiate
 types as defined in signatures here) from a host, whether TARGET is "host" or
 "cuda".
+
+See `numba_osc_benchmark.py` for the throughput of `propagate_array`.
 """
 
 
@@ -18,6 +20,7 @@ import numpy as np
 from numba import guvectorize, njit
 
 from pisa import FTYPE, ITYPE, TARGET
+from pisa.utils.numba_tools import NUMBA_CACHE
 from pisa.stages.osc.prob3numba.numba_osc_kernels import (
     # osc_probs_vacuum_kernel,
     osc_probs_layers_kernel,
@@ -65,6 +68,7 @@ IX = "i4" if ITYPE == np.int32 else "i8"
     [f"({FX}[:,:], {CX}[:,:], {CX}[:,:], {IX}, {FX}, {FX}[:], {FX}[:], {FX}[:,:])"],
     "(a,a), (a,a), (b,c), (), (), (i), (i) -> (a,a)",
     target=TARGET,
+    cache=NUMBA_CACHE,
 )
 def propagate_array(dm, mix, mat_pot, nubar, energy, densities, distances, probability):
     """wrapper to run `osc_probs_layers_kernel` from host (whether TARGET
@@ -77,6 +81,7 @@ def propagate_array(dm, mix, mat_pot, nubar, energy, densities, distances, proba
 @njit(
     [f"({FX}[:,:], {CX}[:,:], {CX}[:,:], {IX}, {FX}, {FX}[:], {FX}[:], {FX}[:,:])"],
     target=TARGET,
+    cache=NUMBA_CACHE,
 )
 def propagate_scalar(
     dm, mix, mat_pot, nubar, energy, densities, distances, probability
@@ -104,6 +109,7 @@ def propagate_scalar(
         ")"
     ],
     target=TARGET,
+    cache=NUMBA_CACHE,
 )
 def get_transition_matrix_hostfunc(
     nubar,
@@ -133,7 +139,11 @@ def get_transition_matrix_hostfunc(
     )
 
 
-@njit([f"({FX}, {FX}, {CX}[:,:], {CX}[:,:], {CX}[:,:], {CX}[:,:])"], target=TARGET)
+@njit(
+    [f"({FX}, {FX}, {CX}[:,:], {CX}[:,:], {CX}[:,:], {CX}[:,:])"],
+    target=TARGET,
+    cache=NUMBA_CACHE,
+)
 def get_transition_matrix_massbasis_hostfunc(
     baseline,
     energy,
@@ -154,7 +164,11 @@ def get_transition_matrix_massbasis_hostfunc(
     )
 
 
-@njit([f"({CX}[:,:], {CX}[:,:], {FX}[:,:], {CX}[:,:])"], target=TARGET)
+@njit(
+    [f"({CX}[:,:], {CX}[:,:], {FX}[:,:], {CX}[:,:])"],
+    target=TARGET,
+    cache=NUMBA_CACHE,
+)
 def get_H_vac_hostfunc(mix_nubar, mix_nubar_conj_transp, dm_vac_vac, H_vac):
     """wrapper to run `get_H_vac` from host (whether TARGET is "cuda" or "host")"""
     get_H_vac(mix_nubar, mix_nubar_conj_transp, dm_vac_vac, H_vac)
@@ -163,19 +177,27 @@ def get_H_vac_hostfunc(mix_nubar, mix_nubar_conj_transp, dm_vac_vac, H_vac):
 # @guvectorize(
 #     [f"({FX}, {CX}[:,:], {IX}, {CX}[:,:])"], "(), (m, m), () -> (m, m)", target=TARGET
 # )
-@njit([f"({FX}, {CX}[:,:], {IX}, {CX}[:,:])"], target=TARGET)
+@njit([f"({FX}, {CX}[:,:], {IX}, {CX}[:,:])"], target=TARGET, cache=NUMBA_CACHE)
 def get_H_mat_hostfunc(rho, mat_pot, nubar, H_mat):
     """wrapper to run `get_H_mat` from host (whether TARGET is "cuda" or "host")"""
     get_H_mat(rho, mat_pot, nubar, H_mat)
 
 
-@njit([f"({FX}, {CX}[:,:], {FX}[:,:], {CX}[:,:], {CX}[:,:])"], target=TARGET)
+@njit(
+    [f"({FX}, {CX}[:,:], {FX}[:,:], {CX}[:,:], {CX}[:,:])"],
+    target=TARGET,
+    cache=NUMBA_CACHE,
+)
 def get_dms_hostfunc(energy, H_mat, dm_vac_vac, dm_mat_mat, dm_mat_vac):
     """wrapper to run `get_dms` from host (whether TARGET is "cuda" or "host")"""
     get_dms(energy, H_mat, dm_vac_vac, dm_mat_mat, dm_mat_vac)
 
 
-@njit([f"({FX}, {CX}[:,:], {CX}[:,:], {CX}[:,:], {CX}[:,:,:])"], target=TARGET)
+@njit(
+    [f"({FX}, {CX}[:,:], {CX}[:,:], {CX}[:,:], {CX}[:,:,:])"],
+    target=TARGET,
+    cache=NUMBA_CACHE,
+)
 def get_product_hostfunc(
     energy, dm_mat_vac, dm_mat_mat, H_mat_mass_eigenstate_basis, product
 ):
@@ -183,7 +205,7 @@ def get_product_hostfunc(
     get_product(energy, dm_mat_vac, dm_mat_mat, H_mat_mass_eigenstate_basis, product)
 
 
-@njit([f"({IX}, {CX}[:,:], {CX}[:])"], target=TARGET)
+@njit([f"({IX}, {CX}[:,:], {CX}[:])"], target=TARGET, cache=NUMBA_CACHE)
 def convert_from_mass_eigenstate_hostfunc(state, mix_nubar, psi):
     """wrapper to run `convert_from_mass_eigenstate` from host (whether TARGET
     is "cuda" or "host")"""
@@ -191,7 +213,10 @@ def convert_from_mass_eigenstate_hostfunc(state, mix_nubar, psi):
 
 
 @guvectorize(
-    [f"({FX}[:,:], {IX}, {IX}, {FX}[:])"], "(a,b), (), () -> ()", target=TARGET
+    [f"({FX}[:,:], {IX}, {IX}, {FX}[:])"],
+    "(a,b), (), () -> ()",
+    target=TARGET,
+    cache=NUMBA_CACHE,
 )
 def fill_probs(probability, initial_flav, flav, out):
     """Fill `out` with transition probabilities to go from `initial_flav` to
@@ -10,7 +10,7 @@ import numpy as np
 from pisa import FTYPE, TARGET
 from pisa.core.pi_stage import PiStage
 from pisa.utils import vectorizer
-from pisa.utils.numba_tools import WHERE
+from pisa.utils.numba_tools import NUMBA_CACHE, WHERE
 
 __all__ = ['pi_shift_scale_pid']
 
@@ -118,7 +118,7 @@ signatures = [
 layout = '(),(),()->()'
 
 
-@guvectorize(signatures, layout, target=TARGET)
+@guvectorize(signatures, layout, target=TARGET, cache=NUMBA_CACHE)
 def calculate_pid_function(bias_value, scale_factor, pid, out):
     """This function selects a pid cut by shifting the pid variable so
     the default cut at 1.0 is at the desired cut position.
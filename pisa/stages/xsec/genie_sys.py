@@ -12,7 +12,7 @@ from numba import guvectorize
 from pisa import FTYPE, TARGET
 from pisa.core.pi_stage import PiStage
 from pisa.utils.profiler import profile
-from pisa.utils.numba_tools import WHERE
+from pisa.utils.numba_tools import NUMBA_CACHE, WHERE
 
 
 class genie_sys(PiStage): # pylint: disable=invalid-name
@@ -120,7 +120,7 @@ if FTYPE == np.float64:
     SIGNATURE = '(f8, f8, f8, f8, f8, f8, f8[:])'
 else:
     SIGNATURE = '(f4, f4, f4, f4, f4, f4, f4[:])'
-@guvectorize([SIGNATURE], '(),(),(),(),(),()->()', target=TARGET)
+@guvectorize([SIGNATURE], '(),(),(),(),(),()->()', target=TARGET, cache=NUMBA_CACHE)
 def apply_genie_sys(
     genie_ma_qe,
     linear_fit_maccqe,
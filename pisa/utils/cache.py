@@ -1,5 +1,6 @@
 """
-MemoryCache and DiskCache classes to store long-to-compute results.
+MemoryCache, DiskCache, ArrayDiskCache and ArrayCache classes to store
+long-to-compute results.
 """
 
 
@@ -7,6 +8,7 @@ from __future__ import absolute_import
 
 from collections import OrderedDict
 import copy
+from io import BytesIO
 import os
 import pickle
 import re
@@ -14,12 +16,17 @@ import sqlite3
 import shutil
 import tempfile
 import time
+import uuid
 
+import numpy as np
+
+from pisa import CACHE_DIR
 from pisa.utils.log import logging, set_verbosity
 
 
-__all__ = ['MemoryCache', 'DiskCache',
-           'test_MemoryCache', 'test_DiskCache']
+__all__ = ['MemoryCache', 'DiskCache', 'ArrayDiskCache', 'ArrayCache',
+           'test_MemoryCache', 'test_DiskCache', 'test_ArrayDiskCache',
+           'test_ArrayCache']
 
 __author__ = 'J.L. Lanfranchi'
 
@@ -481,6 +488,492 @@ class DiskCache(object):
         return int(time.time() * 1e6)
 
 
+class ArrayCache(object):
+    """
+    Content-addressed persistent storage of sets of named numpy arrays, e.g.
+    quantities precomputed for all events of a sample. Every array is stored
+    as a `.npy` file and read back as a memory map, such that loading an entry
+    costs next to nothing until the data is actually accessed.
+
+    Parameters
+    ----------
+    root_dir : str
+        Directory holding the cache entries; relative paths are interpreted
+        relative to `pisa.CACHE_DIR`. Created if it does not exist.
+
+    mmap_mode : None or str
+        Passed to `numpy.load`; the default "r" returns read-only memory maps
+        while None reads the arrays into memory.
+
+    Notes
+    -----
+    Each entry is a directory `<root_dir>/<key>` which is written to a
+    temporary directory first and then renamed into place. Any number of
+    processes (e.g. cluster jobs sharing a cache directory on a network file
+    system) can therefore access the same cache simultaneously and will only
+    ever see complete entries. If two processes compute the same entry, the
+    first one to finish wins.
+
+    Entries are never removed automatically, and keys must be derived from
+    everything that determines the contents (see e.g. `pisa.utils.hash`).
+
+    Examples
+    --------
+    >>> cache = ArrayCache('/tmp/arraycache')
+    >>> cache['abc'] = {'x': np.arange(3), 'y': np.ones((2, 2))}
+    >>> 'abc' in cache
+    True
+    >>> cache['abc']['x']
+    memmap([0, 1, 2])
+
+    """
+    def __init__(self, root_dir, mmap_mode='r'):
+        root_dir = os.path.expandvars(os.path.expanduser(root_dir))
+        if not os.path.isabs(root_dir):
+            root_dir = os.path.join(CACHE_DIR, root_dir)
+        self.__root_dir = root_dir
+        self.__mmap_mode = mmap_mode
+        if not os.path.isdir(self.__root_dir):
+            os.makedirs(self.__root_dir, exist_ok=True)
+
+    @property
+    def path(self):
+        return self.__root_dir
+
+    def __str__(self):
+        return 'ArrayCache(root_dir=%s, mmap_mode=%s)' % (self.__root_dir,
+                                                          self.__mmap_mode)
+
+    def __repr__(self):
+        return str(self) + '; %d keys:\n%s' % (len(self), self.keys())
+
+    def __entry_dir(self, key):
+        if key is None:
+            raise KeyError(
+                '`None` is not a valid cache key, so nothing can live there.'
+            )
+        key = str(key)
+        if not key or os.sep in key or key.startswith('.'):
+            raise KeyError('Invalid cache key "%s"' % key)
+        return os.path.join(self.__root_dir, key)
+
+    def __getitem__(self, key):
+        entry_dir = self.__entry_dir(key)
+        if not os.path.isdir(entry_dir):
+            raise KeyError(str(key))
+        arrays = OrderedDict()
+        for fname in sorted(os.listdir(entry_dir)):
+            name, ext = os.path.splitext(fname)
+            if ext != '.npy':
+                continue
+            arrays[name] = np.load(os.path.join(entry_dir, fname),
+                                   mmap_mode=self.__mmap_mode,
+                                   allow_pickle=False)
+        return arrays
+
+    def __setitem__(self, key, arrays):
+        entry_dir = self.__entry_dir(key)
+        if os.path.isdir(entry_dir):
+            return
+        tmp_dir = tempfile.mkdtemp(prefix='.tmp_', dir=self.__root_dir)
+        try:
+            for name, array in arrays.items():
+                np.save(os.path.join(tmp_dir, name + '.npy'),
+                        np.asarray(array), allow_pickle=False)
+            try:
+                os.rename(tmp_dir, entry_dir)
+            except OSError:
+                # Another process has stored the same entry in the meantime
+                if not os.path.isdir(entry_dir):
+                    raise
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def __delitem__(self, key):
+        entry_dir = self.__entry_dir(key)
+        if not os.path.isdir(entry_dir):
+            raise KeyError(str(key))
+        shutil.rmtree(entry_dir)
+
+    def __contains__(self, key):
+        return os.path.isdir(self.__entry_dir(key))
+
+    def __len__(self):
+        return len(self.keys())
+
+    def get(self, key, dflt=None):
+        try:
+            return self[key]
+        except KeyError:
+            return dflt
+
+    def keys(self):
+        return sorted(
+            k for k in os.listdir(self.__root_dir)
+            if not k.startswith('.')
+            and os.path.isdir(os.path.join(self.__root_dir, k))
+        )
+
+    def clear(self):
+        for key in self.keys():
+            del self[key]
+
+
+class _ArrayPickler(pickle.Pickler):
+    """Pickler collecting numpy arrays in `arrays` (name : array, to be stored
+    as an `ArrayCache` entry) instead of storing them into the pickle"""
+    def __init__(self, file, min_array_nbytes):
+        super().__init__(file, pickle.HIGHEST_PROTOCOL)
+        self.min_array_nbytes = min_array_nbytes
+        self.arrays = OrderedDict()
+        self.names = {}
+
+    def persistent_id(self, obj): # pylint: disable=method-hidden
+        if (type(obj) not in (np.ndarray, np.memmap) or obj.dtype.hasobject
+                or obj.nbytes < self.min_array_nbytes):
+            return None
+        # An array referenced multiple times is only stored once; `arrays`
+        # keeps a reference to it such that its id stays unique
+        if id(obj) not in self.names:
+            name = str(len(self.arrays))
+            self.arrays[name] = obj
+            self.names[id(obj)] = name
+        return self.names[id(obj)]
+
+
+class _ArrayUnpickler(pickle.Unpickler):
+    """Unpickler for pickles written by `_ArrayPickler`, taking the arrays
+    from `arrays` (name : array, as retrieved from an `ArrayCache`)"""
+    def __init__(self, file, arrays):
+        super().__init__(file)
+        self.arrays = arrays
+
+    def persistent_load(self, pid): # pylint: disable=method-hidden
+        return self.arrays[pid]
+
+
+class ArrayDiskCache(object):
+    """
+    Implements the same subset of dict methods as `DiskCache`, but stores the
+    numpy arrays contained in the cached objects (e.g. the arrays of a
+    TransformSet or MapSet) as raw `.npy` files which are memory-mapped, not
+    read and unpickled, upon retrieval. Only the remainder of each object and
+    the bookkeeping are pickled into an sqlite database, to which a single
+    connection is kept open. Retrieving even large objects therefore takes
+    well below a millisecond, and this cache can be used e.g. for transforms
+    that are retrieved once per set of parameter values.
+
+    Parameters
+    ----------
+    root_dir : str
+        Directory holding the database and the array files; relative paths
+        are interpreted relative to `pisa.CACHE_DIR`. Created if it does not
+        exist.
+
+    max_depth : int
+        Limit on the number of entries. Pruning is either via first-in-first-
+        out (FIFO) or least-recently-used (LRU) logic.
+
+    is_lru : bool
+        If True, implement least-recently-used (LRU) logic for removing items
+        beyond `max_depth`. Access times are recorded in memory and only
+        written to the database when the next item is stored, so this adds no
+        cost to item retrieval. Otherwise, behaves as a first-in-first-out
+        (FIFO) cache.
+
+    mmap_mode : None or str
+        Passed to `numpy.load`. The default "c" (copy-on-write) allows
+        modifying retrieved arrays without affecting the cache, "r" returns
+        read-only memory maps, and None reads the arrays into memory.
+
+    min_array_nbytes : int > 0
+        Arrays smaller than this are pickled along with the rest of the object
+        rather than stored to their own files.
+
+    Notes
+    -----
+    Only instances of numpy.ndarray (and numpy.memmap) with non-object dtype
+    are stored as files; anything else is pickled as in `DiskCache`.
+
+    The arrays of each cached object are stored as an entry of an
+    `ArrayCache` in `root_dir`, under a unique name that is recorded in the
+    database. As for `DiskCache`, multiple processes can use the same cache
+    simultaneously: the `ArrayCache` entry is complete before the database is
+    updated, so other processes only ever see complete entries. Files of
+    pruned or replaced entries are removed right away; memory maps of them
+    that are still in use remain valid (on POSIX systems).
+
+    Examples
+    --------
+    >>> cache = ArrayDiskCache('/tmp/arraydiskcache', max_depth=5)
+    >>> cache[12] = {'hist': np.ones((100, 100)), 'name': 'x'}
+    >>> cache[12]['hist'].sum()
+    10000.0
+    >>> type(cache[12]['hist'])
+    numpy.memmap
+
+    """
+    DB_FNAME = 'cache.sqlite'
+    TABLE_SCHEMA = \
+        '''CREATE TABLE cache (hash INTEGER PRIMARY KEY,
+                               accesstime INTEGER,
+                               entry TEXT,
+                               data BLOB)'''
+
+    def __init__(self, root_dir, max_depth=100, is_lru=False, mmap_mode='c',
+                 min_array_nbytes=4096):
+        assert 0 < max_depth < 1e6, 'Invalid `max_depth`:' + str(max_depth)
+        assert min_array_nbytes > 0, \
+                'Invalid `min_array_nbytes`:' + str(min_array_nbytes)
+        self.__arrays = ArrayCache(root_dir, mmap_mode=mmap_mode)
+        self.__root_dir = self.__arrays.path
+        self.__db_fpath = os.path.join(self.__root_dir, self.DB_FNAME)
+        self.__max_depth = max_depth
+        self.__is_lru = is_lru
+        self.__min_array_nbytes = min_array_nbytes
+        self.__conn = None
+        self.__conn_pid = None
+        self.__accesstimes = OrderedDict()
+        self.__instantiate_db()
+
+    @property
+    def path(self):
+        return self.__root_dir
+
+    def __instantiate_db(self):
+        conn = self.__connect()
+        cursor = conn.execute(
+            "SELECT sql FROM sqlite_master WHERE type='table' AND NAME='cache'"
+        )
+        row = cursor.fetchall()
+        if row:
+            # Check that the table format is valid
+            schema = re.sub(r'\s', '', row[0][0]).lower()
+            ref_schema = re.sub(r'\s', '', self.TABLE_SCHEMA).lower()
+            if schema != ref_schema:
+                raise ValueError('Existing database at "%s" has'
+                                 'non-matching schema:\n"""%s"""'
+                                 %(self.__db_fpath, schema))
+            return
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute(self.TABLE_SCHEMA.replace('CREATE TABLE',
+                                                   'CREATE TABLE IF NOT EXISTS'))
+            conn.execute("CREATE INDEX IF NOT EXISTS idx1 ON cache(accesstime)")
+        except:
+            conn.rollback()
+            raise
+        else:
+            conn.commit()
+
+    def __connect(self):
+        """Return the open connection to the database, (re)connecting if this
+        is a new process (connections must not be shared across a fork)"""
+        if self.__conn is not None and self.__conn_pid == os.getpid():
+            return self.__conn
+        conn = sqlite3.connect(
+            self.__db_fpath,
+            isolation_level=None, check_same_thread=False, timeout=10,
+        )
+        # Trust journaling to memory
+        conn.execute("PRAGMA journal_mode=MEMORY")
+        # Trust OS to complete transaction
+        conn.execute("PRAGMA synchronous=0")
+        self.__conn = conn
+        self.__conn_pid = os.getpid()
+        self.__accesstimes.clear()
+        return conn
+
+    def close(self):
+        """Write any pending access times and close the database connection"""
+        if self.__conn is None or self.__conn_pid != os.getpid():
+            self.__conn = None
+            return
+        try:
+            self.__flush_accesstimes(self.__conn)
+        finally:
+            self.__conn.close()
+            self.__conn = None
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception: # pylint: disable=broad-except
+            pass
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_ArrayDiskCache__conn'] = None
+        state['_ArrayDiskCache__accesstimes'] = OrderedDict()
+        return state
+
+    def __str__(self):
+        s = 'ArrayDiskCache(root_dir=%s, max_depth=%d, is_lru=%s)' % \
+                (self.__root_dir, self.__max_depth, self.__is_lru)
+        return s
+
+    def __repr__(self):
+        return str(self) + '; %d keys:\n%s' % (len(self), self.keys())
+
+    @staticmethod
+    def __check_key(key):
+        if key is None:
+            raise KeyError(
+                '`None` is not a valid cache key, so nothing can live there.'
+            )
+        if not isinstance(key, int):
+            raise KeyError('`key` must be int, got "%s"' % type(key))
+
+    def __getitem__(self, key):
+        self.__check_key(key)
+        conn = self.__connect()
+        rows = conn.execute(
+            "SELECT entry, data FROM cache WHERE hash = ?", (key,)
+        ).fetchall()
+        if not rows:
+            raise KeyError(str(key))
+        entry, data = rows[0]
+        try:
+            arrays = {} if entry is None else self.__arrays[entry]
+        except (KeyError, IOError, OSError):
+            # Entry was removed by another process in the meantime
+            raise KeyError(str(key))
+        obj = _ArrayUnpickler(BytesIO(data), arrays).load()
+        if self.__is_lru:
+            self.__accesstimes[key] = self.now
+        return obj
+
+    def __setitem__(self, key, obj):
+        self.__check_key(key)
+        buf = BytesIO()
+        pickler = _ArrayPickler(buf, self.__min_array_nbytes)
+        pickler.dump(obj)
+        entry = None
+        if pickler.arrays:
+            entry = uuid.uuid4().hex
+            self.__arrays[entry] = pickler.arrays
+
+        conn = self.__connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            self.__flush_accesstimes(conn)
+            removed = [
+                row[0] for row in conn.execute(
+                    "SELECT entry FROM cache WHERE hash = ?", (key,)
+                ).fetchall()
+            ]
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (hash, accesstime, entry, data)"
+                " VALUES (?, ?, ?, ?)",
+                (key, self.now, entry, sqlite3.Binary(buf.getvalue()))
+            )
+
+            # Remove oldest-accessed rows in excess of limit
+            count, = conn.execute('SELECT COUNT (*) FROM cache').fetchone()
+            n_to_remove = count - self.__max_depth
+            if n_to_remove > 0:
+                rows = conn.execute(
+                    "SELECT hash, entry FROM cache ORDER BY accesstime ASC"
+                    " LIMIT ?", (n_to_remove,)
+                ).fetchall()
+                conn.executemany("DELETE FROM cache WHERE hash = ?",
+                                 [(row[0],) for row in rows])
+                removed.extend(row[1] for row in rows)
+        except:
+            conn.rollback()
+            if entry is not None:
+                self.__remove_entry(entry)
+            raise
+        else:
+            conn.commit()
+        for removed_entry in removed:
+            self.__remove_entry(removed_entry)
+
+    def __flush_accesstimes(self, conn):
+        if not self.__accesstimes:
+            return
+        conn.executemany("UPDATE cache SET accesstime = ? WHERE hash = ?",
+                         [(t, k) for k, t in self.__accesstimes.items()])
+        self.__accesstimes.clear()
+
+    def __remove_entry(self, entry):
+        if entry is None:
+            return
+        try:
+            del self.__arrays[entry]
+        except (KeyError, OSError):
+            pass
+
+    def __delitem__(self, key):
+        conn = self.__connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            rows = conn.execute("SELECT entry FROM cache WHERE hash = ?",
+                                (key,)).fetchall()
+            conn.execute("DELETE FROM cache WHERE hash = ?", (key,))
+        except:
+            conn.rollback()
+            raise
+        else:
+            conn.commit()
+        self.__accesstimes.pop(key, None)
+        for row in rows:
+            self.__remove_entry(row[0])
+
+    def __len__(self):
+        count, = self.__connect().execute(
+            'SELECT COUNT (*) FROM cache'
+        ).fetchone()
+        return count
+
+    def __contains__(self, key):
+        rows = self.__connect().execute(
+            "SELECT 1 FROM cache WHERE hash = ?", (key,)
+        ).fetchall()
+        return len(rows) > 0
+
+    def get(self, key, dflt=None):
+        rslt = dflt
+        try:
+            rslt = self.__getitem__(key)
+        except KeyError:
+            pass
+        return rslt
+
+    def clear(self):
+        conn = self.__connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            rows = conn.execute("SELECT entry FROM cache").fetchall()
+            conn.execute('DELETE FROM cache')
+        except:
+            conn.rollback()
+            raise
+        else:
+            conn.commit()
+        self.__accesstimes.clear()
+        for row in rows:
+            self.__remove_entry(row[0])
+
+    def keys(self):
+        conn = self.__connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            self.__flush_accesstimes(conn)
+        except:
+            conn.rollback()
+            raise
+        else:
+            conn.commit()
+        sql = "SELECT hash FROM cache ORDER BY accesstime ASC"
+        return [k[0] for k in conn.execute(sql).fetchall()]
+
+    @property
+    def now(self):
+        """Microseconds since the epoch"""
+        return int(time.time() * 1e6)
+
+
 # TODO: augment test
 def test_MemoryCache():
     """Unit tests for MemoryCache class"""
@@ -531,7 +1024,109 @@ def test_DiskCache():
     logging.info('<< PASS : test_DiskCache >>')
 
 
+def test_ArrayDiskCache():
+    """Unit tests for ArrayDiskCache class"""
+    testdir = tempfile.mkdtemp()
+    try:
+        root_dir = os.path.join(testdir, 'subfolder1/subfolder2')
+        dc = ArrayDiskCache(root_dir=root_dir, max_depth=3, is_lru=True)
+        assert 0 not in dc
+        dc[0] = 'zero'
+        assert dc[0] == 'zero'
+
+        # Large arrays are stored as files and memory-mapped, small ones and
+        # object arrays are pickled; shared arrays are stored once
+        big = np.arange(1000.)
+        obj = {'big': big, 'same': big, 'small': np.arange(3),
+               'objs': np.array(['a', None], dtype=object), 'name': 'one'}
+        dc[1] = obj
+        loaded = dc[1]
+        assert isinstance(loaded['big'], np.memmap)
+        assert loaded['same'] is loaded['big']
+        assert not isinstance(loaded['small'], np.memmap)
+        for key, val in obj.items():
+            assert np.all(loaded[key] == val)
+
+        # Copy-on-write: modifying a retrieved array does not affect the cache
+        loaded['big'][:] = -1
+        assert np.array_equal(dc[1]['big'], big)
+
+        # Replacing an entry removes its files
+        dc[1] = {'big': 2 * big}
+        assert np.array_equal(dc[1]['big'], 2 * big)
+        entries = [d for d in os.listdir(root_dir) if d != dc.DB_FNAME]
+        assert len(entries) == 1, entries
+
+        # LRU: 0 was accessed more recently than 1, so 1 gets pruned
+        dc[2] = 'two'
+        assert dc[0] == 'zero'
+        dc[3] = 'three'
+        assert 1 not in dc
+        assert dc.keys() == [2, 0, 3]
+        assert [d for d in os.listdir(root_dir) if d != dc.DB_FNAME] == []
+
+        # A second instance (e.g. another process) sees the same entries
+        dc2 = ArrayDiskCache(root_dir=root_dir, max_depth=3, mmap_mode=None)
+        dc2[4] = {'big': big}
+        assert isinstance(pickle.loads(pickle.dumps(dc)), ArrayDiskCache)
+        assert np.array_equal(dc[4]['big'], big)
+        assert len(dc) == 3 and 2 not in dc
+        del dc[4]
+        assert dc2.get(4) is None
+        dc2.close()
+        dc.clear()
+        assert len(dc) == 0
+        assert os.listdir(root_dir) == [dc.DB_FNAME]
+        dc.close()
+    finally:
+        shutil.rmtree(testdir, ignore_errors=True)
+
+    logging.info('<< PASS : test_ArrayDiskCache >>')
+
+
+def test_ArrayCache():
+    """Unit tests for ArrayCache class"""
+    testdir = tempfile.mkdtemp()
+    try:
+        ac = ArrayCache(root_dir=os.path.join(testdir, 'subfolder'))
+        arrays = {'x': np.arange(10.), 'y': np.ones((5, 2), dtype=np.float32)}
+        assert 'a0' not in ac
+        ac['a0'] = arrays
+        assert 'a0' in ac
+        assert ac.keys() == ['a0']
+        loaded = ac['a0']
+        assert set(loaded.keys()) == set(arrays.keys())
+        for name, array in arrays.items():
+            assert isinstance(loaded[name], np.memmap)
+            assert loaded[name].dtype == array.dtype
+            assert np.array_equal(loaded[name], array)
+
+        # Existing entries are not overwritten
+        ac['a0'] = {'x': np.zeros(2)}
+        assert np.array_equal(ac['a0']['x'], arrays['x'])
+
+        # A second instance sees the same entries
+        ac2 = ArrayCache(root_dir=ac.path, mmap_mode=None)
+        assert not isinstance(ac2['a0']['x'], np.memmap)
+        del ac2['a0']
+        assert 'a0' not in ac and len(ac) == 0
+        assert ac.get('a0') is None
+        for key in [None, '', '../a0']:
+            try:
+                ac[key] = arrays
+            except KeyError:
+                pass
+            else:
+                raise AssertionError('Invalid key "%s" accepted' % key)
+    finally:
+        shutil.rmtree(testdir, ignore_errors=True)
+
+    logging.info('<< PASS : test_ArrayCache >>')
+
+
 if __name__ == "__main__":
     set_verbosity(1)
     test_MemoryCache()
     test_DiskCache()
+    test_ArrayDiskCache()
+    test_ArrayCache()
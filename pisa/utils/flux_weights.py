@@ -14,13 +14,17 @@ from __future__ import absolute_import, division
 import numpy as np
 import scipy.interpolate as interpolate
 
+from pisa import FTYPE
+from pisa.utils.cache import ArrayCache
+from pisa.utils.hash import hash_obj
 from pisa.utils.log import logging
 from pisa.utils.resources import open_resource
 
 
 __all__ = ['load_2d_honda_table', 'load_2d_bartol_table', 'load_2d_table',
            'calculate_2d_flux_weights', 'load_3d_honda_table', 'load_3d_table',
-           'calculate_3d_flux_weights', ]
+           'calculate_3d_flux_weights', 'get_flux_cache',
+           'get_flux_cache_key', 'test_flux_weights', ]
 
 __author__ = 'S. Wren'
 
@@ -43,6 +47,38 @@ PRIMARIES = ['numu', 'numubar', 'nue', 'nuebar']
 TEXPRIMARIES = [r'$\nu_{\mu}$', r'$\bar{\nu}_{\mu}$', r'$\nu_{e}$',
                 r'$\bar{\nu}_{e}$']
 
+CHUNK_SIZE = 100000
+"""Number of events for which flux weights are computed at once (limits the
+size of the intermediate arrays of shape (num events, num table points))"""
+
+
+def _stack_splines(splines):
+    """Combine `splrep` splines sharing the same knots and degree (as is the
+    case for all splines made from the same abscissae) into a single
+    vector-valued `BSpline`, such that they can be evaluated in one call."""
+    t, _, k = splines[0]
+    num_coeffs = len(t) - k - 1
+    coeffs = []
+    for spline_t, spline_c, spline_k in splines:
+        if spline_k != k or not np.array_equal(spline_t, t):
+            raise ValueError('Splines must share the same knots and degree')
+        coeffs.append(spline_c[:num_coeffs])
+    return interpolate.BSpline(t, np.stack(coeffs, axis=-1), k)
+
+
+def _interpolation_weights(x_points, k=3, der=0):
+    """Return a function computing for each of an array of `x` the weights
+    `w` with which the interpolating spline of degree `k` (as constructed by
+    `splrep(x_points, y, k=k, s=0)`) or its derivative of order `der`
+    evaluates to `w @ y`. Such a spline is linear in `y`, so the weights are
+    the values of the splines through each of the unit vectors."""
+    splines = [interpolate.splrep(x_points, y, k=k, s=0)
+               for y in np.eye(len(x_points))]
+    spline = _stack_splines(splines)
+    if der > 0:
+        spline = spline.derivative(der)
+    return spline
+
 
 def load_2d_honda_table(flux_file, enpow=1, return_table=False):
 
@@ -314,19 +350,22 @@ def calculate_2d_flux_weights(true_energies, true_coszens, en_splines,
     if out is None:
         out = np.empty_like(true_energies)
 
-    spline_vals = np.zeros(num_cz_points+1)
-    for i in range(len(true_energies)):
-        true_log_energy = np.log10(true_energies[i])
-        for j in range(num_cz_points):
-            spline_vals[j+1] = interpolate.splev(true_log_energy,
-                                                 en_splines[czkeys[j]],
-                                                 der=1)
-
-        int_spline_vals = np.cumsum(spline_vals)*0.1
-        spline = interpolate.splrep(cz_spline_points,
-                                    int_spline_vals, s=0)
-
-        out[i] = interpolate.splev(true_coszens[i], spline, der=1) / np.power(true_energies[i], enpow)
+    # Splines in energy for all table coszen values, evaluated together
+    energy_splines = _stack_splines(
+        [en_splines[czkey] for czkey in czkeys]
+    ).derivative()
+    # Weights for the derivative of the integral-preserving spline in coszen
+    cz_weights = _interpolation_weights(cz_spline_points, der=1)
+
+    for start in range(0, len(true_energies), CHUNK_SIZE):
+        stop = start + CHUNK_SIZE
+        energies = true_energies[start:stop]
+        spline_vals = np.zeros((len(energies), num_cz_points+1))
+        spline_vals[:, 1:] = energy_splines(np.log10(energies))
+        int_spline_vals = np.cumsum(spline_vals, axis=1)*0.1
+        out[start:stop] = np.einsum(
+            'ij,ij->i', cz_weights(true_coszens[start:stop]), int_spline_vals
+        ) / np.power(energies, enpow)
 
     return out
 
@@ -540,65 +579,148 @@ def calculate_3d_flux_weights(true_energies, true_coszens, true_azimuths,
     czkeys = ['%.2f'%x for x in np.linspace(-0.95, 0.95, 20)]
     cz_spline_points = np.linspace(-1, 1, 21)
 
-    flux_weights = []
-    for true_energy, true_coszen, true_azimuth in zip(true_energies,
-                                                      true_coszens,
-                                                      true_azimuths):
-        true_azimuth *= 180.0/np.pi
-        true_log_energy = np.log10(true_energy)
-        az_spline_vals = []
-        for azkey in azkeys:
-            cz_spline_vals = [0]
-            for czkey in czkeys:
-                spval = interpolate.splev(true_log_energy,
-                                          en_splines[azkey][czkey],
-                                          der=1)
-
-                cz_spline_vals.append(spval)
-            cz_spline_vals = np.array(cz_spline_vals)
-            cz_int_spline_vals = np.cumsum(cz_spline_vals)*0.1
-            cz_spline = interpolate.splrep(cz_spline_points,
-                                           cz_int_spline_vals, s=0)
-            az_spline_vals.append(interpolate.splev(true_coszen,
-                                                    cz_spline,
-                                                    der=1))
+    # Splines in energy for all table (azimuth, coszen) values, evaluated together
+    energy_splines = _stack_splines(
+        [en_splines[azkey][czkey] for azkey in azkeys for czkey in czkeys]
+    ).derivative()
+    # Weights for the derivative of the integral-preserving spline in coszen
+    cz_weights = _interpolation_weights(cz_spline_points, der=1)
+    if not az_linear:
         # Treat the azimuthal dimension in an integral-preserving manner.
         # This is not recommended.
-        if not az_linear:
-            az_spline_vals = np.array(az_spline_vals)
-            az_spline_vals = np.insert(az_spline_vals, 0, 0)
-            az_int_spline_vals = np.cumsum(az_spline_vals)*30.0
-            az_spline = interpolate.splrep(az_spline_points,
-                                           az_int_spline_vals, s=0)
-            flux_weights.append(
-                interpolate.splev(
-                    true_azimuth,
-                    az_spline,
-                    der=1
-                )/np.power(true_energy, enpow)
-            )
+        az_weights = _interpolation_weights(az_spline_points, der=1)
+    else:
         # Treat the azimuthal dimension with a linear interpolation.
         # This is the best treatment.
+        az_weights = _interpolation_weights(az_spline_points, k=1)
+
+    flux_weights = np.empty(len(true_energies))
+    for start in range(0, len(true_energies), CHUNK_SIZE):
+        stop = start + CHUNK_SIZE
+        energies = true_energies[start:stop]
+        num_events = len(energies)
+        azimuths = true_azimuths[start:stop]*180.0/np.pi
+
+        cz_spline_vals = np.zeros((num_events, len(azkeys), len(czkeys)+1))
+        cz_spline_vals[:, :, 1:] = energy_splines(np.log10(energies)).reshape(
+            num_events, len(azkeys), len(czkeys)
+        )
+        cz_int_spline_vals = np.cumsum(cz_spline_vals, axis=2)*0.1
+        az_spline_vals = np.einsum(
+            'ik,ijk->ij', cz_weights(true_coszens[start:stop]), cz_int_spline_vals
+        )
+
+        if not az_linear:
+            az_spline_vals = np.concatenate(
+                [np.zeros((num_events, 1)), az_spline_vals], axis=1
+            )
+            az_int_spline_vals = np.cumsum(az_spline_vals, axis=1)*30.0
+            flux_weights[start:stop] = np.einsum(
+                'ij,ij->i', az_weights(azimuths), az_int_spline_vals
+            ) / np.power(energies, enpow)
         else:
             # Make the azimuthal spline cyclic
-            az_spline_vals.append(az_spline_vals[0])
-            # Account for the energy power that was applied in the first splines
-            az_spline_vals /= np.power(true_energy, enpow)
-            az_spline = interpolate.splrep(az_spline_points,
-                                           az_spline_vals, k=1)
-            if true_azimuth < 15.0:
-                true_azimuth += 360.0
-            flux_weights.append(
-                interpolate.splev(
-                    true_azimuth,
-                    az_spline,
-                    der=0
-                )
+            az_spline_vals = np.concatenate(
+                [az_spline_vals, az_spline_vals[:, :1]], axis=1
             )
-    flux_weights = np.array(flux_weights)
+            azimuths = np.where(azimuths < 15.0, azimuths + 360.0, azimuths)
+            # Account for the energy power that was applied in the first splines
+            flux_weights[start:stop] = np.einsum(
+                'ij,ij->i', az_weights(azimuths), az_spline_vals
+            ) / np.power(energies, enpow)
+
     return flux_weights
 
 
+def get_flux_cache(disk_cache):
+    """Interpret the `disk_cache` argument of flux stages that cache fluxes
+    precomputed for their events.
+
+    Parameters
+    ----------
+    disk_cache : None, bool, str, or ArrayCache
+        If None or False, no caching. If True, use the directory "flux_weights"
+        under `pisa.CACHE_DIR`; if str, the directory at that path (relative to
+        `pisa.CACHE_DIR` if not absolute).
+
+    Returns
+    -------
+    cache : ArrayCache or None
+
+    """
+    if disk_cache is None or disk_cache is False:
+        return None
+    if disk_cache is True:
+        disk_cache = 'flux_weights'
+    if isinstance(disk_cache, str):
+        return ArrayCache(disk_cache)
+    if not isinstance(disk_cache, ArrayCache):
+        raise TypeError("Don't know what to do with a %s." % type(disk_cache))
+    return disk_cache
+
+
+def get_flux_cache_key(*args):
+    """Derive the key under which fluxes are cached from everything they
+    depend on, typically the name of the stage, the hash of the flux table
+    file and the events' true variables. Arrays are hashed including dtype and
+    shape, and the key is specific to the current `FTYPE`."""
+    id_objects = [np.dtype(FTYPE).name]
+    for arg in args:
+        if isinstance(arg, np.ndarray):
+            arg = (arg.dtype.str, arg.shape, hash_obj(arg))
+        id_objects.append(arg)
+    return hash_obj(id_objects, hash_to='hex')
+
+
+def test_flux_weights():
+    """Compare the flux weights against evaluating the splines event by event"""
+    rand = np.random.RandomState(0)
+    num_events = 50
+    true_energies = np.power(10, rand.uniform(-0.9, 3.9, num_events))
+    true_coszens = rand.uniform(-1, 1, num_events)
+    true_azimuths = rand.uniform(0, 2*np.pi, num_events)
+    czkeys = ['%.2f'%x for x in np.linspace(-0.95, 0.95, 20)]
+    cz_spline_points = np.linspace(-1, 1, 21)
+
+    def integral_preserving_cz_derivative(true_energy, true_coszen, splines):
+        spline_vals = [0.] + [
+            interpolate.splev(np.log10(true_energy), splines[czkey], der=1)
+            for czkey in czkeys
+        ]
+        spline = interpolate.splrep(cz_spline_points,
+                                    np.cumsum(spline_vals)*0.1, s=0)
+        return interpolate.splev(true_coszen, spline, der=1)
+
+    spline_dict = load_2d_table('flux/honda-2015-spl-solmax-aa.d')
+    for prim in PRIMARIES:
+        flux_weights = calculate_2d_flux_weights(true_energies, true_coszens,
+                                                 spline_dict[prim])
+        ref = [integral_preserving_cz_derivative(e, cz, spline_dict[prim]) / e
+               for e, cz in zip(true_energies, true_coszens)]
+        assert np.allclose(flux_weights, ref, rtol=1e-10, atol=0)
+
+    spline_dict = load_3d_table('flux/honda-2015-spl-solmax.d')
+    azkeys = np.linspace(15.0, 345.0, 12)
+    az_spline_points = np.linspace(15.0, 375.0, 13)
+    flux_weights = calculate_3d_flux_weights(true_energies, true_coszens,
+                                             true_azimuths, spline_dict['numu'])
+    ref = []
+    for e, cz, az in zip(true_energies, true_coszens, true_azimuths):
+        az_spline_vals = [
+            integral_preserving_cz_derivative(e, cz, spline_dict['numu'][azkey])
+            for azkey in azkeys
+        ]
+        az_spline = interpolate.splrep(
+            az_spline_points, az_spline_vals + az_spline_vals[:1], k=1
+        )
+        az = az*180.0/np.pi
+        ref.append(interpolate.splev(az + 360.0 if az < 15.0 else az,
+                                     az_spline) / e)
+    assert np.allclose(flux_weights, ref, rtol=1e-10, atol=0)
+
+    logging.info('<< PASS : test_flux_weights >>')
+
+
 def main():
     """This is a slightly longer example than that given in the docstring of
     the calculate_flux_weights function. This will make a quick plot of the
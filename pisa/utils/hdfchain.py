@@ -4,13 +4,18 @@ class to access hdf5 files chained together.
 from __future__ import print_function
 
 
+import os
+import shutil
+import tempfile
+import warnings
+
 import numpy as n
 import tables
 from glob import glob
 from collections import defaultdict
 
 
-__all__ = ['HDFTableProxy', 'TableAccessor', 'HDFChain']
+__all__ = ['HDFTableProxy', 'TableAccessor', 'HDFChain', 'test_HDFChain']
 
 
 class HDFTableProxy(object):
@@ -24,7 +29,7 @@ class HDFTableProxy(object):
         lengths = n.zeros(len(self.files), dtype=int)
         for i, file in enumerate(self.files):
             try:
-                lengths[i] = len(file.getNode(self.path))
+                lengths[i] = len(file.get_node(self.path))
             except tables.NoSuchNodeError:
                 print("WARN: node %s does not exist in file %s" % (self.path, file.filename))
                 lengths[i] = 0
@@ -36,17 +41,71 @@ class HDFTableProxy(object):
         for i, file in enumerate(self.files):
             if lengths[i] == 0:
                 continue
-            result[lengths[:i].sum():lengths[:i].sum()+lengths[i]] = file.getNode(self.path).read()
+            result[lengths[:i].sum():lengths[:i].sum()+lengths[i]] = file.get_node(self.path).read()
 
         return result
 
-    def read_iter(self):
-        for i, file in enumerate(self.files):
-            yield file.getNode(self.path).read()
-    
-    def col_iter(self, colname):
-        for i, file in enumerate(self.files):
-            yield file.getNode(self.path).col(colname)
+    def read_iter(self, chunk_rows=None, columns=None, where=None,
+                  condvars=None):
+        """
+            iterate over the rows of the chained table, reading at most
+            `chunk_rows` rows at a time (default: one chunk per file) such that
+            memory use does not grow with the total number of rows.
+
+            columns : None (all), a column name (yields plain arrays of that
+                column) or a sequence of column names (yields structured arrays
+                with only these fields); other columns are not read
+            where : PyTables condition string (e.g. "(energy > 1) & (pid == 1)"),
+                evaluated in-kernel per chunk such that only matching rows are
+                read; variables in the condition that are not columns are looked
+                up in `condvars`
+        """
+        if chunk_rows is not None and chunk_rows < 1:
+            raise ValueError("chunk_rows must be positive, got %s" % chunk_rows)
+
+        if columns is None or isinstance(columns, str):
+            fields = None
+        else:
+            fields = list(columns)
+            dtype = n.dtype([(name, self._v_dtype[name]) for name in fields])
+
+        for file in self.files:
+            try:
+                table = file.get_node(self.path)
+            except tables.NoSuchNodeError:
+                print("WARN: node %s does not exist in file %s" % (self.path, file.filename))
+                continue
+
+            nrows = table.nrows
+            step = nrows if chunk_rows is None else chunk_rows
+            for start in range(0, nrows, max(step, 1)):
+                stop = min(start + step, nrows)
+                coords = None
+                length = stop - start
+                if where is not None:
+                    coords = table.get_where_list(where, condvars=condvars,
+                                                  start=start, stop=stop)
+                    length = len(coords)
+                    if length == 0:
+                        continue
+
+                if fields is None:
+                    yield self._read_chunk(table, start, stop, coords, columns)
+                else:
+                    result = n.empty(length, dtype=dtype)
+                    for name in fields:
+                        result[name] = self._read_chunk(table, start, stop, coords, name)
+                    yield result
+
+    @staticmethod
+    def _read_chunk(table, start, stop, coords, field):
+        if coords is None:
+            return table.read(start, stop, field=field)
+        return table.read_coordinates(coords, field=field)
+
+    def col_iter(self, colname, chunk_rows=None, where=None, condvars=None):
+        return self.read_iter(chunk_rows=chunk_rows, columns=colname,
+                              where=where, condvars=condvars)
 
     def col(self, colname):
         dtype = self._v_dtype[colname]
@@ -55,7 +114,7 @@ class HDFTableProxy(object):
         #print "INFO: counting rows"
         for i, file in enumerate(self.files):
             try:
-                lengths[i] = len(file.getNode(self.path))
+                lengths[i] = len(file.get_node(self.path))
             except tables.NoSuchNodeError:
                 print("WARN: node %s does not exist in file %s" % (self.path, file.filename))
                 lengths[i] = 0
@@ -68,18 +127,18 @@ class HDFTableProxy(object):
             #print "INFO: read %d/%d" % (i+1, len(self.files))
             if lengths[i] == 0:
                 continue
-            result[lengths[:i].sum():lengths[:i].sum()+lengths[i]] = file.getNode(self.path).col(colname)
+            result[lengths[:i].sum():lengths[:i].sum()+lengths[i]] = file.get_node(self.path).col(colname)
 
         return result
 
     def __len__(self):
         length = 0
         for i, file in enumerate(self.files):
-            length += len(file.getNode(self.path))
+            length += len(file.get_node(self.path))
         return length
 
     def __repr__(self):
-        return ("chained table with %d files:\n" % len(self.files))+self.files[0].getNode(self.path).__repr__()
+        return ("chained table with %d files:\n" % len(self.files))+self.files[0].get_node(self.path).__repr__()
 
 class TableAccessor(object):
     def __init__(self, tabledict):
@@ -94,7 +153,7 @@ class HDFChain(object):
         """ 
             setup a chain of hdf files. 
             files is either a list of filenames or a glob string
-            kwargs are passed to tables.openFile (e.g. NODE_CACHE_SLOTS)
+            kwargs are passed to tables.open_file (e.g. NODE_CACHE_SLOTS)
         """
 
         self.files = list()
@@ -107,9 +166,9 @@ class HDFChain(object):
         if type(files) is list:
             if len(files) == 0:
                 raise ValueError("provided file list is empty!")
-            self.files = [tables.openFile(fname, **kwargs) for fname in files ]
+            self.files = [tables.open_file(fname, **kwargs) for fname in files ]
         elif type(files) is str:
-            self.files = [tables.openFile(fname, **kwargs) for fname in sorted(glob(files)) ]
+            self.files = [tables.open_file(fname, **kwargs) for fname in sorted(glob(files)) ]
             if len(self.files) == 0:
                 raise ValueError("glob string matches no file!")
         else:
@@ -119,7 +178,7 @@ class HDFChain(object):
         file = self.files[0]
         if self.verbose:
             print("walking through first file %s" % file.filename)
-        for table in file.walkNodes(classname="Table"):
+        for table in file.walk_nodes(classname="Table"):
             if table._v_depth > maxdepth:
                 continue
             if table.name in self._tables:
@@ -141,6 +200,73 @@ class HDFChain(object):
             file.close()
 
 
-    def getNode(self, path):
+    def get_node(self, path):
         return self.pathes[path]
 
+    def getNode(self, path):
+        """deprecated alias of `get_node`"""
+        warnings.warn("HDFChain.getNode is deprecated, use get_node instead",
+                      DeprecationWarning, stacklevel=2)
+        return self.get_node(path)
+
+
+def test_HDFChain():
+    """Unit tests for chunked reading of chained tables"""
+    rand = n.random.RandomState(0)
+    dtype = n.dtype([('energy', n.float64), ('coszen', n.float32), ('pid', n.int32)])
+    testdir = tempfile.mkdtemp()
+    try:
+        fnames = []
+        ref = []
+        for i, num_rows in enumerate([100, 37, 0]):
+            data = n.empty(num_rows, dtype=dtype)
+            data['energy'] = rand.uniform(1, 80, num_rows)
+            data['coszen'] = rand.uniform(-1, 1, num_rows)
+            data['pid'] = rand.randint(0, 2, num_rows)
+            fnames.append(os.path.join(testdir, 'test%d.h5' % i))
+            with tables.open_file(fnames[-1], mode='w') as h5file:
+                h5file.create_table('/', 'events', obj=data)
+            ref.append(data)
+        ref = n.concatenate(ref)
+
+        chain = HDFChain(os.path.join(testdir, 'test*.h5'))
+        events = chain.root.events
+        assert len(events) == len(ref)
+        assert n.array_equal(events.read(), ref)
+        assert n.array_equal(events.col('coszen'), ref['coszen'])
+
+        # One chunk per (non-empty) file by default
+        assert [len(c) for c in events.read_iter()] == [100, 37]
+
+        chunks = list(events.read_iter(chunk_rows=16))
+        assert max(len(c) for c in chunks) == 16
+        assert n.array_equal(n.concatenate(chunks), ref)
+
+        chunks = list(events.read_iter(chunk_rows=16, columns=['pid', 'energy']))
+        assert chunks[0].dtype.names == ('pid', 'energy')
+        assert n.array_equal(n.concatenate(chunks), ref[['pid', 'energy']])
+
+        col = n.concatenate(list(events.col_iter('energy', chunk_rows=10)))
+        assert n.array_equal(col, ref['energy'])
+
+        mask = (ref['energy'] > 40) & (ref['pid'] == 1)
+        chunks = list(events.read_iter(chunk_rows=16, columns='energy',
+                                       where='(energy > emin) & (pid == 1)',
+                                       condvars={'emin': 40.}))
+        assert n.array_equal(n.concatenate(chunks), ref['energy'][mask])
+
+        assert chain.get_node('/events') is events
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            assert chain.getNode('/events') is events
+        assert caught[0].category is DeprecationWarning
+
+        del chain, events
+    finally:
+        shutil.rmtree(testdir, ignore_errors=True)
+
+    print('<< PASS : test_HDFChain >>')
+
+
+if __name__ == '__main__':
+    test_HDFChain()
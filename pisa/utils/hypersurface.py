@@ -7,7 +7,7 @@ simulation datasets, for example for detedctor uncertainties.
 """
 
 __all__ = ['HypersurfaceInterpolator', 'Hypersurface', 'HypersurfaceParam',
-           'fit_hypersurfaces', 'load_hypersurfaces', 'load_interpolated_hypersurfaces',
+           'fit_hypersurfaces', 'parallel_fit_hypersurfaces', 'load_hypersurfaces', 'load_interpolated_hypersurfaces',
            'extract_interpolated_hypersurface_params', 'plot_bin_fits',
            'plot_bin_fits_2d']
 
@@ -30,8 +30,11 @@ __license__ = '''Copyright (c) 2014-2017, The IceCube Collaboration
 
 import os
 import collections
+import math
 import copy
+import multiprocessing
 
+from numba import jit
 import numpy as np
 from scipy import interpolate
 from iminuit import Minuit
@@ -39,12 +42,15 @@ from iminuit.iminuit_warnings import HesseFailedWarning
 
 from pisa import FTYPE, ureg
 from pisa.utils import matrix
+from pisa.utils.cache import MemoryCache
 from pisa.utils.jsons import from_json, to_json
 from pisa.core.pipeline import Pipeline
 from pisa.core.binning import OneDimBinning, MultiDimBinning, is_binning
 from pisa.core.map import Map
 from pisa.utils.fileio import mkdir
+from pisa.utils.hash import hash_obj
 from pisa.utils.log import logging, set_verbosity
+from pisa.utils.numba_tools import NUMBA_CACHE, register_kernel
 from pisa.utils.comparisons import ALLCLOSE_KW
 from uncertainties import ufloat, correlated_values
 from uncertainties import unumpy as unp
@@ -61,6 +67,12 @@ Hypersurface functional forms
          systematic parameter, `out is the array to write the results to, and there are
          N coefficients of the parameterisation.
 
+   The `grad` method gives the gradient w.r.t. the coefficients (stacked along the
+   last axis of `out`) and the `param_grad` method the derivative w.r.t. `p`.
+
+   The `is_linear` attribute flags functional forms that are linear in their
+   coefficients, which allows fitting them in closed form.
+
    The format of these arguments depends on the use case, of which there are two:
      - When fitting the function coefficients. This is done bin-wise using multiple
      datasets.
@@ -83,6 +95,7 @@ class linear_hypersurface_func(object):
 
     def __init__(self):
         self.nargs = 1
+        self.is_linear = True
 
     def __call__(self, p, m, out):
         result = m * p
@@ -95,6 +108,10 @@ class linear_hypersurface_func(object):
         result = np.broadcast_to(p, foo.shape)[..., np.newaxis]
         np.copyto(src=result, dst=out)
 
+    def param_grad(self, p, m, out):
+        result = np.broadcast_to(m, (m*p).shape)
+        np.copyto(src=result, dst=out)
+
 
 class quadratic_hypersurface_func(object):
     '''
@@ -105,6 +122,7 @@ class quadratic_hypersurface_func(object):
 
     def __init__(self):
         self.nargs = 2
+        self.is_linear = True
 
     def __call__(self, p, m1, m2, out):
         result = m1*p + m2*p**2
@@ -122,6 +140,10 @@ class quadratic_hypersurface_func(object):
                           )
         np.copyto(src=result, dst=out)
 
+    def param_grad(self, p, m1, m2, out):
+        result = m1 + 2.*m2*p
+        np.copyto(src=result, dst=out)
+
 class exponential_hypersurface_func(object):
     '''
     Exponential hypersurface functional form
@@ -133,6 +155,7 @@ class exponential_hypersurface_func(object):
 
     def __init__(self):
         self.nargs = 1
+        self.is_linear = False
 
     def __call__(self, p, b, out):
         result = np.exp(b*p) - 1.
@@ -144,6 +167,10 @@ class exponential_hypersurface_func(object):
         result = np.array([p*np.exp(b*p)])[..., np.newaxis]
         np.copyto(src=result, dst=out)
 
+    def param_grad(self, p, b, out):
+        result = b*np.exp(b*p)
+        np.copyto(src=result, dst=out)
+
 class scaled_exponential_hypersurface_func(object):
     '''
     Exponential hypersurface functional form
@@ -157,6 +184,7 @@ class scaled_exponential_hypersurface_func(object):
 
     def __init__(self):
         self.nargs = 2
+        self.is_linear = False
 
     def __call__(self, p, a, b, out):
         result = (a + 1.) * (np.exp(b*p) - 1.)
@@ -168,6 +196,10 @@ class scaled_exponential_hypersurface_func(object):
         result = np.stack([np.exp(b*p) - 1., (a + 1.)*p*np.exp(b*p)], axis=-1)
         np.copyto(src=result, dst=out)
 
+    def param_grad(self, p, a, b, out):
+        result = (a + 1.)*b*np.exp(b*p)
+        np.copyto(src=result, dst=out)
+
 class logarithmic_hypersurface_func(object):
     '''
     Logarithmic hypersurface functional form
@@ -181,6 +213,7 @@ class logarithmic_hypersurface_func(object):
 
     def __init__(self):
         self.nargs = 1
+        self.is_linear = False
 
     def __call__(self, p, m, out):
         result = np.log(1 + m*p)
@@ -192,6 +225,10 @@ class logarithmic_hypersurface_func(object):
         result = np.array(p/(1 + m*p))[..., np.newaxis]
         np.copyto(src=result, dst=out)
 
+    def param_grad(self, p, m, out):
+        result = m/(1 + m*p)
+        np.copyto(src=result, dst=out)
+
 
 # Container holding all possible functions
 HYPERSURFACE_PARAM_FUNCTIONS = collections.OrderedDict()
@@ -201,6 +238,106 @@ HYPERSURFACE_PARAM_FUNCTIONS["exponential"] = exponential_hypersurface_func
 HYPERSURFACE_PARAM_FUNCTIONS["exponential_scaled"] = scaled_exponential_hypersurface_func
 HYPERSURFACE_PARAM_FUNCTIONS["logarithmic"] = logarithmic_hypersurface_func
 
+# Integer codes of the functional forms that are also implemented in the compiled
+# `_evaluate_hypersurface_kernel`, such that the value and uncertainty of a
+# hypersurface can be evaluated in a single pass over the bins. Hypersurfaces with
+# any other functional form are evaluated using the numpy implementations above.
+HYPERSURFACE_FUNC_CODES = collections.OrderedDict()
+HYPERSURFACE_FUNC_CODES["linear"] = 0
+HYPERSURFACE_FUNC_CODES["quadratic"] = 1
+HYPERSURFACE_FUNC_CODES["exponential"] = 2
+HYPERSURFACE_FUNC_CODES["exponential_scaled"] = 3
+HYPERSURFACE_FUNC_CODES["logarithmic"] = 4
+
+FX = "f4" if FTYPE == np.float32 else "f8"
+
+
+@register_kernel(
+    f"(f8[::1], i8[::1], i8[::1], {FX}[:, ::1], f8[:, :, ::1], b1, {FX}[::1], {FX}[::1])"
+)
+@jit(nopython=True, nogil=True, cache=NUMBA_CACHE)
+def _evaluate_hypersurface_kernel(param_values, func_codes, coefft_offsets, coeffts,
+                                  cov_mat, log, out, sigma):
+    """Evaluate a hypersurface and its uncertainty in all (flattened) bins.
+
+    Per bin, the gradient w.r.t. all coefficients is built in a scratch vector
+    and contracted with the covariance matrix right away, so no arrays with the
+    shape of the binning are created. The functional forms are written out here
+    (rather than calling a function per form) as this is the innermost loop.
+
+    Parameters
+    ----------
+    param_values, func_codes, coefft_offsets : 1D arrays
+        Value, functional form (see `HYPERSURFACE_FUNC_CODES`) and index of the
+        first coefficient of each systematic parameter
+    coeffts : 2D array of shape (num_bins, num_coeffts)
+        All coefficients, with the intercept first (as `Hypersurface.fit_coeffts`)
+    cov_mat : 3D array of shape (num_bins, num_coeffts, num_coeffts)
+    log : bool
+    out, sigma : 1D arrays of length `num_bins`
+        Value and uncertainty of the hypersurface are written to these
+
+    Returns
+    -------
+    valid : bool
+        False if the variance is negative in any bin
+
+    """
+    num_coeffts = cov_mat.shape[1]
+    grad = np.empty(num_coeffts, dtype=cov_mat.dtype)
+    valid = True
+    for i in range(coeffts.shape[0]):
+        value = coeffts[i, 0]
+        grad[0] = 1.
+        for k in range(func_codes.shape[0]):
+            p = param_values[k]
+            n = coefft_offsets[k]
+            func_code = func_codes[k]
+            if func_code == 0:
+                # linear
+                grad[n] = p
+                value += coeffts[i, n]*p
+            elif func_code == 1:
+                # quadratic
+                grad[n] = p
+                grad[n+1] = p**2
+                value += coeffts[i, n]*p + coeffts[i, n+1]*p**2
+            elif func_code == 2:
+                # exponential
+                exp_bp = math.exp(coeffts[i, n]*p)
+                grad[n] = p*exp_bp
+                value += exp_bp - 1.
+            elif func_code == 3:
+                # exponential_scaled
+                exp_bp = math.exp(coeffts[i, n+1]*p)
+                grad[n] = exp_bp - 1.
+                grad[n+1] = (coeffts[i, n] + 1.)*p*exp_bp
+                value += (coeffts[i, n] + 1.)*(exp_bp - 1.)
+            else:
+                # logarithmic
+                grad[n] = p/(1. + coeffts[i, n]*p)
+                value += math.log(1. + coeffts[i, n]*p)
+
+        # In log-mode, the output is exponentiated. For the gradient this simply
+        # means multiplying with the output itself.
+        if log:
+            value = math.exp(value)
+            for j in range(num_coeffts):
+                grad[j] *= value
+
+        variance = 0.
+        for j in range(num_coeffts):
+            cov_grad = 0.
+            for l in range(num_coeffts):
+                cov_grad += cov_mat[i, j, l]*grad[l]
+            variance += cov_grad*grad[j]
+        if variance < 0.:
+            valid = False
+
+        out[i] = value
+        sigma[i] = math.sqrt(variance) if variance >= 0. else np.nan
+    return valid
+
 
 class HypersurfaceInterpolator(object):
     """Factory for interpolated hypersurfaces.
@@ -240,6 +377,9 @@ class HypersurfaceInterpolator(object):
         or ``interpolate.interp2d`` depending on dimensionality.
         Default is 'linear'. Note that kinds supported by ``interp1d`` differ
         from those supported by ``interp2d``.
+    cache_depth : int, optional
+        Number of interpolated hypersurfaces to keep in an LRU cache, keyed on the
+        values of the interpolation parameters. Default is 10.
 
     Notes
     -----
@@ -256,7 +396,7 @@ class HypersurfaceInterpolator(object):
         class used for interpolation with two parameters
     """
 
-    def __init__(self, interp_params, hs_fits, kind='linear'):
+    def __init__(self, interp_params, hs_fits, kind='linear', cache_depth=10):
         self.ndim = len(interp_params)
         assert self.ndim in [
             1, 2], "can only work in either one or two dimensions"
@@ -270,7 +410,7 @@ class HypersurfaceInterpolator(object):
         reference_hs = hs_fits[0]['hypersurface']
         # we are going to produce the hypersurface from a state that is the same
         # as the reference, only the coefficients and covariance matrices are
-        # injected from the spline interpolation.
+        # injected from the interpolation.
         self._reference_state = copy.deepcopy(reference_hs.serializable_state)
         # for cleanliness we wipe numbers from the original state
         self._reference_state["intercept_sigma"] = np.nan
@@ -280,20 +420,13 @@ class HypersurfaceInterpolator(object):
         for param in self._reference_state['params'].values():
             param['fit_coeffts_sigma'] = np.full_like(
                 param['fit_coeffts_sigma'], np.nan)
-        # Instead of holding numbers, these coefficients and covariance
-        # matrices are going to hold spline objects that can be called to interpolate
-        # at the requested point.
-        # The shape of fit_coeffts is [binning ..., fit coeffts]
-        self.coefficients = np.empty(
-            reference_hs.fit_coeffts.shape, dtype=object)
-        # The shape of fit_cov_mat is [binning ..., fit coeffts, fit coeffts]
-        self.covars = np.empty(reference_hs.fit_cov_mat.shape, dtype=object)
+        # The hypersurfaces returned are shallow copies of this one (see
+        # `_make_hypersurface`)
+        self._reference_hs = Hypersurface.from_state(
+            copy.deepcopy(self._reference_state))
         names = [p['name'] for p in self.interp_params]
         units = [p['unit'] for p in self.interp_params]
         # We store the original points that went into the interpolation.
-        # Note that we use the keyword argument "copy=False" in the interpolation
-        # initialization below, so that the interpolation contains only references
-        # to the values stored here.
         self._x = []
         if self.ndim == 2:
             self._y = []
@@ -302,49 +435,142 @@ class HypersurfaceInterpolator(object):
             if self.ndim == 2:
                 self._y.append(f['param_values'][names[1]].m_as(units[1]))
         # dimension is [binning..., fit coeffts, number of fits]
-        self._coeff_z = np.zeros(self.coefficients.shape + (len(hs_fits),))
-        for idx in np.ndindex(self.coefficients.shape):
-            for i, f in enumerate(hs_fits):
-                self._coeff_z[idx][i] = f['hypersurface'].fit_coeffts[idx]
-            if self.ndim == 1:
-                # TODO: Use numpy if kind is 'linear'
-                self.coefficients[idx] = interpolate.interp1d(self._x, self._coeff_z[idx],
-                                                              copy=False,
-                                                              fill_value='extrapolate',
-                                                              kind=kind,
-                                                              )
-            elif self.ndim == 2:
-                self.coefficients[idx] = interpolate.interp2d(self._x, self._y,
-                                                              self._coeff_z[idx],
-                                                              copy=False,
-                                                              kind=kind
-                                                              )
+        self._coeff_z = np.stack(
+            [f['hypersurface'].fit_coeffts for f in hs_fits], axis=-1).astype(np.float64)
         # dimension is [binning..., fit coeffts, fit coeffts, number of fits]
-        self._covar_z = np.zeros(self.covars.shape + (len(hs_fits),))
-        for idx in np.ndindex(self.covars.shape):
-            for i, f in enumerate(hs_fits):
-                self._covar_z[idx][i] = f['hypersurface'].fit_cov_mat[idx]
-            if self.ndim == 1:
-                self.covars[idx] = interpolate.interp1d(self._x, self._covar_z[idx],
-                                                        copy=False,
-                                                        fill_value='extrapolate',
-                                                        kind=kind,
-                                                        )
-            elif self.ndim == 2:
-                self.covars[idx] = interpolate.interp2d(self._x, self._y,
-                                                        self._covar_z[idx],
-                                                        copy=False,
-                                                        kind=kind,
-                                                        )
+        self._covar_z = np.stack(
+            [f['hypersurface'].fit_cov_mat for f in hs_fits], axis=-1).astype(np.float64)
         # In order not to spam warnings, we only want to warn about non positive
         # semi definite covariance matrices once for each bin. We store the bin
         # indeces for which the warning has already been issued.
         self.covar_bins_warning_issued = []
+        # Check the covariance matrices at the support points for symmetry and
+        # fix those that are not positive semi-definite. As the interpolation is a
+        # weighted sum of the matrices at the support points, the interpolated
+        # matrices are then symmetric as well and positive semi-definite as long
+        # as no negative weights are involved.
+        for i in range(len(hs_fits)):
+            covars = self._covar_z[..., i]
+            assert np.allclose(covars, np.swapaxes(covars, -1, -2), rtol=ALLCLOSE_KW['rtol']*10.,
+                               equal_nan=True), f'cov matrix not symmetric in fit {i}'
+            self._fix_covariances(covars)
+
+        #
+        # Precompute the interpolation
+        #
+
+        # All supported kinds of interpolation are linear in the interpolated
+        # values. For a given point, the 1D interpolation therefore is the sum of
+        # the values at the support points, weighted by the interpolation of the
+        # unit vectors. These weights are the same for all coefficients and
+        # covariance matrix elements in all bins.
+        self.kind = kind
+        if self.ndim == 1:
+            self._interp_weights = interpolate.interp1d(self._x, np.eye(len(hs_fits)),
+                                                        axis=0,
+                                                        copy=False,
+                                                        fill_value='extrapolate',
+                                                        kind=kind,
+                                                        )
+        elif self.ndim == 2:
+            # `interp2d` fits a B-spline to the values, which can be evaluated for
+            # all values sharing the same knots at once. Note that the knots of
+            # linear splines depend on the values, such that these are mostly
+            # evaluated individually.
+            z = np.concatenate([self._coeff_z.reshape(-1, len(hs_fits)),
+                                self._covar_z.reshape(-1, len(hs_fits))])
+            groups = collections.OrderedDict()
+            for i, zz in enumerate(z):
+                tx, ty, c, kx, ky = interpolate.interp2d(self._x, self._y, zz,
+                                                         copy=False,
+                                                         kind=kind,
+                                                         ).tck
+                group = groups.setdefault((tx.tobytes(), ty.tobytes(), kx, ky),
+                                          (tx, ty, kx, ky, [], []))
+                group[4].append(i)
+                group[5].append(c)
+            self._spline_groups = [(tx, ty, kx, ky, np.array(idx), np.array(c))
+                                   for tx, ty, kx, ky, idx, c in groups.values()]
+
+        # Cache of the hypersurfaces returned, keyed on the interpolation
+        # parameter values
+        self._cache = MemoryCache(max_depth=cache_depth, is_lru=True)
+
+    def _fix_covariances(self, covars):
+        '''
+        Replace the covariance matrices (array of shape [binning..., fit coeffts,
+        fit coeffts]) that are not positive semi-definite by the nearest ones that
+        are, in place.
+        '''
+        try:
+            np.linalg.cholesky(covars)
+            return
+        except np.linalg.LinAlgError:
+            pass
+        for bin_idx in np.ndindex(covars.shape[:-2]):
+            m = covars[bin_idx]
+            # invalid matrices are caught when interpolating
+            if not np.all(np.isfinite(m)):
+                continue
+            if not matrix.is_psd(m):
+                covars[bin_idx] = matrix.fronebius_nearest_psd(m)
+                if not bin_idx in self.covar_bins_warning_issued:
+                    logging.warn(
+                        f'Invalid covariance matrix fixed in bin: {bin_idx}')
+                    self.covar_bins_warning_issued.append(bin_idx)
+
+    def _interpolate(self, *x):
+        '''
+        Interpolate the coefficients and covariance matrices in all bins at the
+        point `x` in the interpolation parameter space (in the units of
+        `interp_params`). Also returns whether all weights of the values at the
+        support points are known to be non-negative.
+        '''
+        if self.ndim == 1:
+            weights = self._interp_weights(x[0])
+            return self._coeff_z @ weights, self._covar_z @ weights, bool(np.all(weights >= 0.))
+        out = np.empty(self._coeff_z[..., 0].size + self._covar_z[..., 0].size)
+        for tx, ty, kx, ky, idx, c in self._spline_groups:
+            if len(idx) > c.shape[1]:
+                # B-spline basis functions at x
+                basis = np.array([interpolate.bisplev(x[0], x[1], (tx, ty, e, kx, ky))
+                                  for e in np.eye(c.shape[1])])
+                out[idx] = c @ basis
+            else:
+                for i, cc in zip(idx, c):
+                    out[i] = interpolate.bisplev(x[0], x[1], (tx, ty, cc, kx, ky))
+        n = self._coeff_z[..., 0].size
+        return (out[:n].reshape(self._coeff_z.shape[:-1]),
+                out[n:].reshape(self._covar_z.shape[:-1]),
+                False)
+
+    def _make_hypersurface(self, coeffts, covars):
+        '''
+        Make a copy of the reference hypersurface with the given coefficients and
+        covariance matrices. Everything else is shared with the reference.
+        '''
+        hypersurface = copy.copy(self._reference_hs)
+        hypersurface.params = collections.OrderedDict()
+        for name, param in self._reference_hs.params.items():
+            param = copy.copy(param)
+            param.fit_coeffts = np.empty_like(param.fit_coeffts, dtype=np.float64)
+            param._serializable_state = None
+            hypersurface.params[name] = param
+        hypersurface._serializable_state = None
+        hypersurface._coeffts_buffer = None
+        # the setter method defined in the Hypersurface class takes care of
+        # putting the coefficients in the right place in their respective parameters
+        hypersurface.fit_coeffts = coeffts
+        hypersurface.fit_cov_mat = covars
+        return hypersurface
 
     def get_hypersurface(self, **param_kw):
         """
         Get a Hypersurface object with interpolated coefficients.
 
+        The hypersurfaces are cached, so the same object is returned for
+        repeated calls with the same parameter values. It must not be modified.
+
         Parameters
         ----------
         **param_kw
@@ -357,35 +583,21 @@ class HypersurfaceInterpolator(object):
             [i['name'] for i in self.interp_params]), "invalid parameters"
         names = [p['name'] for p in self.interp_params]
         units = [p['unit'] for p in self.interp_params]
-        x = [param_kw[n].m_as(u) for n, u in zip(names, units)]
-        state = copy.deepcopy(self._reference_state)
-        # fit covariance matrices are stored directly
-        for idx in np.ndindex(state['fit_cov_mat'].shape):
-            state['fit_cov_mat'][idx] = self.covars[idx](
-                *x)  # calls the spline
-            assert np.isfinite(
-                state['fit_cov_mat'][idx]), f"invalid cov matrix element encountered at {param_kw} in loc {idx}"
-        # check covariance matrices for symmetry, positive semi-definiteness
-        for bin_idx in np.ndindex(state['fit_cov_mat'].shape[:-2]):
-            m = state['fit_cov_mat'][bin_idx]
-            assert np.allclose(
-                m, m.T, rtol=ALLCLOSE_KW['rtol']*10.), f'cov matrix not symmetric in bin {bin_idx}'
-            if not matrix.is_psd(m):
-                state['fit_cov_mat'][bin_idx] = matrix.fronebius_nearest_psd(m)
-                if not bin_idx in self.covar_bins_warning_issued:
-                    logging.warn(
-                        f'Invalid covariance matrix fixed in bin: {bin_idx}')
-                    self.covar_bins_warning_issued.append(bin_idx)
-        hypersurface = Hypersurface.from_state(state)
-        coeffts = np.zeros(self.coefficients.shape)
-        for idx in np.ndindex(self.coefficients.shape):
-            coeffts[idx] = self.coefficients[idx](
-                *x)  # calls spline interpolation
-            assert np.isfinite(
-                coeffts[idx]), f"invalid coeff encountered at {param_kw} in loc {idx}"
-        # the setter method defined in the Hypersurface class takes care of
-        # putting the coefficients in the right place in their respective parameters
-        hypersurface.fit_coeffts = coeffts
+        x = tuple(float(param_kw[n].m_as(u)) for n, u in zip(names, units))
+        hypersurface = self._cache.get(x)
+        if hypersurface is not None:
+            return hypersurface
+        coeffts, covars, positive_weights = self._interpolate(*x)
+        assert np.all(np.isfinite(
+            covars)), f"invalid cov matrix element encountered at {param_kw}"
+        assert np.all(np.isfinite(
+            coeffts)), f"invalid coeff encountered at {param_kw}"
+        # a weighted sum of positive semi-definite matrices with non-negative
+        # weights is positive semi-definite, otherwise the result must be checked
+        if not positive_weights:
+            self._fix_covariances(covars)
+        hypersurface = self._make_hypersurface(coeffts, covars)
+        self._cache[x] = hypersurface
         return hypersurface
 
     def make_slices(self, x_plot, name):
@@ -412,8 +624,8 @@ class HypersurfaceInterpolator(object):
             Size: (binning..., number of coeffs, number of coeffs, len(`x_plot`))
         """
         assert self.ndim == 1, "making slices is only supported for 1D at the moment"
-        coeff_slices = np.zeros(self.coefficients.shape+(len(x_plot),))
-        covar_slices = np.zeros(self.covars.shape+(len(x_plot),))
+        coeff_slices = np.zeros(self._coeff_z.shape[:-1]+(len(x_plot),))
+        covar_slices = np.zeros(self._covar_z.shape[:-1]+(len(x_plot),))
         for i, x in enumerate(x_plot):
             pars = {name: x}
             hs = self.get_hypersurface(**pars)
@@ -440,7 +652,7 @@ class HypersurfaceInterpolator(object):
         assert self.ndim == 1, "plotting currently only supported in 1D"
         # TODO Support 2D plotting
         import matplotlib.pyplot as plt
-        n_coeff = self.coefficients.shape[-1]
+        n_coeff = self._coeff_z.shape[-2]
         hs_param_names = list(self._reference_state['params'].keys())
         hs_param_labels = ["intercept"] + [f"{p} p{i}" for p in hs_param_names
                                            for i in range(self._reference_state['params'][p]['num_fit_coeffts'])]
@@ -454,10 +666,12 @@ class HypersurfaceInterpolator(object):
         unit = self.interp_params[0]['unit']
         x_plot = np.linspace(np.min(self._x), np.max(self._x), n_steps)
         coeff_slices, covar_slices = self.make_slices(x_plot*ureg[unit], name)
+        # interpolation weights of the support points at each plotted point
+        weights = self._interp_weights(x_plot)
 
         # first row plots fit coefficients
         for i in range(n_coeff):
-            z_plot = self.coefficients[bin_idx][i](x_plot)
+            z_plot = weights @ self._coeff_z[bin_idx][i]
             ax[i, 0].plot(x_plot, z_plot, label='spline')
             z_slice = coeff_slices[bin_idx][i]
             # since there are no corrections on the fitted coefficients, there
@@ -473,7 +687,7 @@ class HypersurfaceInterpolator(object):
             # that it is positive semi definite. These plots should show the difference.
             for j in range(0, n_coeff):
                 coeff_idx = (i, j)
-                z_plot = self.covars[bin_idx][coeff_idx](x_plot)
+                z_plot = weights @ self._covar_z[bin_idx][coeff_idx]
                 ax[i, j+1].plot(x_plot, z_plot, label='spline')
                 ax[i, j+1].scatter(self._x, self._covar_z[bin_idx][coeff_idx],
                                    color='k', marker='x', label='truth')
@@ -577,6 +791,9 @@ class Hypersurface(object):
         # Serialization
         self._serializable_state = None
 
+        # Scratch space for `evaluate_with_uncertainty`
+        self._coeffts_buffer = None
+
         # Legacy handling
         self.using_legacy_data = False
 
@@ -636,7 +853,7 @@ class Hypersurface(object):
         '''
         return list(self.params.keys())
 
-    def evaluate(self, param_values, bin_idx=None, return_uncertainty=False):
+    def evaluate(self, param_values, bin_idx=None, return_uncertainty=False, fused=True):
         '''
         Evaluate the hypersurface, using the systematic parameter values provided.
         Uses the current internal values for all functional form coefficients.
@@ -656,10 +873,20 @@ class Hypersurface(object):
 
         return_uncertainty : bool, optional
             return the uncertainty on the output (default: False)
+
+        fused : bool, optional
+            When evaluating the uncertainty in all bins, use the compiled single-pass
+            implementation (see `evaluate_with_uncertainty`) if all functional forms
+            support it. Set to False to use the numpy implementation (default: True)
         '''
 
         assert self._initialized, "Cannot evaluate hypersurface, it haas not been initialized"
 
+        if return_uncertainty and fused and bin_idx is None and self.supports_fused_evaluation:
+            out = np.empty(self.binning.shape, dtype=FTYPE)
+            sigma = np.empty(self.binning.shape, dtype=FTYPE)
+            return self.evaluate_with_uncertainty(param_values, out=out, sigma=sigma)
+
         #
         # Check inputs
         #
@@ -757,9 +984,121 @@ class Hypersurface(object):
         else:
             return output_factors
 
+    @property
+    def supports_fused_evaluation(self):
+        '''
+        Whether all functional forms are implemented in the compiled kernel used
+        by `evaluate_with_uncertainty`
+        '''
+        return all(p.func_name in HYPERSURFACE_FUNC_CODES for p in self.params.values())
+
+    def evaluate_with_uncertainty(self, param_values, out=None, sigma=None):
+        '''
+        Evaluate the hypersurface and its uncertainty in all bins, equivalent to
+        `evaluate(param_values, return_uncertainty=True)`.
+
+        Value, gradient w.r.t. the coefficients and variance are computed together
+        bin by bin in a compiled loop, without any temporary arrays. Passing
+        preallocated `out` and `sigma` arrays avoids any allocation at all, which is
+        what the hypersurface stage does on every evaluation.
+
+        Parameters
+        ----------
+        param_values : dict
+            Values of the systematic parameters, as for `evaluate` (scalars only)
+
+        out, sigma : arrays or None
+            Contiguous arrays with `binning.size` elements (of any shape) to write the
+            hypersurface values and uncertainties to. Created if None.
+
+        Returns
+        -------
+        out, sigma : arrays
+            Of shape `binning.shape` if they were created here
+        '''
+        assert self._initialized, "Cannot evaluate hypersurface, it haas not been initialized"
+        assert self.supports_fused_evaluation, "Functional form not supported in fused evaluation"
+        assert self.fit_cov_mat is not None, "Hypersurface has no covariance matrix"
+
+        num_bins = self.binning.size
+        if out is None:
+            out = np.empty(self.binning.shape, dtype=FTYPE)
+        if sigma is None:
+            sigma = np.empty(self.binning.shape, dtype=FTYPE)
+        for array in (out, sigma):
+            assert array.size == num_bins, "Output arrays must have one element per bin"
+            assert array.flags.c_contiguous, "Output arrays must be contiguous"
+
+        # Gather all coefficients in a buffer that is kept for subsequent calls
+        num_coeffts = self.num_fit_coeffts
+        if self._coeffts_buffer is None or self._coeffts_buffer.shape != (num_bins, num_coeffts):
+            self._coeffts_buffer = np.empty((num_bins, num_coeffts), dtype=FTYPE)
+        coeffts = self._coeffts_buffer
+        coeffts[:, 0] = self.intercept.reshape(num_bins)
+        param_vals = np.empty(len(self.params), dtype=np.float64)
+        func_codes = np.empty(len(self.params), dtype=np.int64)
+        coefft_offsets = np.empty(len(self.params), dtype=np.int64)
+        n = 1
+        for i, (k, p) in enumerate(self.params.items()):
+            coeffts[:, n:n+p.num_fit_coeffts] = p.fit_coeffts.reshape(num_bins, p.num_fit_coeffts)
+            param_vals[i] = param_values[k] if self.using_legacy_data else param_values[k] - p.nominal_value
+            func_codes[i] = HYPERSURFACE_FUNC_CODES[p.func_name]
+            coefft_offsets[i] = n
+            n += p.num_fit_coeffts
+
+        valid = _evaluate_hypersurface_kernel(
+            param_vals,
+            func_codes,
+            coefft_offsets,
+            coeffts,
+            self.fit_cov_mat.reshape(num_bins, num_coeffts, num_coeffts),
+            self.log,
+            out.reshape(num_bins),
+            sigma.reshape(num_bins),
+        )
+        assert valid, "invalid covariance"
+
+        return out, sigma
+
+    def evaluate_log_grad(self, param_values, param_name):
+        '''
+        Evaluate the derivative of the logarithm of the hypersurface w.r.t. one of
+        the systematic parameters, for all bins.
+
+        Parameters
+        ----------
+        param_values : dict
+            Values of the systematic parameters, as for `evaluate` (scalars only)
+
+        param_name : str
+            Parameter to differentiate w.r.t.
+
+        Returns
+        -------
+        log_grad : array of shape `binning.shape`
+            NaN where the hypersurface is zero or not finite
+        '''
+        assert self._initialized, "Cannot evaluate hypersurface, it haas not been initialized"
+
+        p = self.params[param_name]
+        param_val = param_values[param_name] if self.using_legacy_data else param_values[param_name] - p.nominal_value
+        grad = np.full(self.binning.shape, np.NaN, dtype=FTYPE)
+        p.param_gradient(param_val, out=grad)
+
+        # In log-mode the output is exp(sum of the functional forms), so the
+        # log derivative is just the derivative of the respective functional form
+        if self.log:
+            return grad
+
+        output_factors = self.evaluate(param_values)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            log_grad = grad / output_factors
+        log_grad[~np.isfinite(log_grad)] = np.NaN
+        return log_grad
+
     def fit(self, nominal_map, nominal_param_values, sys_maps, sys_param_values,
             norm=True, method="L-BFGS-B", fix_intercept=False, intercept_bounds=None,
-            intercept_sigma=None, include_empty=False):
+            intercept_sigma=None, include_empty=False, vectorized=True, bins=None):
         '''
         Fit the hypersurface coefficients (in every bin) to best match the provided
         nominal and systematic datasets.
@@ -802,6 +1141,52 @@ class Hypersurface(object):
             Include empty bins in the fit. If True, empty bins are included with value 0
             and sigma 1.
             Default: False
+
+        vectorized : bool
+            Fit all bins simultaneously (see `_fit_vectorized`). Bins for which the
+            vectorized fit fails, does not converge or violates the bounds are
+            re-fitted individually with Minuit. If False, every bin is fitted
+            individually with Minuit.
+            Default: True
+
+        bins : sequence of tuples, optional
+            Only fit the bins with these indices, leaving the coefficients in all
+            other bins at their initial values. Default is to fit all bins.
+        '''
+
+        # Store thr fitting method
+        self.fit_method = method
+
+        # Check inputs, initialise the hypersurface and store the fit datasets
+        self._prepare_fit(nominal_map=nominal_map,
+                          nominal_param_values=nominal_param_values,
+                          sys_maps=sys_maps,
+                          sys_param_values=sys_param_values,
+                          norm=norm,
+                          include_empty=include_empty,
+                          )
+
+        # Fit the bins
+        self._fit_bins(bins=bins,
+                       fix_intercept=fix_intercept,
+                       intercept_bounds=intercept_bounds,
+                       intercept_sigma=intercept_sigma,
+                       include_empty=include_empty,
+                       vectorized=vectorized,
+                       )
+
+        # Evaluate the fit quality
+        self._finalize_fit(include_empty=include_empty)
+
+    def _prepare_fit(self, nominal_map, nominal_param_values, sys_maps, sys_param_values,
+                     norm=True, include_empty=False):
+        '''
+        Check the fit inputs, initialise the hypersurface using the nominal dataset
+        and store the (normalised) maps and param values used for fitting.
+
+        See `fit` for a description of the arguments.
+
+        Internal function, not to be called by a user.
         '''
 
         #
@@ -832,9 +1217,6 @@ class Hypersurface(object):
         # Format things before getting started
         #
 
-        # Store thr fitting method
-        self.fit_method = method
-
         # Initialise hypersurface using nominal dataset
         self._init(binning=nominal_map.binning,
                    nominal_param_values=nominal_param_values)
@@ -854,10 +1236,6 @@ class Hypersurface(object):
         for name, values in list(param_values_dict.items()):
             self.params[name].fit_param_values = values
 
-        # Format the fit `x` values : [ [sys param 0 values], [sys param 1 values], ... ]
-        # Order of the params must match the order in `self.params`
-        x = np.asarray([param_values_dict[param_name]
-                        for param_name in list(self.params.keys())], dtype=FTYPE)
         # Prepare covariance matrix array
         self.fit_cov_mat = np.full(
             list(self.binning.shape)+[self.num_fit_coeffts, self.num_fit_coeffts], np.NaN)
@@ -905,11 +1283,103 @@ class Hypersurface(object):
             assert np.all(m.nominal_values[finite_mask]
                           >= 0.), "Found negative bin counts"
 
+    def _fit_bins(self, bins=None, fix_intercept=False, intercept_bounds=None,
+                  intercept_sigma=None, include_empty=False, vectorized=True):
+        '''
+        Fit the hypersurface coefficients in the bins `bins` (a sequence of bin
+        indices, or None for all bins), writing the results directly into this data
+        structure. The fit datasets must have been stored via `_prepare_fit`.
+
+        See `fit` for a description of the other arguments.
+
+        Internal function, not to be called by a user.
+        '''
+
+        # Format the fit `x` values : [ [sys param 0 values], [sys param 1 values], ... ]
+        # Order of the params must match the order in `self.params`
+        x = np.asarray([param.fit_param_values
+                        for param in list(self.params.values())], dtype=FTYPE)
+
+        #
+        # Priors and bounds
+        #
+
+        inv_param_sigma = []
+        if intercept_sigma is not None:
+            inv_param_sigma.append(1./intercept_sigma)
+        else:
+            inv_param_sigma.append(0.)
+        for param in list(self.params.values()):
+            if param.coeff_prior_sigma is not None:
+                for j in range(param.num_fit_coeffts):
+                    inv_param_sigma.append(
+                        1./param.coeff_prior_sigma[j])
+            else:
+                for j in range(param.num_fit_coeffts):
+                    inv_param_sigma.append(0.)
+        inv_param_sigma = np.array(inv_param_sigma)
+        assert np.all(np.isfinite(
+            inv_param_sigma)), "invalid values found in prior sigma. They must not be zero."
+
+        # coefficient names to pass to Minuit. Not strictly necessary
+        coeff_names = [] if fix_intercept else ['intercept']
+        for name, param in self.params.items():
+            for j in range(param.num_fit_coeffts):
+                coeff_names.append(name + '_p{:d}'.format(j))
+
+        # Define fit bounds for `minimize`. Bounds are pairs of (min, max)
+        # values for each parameter in the fit. Use 'None' in place of min/max
+        # if there is
+        # no bound in that direction.
+        fit_bounds = []
+        if intercept_bounds is None:
+            fit_bounds.append(tuple([None, None]))
+        else:
+            assert (len(intercept_bounds) == 2) and (
+                np.ndim(intercept_bounds) == 1), "intercept bounds must be given as 2-tuple"
+            fit_bounds.append(intercept_bounds)
+
+        for param in self.params.values():
+            if param.bounds is None:
+                fit_bounds.extend(
+                    ((None, None),)*param.num_fit_coeffts)
+            else:
+                if np.ndim(param.bounds) == 1:
+                    assert len(
+                        param.bounds) == 2, "bounds on single coefficients must be given as 2-tuples"
+                    fit_bounds.append(param.bounds)
+                elif np.ndim(param.bounds) == 2:
+                    assert np.all([len(t) == 2 for t in param.bounds]
+                                  ), "bounds must be given as a tuple of 2-tuples"
+                    fit_bounds.extend(param.bounds)
+
+        #
+        # Fit all bins simultaneously
+        #
+
+        if bins is None:
+            bins = list(np.ndindex(self.binning.shape))
+        if vectorized:
+            bins_to_fit = self._fit_vectorized(
+                bins=bins,
+                x=x,
+                fix_intercept=fix_intercept,
+                fit_bounds=fit_bounds,
+                inv_param_sigma=inv_param_sigma,
+                include_empty=include_empty,
+            )
+            logging.debug(
+                "Vectorized hypersurface fit : %i of %i bins need an individual fit"
+                % (len(bins_to_fit), len(bins))
+            )
+        else:
+            bins_to_fit = list(bins)
+
         #
         # Loop over bins
         #
 
-        for bin_idx in np.ndindex(self.binning.shape):  # TODO grab from input map
+        for bin_idx in bins_to_fit:  # TODO grab from input map
 
             #
             # Format this bin's data for fitting
@@ -1012,29 +1482,6 @@ class Hypersurface(object):
 
                     return self.evaluate(params_unflattened, bin_idx=bin_idx)
 
-                inv_param_sigma = []
-                if intercept_sigma is not None:
-                    inv_param_sigma.append(1./intercept_sigma)
-                else:
-                    inv_param_sigma.append(0.)
-                for param in list(self.params.values()):
-                    if param.coeff_prior_sigma is not None:
-                        for j in range(param.num_fit_coeffts):
-                            inv_param_sigma.append(
-                                1./param.coeff_prior_sigma[j])
-                    else:
-                        for j in range(param.num_fit_coeffts):
-                            inv_param_sigma.append(0.)
-                inv_param_sigma = np.array(inv_param_sigma)
-                assert np.all(np.isfinite(
-                    inv_param_sigma)), "invalid values found in prior sigma. They must not be zero."
-
-                # coefficient names to pass to Minuit. Not strictly necessary
-                coeff_names = [] if fix_intercept else ['intercept']
-                for name, param in self.params.items():
-                    for j in range(param.num_fit_coeffts):
-                        coeff_names.append(name + '_p{:d}'.format(j))
-
                 def loss(p):
                     '''
                     Loss to be minimized during the fit.
@@ -1042,32 +1489,6 @@ class Hypersurface(object):
                     fvals = callback(x_to_use, *p)
                     return np.sum(((fvals - y_to_use)/y_sigma_to_use)**2) + np.sum((inv_param_sigma*p)**2)
 
-                # Define fit bounds for `minimize`. Bounds are pairs of (min, max)
-                # values for each parameter in the fit. Use 'None' in place of min/max
-                # if there is
-                # no bound in that direction.
-                fit_bounds = []
-                if intercept_bounds is None:
-                    fit_bounds.append(tuple([None, None]))
-                else:
-                    assert (len(intercept_bounds) == 2) and (
-                        np.ndim(intercept_bounds) == 1), "intercept bounds must be given as 2-tuple"
-                    fit_bounds.append(intercept_bounds)
-
-                for param in self.params.values():
-                    if param.bounds is None:
-                        fit_bounds.extend(
-                            ((None, None),)*param.num_fit_coeffts)
-                    else:
-                        if np.ndim(param.bounds) == 1:
-                            assert len(
-                                param.bounds) == 2, "bounds on single coefficients must be given as 2-tuples"
-                            fit_bounds.append(param.bounds)
-                        elif np.ndim(param.bounds) == 2:
-                            assert np.all([len(t) == 2 for t in param.bounds]
-                                          ), "bounds must be given as a tuple of 2-tuples"
-                            fit_bounds.extend(param.bounds)
-
                 # Define the EPS (step length) used by the fitter Need to take care with
                 # floating type precision, don't want to go smaller than the FTYPE being
                 # used by PISA can handle
@@ -1143,6 +1564,14 @@ class Hypersurface(object):
             else:
                 self.fit_cov_mat[bin_idx] = pcov
 
+    def _finalize_fit(self, include_empty=False):
+        '''
+        Compute the chi2 of the fitted hypersurface w.r.t. each fit dataset and mark
+        the fit as complete.
+
+        Internal function, not to be called by a user.
+        '''
+
         #
         # chi2
         #
@@ -1158,7 +1587,7 @@ class Hypersurface(object):
 
             # Get expected bin values according tohypersurface value
             predicted = self.evaluate(
-                {name: values[i_set] for name, values in list(param_values_dict.items())})
+                {name: values[i_set] for name, values in list(self.fit_param_values.items())})
 
             # Get the observed value
             observed = self.fit_maps[i_set].nominal_values
@@ -1186,6 +1615,192 @@ class Hypersurface(object):
         # Record some provenance info about the fits
         self.fit_complete = True
 
+    def _fit_vectorized(self, bins, x, fix_intercept, fit_bounds, inv_param_sigma,
+                        include_empty, max_iter=100, tol=1e-10):
+        '''
+        Fit the hypersurface coefficients in all bins `bins` simultaneously.
+
+        If the hypersurface is linear in all of its coefficients (linear mode with
+        only linear and quadratic functional forms), the prior-regularized least
+        squares problem is solved in closed form. Otherwise a Gauss-Newton fit with
+        Levenberg-Marquardt damping is performed for all bins at once. The
+        covariance matrix in each bin is the inverse of the (Gauss-Newton
+        approximation of the) Hessian at the best fit.
+
+        Writes the results for all successfully fitted bins directly into this data
+        structure and returns the indices of the bins that still need to be fitted
+        individually (no valid data, singular Hessian, no convergence or fit result
+        outside of `fit_bounds`).
+
+        Internal function, not to be called by a user.
+        '''
+
+        if len(bins) == 0:
+            return []
+
+        params = list(self.params.values())
+        first_free = 1 if fix_intercept else 0
+        num_free = self.num_fit_coeffts - first_free
+        flat_idx = np.ravel_multi_index(tuple(np.transpose(bins)), self.binning.shape)
+        num_bins = flat_idx.size
+
+        # Bin values and uncertainties as [ bin, dataset ]
+        y = np.stack([m.nominal_values.reshape(-1)[flat_idx] for m in self.fit_maps],
+                     axis=-1).astype(np.float64)
+        y_sigma = np.stack([m.std_devs.reshape(-1)[flat_idx] for m in self.fit_maps],
+                           axis=-1).astype(np.float64)
+
+        # Must have at least as many sets as free params in fit
+        assert y.shape[1] >= num_free, "Number of datasets used for fitting (%i) must be >= num free params (%i)" % (
+            y.shape[1], num_free)
+
+        # Same treatment of empty bins as in the bin-wise fit: points with zero
+        # uncertainty are either ignored (zero weight) or included with sigma = 1
+        bad_sigma_mask = y_sigma == 0.
+        if include_empty:
+            y_sigma[bad_sigma_mask] = 1.
+            bad_sigma_mask[...] = False
+        weights = np.zeros_like(y_sigma)
+        weights[~bad_sigma_mask] = 1. / y_sigma[~bad_sigma_mask]**2
+
+        # Bins with invalid data are left to the bin-wise fit, which flags them
+        valid_bins = np.all(np.isfinite(y) | bad_sigma_mask, axis=1)
+        y[~np.isfinite(y)] = 0.
+        weights[~valid_bins] = 0.
+
+        prior = np.diag(inv_param_sigma[first_free:].astype(np.float64)**2)
+
+        # The sys param values relative to the nominal values (one row per param)
+        x = np.asarray(x, dtype=np.float64)
+        if not self.using_legacy_data:
+            x = x - np.array([[p.nominal_value] for p in params])
+
+        def eval_model(theta):
+            # Returns the hypersurface value and the jacobian w.r.t. the free
+            # coefficients for each bin and dataset, given coefficients of shape
+            # [ bin, free coefft ]
+            if fix_intercept:
+                f = np.full((theta.shape[0], x.shape[1]), self.initial_intercept,
+                            dtype=np.float64)
+                jac = [np.empty(f.shape + (0,))]
+            else:
+                f = np.repeat(theta[:, :1], x.shape[1], axis=1)
+                jac = [np.ones(f.shape + (1,))]
+            i = 1 - first_free
+            for i_param, param in enumerate(params):
+                n = param.num_fit_coeffts
+                coeffts = [theta[:, i+j, np.newaxis] for j in range(n)]
+                func = param._hypersurface_func
+                this_f = np.empty_like(f)
+                func(x[i_param], *coeffts, this_f)
+                f += this_f
+                this_jac = np.empty(f.shape + (n,))
+                func.grad(x[i_param], *coeffts, this_jac)
+                jac.append(this_jac)
+                i += n
+            jac = np.concatenate(jac, axis=-1)
+            if self.log:
+                f = np.exp(f)
+                jac = f[..., np.newaxis] * jac
+            return f, jac
+
+        def chi2(theta, f, idx):
+            return (np.sum(weights[idx] * (f - y[idx])**2, axis=-1)
+                    + np.einsum('bi,ij,bj->b', theta, prior, theta))
+
+        def normal_matrix(jac, idx):
+            return np.einsum('bsi,bs,bsj->bij', jac, weights[idx], jac) + prior
+
+        # Starting point is the current (initial) state of the hypersurface
+        theta = self.fit_coeffts.reshape(-1, self.num_fit_coeffts)[flat_idx, first_free:].astype(np.float64)
+
+        is_linear = (not self.log) and all(p._hypersurface_func.is_linear for p in params)
+
+        if is_linear:
+
+            # Design matrix is the same for all bins, as the jacobian does not
+            # depend on the coefficients
+            f0, jac = eval_model(np.zeros((1, num_free)))
+            hess = np.einsum('si,bs,sj->bij', jac[0], weights, jac[0]) + prior
+            rhs = np.einsum('si,bs,bs->bi', jac[0], weights, y - f0)
+            converged = valid_bins.copy()
+
+        else:
+
+            converged = ~valid_bins
+            damping = np.full(num_bins, 1e-3)
+            f, jac = eval_model(theta)
+            all_idx = np.arange(num_bins)
+            current_chi2 = chi2(theta, f, all_idx)
+            for _ in range(max_iter):
+                idx = np.flatnonzero(~converged)
+                if idx.size == 0:
+                    break
+                f, jac = eval_model(theta[idx])
+                hess = normal_matrix(jac, idx)
+                grad = (np.einsum('bsi,bs,bs->bi', jac, weights[idx], y[idx] - f)
+                        - np.einsum('ij,bj->bi', prior, theta[idx]))
+                diag = np.maximum(np.diagonal(hess, axis1=1, axis2=2),
+                                  np.finfo(np.float64).tiny)
+                damped = hess + damping[idx, np.newaxis, np.newaxis] * np.eye(num_free) * diag[:, np.newaxis, :]
+                step = np.linalg.solve(damped, grad[..., np.newaxis])[..., 0]
+                trial = theta[idx] + step
+                with np.errstate(over='ignore', invalid='ignore'):
+                    trial_chi2 = chi2(trial, eval_model(trial)[0], idx)
+                improved = np.isfinite(trial_chi2) & (trial_chi2 <= current_chi2[idx])
+                decrease = current_chi2[idx] - trial_chi2
+                theta[idx[improved]] = trial[improved]
+                damping[idx[improved]] /= 10.
+                damping[idx[~improved]] *= 10.
+                # Converged if the chi2 no longer decreases significantly, or if no
+                # step (however small) can decrease it any further
+                converged[idx[improved & (decrease <= tol * (current_chi2[idx] + tol))]] = True
+                converged[idx[~improved & (damping[idx] > 1e16)]] = True
+                current_chi2[idx[improved]] = trial_chi2[improved]
+            converged &= valid_bins
+
+            _, jac = eval_model(theta)
+            hess = normal_matrix(jac, np.arange(num_bins))
+
+        # Singular Hessians (e.g. too few non-empty points in a bin) are left to
+        # the bin-wise fit
+        hess[~converged] = np.eye(num_free)
+        with np.errstate(invalid='ignore'):
+            converged &= np.linalg.cond(hess) < 1. / np.finfo(np.float64).eps
+        hess[~converged] = np.eye(num_free)
+        cov = np.linalg.inv(hess)
+        if is_linear:
+            theta = np.einsum('bij,bj->bi', cov, rhs)
+
+        # Check the bounds
+        bounds = np.array([[-np.inf if lo is None else lo, np.inf if hi is None else hi]
+                           for lo, hi in fit_bounds[first_free:]], dtype=np.float64)
+        converged &= np.all(np.isfinite(theta), axis=1)
+        converged &= np.all((theta >= bounds[:, 0]) & (theta <= bounds[:, 1]), axis=1)
+
+        #
+        # Write the results
+        #
+
+        sigma = np.sqrt(np.diagonal(cov, axis1=1, axis2=2))
+        if fix_intercept:
+            cov = np.pad(cov, ((0, 0), (1, 0), (1, 0)))
+
+        done = np.unravel_index(flat_idx[converged], self.binning.shape)
+        self.fit_cov_mat[done] = cov[converged]
+        if not fix_intercept:
+            self.intercept[done] = theta[converged, 0]
+            self.intercept_sigma[done] = sigma[converged, 0]
+        i = 1 - first_free
+        for param in params:
+            for j in range(param.num_fit_coeffts):
+                idx = param.get_fit_coefft_idx(coefft_idx=j)
+                param.fit_coeffts[idx][done] = theta[converged, i]
+                param.fit_coeffts_sigma[idx][done] = sigma[converged, i]
+                i += 1
+
+        return [np.unravel_index(b, self.binning.shape) for b in flat_idx[~converged]]
+
     @property
     def nominal_values(self):
         '''
@@ -1628,6 +2243,21 @@ class HypersurfaceParam(object):
         # Copy to wherever the gradient is to be stored
         np.copyto(src=this_out, dst=out)
 
+    def param_gradient(self, param, out, bin_idx=None):
+        '''
+        Evaluate the derivative of the functional form w.r.t. the systematic parameter
+        for the given `param` values. Uses the current values of the fit coefficients.
+        '''
+        this_out = np.full_like(out, np.NaN, dtype=FTYPE)
+
+        args = [param]
+        for cft_idx in range(self.num_fit_coeffts):
+            args += [self.get_fit_coefft(bin_idx=bin_idx, coefft_idx=cft_idx)]
+        args += [this_out]
+
+        self._hypersurface_func.param_grad(*args)
+        np.copyto(src=this_out, dst=out)
+
     def get_fit_coefft_idx(self, bin_idx=None, coefft_idx=None):
         '''
         Indexing the fit_coefft matrix is a bit of a pain
@@ -1706,7 +2336,8 @@ def get_hypersurface_file_name(hypersurface, tag):
 
 
 def fit_hypersurfaces(nominal_dataset, sys_datasets, params, output_dir, tag, combine_regex=None,
-                      log=True, **hypersurface_fit_kw):
+                      log=True, num_parallel=1, bin_chunk_size=None, checkpoint_dir=None,
+                      **hypersurface_fit_kw):
     '''
     A helper function that a user can use to fit hypersurfaces to a bunch of simulation
     datasets, and save the results to a file. Basically a wrapper of Hypersurface.fit,
@@ -1754,6 +2385,10 @@ def fit_hypersurfaces(nominal_dataset, sys_datasets, params, output_dir, tag, co
         `MapSet.combine_re` function (see that functions docs for more details). Choose
         `None` is do not want to perform this merging.
 
+    num_parallel, bin_chunk_size, checkpoint_dir
+        Distribution of the fits over worker processes and checkpointing of the
+        results, see `parallel_fit_hypersurfaces`
+
     hypersurface_fit_kw : kwargs
         kwargs will be passed on to the calls to `Hypersurface.fit`
     '''
@@ -1829,71 +2464,282 @@ def fit_hypersurfaces(nominal_dataset, sys_datasets, params, output_dir, tag, co
     # TODO check every mapset has the same elements
 
     #
-    # Loop over maps
+    # Fit the hypersurfaces
     #
 
-    # Create the container to fill
-    hypersurfaces = collections.OrderedDict()
+    hypersurfaces = parallel_fit_hypersurfaces(
+        nominal_mapset=nominal_dataset["mapset"],
+        nominal_param_values=nominal_dataset["sys_params"],
+        sys_mapsets=[sys_dataset["mapset"] for sys_dataset in sys_datasets],
+        sys_param_values=[sys_dataset["sys_params"] for sys_dataset in sys_datasets],
+        params=params,
+        log=log,
+        num_parallel=num_parallel,
+        bin_chunk_size=bin_chunk_size,
+        checkpoint_dir=checkpoint_dir,
+        **hypersurface_fit_kw
+    )
 
-    # Loop over maps
-    for map_name in nominal_dataset["mapset"].names:
+    # Report the results
+    for hypersurface in hypersurfaces.values():
+        logging.debug("\nFitted hypersurface report:\n%s" % hypersurface)
 
-        #
-        # Prepare data for fit
-        #
+    #
+    # Store results
+    #
 
-        nominal_map = nominal_dataset["mapset"][map_name]
-        nominal_param_values = nominal_dataset["sys_params"]
+    # Create a file name
+    output_path = os.path.join(output_dir, get_hypersurface_file_name(
+        list(hypersurfaces.values())[0], tag))
 
-        sys_maps = [sys_dataset["mapset"][map_name]
-                    for sys_dataset in sys_datasets]
-        sys_param_values = [sys_dataset["sys_params"]
-                            for sys_dataset in sys_datasets]
+    # Create the output directory
+    mkdir(output_dir)
 
-        #
-        # Fit the hypersurface
-        #
+    # Write to a json file
+    to_json(hypersurfaces, output_path)
+
+    logging.info("Fit results written : %s" % output_path)
+
+    return output_dir
+
+
+def _get_bin_fit_results(hypersurface, bins):
+    '''
+    Get the fit results (coefficients, their uncertainties and the covariance
+    matrices) of `hypersurface` in the bins `bins` as a dict of arrays.
+    '''
+    idx = tuple(np.transpose(bins))
+    results = collections.OrderedDict()
+    results["intercept"] = hypersurface.intercept[idx]
+    results["intercept_sigma"] = hypersurface.intercept_sigma[idx]
+    results["fit_cov_mat"] = hypersurface.fit_cov_mat[idx]
+    for name, param in hypersurface.params.items():
+        results[name + "/fit_coeffts"] = param.fit_coeffts[idx]
+        results[name + "/fit_coeffts_sigma"] = param.fit_coeffts_sigma[idx]
+    return results
+
+
+def _set_bin_fit_results(hypersurface, bins, results):
+    '''
+    Write the fit results produced by `_get_bin_fit_results` back to `hypersurface`.
+    '''
+    idx = tuple(np.transpose(bins))
+    hypersurface.intercept[idx] = results["intercept"]
+    hypersurface.intercept_sigma[idx] = results["intercept_sigma"]
+    hypersurface.fit_cov_mat[idx] = results["fit_cov_mat"]
+    for name, param in hypersurface.params.items():
+        param.fit_coeffts[idx] = results[name + "/fit_coeffts"]
+        param.fit_coeffts_sigma[idx] = results[name + "/fit_coeffts_sigma"]
+
+
+_FIT_BINS_KW = ("fix_intercept", "intercept_bounds", "intercept_sigma", "include_empty",
+                "vectorized")
+"""Kwargs of `Hypersurface.fit` that are passed on to `Hypersurface._fit_bins`"""
+
+
+def _fit_hypersurface_bins(hypersurface, fit_bins_kw, bins):
+    '''
+    Fit `hypersurface`, whose fit datasets must have been stored already (see
+    `Hypersurface._prepare_fit`), in the bins `bins` only, and return the results.
+    '''
+    hypersurface._fit_bins(bins=bins, **fit_bins_kw)  # pylint: disable=protected-access
+    return _get_bin_fit_results(hypersurface, bins)
+
+
+_FIT_WORKER_STATE = None
+"""Prepared hypersurfaces by map name and `_fit_bins` kwargs in a worker process"""
+
+
+def _init_fit_worker(hypersurfaces, fit_bins_kw):
+    '''
+    Initializer of the worker processes of `parallel_fit_hypersurfaces`. As the
+    workers are forked, `hypersurfaces` (including the maps to fit) is not pickled.
+    '''
+    global _FIT_WORKER_STATE
+    _FIT_WORKER_STATE = (hypersurfaces, fit_bins_kw)
+
+
+def _run_fit_worker_task(task):
+    '''
+    Fit the bins of a `(map_name, bins, ...)` task of `parallel_fit_hypersurfaces`
+    in a worker process, and return the task along with the results.
+    '''
+    hypersurfaces, fit_bins_kw = _FIT_WORKER_STATE
+    map_name, bins = task[:2]
+    return task, _fit_hypersurface_bins(hypersurfaces[map_name], fit_bins_kw, bins)
+
+
+def parallel_fit_hypersurfaces(nominal_mapset, nominal_param_values, sys_mapsets,
+                               sys_param_values, params, log=True, num_parallel=1,
+                               bin_chunk_size=None, checkpoint_dir=None,
+                               **hypersurface_fit_kw):
+    '''
+    Fit one hypersurface per map in `nominal_mapset`, distributing the fits of each
+    map (or of chunks of its bins) over a pool of worker processes.
+
+    Each fitted chunk can be checkpointed to disk, such that an interrupted run can
+    be resumed by calling this function again with the same arguments. The
+    hypersurfaces returned are identical to those produced by calling
+    `Hypersurface.fit` on each map in turn.
+
+    Parameters
+    ----------
+    nominal_mapset : MapSet
+        Maps from the nominal dataset
+
+    nominal_param_values : dict
+        Value of each systematic param used to generate the nominal dataset
+
+    sys_mapsets : list of MapSets
+        MapSets from each systematic dataset
+
+    sys_param_values : list of dicts
+        Values of the systematic params used to generate each systematic dataset
+
+    params : list of HypersurfaceParams
+        Params defining the hypersurfaces (copied for each map)
+
+    log : bool
+        Fit hypersurfaces in log mode
+
+    num_parallel : int
+        Number of worker processes to use. If 1, all fits are performed in the
+        calling process.
+
+    bin_chunk_size : int, optional
+        Maximum number of bins per fit task. If None (default), one task fits all
+        bins of a map.
+
+    checkpoint_dir : str, optional
+        Directory to store the results of each fit task in. Results of earlier
+        (e.g. interrupted) runs found in here are re-used if they were produced
+        from the same inputs. The files are not removed after completion.
+
+    hypersurface_fit_kw : kwargs
+        kwargs will be passed on to the calls to `Hypersurface.fit`
+
+    Returns
+    -------
+    hypersurfaces : OrderedDict
+        Fitted hypersurface for each map
+    '''
+
+    assert num_parallel >= 1
+    assert bin_chunk_size is None or bin_chunk_size >= 1
+    include_empty = hypersurface_fit_kw.get("include_empty", False)
+    fit_kw = dict(hypersurface_fit_kw)
+    fit_kw.setdefault("norm", True)
+    fit_bins_kw = {k: v for k, v in fit_kw.items() if k in _FIT_BINS_KW}
+
+    #
+    # Define the fit tasks
+    #
+
+    hypersurfaces = collections.OrderedDict()
+    tasks = []
+    for map_name in nominal_mapset.names:
+
+        map_fit_kw = dict(
+            nominal_map=nominal_mapset[map_name],
+            nominal_param_values=nominal_param_values,
+            sys_maps=[sys_mapset[map_name] for sys_mapset in sys_mapsets],
+            sys_param_values=sys_param_values,
+            **fit_kw
+        )
 
-        # Create the hypersurface
         hypersurface = Hypersurface(
             params=copy.deepcopy(params),
             initial_intercept=0. if log else 1.,  # Initial value for intercept
             log=log
         )
+        # Initialise the hypersurface and store the fit datasets, without fitting
+        # any bin yet; the tasks then only fit their chunk of bins in it
+        hypersurface.fit(bins=[], **map_fit_kw)
+        hypersurfaces[map_name] = hypersurface
 
-        # Perform fit
-        hypersurface.fit(
-            nominal_map=nominal_map,
-            nominal_param_values=nominal_param_values,
-            sys_maps=sys_maps,
-            sys_param_values=sys_param_values,
-            norm=True,
-            **hypersurface_fit_kw
+        # Split the bins into chunks
+        bins = list(np.ndindex(hypersurface.binning.shape))
+        chunk_size = len(bins) if bin_chunk_size is None else bin_chunk_size
+        chunks = [bins[i:i+chunk_size] for i in range(0, len(bins), chunk_size)]
+
+        # Identify the inputs to be able to validate checkpoints
+        map_key = hash_obj(
+            [
+                [(hash_obj(m.nominal_values), hash_obj(m.std_devs))
+                 for m in [map_fit_kw["nominal_map"]] + map_fit_kw["sys_maps"]],
+                sorted(nominal_param_values.items()),
+                [sorted(v.items()) for v in sys_param_values],
+                [(p.name, p.func_name, np.asarray(p.initial_fit_coeffts).tolist(),
+                  p.bounds, p.coeff_prior_sigma) for p in params],
+                log,
+                sorted((k, repr(v)) for k, v in fit_kw.items()),
+            ],
+            full_hash=True,
         )
 
-        # Report the results
-        logging.debug("\nFitted hypersurface report:\n%s" % hypersurface)
-
-        # Store for later write to disk
-        hypersurfaces[map_name] = hypersurface
+        for i_chunk, chunk in enumerate(chunks):
+            key = "%s_%s" % (map_key, hash_obj(chunk, full_hash=True))
+            checkpoint_file = None if checkpoint_dir is None else os.path.join(
+                checkpoint_dir, "hypersurface_fit__%s__chunk_%i.npz" % (map_name, i_chunk))
+            tasks.append((map_name, chunk, key, checkpoint_file))
 
     #
-    # Store results
+    # Resume from checkpoints
     #
 
-    # Create a file name
-    output_path = os.path.join(output_dir, get_hypersurface_file_name(
-        list(hypersurfaces.values())[0], tag))
+    remaining_tasks = []
+    for map_name, chunk, key, checkpoint_file in tasks:
+        if checkpoint_file is not None and os.path.isfile(checkpoint_file):
+            with np.load(checkpoint_file) as checkpoint:
+                if str(checkpoint["checkpoint_key"]) == key:
+                    _set_bin_fit_results(hypersurfaces[map_name], chunk, checkpoint)
+                    continue
+            logging.warning("Ignoring outdated checkpoint : %s" % checkpoint_file)
+        remaining_tasks.append((map_name, chunk, key, checkpoint_file))
 
-    # Create the output directory
-    mkdir(output_dir)
+    logging.info("Hypersurface fits : %i of %i tasks restored from checkpoints, %i to run"
+                 % (len(tasks) - len(remaining_tasks), len(tasks), len(remaining_tasks)))
 
-    # Write to a json file
-    to_json(hypersurfaces, output_path)
+    if checkpoint_dir is not None:
+        mkdir(checkpoint_dir, warn=False)
 
-    logging.info("Fit results written : %s" % output_path)
+    #
+    # Fit
+    #
 
-    return output_dir
+    def store(task, results):
+        map_name, chunk, key, checkpoint_file = task
+        _set_bin_fit_results(hypersurfaces[map_name], chunk, results)
+        if checkpoint_file is not None:
+            # Write to a temporary file first so an interruption cannot leave a
+            # corrupted checkpoint behind
+            tmp_file = checkpoint_file + ".tmp.npz"
+            np.savez(tmp_file, checkpoint_key=key, **results)
+            os.replace(tmp_file, checkpoint_file)
+        logging.debug("Fitted %i bins of hypersurface for map %s" % (len(chunk), map_name))
+
+    if num_parallel == 1:
+        for task in remaining_tasks:
+            map_name, chunk = task[:2]
+            store(task, _fit_hypersurface_bins(hypersurfaces[map_name], fit_bins_kw,
+                                               bins=chunk))
+
+    elif remaining_tasks:
+        ctx = multiprocessing.get_context("fork")
+        with ctx.Pool(processes=num_parallel, initializer=_init_fit_worker,
+                      initargs=(hypersurfaces, fit_bins_kw)) as pool:
+            for task, results in pool.imap_unordered(_run_fit_worker_task,
+                                                     remaining_tasks):
+                store(task, results)
+
+    #
+    # Done
+    #
+
+    for hypersurface in hypersurfaces.values():
+        hypersurface._finalize_fit(include_empty=include_empty)
+
+    return hypersurfaces
 
 
 def load_interpolated_hypersurfaces(input_file, expected_binning=None):
@@ -2723,6 +3569,81 @@ def test_hypersurface_uncertainty(plot=False):
     logging.info('<< PASS : test_hypersurface_uncertainty >>')
 
 
+def test_hypersurface_interpolator():
+    '''
+    Test the interpolated hypersurfaces against interpolating each coefficient
+    and covariance matrix element individually
+    '''
+    binning = MultiDimBinning([OneDimBinning(name="reco_energy",
+                                             domain=[0., 10.],
+                                             num_bins=3,
+                                             units=ureg.GeV,
+                                             is_lin=True,
+                                             ),
+                               OneDimBinning(name="reco_coszen",
+                                             domain=[-1., 1.],
+                                             num_bins=2,
+                                             is_lin=True,
+                                             )])
+    random_state = np.random.RandomState(0)
+    # covariance matrices vary smoothly between the support points
+    a = random_state.normal(size=binning.shape + (4, 4))
+    cov_mat = np.einsum('...ij,...kj->...ik', a, a)
+
+    def make_hypersurface(scale):
+        hypersurface = Hypersurface(
+            params=[HypersurfaceParam(name="foo", func_name="linear"),
+                    HypersurfaceParam(name="bar", func_name="quadratic")],
+            initial_intercept=1.,
+        )
+        hypersurface._init(binning=binning,
+                           nominal_param_values={"foo": 0., "bar": 0.})
+        hypersurface.fit_coeffts = random_state.normal(
+            size=hypersurface.fit_coeffts.shape)
+        hypersurface.fit_cov_mat = scale * cov_mat + np.eye(4)
+        return hypersurface
+
+    for interp_params, points, test_point in [
+            ([{'name': 'a', 'unit': 'eV'}],
+             [{'a': a * ureg.eV} for a in np.linspace(0., 2., 6)],
+             {'a': 0.7 * ureg.eV}),
+            ([{'name': 'a', 'unit': 'eV'}, {'name': 'b', 'unit': 'm'}],
+             [{'a': a * ureg.eV, 'b': b * ureg.m}
+              for a in (0., 1., 2., 3.) for b in (0., 0.5, 1., 1.5)],
+             {'a': 1.3 * ureg.eV, 'b': 0.2 * ureg.m}),
+    ]:
+        hs_fits = [{'param_values': p, 'hypersurface': make_hypersurface(1. + 0.1*i)}
+                   for i, p in enumerate(points)]
+        x = [[p[ip['name']].m_as(ip['unit']) for p in points] for ip in interp_params]
+        x_test = [test_point[ip['name']].m_as(ip['unit']) for ip in interp_params]
+        for kind in ('linear', 'cubic'):
+            interpolator = HypersurfaceInterpolator(interp_params, hs_fits, kind=kind)
+            hypersurface = interpolator.get_hypersurface(**test_point)
+            # repeated calls hit the cache
+            assert interpolator.get_hypersurface(**test_point) is hypersurface
+
+            for attr in ('fit_coeffts', 'fit_cov_mat'):
+                z = np.stack([getattr(f['hypersurface'], attr) for f in hs_fits], axis=-1)
+                expected = np.empty(z.shape[:-1])
+                for idx in np.ndindex(expected.shape):
+                    if len(x) == 1:
+                        spline = interpolate.interp1d(x[0], z[idx], kind=kind)
+                    else:
+                        spline = interpolate.interp2d(x[0], x[1], z[idx], kind=kind)
+                    expected[idx] = spline(*x_test)
+                if attr == 'fit_cov_mat':
+                    for bin_idx in np.ndindex(binning.shape):
+                        if not matrix.is_psd(expected[bin_idx]):
+                            expected[bin_idx] = matrix.fronebius_nearest_psd(expected[bin_idx])
+                assert np.allclose(getattr(hypersurface, attr), expected,
+                                   **ALLCLOSE_KW), (len(x), kind, attr)
+
+            assert np.all(np.isfinite(hypersurface.evaluate(
+                {"foo": 0.1, "bar": -0.2}, return_uncertainty=True)))
+
+    logging.info('<< PASS : test_hypersurface_interpolator >>')
+
+
 def test_hypersurface_basics():
     '''
     Test basic fitting, inject/recover, storing and loading
@@ -2857,11 +3778,245 @@ def test_hypersurface_basics():
                            reloaded_hypersurface.params[param_name].fit_coeffts,
                            rtol=ALLCLOSE_KW['rtol']*10.)
     logging.debug("... setting and getting coefficients was successful!")
+
+    # test derivatives w.r.t. the systematic parameters against finite differences
+    test_param_values = {"foo": 0.3, "bar": 12.}
+    step = 1e-6
+    for param_name in hypersurface.param_names:
+        log_grad = hypersurface.evaluate_log_grad(test_param_values, param_name)
+        shifted = []
+        for sgn in (+1, -1):
+            param_values = dict(test_param_values)
+            param_values[param_name] += sgn * step
+            shifted.append(np.log(hypersurface.evaluate(param_values)))
+        assert np.allclose(log_grad, (shifted[0] - shifted[1]) / (2 * step), rtol=1e-5)
+    logging.debug("... derivatives are correct!")
     logging.info('<< PASS : test_hypersurface_basics >>')
 
 
+def test_hypersurface_vectorized_fit():
+    '''
+    Test that fitting all bins simultaneously agrees with the bin-wise fits, for
+    functional forms that are linear and non-linear in their coefficients
+    '''
+    binning = MultiDimBinning([OneDimBinning(name="reco_energy",
+                                             domain=[0., 10.],
+                                             num_bins=4,
+                                             units=ureg.GeV,
+                                             is_lin=True,
+                                             ),
+                               OneDimBinning(name="reco_coszen",
+                                             domain=[-1., 1.],
+                                             num_bins=3,
+                                             is_lin=True,
+                                             )])
+    nominal_param_values = {"foo": 0., "bar": 0.}
+    sys_param_values = [{"foo": f, "bar": b}
+                        for f in (-0.2, 0., 0.3) for b in (-0.3, 0.2)]
+
+    # Random bin counts, with an empty bin in the nominal map
+    random_state = np.random.RandomState(0)
+    maps = []
+    for param_values in [nominal_param_values] + sys_param_values:
+        expected = 100. * (1. + 0.5*param_values["foo"] + 0.3*param_values["bar"]**2)
+        hist = random_state.poisson(expected, size=binning.shape).astype(FTYPE)
+        if not maps:
+            hist[0, 0] = 0.
+        maps.append(Map(name="nue_cc", binning=binning,
+                        hist=hist, error_hist=np.sqrt(hist)))
+
+    for log, func_names in [(False, ("linear", "quadratic")),
+                            (True, ("linear", "exponential"))]:
+        hypersurfaces = []
+        for vectorized in (True, False):
+            params = [HypersurfaceParam(name="foo", func_name=func_names[0]),
+                      HypersurfaceParam(name="bar", func_name=func_names[1],
+                                        coeff_prior_sigma=[1.]*(2 if func_names[1] == "quadratic" else 1)),
+                      ]
+            hypersurface = Hypersurface(params=params,
+                                        initial_intercept=0. if log else 1.,
+                                        log=log,
+                                        )
+            hypersurface.fit(nominal_map=maps[0],
+                             nominal_param_values=nominal_param_values,
+                             sys_maps=maps[1:],
+                             sys_param_values=sys_param_values,
+                             vectorized=vectorized,
+                             )
+            hypersurfaces.append(hypersurface)
+
+        # Bins that cannot be fitted are flagged the same way
+        vec_coeffts, bin_coeffts = [h.fit_coeffts for h in hypersurfaces]
+        assert np.array_equal(np.isnan(vec_coeffts), np.isnan(bin_coeffts))
+        assert np.all(np.isnan(vec_coeffts[0, 0]))
+
+        # Agreement within a small fraction of the coefficient uncertainties
+        # (limited by the convergence of the bin-wise fits)
+        vec_cov, bin_cov = [h.fit_cov_mat for h in hypersurfaces]
+        sigma = np.sqrt(np.einsum('...ii->...i', bin_cov))
+        assert np.nanmax(np.abs(vec_coeffts - bin_coeffts) / sigma) < 0.05
+        # In the linear case the covariance is exact, otherwise the Gauss-Newton
+        # approximation of the Hessian is used
+        cov_diff = np.abs(vec_cov - bin_cov) / (sigma[..., :, np.newaxis] * sigma[..., np.newaxis, :])
+        assert np.nanmax(cov_diff) < (0.2 if log else 1e-4)
+
+    logging.info('<< PASS : test_hypersurface_vectorized_fit >>')
+
+
+def test_parallel_fit_hypersurfaces():
+    '''
+    Test that the parallel, chunked and checkpointed fits produce the same
+    hypersurfaces as fitting each map in turn, and that fits can be resumed from
+    the checkpoints
+    '''
+    import tempfile
+    from pisa.core.map import MapSet
+    from pisa.utils.jsons import dumps
+
+    binning = MultiDimBinning([OneDimBinning(name="reco_energy",
+                                             domain=[0., 10.],
+                                             num_bins=4,
+                                             units=ureg.GeV,
+                                             is_lin=True,
+                                             ),
+                               OneDimBinning(name="reco_coszen",
+                                             domain=[-1., 1.],
+                                             num_bins=3,
+                                             is_lin=True,
+                                             )])
+    params = [HypersurfaceParam(name="foo", func_name="linear"),
+              HypersurfaceParam(name="bar", func_name="exponential"),
+              ]
+    nominal_param_values = {"foo": 0., "bar": 0.}
+    sys_param_values = [{"foo": f, "bar": b}
+                        for f in (-0.2, 0., 0.3) for b in (-0.3, 0.2)]
+
+    random_state = np.random.RandomState(0)
+    mapsets = []
+    for param_values in [nominal_param_values] + sys_param_values:
+        maps = []
+        for name in ("nue_cc", "numu_cc"):
+            expected = 100. * (1. + 0.5*param_values["foo"] + 0.3*param_values["bar"]**2)
+            hist = random_state.poisson(expected, size=binning.shape).astype(FTYPE)
+            maps.append(Map(name=name, binning=binning,
+                            hist=hist, error_hist=np.sqrt(hist)))
+        mapsets.append(MapSet(maps))
+
+    # Reference: fit each map in turn
+    ref_hypersurfaces = collections.OrderedDict()
+    for name in mapsets[0].names:
+        hypersurface = Hypersurface(params=copy.deepcopy(params),
+                                    initial_intercept=0.,
+                                    log=True,
+                                    )
+        hypersurface.fit(nominal_map=mapsets[0][name],
+                         nominal_param_values=nominal_param_values,
+                         sys_maps=[m[name] for m in mapsets[1:]],
+                         sys_param_values=sys_param_values,
+                         norm=True,
+                         )
+        ref_hypersurfaces[name] = hypersurface
+    ref_state = dumps(ref_hypersurfaces)
+
+    fit_kw = dict(nominal_mapset=mapsets[0],
+                  nominal_param_values=nominal_param_values,
+                  sys_mapsets=mapsets[1:],
+                  sys_param_values=sys_param_values,
+                  params=params,
+                  log=True,
+                  )
+
+    hypersurfaces = parallel_fit_hypersurfaces(**fit_kw)
+    assert dumps(hypersurfaces) == ref_state
+
+    with tempfile.TemporaryDirectory() as checkpoint_dir:
+        hypersurfaces = parallel_fit_hypersurfaces(num_parallel=2,
+                                                   bin_chunk_size=5,
+                                                   checkpoint_dir=checkpoint_dir,
+                                                   **fit_kw)
+        assert dumps(hypersurfaces) == ref_state
+        checkpoint_files = sorted(os.listdir(checkpoint_dir))
+        assert len(checkpoint_files) == 6, checkpoint_files
+
+        # Resuming must use the stored results (modify one to check this)
+        checkpoint_file = os.path.join(checkpoint_dir, checkpoint_files[0])
+        with np.load(checkpoint_file) as checkpoint:
+            results = dict(checkpoint)
+        results["intercept"] = np.full_like(results["intercept"], 42.)
+        np.savez(checkpoint_file, **results)
+        hypersurfaces = parallel_fit_hypersurfaces(bin_chunk_size=5,
+                                                   checkpoint_dir=checkpoint_dir,
+                                                   **fit_kw)
+        assert np.sum(hypersurfaces["nue_cc"].intercept == 42.) == 5
+
+        # Checkpoints from different inputs are not used
+        hypersurfaces = parallel_fit_hypersurfaces(bin_chunk_size=5,
+                                                   checkpoint_dir=checkpoint_dir,
+                                                   vectorized=False,
+                                                   **fit_kw)
+        assert not np.any(hypersurfaces["nue_cc"].intercept == 42.)
+
+    logging.info('<< PASS : test_parallel_fit_hypersurfaces >>')
+
+
+def test_hypersurface_fused_uncertainty():
+    '''
+    Test the compiled evaluation of the hypersurface value and uncertainty against
+    the numpy implementation, for all functional forms and empty bins
+    '''
+    binning = MultiDimBinning([OneDimBinning(name="reco_energy",
+                                             domain=[0., 10.],
+                                             num_bins=4,
+                                             units=ureg.GeV,
+                                             is_lin=True,
+                                             ),
+                               OneDimBinning(name="reco_coszen",
+                                             domain=[-1., 1.],
+                                             num_bins=3,
+                                             is_lin=True,
+                                             )])
+    random_state = np.random.RandomState(0)
+    param_values = {"a": 0.3, "b": -0.7, "c": 1.2, "d": 0.4, "e": 0.9}
+
+    for log in (False, True):
+        params = [HypersurfaceParam(name=name, func_name=func_name)
+                  for name, func_name in zip(param_values, HYPERSURFACE_FUNC_CODES)]
+        hypersurface = Hypersurface(params=params, log=log)
+        hypersurface._init(binning=binning,
+                           nominal_param_values={name: 0.1 for name in param_values})
+        assert hypersurface.supports_fused_evaluation
+        # small coefficients keep the logarithmic form well-defined
+        hypersurface.fit_coeffts = 0.2 * random_state.normal(
+            size=hypersurface.fit_coeffts.shape)
+        a = random_state.normal(size=binning.shape + (8, 8))
+        hypersurface.fit_cov_mat = np.einsum('...ij,...kj->...ik', a, a)
+        # an empty bin
+        hypersurface.intercept[1, 2] = np.NaN
+        hypersurface.fit_cov_mat[1, 2] = np.NaN
+
+        expected = hypersurface.evaluate(param_values, return_uncertainty=True, fused=False)
+        result = hypersurface.evaluate(param_values, return_uncertainty=True)
+        for x, y in zip(result, expected):
+            assert x.shape == y.shape == binning.shape
+            assert np.array_equal(np.isnan(x), np.isnan(y))
+            assert np.allclose(x[~np.isnan(y)], y[~np.isnan(y)], rtol=1e-10, atol=0.)
+
+        # evaluate into preallocated (flat) arrays
+        out = np.empty(binning.size, dtype=FTYPE)
+        sigma = np.empty(binning.size, dtype=FTYPE)
+        hypersurface.evaluate_with_uncertainty(param_values, out=out, sigma=sigma)
+        np.testing.assert_array_equal(out, result[0].ravel())
+        np.testing.assert_array_equal(sigma, result[1].ravel())
+
+    logging.info('<< PASS : test_hypersurface_fused_uncertainty >>')
+
+
 # Run the examp'es/tests
 if __name__ == "__main__":
     set_verbosity(2)
     test_hypersurface_basics()
     test_hypersurface_uncertainty()
+    test_hypersurface_interpolator()
+    test_hypersurface_vectorized_fit()
+    test_parallel_fit_hypersurfaces()
+    test_hypersurface_fused_uncertainty()
@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+# pylint: disable = invalid-name
+
+
+"""
+Benchmark the evaluation of hypersurface values and uncertainties (as done by
+the `pi_hypersurfaces` stage with `propagate_uncertainty` enabled), comparing
+the compiled single-pass `Hypersurface.evaluate_with_uncertainty` with the
+numpy implementation of `Hypersurface.evaluate` for different numbers of bins.
+"""
+
+
+from __future__ import absolute_import, print_function, division
+
+
+__all__ = [
+    "DEFAULT_NUM_BINS",
+    "make_benchmark_hypersurface",
+    "benchmark_hypersurface_uncertainty",
+    "run_benchmarks",
+    "main",
+]
+
+
+from argparse import ArgumentParser
+import time
+
+import numpy as np
+
+from pisa import FTYPE, ureg
+from pisa.core.binning import MultiDimBinning, OneDimBinning
+from pisa.utils.hypersurface import Hypersurface, HypersurfaceParam
+from pisa.utils.log import Levels, logging, set_verbosity
+
+
+DEFAULT_NUM_BINS = (1000, 10000, 100000)
+
+BENCHMARK_PARAMS = (
+    ("dom_eff", "linear"),
+    ("hole_ice_p0", "quadratic"),
+    ("hole_ice_p1", "linear"),
+    ("bulk_ice_abs", "exponential"),
+    ("bulk_ice_scatter", "logarithmic"),
+)
+"""Systematic parameters and functional forms of the benchmark hypersurface"""
+
+
+def make_benchmark_hypersurface(num_bins, log=True, seed=0):
+    """Create a hypersurface with `num_bins` bins and random coefficients and
+    covariance matrices.
+
+    Parameters
+    ----------
+    num_bins : int
+    log : bool
+    seed : int
+
+    Returns
+    -------
+    hypersurface : Hypersurface
+    param_values : dict
+        Values of the systematic parameters to evaluate the hypersurface at
+
+    """
+    rand = np.random.RandomState(seed)
+    binning = MultiDimBinning([OneDimBinning(name="reco_energy",
+                                             domain=[1., 100.],
+                                             num_bins=num_bins,
+                                             units=ureg.GeV,
+                                             is_log=True,
+                                             )])
+    hypersurface = Hypersurface(
+        params=[HypersurfaceParam(name=name, func_name=func_name)
+                for name, func_name in BENCHMARK_PARAMS],
+        log=log,
+    )
+    hypersurface._init(binning=binning,
+                       nominal_param_values={name: 1. for name, _ in BENCHMARK_PARAMS})
+    hypersurface.fit_coeffts = 0.1 * rand.normal(size=hypersurface.fit_coeffts.shape)
+    a = 0.1 * rand.normal(size=binning.shape + (hypersurface.num_fit_coeffts,)*2)
+    hypersurface.fit_cov_mat = np.einsum('...ij,...kj->...ik', a, a)
+
+    param_values = {name: 1. + 0.1 * rand.normal() for name, _ in BENCHMARK_PARAMS}
+    return hypersurface, param_values
+
+
+def benchmark_hypersurface_uncertainty(num_bins, log=True, repeats=5, seed=0):
+    """Time the evaluation of value and uncertainty of a hypersurface with
+    `num_bins` bins, with the numpy implementation and with the compiled one
+    writing into preallocated arrays.
+
+    Parameters
+    ----------
+    num_bins : int
+    log : bool
+    repeats : int
+        Number of timed calls; the fastest is reported. One additional call
+        is made beforehand to exclude compilation time.
+    seed : int
+
+    Returns
+    -------
+    times : dict
+        Seconds per evaluation, keyed by "numpy" and "fused"
+
+    """
+    hypersurface, param_values = make_benchmark_hypersurface(num_bins, log=log, seed=seed)
+    out = np.empty(num_bins, dtype=FTYPE)
+    sigma = np.empty(num_bins, dtype=FTYPE)
+
+    def numpy_eval():
+        return hypersurface.evaluate(param_values, return_uncertainty=True, fused=False)
+
+    def fused_eval():
+        return hypersurface.evaluate_with_uncertainty(param_values, out=out, sigma=sigma)
+
+    times = {}
+    for name, func in [("numpy", numpy_eval), ("fused", fused_eval)]:
+        # compile (or load from cache) outside of the timed calls
+        func()
+        durations = []
+        for _ in range(repeats):
+            t0 = time.time()
+            func()
+            durations.append(time.time() - t0)
+        times[name] = min(durations)
+
+    expected = numpy_eval()
+    assert np.allclose(out, expected[0], rtol=1e-10)
+    assert np.allclose(sigma, expected[1], rtol=1e-10)
+
+    logging.info(
+        "<< %d bins (log=%s): numpy %.3e s, fused %.3e s, speedup %.1f >>",
+        num_bins, log, times["numpy"], times["fused"], times["numpy"] / times["fused"]
+    )
+    return times
+
+
+def run_benchmarks(num_bins=DEFAULT_NUM_BINS, log=True, repeats=5):
+    """Run `benchmark_hypersurface_uncertainty` for each of `num_bins`.
+
+    Parameters
+    ----------
+    num_bins : sequence of int
+    log : bool
+    repeats : int
+
+    Returns
+    -------
+    results : dict
+        Timings as returned by `benchmark_hypersurface_uncertainty`, keyed by
+        the entries of `num_bins`
+
+    """
+    return {
+        n: benchmark_hypersurface_uncertainty(n, log=log, repeats=repeats)
+        for n in num_bins
+    }
+
+
+def main(description=__doc__):
+    """Script interface for `run_benchmarks` function"""
+    parser = ArgumentParser(description=description)
+    parser.add_argument(
+        "--num-bins", type=int, nargs="+", default=list(DEFAULT_NUM_BINS)
+    )
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument(
+        "--linear", dest="log", action="store_false",
+        help="Benchmark a hypersurface in linear instead of log mode"
+    )
+    parser.add_argument("-v", action="count", default=Levels.INFO)
+    kwargs = vars(parser.parse_args())
+    set_verbosity(kwargs.pop("v"))
+    results = run_benchmarks(**kwargs)
+    for n, times in results.items():
+        print(
+            f"{n} bins: numpy {times['numpy']:.3e} s, fused {times['fused']:.3e} s"
+            f" ({times['numpy'] / times['fused']:.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
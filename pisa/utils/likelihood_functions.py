@@ -83,7 +83,6 @@ def barlowLLH(data, unweighted_mc, weights):
     Link to paper: https://doi.org/10.1016/0010-4655(93)90005-W
     -- Input variables --
     data = data histogram
-    mc = weighted MC histogram
     unweighted_mc = unweighted MC histogream
     weights = weight of each bin
 
@@ -91,49 +90,54 @@ def barlowLLH(data, unweighted_mc, weights):
     llh = LLH values in each bin
 
     -- Notes --
-    Shape of data, mc, unweighted_mc, weights and llh must be identical
-    """
-
-    # The actual barlow LLH
-    def llh(A_, k, w, a):
-        SMALL_VAL = 1.e-10
-
-        f = w*A_
+    Shape of data, unweighted_mc, weights and llh must be identical
 
-        # Takes care of log(0) problems
-        if not len(A_) > 1:
-            f = max((f, SMALL_VAL))
-            A_ = max((A_, SMALL_VAL))
-
-        # The loggamma() terms takes care of the log(value!) for non-integer values
-        return -1.*(k*np.log(f) - f + a*np.log(A_) - A_ - special.loggamma(k+1) - special.loggamma(a+1))
-
-    A = np.array(unweighted_mc) # Expected unweighted counts in a bin
-    # For each bin the appropriate 'A' will now be found using the current counts as a seed
-    # This will be done by using a minimiser to ensure that the value of 'A' found minimises the -LLH
+    With a single MC source per bin, the expected unweighted counts `A` that
+    maximise the LLH in each bin follow in closed form from
+    d(LLH)/dA = (data + unweighted_mc)/A - (weights + 1) = 0, so all bins are
+    evaluated at once instead of being minimised one by one
+    """
+    SMALL_VAL = 1.e-10
 
-    # Find values of A such that llh in each bin is a maximum
-    for i, val in enumerate(A):
-        # If the unweighted MC counts in the bin is 0, A = 0
-        if val == 0:
-            continue
-        # Otherwise, find the value of A
-        arg = (data[i], weights[i], unweighted_mc[i])
-        # Powell works fast and is fine for our purposes
-        result = optimize.minimize(fun=llh, x0=val, args=arg, method='Powell')
+    # Expected unweighted counts in each bin maximising the LLH (A = 0 if
+    # there are no unweighted MC counts in the bin)
+    A = (data + unweighted_mc) / (1. + weights) * (unweighted_mc != 0)
 
-        # Check that the minimisation ran properly
-        if result.success:
-            A[i] = result.x
-        else:
-            print("Something went wrong...")
-            print("Minimiser message: ")
-            print("------------------")
-            print(result.message)
-            return -np.inf
+    # Takes care of log(0) problems
+    f = np.maximum(weights*A, SMALL_VAL)
+    A = np.maximum(A, SMALL_VAL)
 
-    LLH = llh(A, data, weights, unweighted_mc)
+    # The loggamma() terms takes care of the log(value!) for non-integer values
+    return (data*np.log(f) - f + unweighted_mc*np.log(A) - A
+            - special.loggamma(data+1).real - special.loggamma(unweighted_mc+1).real)
 
-    return -1*LLH # Return LLH (not negative LLH)
 
+def test_barlowLLH():
+    """Compare the closed-form Barlow LLH with numerical maximisation of the
+    LLH w.r.t. the expected unweighted counts in each bin"""
+    rand = np.random.RandomState(0)
+    n_bins = 50
+    unweighted_mc = rand.uniform(1, 1000, n_bins)
+    weights = rand.uniform(0.01, 2, n_bins)
+    data = rand.poisson(unweighted_mc * weights).astype(np.float64)
 
+    def neg_llh(A_, k, w, a):
+        f = w*A_
+        return -1.*(k*np.log(f) - f + a*np.log(A_) - A_
+                    - special.loggamma(k+1).real - special.loggamma(a+1).real)
+
+    ref = np.empty(n_bins)
+    for i in range(n_bins):
+        args = (data[i], weights[i], unweighted_mc[i])
+        result = optimize.minimize_scalar(
+            fun=lambda A_, *args: neg_llh(A_, *args), args=args,
+            bounds=(1e-3, 10*unweighted_mc[i] + 10*data[i]), method='bounded',
+            options=dict(xatol=1e-10)
+        )
+        assert result.success
+        ref[i] = -result.fun
+
+    llh = barlowLLH(data, unweighted_mc, weights)
+    assert np.allclose(llh, ref, rtol=1e-9, atol=1e-9), np.max(np.abs(llh - ref))
+    # the closed-form solution is the maximum
+    assert np.all(llh >= ref - 1e-9)
@@ -83,16 +83,19 @@ def get_llh(x, server_infos):
 
     Parameters
     ----------
-    x : sequence
+    x : sequence or sequence of sequences
         Free param values to set on the DistributionMaker, at which we wich to
-        find llh
+        find llh. If a sequence of param vectors is passed, the server
+        evaluates all of them in one request (see
+        `DistributionMaker.get_outputs_multi`) and a list of llh values is
+        returned.
 
     server_infos : dict or iterable thereof
         Each dict must have fields "host", "port", and "lock"
 
     Returns
     -------
-    llh
+    llh : float or list thereof
 
     """
     if isinstance(server_infos, Mapping):
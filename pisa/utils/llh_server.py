@@ -4,7 +4,8 @@
 Server(s) for handling llh requests from a client: client passes free param
 values, server sets these on its DistributionMaker, generates outputs, and
 compares the resulting distributions against a reference template, returning
-the llh value.
+the llh value. A client can also pass several free param vectors at once, in
+which case one llh value per vector is returned.
 
 Code adapted from Dan Krause
   https://gist.github.com/dankrause/9607475
@@ -48,6 +49,8 @@ import pickle
 import socketserver
 import struct
 
+import numpy as np
+
 from pisa.core.distribution_maker import DistributionMaker
 from pisa.core.map import MapSet
 
@@ -106,10 +109,14 @@ def receive_obj(sock):
         raise ConnectionClosed()
     payload_size = struct.unpack('!i', header)[0]
 
-    # Receive the payload
-    payload = sock.recv(payload_size)
-    if len(payload) == 0:
-        raise ConnectionClosed()
+    # Receive the payload; large payloads (e.g. many param vectors) can
+    # arrive in several chunks
+    payload = b""
+    while len(payload) < payload_size:
+        chunk = sock.recv(payload_size - len(payload))
+        if len(chunk) == 0:
+            raise ConnectionClosed()
+        payload += chunk
 
     # Payload was pickled; unpickle to recreate original Python object
     obj = pickle.loads(payload)
@@ -150,13 +157,29 @@ def serve(config, ref, port=DFLT_PORT):
                 param_values = receive_obj(self.request)
             except ConnectionClosed:
                 return
-            dist_maker._set_rescaled_free_params(param_values)  # pylint: disable=protected-access
-            test_map = dist_maker.get_outputs(return_sum=True)[0]
-            llh = test_map.llh(
-                expected_values=ref,
-                binned=False,  # return sum over llh from all bins (not per-bin llh's)
-            )
-            send_obj(llh, self.request)
+            # A sequence of param vectors is evaluated in one request,
+            # returning one llh per vector
+            if np.ndim(param_values) == 2:
+                test_maps = [
+                    outputs[0] for outputs in dist_maker.get_outputs_multi(
+                        param_values, rescaled=True, return_sum=True
+                    )
+                ]
+            else:
+                dist_maker._set_rescaled_free_params(param_values)  # pylint: disable=protected-access
+                test_maps = [dist_maker.get_outputs(return_sum=True)[0]]
+
+            llhs = [
+                test_map.llh(
+                    expected_values=ref,
+                    binned=False,  # return sum over llh from all bins (not per-bin llh's)
+                )
+                for test_map in test_maps
+            ]
+            if np.ndim(param_values) == 2:
+                send_obj(llhs, self.request)
+            else:
+                send_obj(llhs[0], self.request)
 
     server = socketserver.TCPServer((DFLT_HOST, int(port)), MyTCPHandler)
     print("llh server started on {}:{}".format(DFLT_HOST, port))
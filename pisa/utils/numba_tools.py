@@ -14,6 +14,11 @@ __all__ = [
     "ctype",
     "ftype",
     "WHERE",
+    "NUMBA_CACHE",
+    "KERNELS",
+    "register_kernel",
+    "local_array_factory",
+    "test_local_array_factory",
     "myjit",
     "conjugate_transpose",
     "conjugate_transpose_guf",
@@ -38,7 +43,12 @@ __version__ = "0.2"
 __author__ = "Philipp Eller (pde3@psu.edu)"
 
 from argparse import ArgumentParser
+from collections import OrderedDict
+import hashlib
 import inspect
+import os
+import re
+import sys
 
 # NOTE: Following must be imported to be in the namespace for use by `myjit`
 # when re-compiling modified (external) function code
@@ -59,8 +69,11 @@ from numba import (  # pylint: disable=unused-import
     jit,
     SmartArray,
 )
+from numba import cgutils, from_dtype, types
+from numba.extending import intrinsic
+from numba.targets.arrayobj import make_array, populate_array
 
-from pisa import FTYPE, TARGET
+from pisa import CACHE_DIR, FTYPE, TARGET
 from pisa.utils.comparisons import ALLCLOSE_KW
 from pisa.utils.log import Levels, logging, set_verbosity
 
@@ -98,14 +111,139 @@ elif FTYPE == np.float64:
     FX = "f8"
     CX = "c16"
 
+# Numba cannot cache CUDA kernels, but everything compiled for the CPU targets
+# is written to (and loaded from) `NUMBA_CACHE_DIR`
+NUMBA_CACHE = TARGET != "cuda"
+
+KERNELS = OrderedDict()
+"""Registry of PISA's Numba functions, filled by `register_kernel` and
+`myjit`: maps "<module>.<function name>" to `(function, signatures)`, where
+`signatures` are those a lazily compiled function is to be compiled for ahead
+of its first call (see `pisa/scripts/warmup.py`)"""
+
+
+def register_kernel(*signatures):
+    """Decorator adding a Numba-compiled function to `KERNELS`.
+
+    Parameters
+    ----------
+    *signatures : strings
+        Signatures (e.g. `"(f8[::1], f8[::1])"`) with which lazily compiled
+        (`jit` without explicit signatures) functions are actually called;
+        leave empty for functions that are compiled on import (`guvectorize`,
+        `jit` with signatures)
+
+    """
+    # `guvectorize` returns a ufunc, which doesn't know its defining module
+    module = sys._getframe(1).f_globals["__name__"]  # pylint: disable=protected-access
+
+    def decorator(func):
+        KERNELS["%s.%s" % (module, func.__name__)] = (func, signatures)
+        return func
+
+    return decorator
+
+MYJIT_SOURCE_DIR = os.path.join(CACHE_DIR, "numba", "myjit_src")
+"""Directory to write the source code of functions refactored by `myjit` to;
+numba can only cache functions that are defined in an actual file"""
+
+
+LOCAL_ARRAY_RE = re.compile(
+    r"cuda\.local\.array\(\s*(?:shape\s*=\s*)?(?P<shape>\([^)]*\)|\w+)\s*,"
+    r"\s*dtype\s*=\s*(?P<dtype>\w+)\s*\)"
+)
+"""Matches calls `cuda.local.array(shape=..., dtype=...)` in `myjit` sources"""
+
+
+def local_array_factory(shape, dtype):
+    """Make a Numba intrinsic that returns a new C-contiguous array of fixed
+    `shape` and `dtype`, allocated on the stack of the calling function.
+
+    This is the CPU equivalent of `cuda.local.array`: unlike `np.empty`, it
+    neither allocates on the heap nor requires reference counting, which
+    matters for small scratch arrays used in the innermost loops. The array
+    must not outlive (i.e., be returned from) the calling function.
+
+    Parameters
+    ----------
+    shape : int or tuple of ints
+    dtype : numpy dtype (or anything understood by `np.dtype`)
+
+    Returns
+    -------
+    local_array : numba intrinsic
+        Call as `local_array()` from nopython-mode code
+
+    """
+    shape = (shape,) if np.isscalar(shape) else tuple(shape)
+    shape = tuple(int(dim) for dim in shape)
+    nb_dtype = from_dtype(np.dtype(dtype))
+    array_type = types.Array(nb_dtype, len(shape), "C")
+    size = int(np.prod(shape))
+
+    @intrinsic
+    def local_array(typingctx):  # pylint: disable=unused-argument
+        def codegen(context, builder, signature, args):  # pylint: disable=unused-argument
+            ll_dtype = context.get_data_type(nb_dtype)
+            itemsize = context.get_abi_sizeof(ll_dtype)
+            # `alloca_once` places the allocation in the function's entry
+            # block, so calls within loops re-use the same memory
+            data = cgutils.alloca_once(builder, ll_dtype, size=size)
+            strides = [itemsize * int(np.prod(shape[i + 1:])) for i in range(len(shape))]
+            ary = make_array(array_type)(context, builder)
+            populate_array(
+                ary,
+                data=data,
+                shape=[context.get_constant(types.intp, dim) for dim in shape],
+                strides=[context.get_constant(types.intp, st) for st in strides],
+                itemsize=context.get_constant(types.intp, itemsize),
+                meminfo=None,
+            )
+            return ary._getvalue()
+
+        return array_type(), codegen
+
+    return local_array
+
+
+def _local_array_name(shape, dtype):
+    """Name of the `local_array_factory` intrinsic for `shape` and `dtype` in
+    the namespace of `myjit` functions"""
+    shape = (shape,) if np.isscalar(shape) else tuple(shape)
+    return "_local_array_%s_%s" % (
+        np.dtype(dtype).name,
+        "x".join(str(int(dim)) for dim in shape),
+    )
+
+
+def _replace_local_arrays(source):
+    """Replace all `cuda.local.array(shape=..., dtype=...)` calls in `source`
+    by calls to (stack-allocating) intrinsics made by `local_array_factory`,
+    which are added to this module's globals. Calls whose shape or dtype is
+    not a constant fall back to `np.empty`."""
+
+    def replace(match):
+        try:
+            shape = eval(match.group("shape"), globals())
+            dtype = eval(match.group("dtype"), globals())
+        except NameError:
+            return match.group(0)
+        name = _local_array_name(shape, dtype)
+        if name not in globals():
+            globals()[name] = local_array_factory(shape, dtype)
+        return "%s()" % name
+
+    source = LOCAL_ARRAY_RE.sub(replace, source)
+    return source.replace("cuda.local.array", "np.empty")
+
 
 def myjit(func):
     """
     Decorator to assign the right jit for different targets
-    In case of non-cuda targets, all instances of `cuda.local.array`
-    are replaced by `np.empty`. This is a dirty fix, hopefully in the
-    near future numba will support numpy array allocation and this will
-    not be necessary anymore
+    In case of non-cuda targets, all instances of
+    `cuda.local.array(shape=..., dtype=...)` are replaced by arrays of fixed
+    size allocated on the stack (see `local_array_factory`), s.t. the
+    functions do not allocate memory on the heap
 
     Parameters
     ----------
@@ -115,8 +253,8 @@ def myjit(func):
     -------
     new_nb_func: numba callable
         Refactored version of `func` but with `cuda.local.array` replaced by
-        `np.empty` if `TARGET == "cpu"`. For either TARGET, the returned
-        function will be callable within numba code for that target.
+        stack-allocated arrays if `TARGET == "cpu"`. For either TARGET, the
+        returned function will be callable within numba code for that target.
 
     """
     # pylint: disable=exec-used, eval-used
@@ -128,16 +266,58 @@ def myjit(func):
         source = inspect.getsource(func).splitlines()
         assert source[0].strip().startswith("@myjit")
         source = "\n".join(source[1:]) + "\n"
-        source = source.replace("cuda.local.array", "np.empty")
-        exec(source)
-        new_py_func = eval(func.__name__)
-        new_nb_func = jit(new_py_func, nopython=True)
+        source = _replace_local_arrays(source)
+        filename = _write_myjit_source(func.__name__, source)
+        if filename is None:
+            exec(source)
+            new_py_func = eval(func.__name__)
+            new_nb_func = jit(new_py_func, nopython=True)
+        else:
+            namespace = {}
+            exec(compile(source, filename, "exec"), globals(), namespace)
+            new_py_func = namespace[func.__name__]
+            new_nb_func = jit(new_py_func, nopython=True, cache=NUMBA_CACHE)
         # needs to be exported to globals
         globals()[func.__name__] = new_nb_func
+        KERNELS["%s.%s" % (func.__module__, func.__name__)] = (new_nb_func, ())
 
     return new_nb_func
 
 
+def _write_myjit_source(name, source):
+    """Write refactored function source to a file in `MYJIT_SOURCE_DIR` whose
+    name is unique to the source code, FTYPE, and TARGET, such that numba can
+    cache the compiled function on disk.
+
+    Returns None if the file cannot be written, in which case the function
+    must be compiled without caching.
+
+    """
+    key = "\n".join([source, np.dtype(FTYPE).name, TARGET])
+    filename = os.path.join(
+        MYJIT_SOURCE_DIR,
+        "%s_%s.py" % (name, hashlib.sha256(key.encode("utf-8")).hexdigest()[:16]),
+    )
+    if os.path.isfile(filename):
+        return filename
+    try:
+        if not os.path.isdir(MYJIT_SOURCE_DIR):
+            os.makedirs(MYJIT_SOURCE_DIR, exist_ok=True)
+        # write to a temp file first s.t. concurrent processes never see (and
+        # numba never caches) a partially-written file
+        tmp_filename = "%s.%d.tmp" % (filename, os.getpid())
+        with open(tmp_filename, "w") as f:
+            f.write(source)
+        os.replace(tmp_filename, filename)
+    except OSError:
+        logging.warning(
+            "Could not write to %s; `myjit` functions will not be cached",
+            MYJIT_SOURCE_DIR,
+        )
+        return None
+    return filename
+
+
 # --------------------------------------------------------------------------- #
 
 
@@ -157,7 +337,10 @@ def conjugate_transpose(A, B):
 
 
 @guvectorize(
-    [f"({XX}[:, :], {XX}[:, :])" for XX in [FX, CX]], "(i, j) -> (j, i)", target=TARGET,
+    [f"({XX}[:, :], {XX}[:, :])" for XX in [FX, CX]],
+    "(i, j) -> (j, i)",
+    target=TARGET,
+    cache=NUMBA_CACHE,
 )
 def conjugate_transpose_guf(A, out):
     """gufunc that calls conjugate_transpose"""
@@ -212,7 +395,10 @@ def conjugate(A, B):
 
 
 @guvectorize(
-    [f"({XX}[:, :], {XX}[:, :])" for XX in [FX, CX]], "(i, j) -> (i, j)", target=TARGET,
+    [f"({XX}[:, :], {XX}[:, :])" for XX in [FX, CX]],
+    "(i, j) -> (i, j)",
+    target=TARGET,
+    cache=NUMBA_CACHE,
 )
 def conjugate_guf(A, out):
     """gufunc that calls `conjugate`"""
@@ -268,6 +454,7 @@ def matrix_dot_matrix(A, B, C):
     [f"({XX}[:, :], {XX}[:, :], {XX}[:, :])" for XX in [FX, CX]],
     "(i, n), (n, j) -> (i, j)",
     target=TARGET,
+    cache=NUMBA_CACHE,
 )
 def matrix_dot_matrix_guf(A, B, out):
     """gufunc that calls matrix_dot_matrix"""
@@ -310,6 +497,7 @@ def matrix_dot_vector(A, v, w):
     [f"({XX}[:, :], {XX}[:], {XX}[:])" for XX in [FX, CX]],
     "(i, j), (j) -> (i)",
     target=TARGET,
+    cache=NUMBA_CACHE,
 )
 def matrix_dot_vector_guf(A, B, out):
     """gufunc that calls matrix_dot_vector"""
@@ -348,7 +536,10 @@ def clear_matrix(A):
 
 
 @guvectorize(
-    [f"({XX}[:, :], {XX}[:, :])" for XX in [FX, CX]], "(i, j) -> (i, j)", target=TARGET,
+    [f"({XX}[:, :], {XX}[:, :])" for XX in [FX, CX]],
+    "(i, j) -> (i, j)",
+    target=TARGET,
+    cache=NUMBA_CACHE,
 )
 def clear_matrix_guf(dummy, out):  # pylint: disable=unused-argument
     """gufunc that calls `clear_matrix`"""
@@ -385,7 +576,10 @@ def copy_matrix(A, B):
 
 
 @guvectorize(
-    [f"({XX}[:, :], {XX}[:, :])" for XX in [FX, CX]], "(i, j) -> (i, j)", target=TARGET,
+    [f"({XX}[:, :], {XX}[:, :])" for XX in [FX, CX]],
+    "(i, j) -> (i, j)",
+    target=TARGET,
+    cache=NUMBA_CACHE,
 )
 def copy_matrix_guf(A, out):
     """gufunc that calls `copy_matrix`"""
@@ -407,6 +601,45 @@ def test_copy_matrix():
     logging.info("<< PASS : test_copy_matrix >>")
 
 
+def test_local_array_factory():
+    """Unit tests of `local_array_factory` and its use by `myjit`"""
+    local_array = local_array_factory((2, 3), np.complex128)
+
+    @jit(nopython=True)
+    def fill_and_sum(n):
+        total = 0j
+        for k in range(n):
+            A = local_array()
+            for i in range(2):
+                for j in range(3):
+                    A[i, j] = i + 1j * j + k
+            total += A.sum()
+        return total
+
+    n = 1000
+    test = fill_and_sum(n)
+    ref = np.sum(
+        np.arange(2)[None, :, None]
+        + 1j * np.arange(3)[None, None, :]
+        + np.arange(n)[:, None, None]
+    )
+    assert test == ref, f"test: {test} != ref: {ref}"
+
+    if TARGET != "cuda":
+        for source, shape, dtype in [
+            ("C = cuda.local.array(shape=(3, 3), dtype=ctype)", (3, 3), ctype),
+            ("C = cuda.local.array(2, dtype=ftype)", 2, ftype),
+        ]:
+            source = _replace_local_arrays(source)
+            name = _local_array_name(shape, dtype)
+            assert source == "C = %s()" % name, source
+            assert name in globals()
+        source = _replace_local_arrays("C = cuda.local.array(shape=n, dtype=ftype)")
+        assert source == "C = np.empty(shape=n, dtype=ftype)", source
+
+    logging.info("<< PASS : test_local_array_factory >>")
+
+
 # --------------------------------------------------------------------------- #
 
 
@@ -426,3 +659,4 @@ if __name__ == "__main__":
     test_matrix_dot_vector()
     test_clear_matrix()
     test_copy_matrix()
+    test_local_array_factory()
@@ -9,17 +9,21 @@ multiple processes.
 
 from __future__ import division
 
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from copy import copy
 from functools import reduce
+import multiprocessing
 import queue
 import threading
 import time
+import traceback
 
-from pisa import OMP_NUM_THREADS
+from pisa import OMP_NUM_THREADS, ureg
 from pisa.utils.log import logging, set_verbosity
 
 
-__all__ = ['parallel_run']
+__all__ = ['parallel_run', 'PipelineExecutor']
 
 __author__ = 'J.L. Lanfranchi'
 
@@ -277,6 +281,149 @@ def parallel_run(func, kind, num_parallel, scalar_func, divided_args_mask,
     return return_values
 
 
+def _serve(obj, conn):
+    """Worker-process loop of `PipelineExecutor`: receive
+    `(param_values, method, kwargs)`, set the values of `obj`'s params, call
+    the method and send back `(success, return value or traceback)` until
+    `None` is received."""
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            break
+        if request is None:
+            break
+        param_values, method, kwargs = request
+        try:
+            params = obj.params
+            for name, (value, units) in param_values.items():
+                if units is not None:
+                    value = ureg.Quantity(value, units)
+                params[name].value = value
+            obj.update_params(params)
+            conn.send((True, getattr(obj, method)(**kwargs)))
+        except Exception: # pylint: disable=broad-except
+            conn.send((False, traceback.format_exc()))
+    conn.close()
+
+
+class PipelineExecutor(object):
+    """Evaluate independent pipelines (or anything else with `params`,
+    `update_params` and `get_outputs`, e.g. distribution makers)
+    concurrently.
+
+    Parameters
+    ----------
+    objects : sequence
+        The pipelines to evaluate.
+
+    kind : string, either 'threads' or 'processes'
+        'threads' calls the objects from a pool of threads in this process.
+        Only the parts not holding Python's global interpreter lock (GIL)
+        actually run in parallel, e.g. Numba functions compiled with
+        `nogil=True`.
+
+        'processes' forks one persistent worker process per object, which
+        keeps its own copy of the object (as it is at the time of
+        instantiation). For each call, the current values of the objects'
+        `params` in this process are sent to the workers, so param values set
+        in this process take effect; any other change of the objects or their
+        params (e.g. via `select_params`) does not. Outputs are pickled and sent back. Forking
+        requires that no CUDA context exists yet.
+
+    num_parallel : int or None
+        Number of threads to use with 'threads'. If None, use one per object.
+
+    """
+    def __init__(self, objects, kind='threads', num_parallel=None):
+        self._pool = None
+        self._workers = []
+        valid_kinds = ['threads', 'processes']
+        if not kind in valid_kinds:
+            raise ValueError(
+                '`kind` must either be one of {%s}, but got "%s".'
+                % (', '.join(['"%s"' % k for k in valid_kinds]), kind)
+            )
+        self.objects = list(objects)
+        self.kind = kind
+
+        if kind == 'threads':
+            if num_parallel is None:
+                num_parallel = len(self.objects)
+            self._pool = ThreadPoolExecutor(max_workers=max(1, num_parallel))
+        else:
+            ctx = multiprocessing.get_context('fork')
+            for obj in self.objects:
+                conn, child_conn = ctx.Pipe()
+                process = ctx.Process(target=_serve, args=(obj, child_conn))
+                process.daemon = True
+                process.start()
+                child_conn.close()
+                self._workers.append((process, conn))
+
+    def call(self, method, **kwargs):
+        """Call `method` with `kwargs` on all objects concurrently.
+
+        Returns
+        -------
+        return_values : list
+            The return values, in the order of the objects
+
+        """
+        if self.kind == 'threads':
+            futures = [self._pool.submit(getattr(obj, method), **kwargs)
+                       for obj in self.objects]
+            return [future.result() for future in futures]
+
+        if not self._workers:
+            raise ValueError('PipelineExecutor has been closed')
+        for obj, (_, conn) in zip(self.objects, self._workers):
+            # quantities would be unpickled into pint's default unit registry
+            param_values = OrderedDict()
+            for param in obj.params:
+                if isinstance(param.value, ureg.Quantity):
+                    param_values[param.name] = (param.value.m,
+                                                str(param.value.units))
+                else:
+                    param_values[param.name] = (param.value, None)
+            conn.send((param_values, method, kwargs))
+        return_values = []
+        errors = []
+        for _, conn in self._workers:
+            success, return_value = conn.recv()
+            if not success:
+                errors.append(return_value)
+            return_values.append(return_value)
+        if errors:
+            raise RuntimeError(
+                'Error in worker process:\n%s' % '\n'.join(errors)
+            )
+        return return_values
+
+    def get_outputs(self, **kwargs):
+        """Call `get_outputs` with `kwargs` on all objects concurrently"""
+        return self.call('get_outputs', **kwargs)
+
+    def close(self):
+        """Shut down the threads or worker processes"""
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+        for process, conn in self._workers:
+            try:
+                conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+            conn.close()
+        self._workers = []
+
+    def __del__(self):
+        self.close()
+
+
 def test_parallel_run():
     """Unit test the parallel_run function"""
     def delay(sec):
@@ -319,6 +466,55 @@ def test_parallel_run():
     logging.info('<< PASS : test_parallel_run >>')
 
 
+def test_PipelineExecutor():
+    """Unit test the PipelineExecutor class"""
+    from pisa.core.param import Param, ParamSet
+
+    class Dummy(object):
+        """stand-in for a pipeline"""
+        def __init__(self, offset):
+            self.offset = offset
+            self.params = ParamSet(Param(
+                name='scale', value=1 * ureg.dimensionless, prior=None,
+                range=None, is_fixed=False
+            ))
+        def update_params(self, params):
+            """update params"""
+            self.params.update_existing(params)
+        def get_outputs(self, value=0):
+            """compute outputs"""
+            if value < 0:
+                raise ValueError('negative value')
+            return self.params.scale.value.m * value + self.offset
+
+    for kind in ['threads', 'processes']:
+        objects = [Dummy(offset) for offset in range(3)]
+        executor = PipelineExecutor(objects, kind=kind)
+        try:
+            assert executor.get_outputs(value=10) == [10, 11, 12]
+            objects[1].params.scale.value = 2 * ureg.dimensionless
+            assert executor.get_outputs(value=10) == [10, 21, 12]
+            try:
+                executor.get_outputs(value=-1)
+            except (ValueError, RuntimeError):
+                pass
+            else:
+                raise AssertionError('error in %s not raised' % kind)
+            assert executor.get_outputs(value=1) == [1, 3, 3]
+        finally:
+            executor.close()
+
+    try:
+        PipelineExecutor([], kind='fibers')
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('invalid `kind` accepted')
+
+    logging.info('<< PASS : test_PipelineExecutor >>')
+
+
 if __name__ == '__main__':
     set_verbosity(1)
     test_parallel_run()
+    test_PipelineExecutor()
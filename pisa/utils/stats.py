@@ -5,19 +5,24 @@ Statistical functions
 
 from __future__ import absolute_import, division
 
+import math
+
 import numpy as np
 from scipy.special import gammaln
 from uncertainties import unumpy as unp
 
-from pisa import FTYPE
+from pisa import FTYPE, numba_jit
 from pisa.utils.comparisons import FTYPE_PREC, isbarenumeric
 from pisa.utils.log import logging
+from pisa.utils.numba_tools import NUMBA_CACHE, register_kernel
 from pisa.utils import likelihood_functions
 
 __all__ = ['SMALL_POS', 'CHI2_METRICS', 'LLH_METRICS', 'ALL_METRICS',
-           'maperror_logmsg',
-           'chi2', 'llh', 'log_poisson', 'log_smear', 'conv_poisson',
-           'norm_conv_poisson', 'conv_llh', 'barlow_llh', 'mod_chi2', 'mcllh_mean', 'mcllh_eff']
+           'GRAD_METRICS', 'ARRAY_METRICS', 'maperror_logmsg',
+           'chi2', 'llh', 'chi2_grad', 'llh_grad', 'log_poisson', 'log_smear', 'conv_poisson',
+           'norm_conv_poisson', 'conv_llh', 'barlow_llh', 'mod_chi2', 'mcllh_mean', 'mcllh_eff',
+           'array_metric_total',
+           'test_metric_grads', 'test_conv_llh', 'test_array_metric_total']
 
 __author__ = 'P. Eller, T. Ehrhardt, J.L. Lanfranchi'
 
@@ -54,6 +59,14 @@ METRICS_TO_MAXIMIZE = LLH_METRICS
 METRICS_TO_MINIMIZE = CHI2_METRICS
 """Metrics that must be minimized to obtain a better fit"""
 
+GRAD_METRICS = ['llh', 'chi2']
+"""Metrics whose derivatives w.r.t. the expected values are implemented (as
+`<metric>_grad`)"""
+
+ARRAY_METRICS = ['llh', 'chi2', 'mod_chi2', 'mcllh_mean', 'mcllh_eff']
+"""Metrics that can be computed directly from plain float arrays of the
+expected values and their sums of squared weights (see `array_metric_total`)"""
+
 
 # TODO(philippeller):
 # * unit tests to ensure these don't break
@@ -375,9 +388,9 @@ def conv_poisson(k, l, s, nsigma=3, steps=50):
 
     Parameters
     ----------
-    k : float
-    l : float
-    s : float
+    k : float or array
+    l : float or array
+    s : float or array
         sigma for smearing term (= the uncertainty to be accounted for)
     nsigma : int
         The ange in sigmas over which to do the convolution, 3 sigmas is > 99%,
@@ -388,32 +401,50 @@ def conv_poisson(k, l, s, nsigma=3, steps=50):
 
     Returns
     -------
-    float
-        convoluted poissson likelihood
+    float or array
+        convoluted poissson likelihood (array of the broadcast shape of `k`,
+        `l`, and `s` if any of them is an array)
+
+    Notes
+    -----
+    All elements are evaluated at once on a common quadrature grid (in units
+    of sigma), at the expense of an array of `2*steps + 1` times the size of
+    the inputs.
 
     """
+    k, l, s = np.broadcast_arrays(
+        np.asarray(k, dtype=np.float64),
+        np.asarray(l, dtype=np.float64),
+        np.asarray(s, dtype=np.float64),
+    )
     # Replace 0's with small positive numbers to avoid inf in log
-    l = max(SMALL_POS, l)
+    l = np.fmax(SMALL_POS, l)
     st = 2*(steps + 1)
-    conv_x = np.linspace(-nsigma*s, +nsigma*s, st)[:-1]+nsigma*s/(st-1.)
-    conv_y = log_smear(conv_x, s)
-    f_x = conv_x + l
-    #f_x = conv_x + k
-    # Avoid zero values for lambda
-    idx = np.argmax(f_x > 0)
-    f_y = log_poisson(k, f_x[idx:])
-    #f_y = log_poisson(f_x[idx:], l)
-    if np.isnan(f_y).any():
+    # quadrature grid in units of sigma
+    grid = np.linspace(-nsigma, +nsigma, st)[:-1] + nsigma/(st-1.)
+    s = s[..., np.newaxis]
+    conv_x = grid*s
+    with np.errstate(divide='ignore', invalid='ignore'):
+        conv_y = log_smear(conv_x, s)
+        f_x = conv_x + l[..., np.newaxis]
+        # Avoid zero values for lambda: only use the grid points from the
+        # first one with a positive lambda onwards
+        idx = np.argmax(f_x > 0, axis=-1)
+        use = np.arange(st - 1) >= idx[..., np.newaxis]
+        f_y = log_poisson(k[..., np.newaxis], f_x)
+    if np.isnan(f_y[use]).any():
+        bad = np.isnan(f_y).any(axis=-1)
         logging.error('`NaN values`:')
-        logging.error('idx = %d', idx)
-        logging.error('s = %s', s)
-        logging.error('l = %s', l)
-        logging.error('f_x = %s', f_x)
-        logging.error('f_y = %s', f_y)
+        logging.error('idx = %s', idx[bad])
+        logging.error('s = %s', s[bad])
+        logging.error('l = %s', l[bad])
+        logging.error('f_x = %s', f_x[bad])
+        logging.error('f_y = %s', f_y[bad])
     f_y = np.nan_to_num(f_y)
-    conv = np.exp(conv_y[idx:] + f_y)
-    norm = np.sum(np.exp(conv_y))
-    return conv.sum()/norm
+    conv = np.sum(np.where(use, np.exp(conv_y + f_y), 0.), axis=-1)
+    norm = np.sum(np.exp(conv_y), axis=-1)
+    result = conv/norm
+    return result[()] if result.ndim == 0 else result
 
 
 def norm_conv_poisson(k, l, s, nsigma=3, steps=50):
@@ -422,9 +453,9 @@ def norm_conv_poisson(k, l, s, nsigma=3, steps=50):
 
     Parameters
     ----------
-    k : float
-    l : float
-    s : float
+    k : float or array
+    l : float or array
+    s : float or array
         sigma for smearing term (= the uncertainty to be accounted for)
     nsigma : int
         The range in sigmas over which to do the convolution, 3 sigmas is >
@@ -441,7 +472,8 @@ def norm_conv_poisson(k, l, s, nsigma=3, steps=50):
 
     """
     cp = conv_poisson(k, l, s, nsigma=nsigma, steps=steps)
-    n1 = np.exp(log_poisson(l, l))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        n1 = np.exp(log_poisson(l, l))
     n2 = conv_poisson(l, l, s, nsigma=nsigma, steps=steps)
     return cp*n1/n2
 
@@ -456,19 +488,22 @@ def conv_llh(actual_values, expected_values):
 
     Returns
     -------
-    total log of convoluted poisson likelihood
+    conv_llh : numpy.ndarray
+        log of convoluted poisson likelihood for each (flattened) element of
+        the inputs; sum these for the total
 
     """
     actual_values = unp.nominal_values(actual_values).ravel()
     sigma = unp.std_devs(expected_values).ravel()
     expected_values = unp.nominal_values(expected_values).ravel()
-    triplets = np.array([actual_values, expected_values, sigma]).T
-    norm_triplets = np.array([actual_values, actual_values, sigma]).T
-    total = 0
-    for i in range(len(triplets)):
-        total += np.log(max(SMALL_POS, norm_conv_poisson(*triplets[i])))
-        total -= np.log(max(SMALL_POS, norm_conv_poisson(*norm_triplets[i])))
-    return total
+    with np.errstate(invalid='ignore'):
+        conv_llh_val = np.log(np.fmax(
+            SMALL_POS, norm_conv_poisson(actual_values, expected_values, sigma)
+        ))
+        conv_llh_val -= np.log(np.fmax(
+            SMALL_POS, norm_conv_poisson(actual_values, actual_values, sigma)
+        ))
+    return conv_llh_val
 
 def barlow_llh(actual_values, expected_values):
     """Compute the Barlow LLH taking into account finite statistics.
@@ -516,8 +551,9 @@ def barlow_llh(actual_values, expected_values):
     
     # TODO(tahmid): Run checks in case expected_values and/or corresponding sigma == 0
     # and handle these appropriately. If sigma/ev == 0 the code below will fail.
-    unweighted = np.array([(ev/s)**2 for ev, s in zip(expected_values, sigmas)])
-    weights = np.array([s**2/ev for ev, s in zip(expected_values, sigmas)])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        unweighted = (expected_values / sigmas)**2
+        weights = sigmas**2 / expected_values
 
     llh = likelihood_functions.barlowLLH(actual_values, unweighted, weights)
     return llh
@@ -547,3 +583,313 @@ def mod_chi2(actual_values, expected_values):
         (actual_values - expected_values)**2 / (sigma**2 + expected_values)
     )
     return m_chi2
+
+
+def _prepare_grad_inputs(actual_values, expected_values):
+    """Strip uncertainties and replace values in `expected_values` smaller than
+    `SMALL_POS` as done when computing the metrics"""
+    if actual_values.shape != expected_values.shape:
+        raise ValueError(
+            'Shape mismatch: actual_values.shape = %s,'
+            ' expected_values.shape = %s'
+            % (actual_values.shape, expected_values.shape)
+        )
+    if not isbarenumeric(actual_values):
+        actual_values = unp.nominal_values(actual_values)
+    if not isbarenumeric(expected_values):
+        expected_values = unp.nominal_values(expected_values)
+    actual_values = np.asarray(actual_values, dtype=np.float64)
+    expected_values = np.clip(expected_values, a_min=SMALL_POS, a_max=np.inf)
+    return actual_values, expected_values
+
+
+def chi2_grad(actual_values, expected_values):
+    """Compute the derivatives of `chi2` w.r.t. each value in
+    `expected_values`.
+
+    Parameters
+    ----------
+    actual_values, expected_values : numpy.ndarrays of same shape
+
+    Returns
+    -------
+    chi2_grad : numpy.ndarray of same shape as inputs
+        0 where `expected_values` is nan
+
+    """
+    actual_values, expected_values = _prepare_grad_inputs(
+        actual_values, expected_values
+    )
+    actual_values = np.clip(actual_values, a_min=SMALL_POS, a_max=np.inf)
+    with np.errstate(invalid='ignore'):
+        grad = 1 - np.square(actual_values / expected_values)
+    return np.where(np.isnan(grad), 0., grad)
+
+
+def llh_grad(actual_values, expected_values):
+    """Compute the derivatives of `llh` w.r.t. each value in
+    `expected_values`.
+
+    Parameters
+    ----------
+    actual_values, expected_values : numpy.ndarrays of same shape
+
+    Returns
+    -------
+    llh_grad : numpy.ndarray of same shape as inputs
+        0 where `expected_values` is nan
+
+    """
+    actual_values, expected_values = _prepare_grad_inputs(
+        actual_values, expected_values
+    )
+    with np.errstate(invalid='ignore'):
+        grad = actual_values / expected_values - 1
+    return np.where(np.isnan(grad), 0., grad)
+
+
+# The following kernels reproduce the per-element definitions (including
+# clipping, masking of invalid values and input checks) of the corresponding
+# uncertainties-based functions above, but sum over the elements of flat
+# float64 arrays in a single pass without allocating any temporaries
+
+
+@register_kernel("(f8[::1], f8[::1])")
+@numba_jit(nopython=True, nogil=True, cache=NUMBA_CACHE)
+def _llh_total(actual_values, expected_values):
+    """Sum of `llh` over all elements"""
+    total = 0.
+    for i in range(actual_values.size):
+        act = actual_values[i]
+        exp = expected_values[i]
+        if act < 0:
+            raise ValueError('`actual_values` must all be >= 0')
+        if exp < 0:
+            raise ValueError('`expected_values` must all be >= 0')
+        # invalid values are masked off in `llh`, as are empty bins (where
+        # the log of the actual value is undefined)
+        if not (np.isfinite(act) and np.isfinite(exp)) or act == 0:
+            continue
+        exp = max(exp, SMALL_POS)
+        total += act*math.log(exp) - exp - (act*math.log(act) - act)
+    return total
+
+
+@register_kernel("(f8[::1], f8[::1])")
+@numba_jit(nopython=True, nogil=True, cache=NUMBA_CACHE)
+def _chi2_total(actual_values, expected_values):
+    """Sum of `chi2` over all elements"""
+    total = 0.
+    for i in range(actual_values.size):
+        act = actual_values[i]
+        exp = expected_values[i]
+        if act < 0:
+            raise ValueError('`actual_values` must all be >= 0')
+        if exp < 0:
+            raise ValueError('`expected_values` must all be >= 0')
+        if not (np.isfinite(act) and np.isfinite(exp)):
+            continue
+        act = max(act, SMALL_POS)
+        exp = max(exp, SMALL_POS)
+        total += (act - exp)**2 / exp
+    return total
+
+
+@register_kernel("(f8[::1], f8[::1], f8[::1])")
+@numba_jit(nopython=True, nogil=True, cache=NUMBA_CACHE)
+def _mod_chi2_total(actual_values, expected_values, expected_sumw2):
+    """Sum of `mod_chi2` over all elements"""
+    total = 0.
+    for i in range(actual_values.size):
+        act = actual_values[i]
+        exp = expected_values[i]
+        sumw2 = expected_sumw2[i]
+        # `mod_chi2` replaces (uncertain) values below SMALL_POS by the bare
+        # number SMALL_POS, thereby also dropping their errors
+        if exp < SMALL_POS:
+            exp = SMALL_POS
+            sumw2 = 0.
+        total += (act - exp)**2 / (sumw2 + exp)
+    return total
+
+
+@register_kernel("(f8[::1], f8[::1], f8[::1], f8, f8)")
+@numba_jit(nopython=True, nogil=True, cache=NUMBA_CACHE)
+def _poisson_gamma_total(actual_values, expected_values, expected_sumw2, a, b):
+    """Sum of `likelihood_functions.poisson_gamma` over all elements, as
+    used by `mcllh_mean` (`a` = 0) and `mcllh_eff` (`a` = 1)"""
+    total = 0.
+    for i in range(actual_values.size):
+        act = actual_values[i]
+        exp = expected_values[i]
+        sumw2 = expected_sumw2[i]
+        if act < 0:
+            raise ValueError('`actual_values` must all be >= 0')
+        if exp < 0:
+            raise ValueError('`expected_values` must all be >= 0')
+        if not (np.isfinite(act) and np.isfinite(exp)):
+            continue
+        if exp <= 0 or sumw2 < 0:
+            if act != 0:
+                total += -np.inf
+        elif sumw2 == 0:
+            total += act*math.log(exp) - exp - math.lgamma(act + 1)
+        else:
+            alpha = exp**2 / sumw2 + a
+            beta = exp / sumw2 + b
+            total += (
+                alpha*math.log(beta) + math.lgamma(act + alpha)
+                - math.lgamma(act + 1) - (act + alpha)*math.log1p(beta)
+                - math.lgamma(alpha)
+            )
+    return total
+
+
+def _as_flat_float_array(values):
+    """Return `values` as flat, C-contiguous float64 array (without copying
+    if it already is one)"""
+    return np.ascontiguousarray(values, dtype=np.float64).ravel()
+
+
+def array_metric_total(actual_values, expected_values, metric,
+                       expected_sumw2=None):
+    """Compute the total `metric` directly from arrays of floats.
+
+    This is equivalent to summing the `metric` function applied to
+    `actual_values` and `unp.uarray(expected_values, sqrt(expected_sumw2))`,
+    but avoids the (slow) uncertainties arrays altogether, as is desirable
+    e.g. when evaluating the metric in each step of a fit.
+
+    Parameters
+    ----------
+    actual_values, expected_values : numpy.ndarrays of same size
+        Nominal values; arrays that are not flat, C-contiguous float64 arrays
+        are converted to such
+
+    metric : str
+        One of `ARRAY_METRICS`
+
+    expected_sumw2 : None or numpy.ndarray of same size
+        Squared uncertainties of `expected_values` (e.g. sums of squared
+        weights). Only used by `mod_chi2`, `mcllh_mean`, and `mcllh_eff`;
+        None is equivalent to all zeros.
+
+    Returns
+    -------
+    total : float
+
+    """
+    if metric not in ARRAY_METRICS:
+        raise ValueError('`metric` "%s" cannot be computed from arrays; use'
+                         ' one of %s.' % (metric, ARRAY_METRICS))
+    actual_values = _as_flat_float_array(actual_values)
+    expected_values = _as_flat_float_array(expected_values)
+    if actual_values.size != expected_values.size:
+        raise ValueError(
+            'Size mismatch: actual_values.size = %d,'
+            ' expected_values.size = %d'
+            % (actual_values.size, expected_values.size)
+        )
+
+    if metric == 'llh':
+        return _llh_total(actual_values, expected_values)
+    if metric == 'chi2':
+        return _chi2_total(actual_values, expected_values)
+
+    if expected_sumw2 is None:
+        expected_sumw2 = np.zeros_like(expected_values)
+    else:
+        expected_sumw2 = _as_flat_float_array(expected_sumw2)
+        if expected_sumw2.size != expected_values.size:
+            raise ValueError(
+                'Size mismatch: expected_sumw2.size = %d,'
+                ' expected_values.size = %d'
+                % (expected_sumw2.size, expected_values.size)
+            )
+    if metric == 'mod_chi2':
+        return _mod_chi2_total(actual_values, expected_values, expected_sumw2)
+    return _poisson_gamma_total(
+        actual_values, expected_values, expected_sumw2,
+        0. if metric == 'mcllh_mean' else 1., 0.
+    )
+
+
+def test_metric_grads():
+    """Compare `GRAD_METRICS` derivatives with finite differences"""
+    rand = np.random.RandomState(0)
+    actual = rand.poisson(10, size=20).astype(np.float64)
+    expected = rand.uniform(5, 15, size=20)
+    step = 1e-6
+    for metric in GRAD_METRICS:
+        func = globals()[metric]
+        grad = globals()[metric + '_grad'](actual, expected)
+        num_grad = (
+            func(actual, expected + step) - func(actual, expected - step)
+        ) / (2*step)
+        assert np.allclose(grad, num_grad, rtol=1e-5), metric
+    logging.info('<< PASS : test_metric_grads >>')
+
+
+def test_conv_llh():
+    """Check array-wise evaluation of `conv_poisson` and `conv_llh` against
+    reference values computed with the original per-bin implementation"""
+    actual = np.array([0., 0., 3., 7., 12., 25., 40., 1., 5.])
+    expected = np.array([0.5, 4., 2.5, 9., 10., 20., 45., 0.2, 30.])
+    sigma = np.array([0.3, 1., 2., 0.5, 4., 6., 3., 0.5, 2.])
+    expected_values = unp.uarray(expected, sigma)
+
+    ref_conv_poisson = np.array([
+        5.8383792885108421e-01, 2.9589684867434889e-02,
+        1.3470536962112739e-01, 1.1656922600593272e-01,
+        6.6442284769891100e-02, 3.9254709378899390e-02,
+        4.5455163731218502e-02, 1.6284394846245601e-01,
+        6.6826002826147933e-08
+    ])
+    ref_conv_llh = np.array([
+        2.2619145564231403e+01, 1.9621431750632429e+01,
+        -1.3051648370376867e-03, -2.3207158081621326e-01,
+        -5.9237799297481075e-02, -1.8949083998161109e-01,
+        -2.3572543647982913e-01, -2.2965722822100387e-01,
+        -1.4719298954413503e+01
+    ])
+
+    conv_poisson_val = conv_poisson(actual, expected, sigma)
+    assert np.allclose(conv_poisson_val, ref_conv_poisson, rtol=1e-10, atol=0)
+    for i, ref in enumerate(ref_conv_poisson):
+        assert np.isclose(conv_poisson(actual[i], expected[i], sigma[i]), ref,
+                          rtol=1e-10, atol=0)
+
+    conv_llh_val = conv_llh(actual, expected_values)
+    assert conv_llh_val.shape == actual.shape
+    assert np.allclose(conv_llh_val, ref_conv_llh, rtol=1e-10, atol=1e-14)
+
+    # Asimov data
+    assert np.allclose(conv_llh(expected, expected_values), 0, atol=1e-12)
+    logging.info('<< PASS : test_conv_llh >>')
+
+
+def test_array_metric_total():
+    """Compare `array_metric_total` with the sums of the uncertainties-based
+    metric functions"""
+    rand = np.random.RandomState(0)
+    expected = rand.uniform(0, 20, size=50)
+    expected[:3] = 0
+    sumw2 = (expected * rand.uniform(0, 0.3, size=50))**2
+    sumw2[5] = 0
+    actual = rand.poisson(expected + 1).astype(np.float64)
+    actual[10:13] = 0
+
+    for metric in ARRAY_METRICS:
+        ref = np.sum(
+            globals()[metric](actual, unp.uarray(expected, np.sqrt(sumw2)))
+        )
+        val = array_metric_total(actual, expected, metric, expected_sumw2=sumw2)
+        assert np.isclose(val, ref, rtol=1e-12, atol=1e-12), (metric, val, ref)
+
+    try:
+        array_metric_total(-actual, expected, 'llh')
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('negative `actual_values` not detected')
+    logging.info('<< PASS : test_array_metric_total >>')
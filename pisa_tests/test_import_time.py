@@ -0,0 +1,187 @@
+#! /usr/bin/env python
+
+"""
+Benchmark the wall time it takes a fresh Python interpreter to import (parts
+of) PISA, both in the default mode and in lazy-loading mode (see
+`PISA_LAZY_IMPORT` env var). Short-lived processes such as cluster array jobs
+and `llh_client` workers pay this cost on every start, so track it over time by
+appending the results to a file with `--outfile`.
+
+The default statement imports `pisa.core`, whose submodules are loaded on first
+access in lazy-loading mode. Note that modules which import `ureg` at module
+level (`pisa.utils.comparisons` and hence most of `pisa.core` and the stages)
+build the unit registry as soon as they are imported, so e.g.
+`import pisa.core.pipeline` takes just as long in either mode.
+"""
+
+
+from __future__ import absolute_import
+
+from argparse import ArgumentParser
+from datetime import datetime
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from pisa import __version__
+from pisa.utils.fileio import from_file, to_file
+from pisa.utils.log import Levels, logging, set_verbosity
+
+
+__all__ = [
+    "DEFAULT_STATEMENT",
+    "time_import",
+    "benchmark_import_time",
+    "test_import_time",
+    "parse_args",
+    "main",
+]
+
+__license__ = """Copyright (c) 2014-2020, The IceCube Collaboration
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License."""
+
+
+DEFAULT_STATEMENT = "import pisa.core"
+
+
+def time_import(statement=DEFAULT_STATEMENT, repeats=5, lazy=False):
+    """Run `python -c statement` in `repeats` fresh interpreters.
+
+    Parameters
+    ----------
+    statement : str
+    repeats : int
+    lazy : bool
+        Whether to enable PISA's lazy-loading mode in the subprocesses
+
+    Returns
+    -------
+    times : list of float
+        Wall time of each run, in seconds
+
+    """
+    env = dict(os.environ)
+    env["PISA_LAZY_IMPORT"] = "1" if lazy else "0"
+    times = []
+    for _ in range(repeats):
+        t0 = time.time()
+        subprocess.run(
+            [sys.executable, "-c", statement],
+            env=env,
+            check=True,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        times.append(time.time() - t0)
+    return times
+
+
+def benchmark_import_time(
+    statement=DEFAULT_STATEMENT,
+    repeats=5,
+    max_time=None,
+    outfile=None,
+    verbosity=Levels.WARN,
+):
+    """Benchmark `statement` with and without lazy-loading mode.
+
+    Parameters
+    ----------
+    statement : str
+    repeats : int
+    max_time : float, optional
+        Fail if the fastest lazy-mode run takes longer than this (in seconds)
+    outfile : str, optional
+        Append the results to this JSON file
+    verbosity : int
+
+    Returns
+    -------
+    results : dict
+
+    """
+    set_verbosity(verbosity)
+    results = dict(
+        timestamp=datetime.now().isoformat(),
+        version=__version__,
+        statement=statement,
+    )
+    for lazy in (False, True):
+        key = "lazy" if lazy else "eager"
+        times = time_import(statement=statement, repeats=repeats, lazy=lazy)
+        results[key] = times
+        logging.info(
+            f'<< {key} "{statement}": min {np.min(times):.3f} s,'
+            f" median {np.median(times):.3f} s >>"
+        )
+
+    if outfile is not None:
+        history = from_file(outfile) if os.path.isfile(outfile) else []
+        history.append(results)
+        to_file(history, outfile)
+
+    if max_time is not None and np.min(results["lazy"]) > max_time:
+        raise Exception(
+            f'"{statement}" took {np.min(results["lazy"]):.3f} s in lazy-loading'
+            f" mode, exceeding the limit of {max_time} s"
+        )
+
+    return results
+
+
+def test_import_time():
+    """Check that PISA can be imported with and without lazy-loading mode.
+
+    This makes a single run per mode and imposes no time limit; use
+    `benchmark_import_time` (or the command line interface) for timing.
+
+    """
+    results = benchmark_import_time(repeats=1)
+    assert len(results["eager"]) == len(results["lazy"]) == 1
+
+
+def parse_args(description=__doc__):
+    """Parse command line arguments"""
+    parser = ArgumentParser(description=description)
+    parser.add_argument("--statement", default=DEFAULT_STATEMENT)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument(
+        "--max-time",
+        type=float,
+        default=None,
+        help="fail if the fastest lazy-mode import takes longer (seconds)",
+    )
+    parser.add_argument(
+        "--outfile", default=None, help="append results to this JSON file"
+    )
+    parser.add_argument(
+        "-v", action="count", default=Levels.INFO, help="set verbosity level"
+    )
+    args = parser.parse_args()
+    return args
+
+
+def main():
+    """Script interface to benchmark_import_time"""
+    args = parse_args()
+    kwargs = vars(args)
+    kwargs["verbosity"] = kwargs.pop("v")
+    benchmark_import_time(**kwargs)
+
+
+if __name__ == "__main__":
+    main()
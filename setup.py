@@ -299,10 +299,12 @@ def do_setup():
                 'pisa-make_toy_events = pisa.scripts.make_toy_events:main',
                 'pisa-profile_scan = pisa.scripts.profile_scan:main',
                 'pisa-scan_allsyst = pisa.scripts.scan_allsyst:main',
+                'pisa-warmup = pisa.scripts.warmup:main',
 
                 # Scripts in pisa_tests dir
                 'pisa-test_changes_with_combined_pidreco = pisa_tests.test_changes_with_combined_pidreco:main',
                 'pisa-test_example_pipelines = pisa_tests.test_example_pipelines:main',
+                'pisa-test_import_time = pisa_tests.test_import_time:main',
                 'pisa-run_unit_tests = pisa_tests.run_unit_tests:run_unit_tests',
             ]
         }